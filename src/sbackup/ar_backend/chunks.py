@@ -0,0 +1,234 @@
+#   Simple Backup - splitting of archives into parts of fixed size
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+:mod:`chunks` --- splitting of archives into parts of fixed size
+=================================================================
+
+.. module:: chunks
+   :synopsis: splitting of (compressed) archive streams into parts
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+The archive stream (as written by TAR, i.e. after compression) is split into
+parts of fixed size while it is written. The parts of archive `files.tar.gz`
+are named `files.tar.gz.001`, `files.tar.gz.002`... A manifest
+`files.tar.gz.parts` lists the parts with their sizes and checksums. When
+reading, the parts are concatenated and verified while streaming.
+
+"""
+
+from gettext import gettext as _
+import hashlib
+
+from sbackup.fs_backend import fam
+
+from sbackup.util.exceptions import SBException
+from sbackup.util import log
+
+
+MANIFEST_SUFFIX = ".parts"
+MANIFEST_HEADER = "# sbackup archive parts 1"
+
+_FOP = fam.get_file_operations_facade_instance()
+
+
+def get_manifest_filename(archive):
+    """Returns the path of the manifest belonging to the given archive.
+    """
+    return "%s%s" % (archive, MANIFEST_SUFFIX)
+
+def get_part_filename(archive, partno):
+    """Returns the path of the part no. `partno` (beginning with 1) of the
+    given archive.
+    """
+    return "%s.%03d" % (archive, partno)
+
+def is_split_archive(archive):
+    """Returns True if the given archive is split into parts (i.e. the
+    manifest exists).
+    """
+    return _FOP.path_exists(get_manifest_filename(archive))
+
+def read_manifest(archive):
+    """Reads the manifest of the given archive.
+
+    @return: list of tuples (name of part, size in bytes, md5 checksum)
+    @raise SBException: if the manifest is invalid
+    """
+    _manifest = get_manifest_filename(archive)
+    _lines = _FOP.readfile(_manifest).splitlines()
+    if len(_lines) == 0 or _lines[0] != MANIFEST_HEADER:
+        raise SBException(_("Manifest of split archive `%s` is invalid.") % _manifest)
+    _parts = []
+    for _line in _lines[1:]:
+        if not _line:
+            continue
+        try:
+            _name, _size, _md5 = _line.split("\t")
+            _parts.append((_name, int(_size), _md5))
+        except ValueError:
+            raise SBException(_("Manifest of split archive `%s` is invalid.") % _manifest)
+    return _parts
+
+
+class ChunkWriter(object):
+    """File-like object that splits the written data into parts of fixed
+    size and writes the manifest when closed.
+    """
+
+    def __init__(self, archive, partsize):
+        """
+        @param archive: path of the (logical) archive
+        @param partsize: max. size of the parts in bytes
+        """
+        if partsize <= 0:
+            raise ValueError("Size of parts must be positive.")
+        self.__logger = log.LogFactory.getLogger()
+        self.__archive = archive
+        self.__partsize = partsize
+        # list of (name, size, checksum) of finished parts
+        self.__parts = []
+        self.__fobj = None
+        self.__md5 = None
+        self.__size = 0
+        self.__closed = False
+
+    def __str__(self):
+        return "%s (split into parts of %s bytes)" % (self.__archive, self.__partsize)
+
+    def __open_part(self):
+        _name = get_part_filename(self.__archive, len(self.__parts) + 1)
+        self.__fobj = _FOP.openfile_for_write(_name)
+        self.__md5 = hashlib.md5()
+        self.__size = 0
+
+    def __close_part(self):
+        self.__fobj.close()
+        _name = _FOP.get_basename(get_part_filename(self.__archive, len(self.__parts) + 1))
+        self.__parts.append((_name, self.__size, self.__md5.hexdigest()))
+        self.__fobj = None
+
+    def write(self, data):
+        _pos = 0
+        _len = len(data)
+        while _pos < _len:
+            if self.__fobj is None:
+                self.__open_part()
+            _chunk = data[_pos:_pos + (self.__partsize - self.__size)]
+            self.__fobj.write(_chunk)
+            self.__md5.update(_chunk)
+            self.__size += len(_chunk)
+            _pos += len(_chunk)
+            if self.__size >= self.__partsize:
+                self.__close_part()
+
+    def close(self):
+        """Closes the current part and writes the manifest.
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+        if self.__fobj is not None or len(self.__parts) == 0:
+            if self.__fobj is None:
+                self.__open_part()
+            self.__close_part()
+        _lines = [MANIFEST_HEADER]
+        for _part in self.__parts:
+            _lines.append("%s\t%s\t%s" % _part)
+        _FOP.writetofile(get_manifest_filename(self.__archive), "\n".join(_lines) + "\n")
+        self.__logger.debug("Archive split into %s parts." % len(self.__parts))
+
+    def get_parts(self):
+        """Returns the list of written parts (name, size, checksum).
+        """
+        return self.__parts
+
+
+class ChunkReader(object):
+    """File-like object that reads the parts of a split archive one after
+    another. Size and checksum of each part are verified while reading.
+    """
+
+    def __init__(self, archive):
+        """
+        @param archive: path of the (logical) archive
+        @raise SBException: if the manifest is invalid
+        """
+        self.__archive = archive
+        self.__dirname = _FOP.get_dirname(archive)
+        self.__parts = read_manifest(archive)
+        self.__partidx = -1
+        self.__fobj = None
+        self.__md5 = None
+        self.__size = 0
+
+    def __str__(self):
+        return "%s (%s parts)" % (self.__archive, len(self.__parts))
+
+    def __next_part(self):
+        """Opens the next part. Returns False if there are no more parts.
+        """
+        self.__partidx += 1
+        if self.__partidx >= len(self.__parts):
+            return False
+        _name = self.__parts[self.__partidx][0]
+        self.__fobj = _FOP.openfile_for_read(_FOP.joinpath(self.__dirname, _name))
+        self.__md5 = hashlib.md5()
+        self.__size = 0
+        return True
+
+    def __finish_part(self):
+        """Closes the current part and verifies it.
+
+        @raise SBException: if size or checksum of the part don't match
+        """
+        self.__fobj.close()
+        self.__fobj = None
+        _name, _size, _md5 = self.__parts[self.__partidx]
+        if self.__size != _size or self.__md5.hexdigest() != _md5:
+            raise SBException(_("Part `%(part)s` of archive `%(archive)s` is corrupted.")\
+                              % { 'part' : _name, 'archive' : self.__archive })
+
+    def read(self, size = -1):
+        """Reads up to `size` bytes (all remaining data if `size` is negative).
+        """
+        _bufs = []
+        _remaining = size
+        while _remaining != 0:
+            if self.__fobj is None:
+                if not self.__next_part():
+                    break
+            if _remaining < 0:
+                _data = self.__fobj.read()
+            else:
+                _data = self.__fobj.read(_remaining)
+            if not _data:
+                self.__finish_part()
+                continue
+            self.__md5.update(_data)
+            self.__size += len(_data)
+            _bufs.append(_data)
+            if _remaining > 0:
+                _remaining -= len(_data)
+        return "".join(_bufs)
+
+    def close(self):
+        if self.__fobj is not None:
+            self.__fobj.close()
+            self.__fobj = None
+        self.__partidx = len(self.__parts)
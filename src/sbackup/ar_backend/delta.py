@@ -0,0 +1,544 @@
+#   Simple Backup - block-level delta storage of large files
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+:mod:`delta` --- block-level delta storage of large files
+=========================================================
+
+.. module:: delta
+   :synopsis: stores only the changed blocks of large files in snapshots
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+TAR stores changed files as a whole, even if only a few bytes of a large
+file (e.g. a database or an image of a virtual machine) were modified. Files
+exceeding a configurable size are therefore excluded from the TAR archive
+and stored by this module instead: the files are split into blocks of fixed
+size and a signature (the checksums of the blocks) is kept in the index
+`delta.index` within the snapshot directory (see `write_index`). An incremental snapshot stores
+only the blocks whose checksum differs from the signature in the base
+snapshot (compressed, in the side archive `files.delta`); files not modified
+since the base snapshot are only recorded in the index.
+
+A file is restored by taking each block from the most recent snapshot in the
+history that stored it (see `DeltaRestorer`). Full snapshots store all
+blocks, hence the history up to the last full snapshot is sufficient.
+
+"""
+
+from gettext import gettext as _
+import hashlib
+import os
+import stat
+import struct
+import zlib
+
+from sbackup.fs_backend import fam
+
+from sbackup.util.exceptions import SBException
+from sbackup.util import log
+
+
+# names of the index and the side archive within the snapshot directory
+INDEX_FILENAME = "delta.index"
+ARCHIVE_FILENAME = "files.delta"
+
+# size of blocks (in bytes) the files are split into
+BLOCK_SIZE = 256 * 1024
+
+# compression level of stored blocks
+COMPRESSION_LEVEL = 6
+
+# size of the checksum of a block
+_DIGEST_SIZE = hashlib.md5().digest_size
+# size of reads when skipping data of the side archive
+_READ_SIZE = 4 * 1024 * 1024
+
+# the index consists of a header (magic, version, number of entries) and the
+# entries; an entry consists of its attributes (`_INDEX_ENTRY`), the path,
+# the checksums of the blocks and the locations of the stored blocks
+# (`_INDEX_BLOCK`). The index is compressed as a whole.
+_INDEX_MAGIC = "SBDELTAIDX"
+_INDEX_VERSION = 2
+_INDEX_HEADER = struct.Struct(">10sHI")
+# length of path, size, mtime, mode, uid, gid, size of blocks, whether all
+# blocks are stored, number of checksums, number of stored blocks
+_INDEX_ENTRY = struct.Struct(">IQdIIIIBII")
+# number of block, offset and size within the side archive
+_INDEX_BLOCK = struct.Struct(">IQI")
+
+_SUFFIX_TMP = ".sbackup-delta.tmp"
+
+_FOP = fam.get_file_operations_facade_instance()
+
+
+def get_block_digest(data):
+    """Returns the checksum of the given block.
+    """
+    return hashlib.md5(data).digest()
+
+
+def has_index(snppath):
+    """Returns True if the given snapshot directory contains an index.
+    """
+    return _FOP.path_exists(_FOP.joinpath(snppath, INDEX_FILENAME))
+
+
+def read_index(snppath):
+    """Returns the index (dictionary path -> `DeltaEntry`) of the given
+    snapshot directory. An empty dictionary is returned for snapshots
+    without index.
+
+    @raise SBException: if the index cannot be read
+    """
+    _path = _FOP.joinpath(snppath, INDEX_FILENAME)
+    if not _FOP.path_exists(_path):
+        return {}
+    try:
+        _data = zlib.decompress(_FOP.readfile(_path))
+        _magic, _version, _count = _INDEX_HEADER.unpack_from(_data)
+        if _magic != _INDEX_MAGIC or _version != _INDEX_VERSION:
+            raise ValueError(_("unknown format"))
+        _index = {}
+        _offset = _INDEX_HEADER.size
+        for _idx in xrange(_count):
+            _file, _entry, _offset = DeltaEntry.unpack(_data, _offset)
+            _index[_file] = _entry
+        if _offset != len(_data):
+            raise ValueError(_("unexpected data after %s entries") % _count)
+    except (zlib.error, struct.error, ValueError), error:
+        raise SBException(_("Unable to read index of large files `%(file)s`: %(error)s")\
+                          % { 'file' : _path, 'error' : error })
+    return _index
+
+
+def write_index(snppath, index):
+    """Writes the given index into the snapshot directory. The index is
+    stored as compressed table (see `DeltaEntry.pack`), i.e. no objects are
+    unpickled when the index is read from the target.
+    """
+    _data = [_INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION, len(index))]
+    for _path in sorted(index):
+        _data.append(index[_path].pack(_path))
+    _FOP.writetofile(_FOP.joinpath(snppath, INDEX_FILENAME), zlib.compress("".join(_data)))
+
+
+def get_nblocks(size, blocksize):
+    """Returns the number of blocks a file of the given size consists of.
+    """
+    return (size + blocksize - 1) // blocksize
+
+
+def write_deltas(snppath, files, basepath = None, blocksize = BLOCK_SIZE):
+    """Stores the given files into the snapshot directory. Only blocks
+    changed since the base snapshot are stored.
+
+    @param snppath: the directory of the snapshot being written
+    @param files: the (local) paths of the files
+    @param basepath: the directory of the base snapshot or None (full snapshot)
+    """
+    _base_index = {}
+    if basepath is not None:
+        _base_index = read_index(basepath)
+    _writer = DeltaWriter(snppath, _base_index, blocksize)
+    try:
+        for _file in files:
+            _writer.add_file(_file)
+    finally:
+        _writer.close()
+
+
+def merge_deltas(snppaths, destpath, complete = False):
+    """Merges the large files of the given snapshots (most recent first)
+    into the directory `destpath` (the snapshot is rebased on the base
+    of the last given snapshot). The stored blocks are copied as they are.
+
+    @param complete: whether all blocks must be found within the given
+                     snapshots (i.e. the result is a full snapshot)
+    """
+    _restorer = DeltaRestorer(snppaths)
+    _index = {}
+    _fobj = None
+    _offset = 0
+    try:
+        for _path in sorted(_restorer.list_files()):
+            _entry = _restorer.get_entry(_path)
+            _blocks, _complete = _restorer.locate_blocks(_path, complete)
+            _merged = _entry.copy()
+            _merged.full = _complete
+            _merged.blocks = {}
+            for _blockno, _data in _restorer.iter_blocks(_blocks, decompress = False):
+                if _fobj is None:
+                    _fobj = _FOP.openfile_for_write(_FOP.joinpath(destpath, ARCHIVE_FILENAME))
+                _fobj.write(_data)
+                _merged.blocks[_blockno] = (_offset, len(_data))
+                _offset += len(_data)
+            _index[_path] = _merged
+    finally:
+        _restorer.close()
+        if _fobj is not None:
+            _fobj.close()
+    if len(_index) > 0:
+        write_index(destpath, _index)
+
+
+class DeltaEntry(object):
+    """The entry of a file within the index of a snapshot.
+    """
+
+    def __init__(self, size, mtime, mode, uid, gid, blocksize):
+        self.size = size
+        self.mtime = mtime
+        self.mode = mode
+        self.uid = uid
+        self.gid = gid
+        self.blocksize = blocksize
+        # checksums of all blocks (concatenated)
+        self.digests = ""
+        # blocks stored in this snapshot: number of block -> (offset, size)
+        # within the side archive
+        self.blocks = {}
+        # whether all blocks are stored in this snapshot
+        self.full = False
+
+    def copy(self):
+        _entry = DeltaEntry(self.size, self.mtime, self.mode, self.uid, self.gid,
+                            self.blocksize)
+        _entry.digests = self.digests
+        _entry.blocks = dict(self.blocks)
+        _entry.full = self.full
+        return _entry
+
+    def pack(self, path):
+        """Returns the entry of the given path as stored in the index.
+        """
+        _blocks = sorted(self.blocks.iteritems())
+        _data = [_INDEX_ENTRY.pack(len(path), self.size, self.mtime, self.mode, self.uid,
+                                   self.gid, self.blocksize, int(self.full),
+                                   len(self.digests) // _DIGEST_SIZE, len(_blocks)),
+                 path, self.digests]
+        _data.extend([_INDEX_BLOCK.pack(_blockno, _offset, _size)
+                      for _blockno, (_offset, _size) in _blocks])
+        return "".join(_data)
+
+    @classmethod
+    def unpack(cls, data, offset):
+        """Reads the entry stored at the given offset of the index (see `pack`).
+
+        @return: tuple (path, entry, offset of the next entry)
+        @raise struct.error, ValueError: if the index is truncated
+        """
+        _plen, _size, _mtime, _mode, _uid, _gid, _blocksize, _full, _ndigests, _nblocks \
+                = _INDEX_ENTRY.unpack_from(data, offset)
+        _offset = offset + _INDEX_ENTRY.size
+        _end = _offset + _plen + _ndigests * _DIGEST_SIZE
+        if _end > len(data):
+            raise ValueError(_("index is truncated"))
+        _path = data[_offset:_offset + _plen]
+        _entry = cls(_size, _mtime, _mode, _uid, _gid, _blocksize)
+        _entry.full = bool(_full)
+        _entry.digests = data[_offset + _plen:_end]
+        _offset = _end
+        for _idx in xrange(_nblocks):
+            _blockno, _boffset, _bsize = _INDEX_BLOCK.unpack_from(data, _offset)
+            _entry.blocks[_blockno] = (_boffset, _bsize)
+            _offset += _INDEX_BLOCK.size
+        return _path, _entry, _offset
+
+    def get_nblocks(self):
+        return get_nblocks(self.size, self.blocksize)
+
+    def get_digest(self, blockno):
+        return self.digests[blockno * _DIGEST_SIZE:(blockno + 1) * _DIGEST_SIZE]
+
+    def is_unchanged(self, fstats):
+        return self.size == fstats.st_size and self.mtime == fstats.st_mtime
+
+
+class DeltaWriter(object):
+    """Writes the blocks of files changed since the base snapshot into the
+    side archive and the index of the snapshot when closed.
+    """
+
+    def __init__(self, snppath, base_index, blocksize = BLOCK_SIZE):
+        """
+        @param snppath: the directory of the snapshot being written
+        @param base_index: the index of the base snapshot (see `read_index`)
+        @param blocksize: size of blocks the files are split into
+        """
+        self.__logger = log.LogFactory.getLogger()
+        self.__snppath = snppath
+        self.__base_index = base_index
+        self.__blocksize = blocksize
+        self.__index = {}
+        self.__fobj = None
+        self.__offset = 0
+        self.__nunchanged = 0
+        self.__nblocks = 0
+        self.__nstored = 0
+        self.__closed = False
+
+    def __str__(self):
+        return _FOP.joinpath(self.__snppath, ARCHIVE_FILENAME)
+
+    def __write_block(self, data):
+        if self.__fobj is None:
+            self.__fobj = _FOP.openfile_for_write(str(self))
+        _data = zlib.compress(data, COMPRESSION_LEVEL)
+        self.__fobj.write(_data)
+        _pos = (self.__offset, len(_data))
+        self.__offset += len(_data)
+        return _pos
+
+    def add_file(self, path):
+        """Stores the given file. Files that cannot be read are skipped with
+        a warning (as done by TAR).
+        """
+        try:
+            _fstats = os.stat(path)
+            if not stat.S_ISREG(_fstats.st_mode):
+                raise IOError(_("Not a regular file"))
+            _base = self.__base_index.get(path)
+            if _base is not None and _base.blocksize != self.__blocksize:
+                _base = None
+            if _base is not None and _base.is_unchanged(_fstats):
+                _entry = _base.copy()
+                _entry.mode, _entry.uid, _entry.gid = _fstats.st_mode, _fstats.st_uid, _fstats.st_gid
+                _entry.blocks = {}
+                _entry.full = False
+                self.__nunchanged += 1
+            else:
+                _entry = self.__store_file(path, _fstats, _base)
+        except (IOError, OSError), error:
+            self.__logger.warning(_("Unable to store large file '%(file)s': %(error)s")\
+                                  % { 'file' : path, 'error' : error })
+            return
+        self.__index[path] = _entry
+
+    def __store_file(self, path, fstats, base):
+        """Reads the file and stores the blocks that differ from the
+        signature in the base snapshot.
+        """
+        _entry = DeltaEntry(fstats.st_size, fstats.st_mtime, fstats.st_mode,
+                            fstats.st_uid, fstats.st_gid, self.__blocksize)
+        _entry.full = (base is None)
+        _digests = []
+        # the size actually read is stored (the file might have been modified)
+        _size = 0
+        _fobj = open(path, "rb")
+        try:
+            _blockno = 0
+            while True:
+                _data = _fobj.read(self.__blocksize)
+                if not _data:
+                    break
+                _size += len(_data)
+                _digest = get_block_digest(_data)
+                _digests.append(_digest)
+                if base is None or _blockno >= base.get_nblocks()\
+                   or base.get_digest(_blockno) != _digest:
+                    _entry.blocks[_blockno] = self.__write_block(_data)
+                _blockno += 1
+        finally:
+            _fobj.close()
+        _entry.digests = "".join(_digests)
+        _entry.size = _size
+        _newstats = os.stat(path)
+        if _newstats.st_mtime != fstats.st_mtime or _newstats.st_size != fstats.st_size:
+            self.__logger.warning(_("File '%s' was modified while it was stored.") % path)
+        self.__nblocks += len(_digests)
+        self.__nstored += len(_entry.blocks)
+        return _entry
+
+    def close(self):
+        """Closes the side archive and writes the index.
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+        if self.__fobj is not None:
+            self.__fobj.close()
+        if len(self.__index) == 0:
+            return
+        write_index(self.__snppath, self.__index)
+        self.__logger.info(_("Large files stored: %(nfiles)s files (%(nunchanged)s unchanged), %(nstored)s of %(nblocks)s blocks stored (%(size)s bytes).")\
+                           % { "nfiles" : len(self.__index), "nunchanged" : self.__nunchanged,
+                               "nstored" : self.__nstored, "nblocks" : self.__nblocks,
+                               "size" : self.__offset })
+
+    def get_index(self):
+        return self.__index
+
+
+class DeltaRestorer(object):
+    """Restores large files from the given snapshot history. Each block is
+    taken from the most recent snapshot that stored it.
+    """
+
+    def __init__(self, snppaths):
+        """
+        @param snppaths: the directories of the snapshots in the history
+                         (most recent first; see `SnapshotManager.getSnpHistory`)
+        """
+        self.__logger = log.LogFactory.getLogger()
+        self.__snppaths = snppaths
+        # indexes read so far (by position in history)
+        self.__indexes = {}
+
+    def __get_index(self, idx):
+        if idx not in self.__indexes:
+            self.__indexes[idx] = read_index(self.__snppaths[idx])
+        return self.__indexes[idx]
+
+    def get_entry(self, path):
+        """Returns the entry of the given file in the most recent snapshot or
+        None if the file is not stored by this module.
+        """
+        return self.__get_index(0).get(path)
+
+    def list_files(self, path = None):
+        """Returns the files of the most recent snapshot that equal or are
+        contained in the given path (all files if None).
+        """
+        _files = self.__get_index(0).keys()
+        if path is None:
+            return _files
+        _prefix = path.rstrip(os.sep) + os.sep
+        return [_file for _file in _files if _file == path or _file.startswith(_prefix)]
+
+    def locate_blocks(self, path, complete = True):
+        """Returns the location of the blocks of the given file and whether
+        all blocks were found.
+
+        @param complete: whether all blocks must be found within the history
+        @return: tuple (dictionary position in history -> list of (number
+                 of block, offset, size), flag whether all blocks were found)
+        @raise SBException: if the history is not consistent
+        """
+        _nblocks = self.get_entry(path).get_nblocks()
+        _remaining = set(range(_nblocks))
+        _blocks = {}
+        for _idx in range(len(self.__snppaths)):
+            if len(_remaining) == 0:
+                break
+            _entry = self.__get_index(_idx).get(path)
+            if _entry is None:
+                # the previous snapshot stored only the changed blocks
+                raise SBException(_("Unable to restore '%(file)s': the file is missing in snapshot '%(snapshot)s'.")\
+                                  % { 'file' : path, 'snapshot' : self.__snppaths[_idx] })
+            for _blockno, _pos in _entry.blocks.iteritems():
+                if _blockno in _remaining:
+                    _blocks.setdefault(_idx, []).append((_blockno, _pos[0], _pos[1]))
+                    _remaining.discard(_blockno)
+            if _entry.full:
+                break
+        if complete and len(_remaining) > 0:
+            raise SBException(_("Unable to restore '%(file)s': %(nblocks)s blocks are missing in snapshot '%(snapshot)s' and its base snapshots.")\
+                              % { 'file' : path, 'nblocks' : len(_remaining),
+                                  'snapshot' : self.__snppaths[0] })
+        return _blocks, (len(_remaining) == 0)
+
+    def iter_blocks(self, blocks, decompress = True):
+        """Iterates over the given blocks (see `locate_blocks`) yielding
+        tuples (number of block, data). The blocks of each snapshot are read
+        in the order of their offsets.
+        """
+        for _idx in sorted(blocks):
+            _archive = _FOP.joinpath(self.__snppaths[_idx], ARCHIVE_FILENAME)
+            _fobj = _FOP.openfile_for_read(_archive)
+            try:
+                _pos = 0
+                for _blockno, _offset, _size in sorted(blocks[_idx], key = lambda _block: _block[1]):
+                    if _pos < _offset:
+                        self.__skip(_fobj, _pos, _offset)
+                    _data = _fobj.read(_size)
+                    if len(_data) != _size:
+                        raise SBException(_("Side archive `%s` is truncated.") % _archive)
+                    _pos = _offset + _size
+                    if decompress:
+                        try:
+                            _data = zlib.decompress(_data)
+                        except zlib.error, error:
+                            raise SBException(_("Side archive `%(file)s` is corrupted: %(error)s")\
+                                              % { 'file' : _archive, 'error' : error })
+                    yield _blockno, _data
+            finally:
+                _fobj.close()
+
+    def __skip(self, fobj, pos, offset):
+        """Skips the data of the side archive from the current position `pos`
+        up to `offset`. Seeking is absolute since the relative modes of GIO's
+        streams differ from those of files.
+        """
+        if hasattr(fobj, "seek"):
+            fobj.seek(offset)
+        else:
+            size = offset - pos
+            while size > 0:
+                _data = fobj.read(min(size, _READ_SIZE))
+                if not _data:
+                    break
+                size -= len(_data)
+
+    def restore_file(self, path, dest, bckupsuffix = None):
+        """Restores the given file to the (local) path `dest`. The file is
+        written into a temporary file that replaces the destination when
+        complete. Existing files are moved to a backup if a suffix is given.
+
+        @raise SBException: if a block is missing or corrupted
+        """
+        _entry = self.get_entry(path)
+        if _entry is None:
+            raise SBException(_("File '%s' not found in index of large files.") % path)
+        _blocks = self.locate_blocks(path)[0]
+        self.__logger.debug("Restoring '%s' from %s snapshots" % (path, len(_blocks)))
+        _dirname = os.path.dirname(dest)
+        if _dirname and not os.path.isdir(_dirname):
+            os.makedirs(_dirname)
+        _tmpdest = "%s%s" % (dest, _SUFFIX_TMP)
+        _fobj = open(_tmpdest, "wb")
+        try:
+            try:
+                for _blockno, _data in self.iter_blocks(_blocks):
+                    if get_block_digest(_data) != _entry.get_digest(_blockno):
+                        raise SBException(_("Block %(blockno)s of '%(file)s' is corrupted.")\
+                                          % { 'blockno' : _blockno, 'file' : path })
+                    _fobj.seek(_blockno * _entry.blocksize)
+                    _fobj.write(_data)
+                _fobj.truncate(_entry.size)
+            finally:
+                _fobj.close()
+        except:
+            os.remove(_tmpdest)
+            raise
+        self.__set_attributes(_tmpdest, _entry)
+        if bckupsuffix and os.path.lexists(dest):
+            os.rename(dest, "%s%s" % (dest, bckupsuffix))
+        os.rename(_tmpdest, dest)
+
+    def __set_attributes(self, path, entry):
+        if os.geteuid() == 0:
+            try:
+                os.chown(path, entry.uid, entry.gid)
+            except OSError, error:
+                self.__logger.warning(_("Unable to change owner of '%(file)s': %(error)s")\
+                                      % { 'file' : path, 'error' : error })
+        os.chmod(path, stat.S_IMODE(entry.mode))
+        os.utime(path, (entry.mtime, entry.mtime))
+
+    def close(self):
+        self.__indexes = {}
@@ -0,0 +1,469 @@
+#   Simple Backup - index of the members of archives for random access
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+:mod:`memberindex` --- index of the members of archives for random access
+=========================================================================
+
+.. module:: memberindex
+   :synopsis: frame-wise compression and member index of archives
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+When an archive is indexed, TAR writes the uncompressed archive stream which
+is compressed in frames of fixed (uncompressed) size. Each frame is an
+independent gzip resp. bzip2 stream; the concatenated frames are a valid
+compressed archive. The positions of the frames (checkpoints) are stored
+together with the position of each member (as reported by TAR using
+`--block-number`) in the file `files.tar.<ext>.index`.
+
+For extracting single members only the frames containing them are read and
+decompressed. The members are passed to TAR as a (shortened) archive stream.
+Archives without index are read from the beginning as before.
+
+"""
+
+from gettext import gettext as _
+import bisect
+import bz2
+import gzip
+import zlib
+
+from sbackup.fs_backend import fam
+
+from sbackup.ar_backend import chunks
+
+from sbackup.util.exceptions import SBException
+from sbackup.util import constants
+from sbackup.util import log
+
+
+INDEX_SUFFIX = ".index"
+INDEX_HEADER = "# sbackup member index 1"
+
+# uncompressed size of the independently compressed frames
+FRAME_SIZE = 1024 * 1024
+
+# compression level used for gzip frames (same as TAR's, see GZIP env.)
+GZIP_LEVEL = 1
+
+_BLOCK_SIZE = constants.TAR_BLOCKSIZE
+_END_OF_ARCHIVE = "\0" * (2 * _BLOCK_SIZE)
+
+_CHECKPOINT = "C"
+_MEMBER = "M"
+_BLOCK_PREFIX = "block "
+
+_FOP = fam.get_file_operations_facade_instance()
+
+
+def get_index_filename(archive):
+    """Returns the path of the member index belonging to the given archive.
+    """
+    return "%s%s" % (archive, INDEX_SUFFIX)
+
+def has_index(archive):
+    return _FOP.path_exists(get_index_filename(archive))
+
+def supports_index(cformat):
+    """Returns True if archives of the given format can be indexed.
+    """
+    return cformat in ("none", "gzip", "bzip2")
+
+def _compress(cformat, data):
+    if cformat == "gzip":
+        _cobj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return _cobj.compress(data) + _cobj.flush()
+    elif cformat == "bzip2":
+        return bz2.compress(data)
+    return data
+
+def _decompress(cformat, data):
+    if cformat == "gzip":
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    elif cformat == "bzip2":
+        return bz2.decompress(data)
+    return data
+
+
+class IndexedArchiveWriter(object):
+    """File-like object that compresses the written (uncompressed) archive
+    stream in frames and writes them into the given destination. The
+    positions of the frames are recorded.
+    """
+
+    def __init__(self, destination, cformat):
+        """
+        @param destination: file-like object the compressed stream is
+                            written into (e.g. a `chunks.ChunkWriter`)
+        @param cformat: the compression format
+        """
+        if not supports_index(cformat):
+            raise SBException(_("Archives of format '%s' cannot be indexed.") % cformat)
+        self.__dest = destination
+        self.__cformat = cformat
+        self.__buffer = []
+        self.__buffered = 0
+        # list of tuples (uncompressed offset, compressed offset)
+        self.__checkpoints = []
+        self.__usize = 0
+        self.__csize = 0
+        self.__closed = False
+
+    def __str__(self):
+        return "%s (indexed)" % self.__dest
+
+    def __write_frame(self, data):
+        _cdata = _compress(self.__cformat, data)
+        self.__checkpoints.append((self.__usize, self.__csize))
+        self.__dest.write(_cdata)
+        self.__usize += len(data)
+        self.__csize += len(_cdata)
+
+    def write(self, data):
+        self.__buffer.append(data)
+        self.__buffered += len(data)
+        if self.__buffered >= FRAME_SIZE:
+            _data = "".join(self.__buffer)
+            _pos = 0
+            while len(_data) - _pos >= FRAME_SIZE:
+                self.__write_frame(_data[_pos:_pos + FRAME_SIZE])
+                _pos += FRAME_SIZE
+            _data = _data[_pos:]
+            self.__buffer = [_data]
+            self.__buffered = len(_data)
+
+    def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        if self.__buffered > 0:
+            self.__write_frame("".join(self.__buffer))
+        self.__buffer = []
+        self.__buffered = 0
+        self.__dest.close()
+
+    def get_format(self):
+        return self.__cformat
+
+    def get_checkpoints(self):
+        return self.__checkpoints
+
+    def get_size(self):
+        """Returns the uncompressed and the compressed size of the archive.
+        """
+        return (self.__usize, self.__csize)
+
+
+def write_index(archive, writer, memberlist):
+    """Writes the index of the given archive.
+
+    @param writer: the writer the archive was written with
+    @type writer: IndexedArchiveWriter
+    @param memberlist: path of the (local) file TAR's verbose output using
+                       `--block-number` was written into
+    @return: the number of indexed members
+    """
+    _members = open(memberlist, "r")
+    try:
+        return write_member_index(archive, writer, _iter_memberlist(_members))
+    finally:
+        _members.close()
+
+def _iter_memberlist(members):
+    """Yields tuples (block, escaped name) of the members listed by TAR.
+    """
+    for _line in members:
+        # lines look like `block 123: path/of/member`
+        if not _line.startswith(_BLOCK_PREFIX):
+            continue
+        _block, _name = _line[len(_BLOCK_PREFIX):].rstrip("\n").split(": ", 1)
+        yield int(_block), _name
+
+def write_member_index(archive, writer, members):
+    """Writes the index of the given archive.
+
+    @param writer: the writer the archive was written with
+    @type writer: IndexedArchiveWriter
+    @param members: iterable of tuples (block number, name) of the members in
+                    order of the archive; the names are escaped as in TAR's
+                    output using `--quoting-style=escape`
+    @return: the number of indexed members
+    """
+    _usize, _csize = writer.get_size()
+    _fobj = _FOP.openfile_for_write(get_index_filename(archive))
+    _gzobj = gzip.GzipFile(fileobj = _fobj, mode = "wb")
+    _count = 0
+    try:
+        _gzobj.write("%s\n" % INDEX_HEADER)
+        _gzobj.write("%s\t%s\t%s\n" % (writer.get_format(), _usize, _csize))
+        for _checkp in writer.get_checkpoints():
+            _gzobj.write("%s\t%s\t%s\n" % (_CHECKPOINT, _checkp[0], _checkp[1]))
+        for _block, _name in members:
+            _gzobj.write("%s\t%s\t%s\n" % (_MEMBER, _block, _name))
+            _count += 1
+    finally:
+        _gzobj.close()
+        _fobj.close()
+    log.LogFactory.getLogger().debug("Member index written (%s members, %s frames)."\
+                                     % (_count, len(writer.get_checkpoints())))
+    return _count
+
+
+class MemberIndex(object):
+    """The index of the members of an archive.
+    """
+
+    def __init__(self, archive):
+        """
+        @param archive: path of the archive
+        """
+        self.__archive = archive
+        self.__path = get_index_filename(archive)
+
+    def __open(self):
+        _fobj = _FOP.openfile_for_read(self.__path)
+        _gzobj = gzip.GzipFile(fileobj = _fobj, mode = "rb")
+        if _gzobj.readline().rstrip("\n") != INDEX_HEADER:
+            _gzobj.close()
+            _fobj.close()
+            raise SBException(_("Member index `%s` is invalid.") % self.__path)
+        return _fobj, _gzobj
+
+    def get_ranges(self, names, recursive = True):
+        """Looks up the given members.
+
+        @param names: names of the members (leading separators are ignored)
+        @param recursive: if True, the content of given directories is
+                          looked up as well
+        @return: tuple (format, uncompressed size, compressed size, checkpoints,
+                 ranges) where checkpoints is a list of tuples (uncompressed
+                 offset, compressed offset) and ranges is a sorted list of
+                 tuples (start, end) of the members in the uncompressed archive
+        @raise SBException: if a name is not found in the index
+        """
+        _names = set()
+        for _name in names:
+            _names.add(_name.strip(_FOP.pathsep))
+        _found = set()
+        _checkpoints = []
+        _ranges = []
+        _fobj, _gzobj = self.__open()
+        try:
+            _cformat, _usize, _csize = _gzobj.readline().rstrip("\n").split("\t")
+            _usize = int(_usize)
+            _csize = int(_csize)
+            _start = None
+            for _line in _gzobj:
+                _type, _pos, _name = _line.rstrip("\n").split("\t", 2)
+                if _type == _CHECKPOINT:
+                    _checkpoints.append((int(_pos), int(_name)))
+                    continue
+                _offset = int(_pos) * _BLOCK_SIZE
+                if _start is not None:
+                    self.__add_range(_ranges, _start, _offset)
+                    _start = None
+                _name = _name.decode("string_escape").strip(_FOP.pathsep)
+                _match = self.__match(_name, _names, recursive)
+                if _match is not None:
+                    _found.add(_match)
+                    _start = _offset
+            if _start is not None:
+                self.__add_range(_ranges, _start, _usize)
+        finally:
+            _gzobj.close()
+            _fobj.close()
+        _missing = _names - _found
+        if len(_missing) > 0:
+            raise SBException(_("Member `%(member)s` not found in index `%(index)s`.")\
+                              % { "member" : _missing.pop(), "index" : self.__path })
+        return (_cformat, _usize, _csize, _checkpoints, _ranges)
+
+    def __match(self, name, names, recursive):
+        """Returns the given name the member `name` matches or None.
+        """
+        if name in names:
+            return name
+        if recursive:
+            _parent = name
+            while _FOP.pathsep in _parent:
+                _parent = _parent.rsplit(_FOP.pathsep, 1)[0]
+                if _parent in names:
+                    return _parent
+        return None
+
+    def __add_range(self, ranges, start, end):
+        if len(ranges) > 0 and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+
+
+class _RawArchive(object):
+    """Random read access to the (compressed) stream of an archive that is
+    possibly split into parts. Checksums of parts are not verified.
+    """
+
+    def __init__(self, archive):
+        self.__archive = archive
+        self.__dirname = _FOP.get_dirname(archive)
+        # list of tuples (path, start offset, size)
+        self.__files = []
+        if chunks.is_split_archive(archive):
+            _start = 0
+            for _name, _size, _md5 in chunks.read_manifest(archive):
+                self.__files.append((_FOP.joinpath(self.__dirname, _name), _start, _size))
+                _start += _size
+        else:
+            self.__files.append((archive, 0, None))
+        self.__starts = [_file[1] for _file in self.__files]
+        self.__fidx = None
+        self.__fobj = None
+        self.__pos = None
+
+    def __open(self, fidx, offset):
+        self.close()
+        _path, _start, _size = self.__files[fidx]
+        self.__fobj = _FOP.openfile_for_read(_path)
+        if offset > _start:
+            if hasattr(self.__fobj, "seek"):
+                self.__fobj.seek(offset - _start)
+            else:
+                _skip = offset - _start
+                while _skip > 0:
+                    _data = self.__fobj.read(min(_skip, FRAME_SIZE))
+                    if not _data:
+                        break
+                    _skip -= len(_data)
+        self.__fidx = fidx
+        self.__pos = offset
+
+    def read_at(self, offset, size):
+        """Reads `size` bytes (or less at the end of the archive) beginning
+        at the given offset.
+        """
+        if self.__fobj is None or self.__pos != offset:
+            self.__open(bisect.bisect_right(self.__starts, offset) - 1, offset)
+        _bufs = []
+        while size > 0:
+            _data = self.__fobj.read(size)
+            if not _data:
+                if self.__fidx + 1 >= len(self.__files):
+                    break
+                self.__open(self.__fidx + 1, self.__files[self.__fidx + 1][1])
+                continue
+            _bufs.append(_data)
+            size -= len(_data)
+            self.__pos += len(_data)
+        return "".join(_bufs)
+
+    def close(self):
+        if self.__fobj is not None:
+            self.__fobj.close()
+            self.__fobj = None
+
+
+class MemberReader(object):
+    """File-like object providing the archive stream that consists of the
+    given members only (followed by the end-of-archive marker). Only the
+    frames containing the members are read and decompressed.
+    """
+
+    def __init__(self, archive, lookup):
+        """
+        @param archive: path of the archive
+        @param lookup: result of `MemberIndex.get_ranges`
+        """
+        self.__archive = archive
+        self.__cformat, _usize, self.__csize, self.__checkpoints, self.__ranges = lookup
+        self.__ustarts = [_checkp[0] for _checkp in self.__checkpoints]
+        self.__raw = _RawArchive(archive)
+        self.__data = self.__iter_data()
+        self.__buffer = ""
+        self.__nframes = 0
+
+    def __str__(self):
+        return "%s (%s ranges)" % (self.__archive, len(self.__ranges))
+
+    def __read_frame(self, fidx):
+        _ustart, _cstart = self.__checkpoints[fidx]
+        if fidx + 1 < len(self.__checkpoints):
+            _cend = self.__checkpoints[fidx + 1][1]
+        else:
+            _cend = self.__csize
+        self.__nframes += 1
+        return _decompress(self.__cformat, self.__raw.read_at(_cstart, _cend - _cstart))
+
+    def __iter_data(self):
+        _fidx = None
+        _frame = None
+        for _start, _end in self.__ranges:
+            _pos = _start
+            while _pos < _end:
+                _idx = bisect.bisect_right(self.__ustarts, _pos) - 1
+                if _idx < 0:
+                    raise SBException(_("Member index of `%s` is corrupted.") % self.__archive)
+                if _idx != _fidx:
+                    _frame = self.__read_frame(_idx)
+                    _fidx = _idx
+                _fstart = self.__ustarts[_idx]
+                _data = _frame[_pos - _fstart:_end - _fstart]
+                if not _data:
+                    raise SBException(_("Member index of `%s` is corrupted.") % self.__archive)
+                yield _data
+                _pos += len(_data)
+        yield _END_OF_ARCHIVE
+
+    def read(self, size = -1):
+        _bufs = [self.__buffer]
+        _len = len(self.__buffer)
+        while size < 0 or _len < size:
+            try:
+                _data = self.__data.next()
+            except StopIteration:
+                break
+            _bufs.append(_data)
+            _len += len(_data)
+        _data = "".join(_bufs)
+        if size < 0:
+            self.__buffer = ""
+            return _data
+        self.__buffer = _data[size:]
+        return _data[:size]
+
+    def close(self):
+        self.__raw.close()
+        log.LogFactory.getLogger().debug("%s frames of `%s` read." % (self.__nframes, self.__archive))
+
+
+def open_members(archive, names, recursive = True):
+    """Returns a reader (see `MemberReader`) providing the given members of
+    the archive or None if the archive cannot be accessed by means of its
+    index (in this case the archive must be read as a whole).
+    """
+    _logger = log.LogFactory.getLogger()
+    if not has_index(archive):
+        return None
+    try:
+        _lookup = MemberIndex(archive).get_ranges(names, recursive)
+    except Exception, error:
+        _logger.warning(_("Unable to use member index of `%(archive)s`: %(error)s")\
+                        % { "archive" : archive, "error" : error })
+        return None
+    _logger.debug("Reading %s ranges of `%s` by means of the member index."\
+                  % (len(_lookup[4]), archive))
+    return MemberReader(archive, _lookup)
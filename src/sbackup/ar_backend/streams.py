@@ -0,0 +1,473 @@
+#   Simple Backup - streaming of members between TAR archives
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+:mod:`streams` --- streaming of members between TAR archives
+============================================================
+
+.. module:: streams
+   :synopsis: copies members of (compressed) archives into a new archive
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+Members are read from the source archives and written into the destination
+archive as streams, i.e. nothing is extracted into temporary directories.
+Compressed archives are piped through the according (de)compression programs.
+Archives that are split into parts (see module `chunks`) and deduplicated
+archives (see module `dedup`) are supported, archives created using TAR's
+multi-volume mode are not. Sparse members are copied as they are stored
+(i.e. without their holes). If requested, the member index (see module
+`memberindex`) of the written archive is created as well.
+
+"""
+
+from gettext import gettext as _
+import copy
+import subprocess
+import threading
+import shutil
+import tarfile
+import StringIO
+
+from sbackup.fs_backend import fam
+
+from sbackup.ar_backend import tar
+from sbackup.ar_backend import chunks
+from sbackup.ar_backend import dedup
+from sbackup.ar_backend import memberindex
+
+from sbackup.util.exceptions import SBException
+from sbackup.util import log
+
+
+# type of members containing dumpdirs (GNU extension used in incremental archives)
+GNUTYPE_DUMPDIR = "D"
+
+_FOP = fam.get_file_operations_facade_instance()
+
+
+def _copy_stream(src, dst, errors):
+    """Copies all data from `src` into `dst` and closes `dst` afterwards.
+    Exceptions are appended to the list `errors` (used in threads).
+    """
+    try:
+        try:
+            shutil.copyfileobj(src, dst)
+        except Exception, error:
+            errors.append(error)
+    finally:
+        try:
+            dst.close()
+        except Exception, error:
+            errors.append(error)
+
+
+class _PipedProcess(object):
+    """A (de)compression program whose stdin is fed or whose stdout is
+    drained by a thread.
+    """
+
+    def __init__(self, argv, source = None, destination = None):
+        """Either `source` (a file-like object piped into stdin of the
+        program) or `destination` (a file-like object stdout is written into)
+        must be given.
+        """
+        log.LogFactory.getLogger().debug("Launching: %s" % " ".join(argv))
+        self.__errors = []
+        self.__proc = subprocess.Popen(argv, stdin = subprocess.PIPE,
+                                       stdout = subprocess.PIPE, close_fds = True)
+        if source is not None:
+            self.fileobj = self.__proc.stdout
+            _args = (source, self.__proc.stdin, self.__errors)
+        else:
+            self.fileobj = self.__proc.stdin
+            _args = (self.__proc.stdout, destination, self.__errors)
+        self.__thread = threading.Thread(target = _copy_stream, args = _args)
+        self.__thread.setDaemon(True)
+        self.__thread.start()
+
+    def terminate(self):
+        if self.__proc.poll() is None:
+            try:
+                self.__proc.terminate()
+            except OSError:
+                pass
+
+    def wait(self):
+        """Waits for the program and the thread to finish.
+
+        @raise SBException: if the program failed or copying failed
+        """
+        if self.fileobj is self.__proc.stdin:
+            self.__proc.stdin.close()
+        self.__thread.join()
+        _retcode = self.__proc.wait()
+        if self.fileobj is self.__proc.stdout:
+            self.__proc.stdout.close()
+        if len(self.__errors) > 0:
+            raise self.__errors[0]
+        if _retcode != 0:
+            raise SBException(_("Compression program failed with exit code %s.") % _retcode)
+
+
+class ArchiveReader(object):
+    """Reads the members of an archive as stream.
+    """
+
+    def __init__(self, archive):
+        """
+        @param archive: path of the archive; its type is determined by the
+                        file extension
+        """
+        self.__archive = archive
+        self.__proc = None
+        if chunks.is_split_archive(archive):
+            self.__src = chunks.ChunkReader(archive)
+        elif dedup.is_dedup_archive(archive):
+            self.__src = dedup.DedupReader(archive)
+        else:
+            self.__src = _FOP.openfile_for_read(archive)
+
+        _type = tar.getArchiveType(archive)
+        if _type is None:
+            self.__src.close()
+            raise SBException(_("Invalid archive type."))
+        try:
+            if _type in ("tar", dedup.FORMAT):
+                _fobj = self.__src
+            else:
+                self.__proc = _PipedProcess(tar.get_decompress_cmd(_type), source = self.__src)
+                _fobj = self.__proc.fileobj
+            self.__tar = tarfile.open(fileobj = _fobj, mode = "r|")
+        except:
+            self.abort()
+            raise
+
+    def __iter__(self):
+        """Iterator over the members of the archive. The data of the current
+        member is available using `extractfile`.
+        """
+        for _member in self.__tar:
+            _fix_member_name(_member)
+            yield _member
+
+    def extractfile(self, member):
+        return self.__tar.extractfile(member)
+
+    def abort(self):
+        """Closes the archive without checking for errors.
+        """
+        if self.__proc is not None:
+            self.__proc.terminate()
+            try:
+                self.__proc.wait()
+            except Exception:
+                pass
+        self.__src.close()
+
+    def close(self):
+        """Closes the archive.
+
+        @raise SBException: if decompressing the archive failed
+        """
+        if self.__proc is None:
+            self.__src.close()
+        else:
+            # read remaining data to let the decompressor finish
+            _fobj = self.__proc.fileobj
+            while _fobj.read(tarfile.RECORDSIZE):
+                pass
+            self.__proc.wait()
+
+
+class ArchiveWriter(object):
+    """Writes members into an archive as stream.
+    """
+
+    def __init__(self, archive, cformat, nthreads = 1, partsize = 0, indexed = False):
+        """
+        @param archive: path of the archive
+        @param cformat: the compression format (see `tar.ARCHIVE_EXTENSIONS`)
+        @param nthreads: max. number of threads used for compressing
+        @param partsize: if positive, the (compressed) archive is split into
+                         parts of this size (in bytes)
+        @param indexed: if True, the archive is compressed in frames and its
+                        member index is written (see module `memberindex`)
+        @raise SBException: if the archive cannot be split or indexed
+        """
+        if indexed and not memberindex.supports_index(cformat):
+            raise SBException(_("Archives of format '%s' cannot be indexed.") % cformat)
+        self.__archive = archive
+        # tuples (block, name) of the written members (if indexed)
+        self.__members = []
+        self.__indexed = None
+        if partsize > 0:
+            if cformat == "none":
+                raise SBException(_("Uncompressed archives can only be split by TAR itself."))
+            if cformat == dedup.FORMAT:
+                raise SBException(_("Deduplicated archives cannot be split."))
+            self.__dst = chunks.ChunkWriter(archive, partsize)
+        elif cformat == dedup.FORMAT:
+            self.__dst = dedup.DedupWriter(archive)
+        else:
+            self.__dst = _FOP.openfile_for_write(archive)
+        self.__proc = None
+        try:
+            if indexed:
+                self.__indexed = memberindex.IndexedArchiveWriter(self.__dst, cformat)
+                _fobj = self.__indexed
+            elif cformat in ("none", dedup.FORMAT):
+                _fobj = self.__dst
+            else:
+                self.__proc = _PipedProcess(tar.get_compress_cmd(cformat, nthreads),
+                                            destination = self.__dst)
+                _fobj = self.__proc.fileobj
+            self.__tar = tarfile.open(fileobj = _fobj, mode = "w|",
+                                      format = tarfile.GNU_FORMAT)
+        except:
+            self.abort()
+            raise
+
+    def addmember(self, tarinfo, fileobj = None):
+        if self.__indexed is not None:
+            self.__members.append((self.__tar.offset // tarfile.BLOCKSIZE,
+                                   tarinfo.name.encode("string_escape")))
+        self.__tar.addfile(tarinfo, fileobj)
+
+    def abort(self):
+        """Closes the archive without checking for errors.
+        """
+        if self.__proc is not None:
+            self.__proc.terminate()
+            try:
+                self.__proc.wait()
+            except Exception:
+                pass
+        else:
+            self.__dst.close()
+
+    def close(self):
+        """Finishes and closes the archive.
+
+        @raise SBException: if compressing the archive failed
+        """
+        self.__tar.close()
+        if self.__indexed is not None:
+            self.__indexed.close()
+            self.__write_index()
+        elif self.__proc is None:
+            self.__dst.close()
+        else:
+            self.__proc.wait()
+
+    def __write_index(self):
+        """Writes the member index of the archive. Failures are not fatal:
+        the archive is read as a whole when restoring in this case.
+        """
+        try:
+            memberindex.write_member_index(self.__archive, self.__indexed, self.__members)
+        except Exception, error:
+            log.LogFactory.getLogger().warning(_("Unable to write member index of archive: %s")\
+                                               % error)
+
+
+def _fix_member_name(member):
+    """Removes the prefix wrongly prepended to the name of members with
+    GNU headers. In GNU headers the prefix field of POSIX headers holds
+    access and change time of incremental archives, but module `tarfile`
+    takes it as prefix of the name.
+    """
+    _buf = member.buf
+    if member.type in tarfile.GNU_TYPES or _buf[257:265] != tarfile.GNU_MAGIC:
+        return
+    _prefix = tarfile.nts(_buf[345:500])
+    if _prefix and member.name.startswith("%s/" % _prefix):
+        member.name = member.name[len(_prefix) + 1:]
+
+def _normpath(path):
+    return path.strip(_FOP.pathsep)
+
+def _get_dumpdir_data(dumpdirs):
+    """Returns the data of a dumpdir member containing the given Dumpdirs.
+    """
+    _entries = ["%s%s\0" % (_ddir.getControl(), _ddir.getFilename()) for _ddir in dumpdirs]
+    _entries.append("\0")
+    return "".join(_entries)
+
+class _SparseTarInfo(tarfile.TarInfo):
+    """A sparse member written in the (old) GNU sparse format. Only the data
+    sections are stored; their positions are written into the header and
+    into extension headers if there are more than 4 sections. Module
+    `tarfile` reads but does not write this format.
+    """
+
+    # number of sections in the header resp. in an extension header
+    __NHEADER = 4
+    __NEXTENDED = 21
+
+    def __init__(self, member):
+        """
+        @param member: the sparse member as read by module `tarfile`
+        """
+        tarfile.TarInfo.__init__(self, member.name)
+        self.__dict__.update(member.__dict__)
+        self.realsize = member.size
+        self.sections = []
+        for _section in member.sparse:
+            # holes do not have a position within the stored data; empty
+            # sections are read from unused fields of the header
+            if hasattr(_section, "realpos") and _section.size > 0:
+                self.sections.append((_section.offset, _section.size))
+        _last = (0, 0)
+        if len(self.sections) > 0:
+            _last = self.sections[-1]
+        if _last[0] + _last[1] < self.realsize:
+            # the size of files ending with a hole is marked by an empty section
+            self.sections.append((self.realsize, 0))
+        self.size = sum([_size for _offset, _size in self.sections])
+
+    def get_data_member(self):
+        """Returns a member for reading the stored data sections as they are.
+        """
+        _member = copy.copy(self)
+        _member.__class__ = tarfile.TarInfo
+        _member.type = tarfile.REGTYPE
+        _member.sparse = None
+        return _member
+
+    def tobuf(self, format = tarfile.DEFAULT_FORMAT, encoding = tarfile.ENCODING,
+              errors = "strict"):
+        _buf = tarfile.TarInfo.tobuf(self, format, encoding, errors)
+        _header = _buf[-tarfile.BLOCKSIZE:]
+        _sections = self.sections[:self.__NHEADER]
+        _remaining = self.sections[self.__NHEADER:]
+        _header = "%s%s%s%s%s" % (_header[:386], self.__get_sections(_sections, self.__NHEADER),
+                                  chr(len(_remaining) > 0),
+                                  tarfile.itn(self.realsize, 12, tarfile.GNU_FORMAT),
+                                  _header[495:])
+        _header = "%s        %s" % (_header[:148], _header[156:])
+        _chksum = tarfile.calc_chksums(_header)[0]
+        _header = "%s%06o\0%s" % (_header[:148], _chksum, _header[155:])
+        _res = [_buf[:-tarfile.BLOCKSIZE], _header]
+        while len(_remaining) > 0:
+            _sections = _remaining[:self.__NEXTENDED]
+            _remaining = _remaining[self.__NEXTENDED:]
+            _res.append("%s%s%s" % (self.__get_sections(_sections, self.__NEXTENDED),
+                                    chr(len(_remaining) > 0), tarfile.NUL * 7))
+        return "".join(_res)
+
+    def __get_sections(self, sections, count):
+        _res = []
+        for _offset, _size in sections:
+            _res.append(tarfile.itn(_offset, 12, tarfile.GNU_FORMAT))
+            _res.append(tarfile.itn(_size, 12, tarfile.GNU_FORMAT))
+        _res.append(tarfile.NUL * (24 * (count - len(sections))))
+        return "".join(_res)
+
+
+def _copy_member(reader, writer, member):
+    """Copies the given member (including its data) from `reader` into `writer`.
+    Sparse members are copied as they are stored.
+    """
+    _fobj = None
+    if member.issparse():
+        member = _SparseTarInfo(member)
+        _fobj = reader.extractfile(member.get_data_member())
+    elif member.isreg() or member.type == GNUTYPE_DUMPDIR:
+        _fobj = reader.extractfile(member)
+    writer.addmember(member, _fobj)
+
+def write_consolidated_archive(archive, cformat, sources, dircontents,
+                               nthreads = 1, partsize = 0, indexed = False):
+    """Writes an archive containing the members of several (incremental)
+    archives without extracting them.
+
+    @param archive: path of the archive to write
+    @param cformat: the compression format of the archive
+    @param sources: list of tuples (path of archive, paths to copy) in
+                    order of the snapshot history (i.e. the most recent archive
+                    first). All members of the first archive are copied
+                    (the paths are ignored), from the other archives only the
+                    members that are not directories and whose path is
+                    contained in the given paths (a collection of paths as
+                    stored in snapshot files).
+    @param dircontents: object providing method `getContent(dirpath)` and
+                        `hasPath(dirpath)` (e.g. `tar.SnapshotContentMap`)
+                        with the content of the resulting snapshot file; it
+                        is used to rewrite the dumpdirs of directories
+    @param nthreads: max. number of threads used for compressing
+    @param partsize: if positive, the (compressed) archive is split into
+                     parts of this size (in bytes)
+    @param indexed: if True, the member index of the archive is written
+                    (see `ArchiveWriter`)
+
+    @return: number of members written
+    @raise SBException: if reading or writing an archive failed
+    """
+    _logger = log.LogFactory.getLogger()
+    _count = 0
+    _writer = ArchiveWriter(archive, cformat, nthreads, partsize, indexed)
+    try:
+        for _idx, (_srcar, _paths) in enumerate(sources):
+            _logger.info(_("Copying members of archive `%s`.") % _srcar)
+            if _idx > 0:
+                _paths = set([_normpath(_path) for _path in _paths])
+            _reader = ArchiveReader(_srcar)
+            try:
+                try:
+                    _count += _copy_members(_reader, _writer, _idx == 0, _paths, dircontents)
+                except tarfile.TarError, error:
+                    raise SBException(_("Unable to read archive `%(archive)s`: %(error)s")
+                                      % { "archive" : _srcar, "error" : error })
+            except:
+                _reader.abort()
+                raise
+            _reader.close()
+    except:
+        _writer.abort()
+        raise
+    _writer.close()
+    _logger.debug("%s members written into archive `%s`." % (_count, archive))
+    return _count
+
+def _copy_members(reader, writer, is_first, paths, dircontents):
+    """Copies the members of the archive opened by `reader` into `writer`
+    (see `write_consolidated_archive`).
+
+    @return: the number of copied members
+    """
+    _count = 0
+    for _member in reader:
+        _name = _normpath(_member.name)
+        if is_first:
+            if _member.type == GNUTYPE_DUMPDIR:
+                _dirname = _FOP.joinpath(_FOP.pathsep, _name)
+                if not dircontents.hasPath(_dirname):
+                    _dirname = _name
+                if dircontents.hasPath(_dirname):
+                    _data = _get_dumpdir_data(dircontents.getContent(_dirname))
+                    _member.size = len(_data)
+                    writer.addmember(_member, StringIO.StringIO(_data))
+                    _count += 1
+                    continue
+        elif _member.isdir() or _member.type == GNUTYPE_DUMPDIR or \
+             _name not in paths:
+            continue
+        _copy_member(reader, writer, _member)
+        _count += 1
+    return _count
+
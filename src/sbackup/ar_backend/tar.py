@@ -33,8 +33,10 @@ import time
 import os
 import subprocess
 import tempfile
-import shutil
 import re
+import types
+import struct
+import hashlib
 
 from datetime import datetime
 
@@ -53,10 +55,46 @@ from sbackup import util
 from sbackup.util import local_file_utils
 from sbackup.util import structs
 from sbackup.util import log
+from sbackup.util import progress
+
+from sbackup.ar_backend import chunks
+from sbackup.ar_backend import dedup
+from sbackup.ar_backend import memberindex
+from sbackup.ar_backend import transfer
 
 
 GZIP_COMPRESSION_SPEED = "-1"
 
+# compression formats: format -> extension of the archive
+ARCHIVE_EXTENSIONS = { "none" : "",
+                       "gzip" : ".gz",
+                       "bzip2" : ".bz2",
+                       "xz" : ".xz",
+                       "zstd" : ".zst",
+                       dedup.FORMAT : dedup.EXTENSION }
+
+# TAR options for (de)compressing using a single thread: format -> options
+_COMPRESS_OPTS = { "gzip" : ["--gzip"],
+                   "bzip2" : ["--bzip2"],
+                   "xz" : ["--xz"],
+                   "zstd" : ["--zstd"] }
+
+# compression programs using several threads: format -> (program, options);
+# the number of threads is substituted into the options
+_PARALLEL_COMPRESSORS = { "gzip" : ("pigz", ["-p", "%(threads)s", GZIP_COMPRESSION_SPEED]),
+                          "bzip2" : ("pbzip2", ["-p%(threads)s"]),
+                          "xz" : ("xz", ["-T", "%(threads)s"]),
+                          "zstd" : ("zstd", ["-T%(threads)s"]) }
+
+# compression programs using a single thread: format -> (program, options)
+_COMPRESSORS = { "gzip" : ("gzip", [GZIP_COMPRESSION_SPEED]),
+                 "bzip2" : ("bzip2", []),
+                 "xz" : ("xz", []),
+                 "zstd" : ("zstd", ["-q"]) }
+
+
+# max. time (seconds) to wait for the end of TAR's stderr
+_STDERR_JOIN_TIMEOUT = 10
 
 _FOP = fam.get_file_operations_facade_instance()
 
@@ -65,7 +103,7 @@ def getArchiveType(archive):
     """Determines the type of an archive by its file extension.
      
     @param archive: Full path to file to check  
-    @return: tar, gzip, bzip2 or None
+    @return: tar, gzip, bzip2, xz, zstd, dedup or None
     @rtype: String
     """
     _res = None
@@ -73,10 +111,99 @@ def getArchiveType(archive):
         _res = "bzip2"
     elif archive.endswith(".gz") or archive.endswith(".tgz"):
         _res = "gzip"
+    elif archive.endswith(".xz") or archive.endswith(".txz"):
+        _res = "xz"
+    elif archive.endswith(".zst") or archive.endswith(".tzst"):
+        _res = "zstd"
     elif archive.endswith(".tar"):
         _res = "tar"
+    elif dedup.is_dedup_archive(archive):
+        _res = dedup.FORMAT
     return _res
 
+def get_archive_name(cformat):
+    """Returns the name of the archive within snapshots of given
+    compression format (e.g. `files.tar.gz`).
+    
+    @raise SBException: if the format is unknown
+    """
+    if cformat not in ARCHIVE_EXTENSIONS:
+        raise SBException(_("Invalid compression format: %s") % cformat)
+    return "files.tar%s" % ARCHIVE_EXTENSIONS[cformat]
+
+def get_compress_opts(cformat, nthreads = 1):
+    """Returns the TAR options for compressing archives of the given format
+    using (up to) `nthreads` threads. TAR pipes the archive into a program
+    that compresses using several threads if available, otherwise TAR's
+    built-in compression is used.
+    
+    Deduplicated archives are written uncompressed since the chunks are
+    compressed by the chunk store (see module `dedup`).
+    
+    @raise SBException: if the format is unknown
+    """
+    if cformat in ("none", dedup.FORMAT):
+        return []
+    if cformat not in _COMPRESS_OPTS:
+        raise SBException(_("Invalid compression format: %s") % cformat)
+
+    if nthreads > 1:
+        _program, _args = _PARALLEL_COMPRESSORS[cformat]
+        # the full path is required since TAR is launched with an empty environment
+        _path = system.which(_program)
+        if _path is not None:
+            _args = [_arg % { "threads" : nthreads } for _arg in _args]
+            return ["--use-compress-program=%s" % " ".join([_path] + _args)]
+        LogFactory.getLogger().warning(_("Program `%s` for compressing using several threads not found.")\
+                                       % _program)
+    return list(_COMPRESS_OPTS[cformat])
+
+def get_decompress_opts(archtype):
+    """Returns the TAR options for decompressing archives of the given type
+    (as returned by `getArchiveType`).
+    
+    @raise SBException: if the type is unknown
+    """
+    if archtype in ("tar", dedup.FORMAT):
+        return []
+    if archtype not in _COMPRESS_OPTS:
+        raise SBException (_("Invalid archive type."))
+    return list(_COMPRESS_OPTS[archtype])
+
+def get_compress_cmd(cformat, nthreads = 1):
+    """Returns the command line of the program that compresses data of
+    the given format from stdin to stdout (using up to `nthreads` threads
+    if the according program is available).
+    
+    @raise SBException: if the format is unknown or no program was found
+    """
+    if cformat not in _COMPRESSORS:
+        raise SBException(_("Invalid compression format: %s") % cformat)
+    if nthreads > 1:
+        _program, _args = _PARALLEL_COMPRESSORS[cformat]
+        _path = system.which(_program)
+        if _path is not None:
+            return [_path] + [_arg % { "threads" : nthreads } for _arg in _args] + ["-c"]
+    _program, _args = _COMPRESSORS[cformat]
+    _path = system.which(_program)
+    if _path is None:
+        raise SBException(_("Program `%s` for compressing not found.") % _program)
+    return [_path] + _args + ["-c"]
+
+def get_decompress_cmd(archtype):
+    """Returns the command line of the program that decompresses archives
+    of the given type (as returned by `getArchiveType`) from stdin to stdout.
+    
+    @raise SBException: if the type is unknown or no program was found
+    """
+    if archtype not in _COMPRESSORS:
+        raise SBException (_("Invalid archive type."))
+    _program, _args = _COMPRESSORS[archtype]
+    _path = system.which(_program)
+    if _path is None:
+        raise SBException(_("Program `%s` for decompressing not found.") % _program)
+    return [_path, "-d", "-c"]
+
 def extract(sourcear, eff_local_sourcear, restore_file, dest , bckupsuffix = None, splitsize = None):
     """Extract from source archive the file "file" to dest.
     
@@ -87,25 +214,70 @@ def extract(sourcear, eff_local_sourcear, restore_file, dest , bckupsuffix = Non
     @param splitsize: If set the split options are added supposing the size of the archives is this variable
     @type splitsize: Integer in 1024 Bytes
     """
+    restore_file = restore_file.lstrip(_FOP.pathsep)    # strip leading separator (as TAR did before)
+    __extract(sourcear, eff_local_sourcear, [restore_file], [restore_file], dest, bckupsuffix,
+              splitsize)
+
+
+def extract_files(sourcear, eff_local_sourcear, restore_files, dest, bckupsuffix = None,
+                  splitsize = None, recursive = True, launcher = None):
+    """Extract the given files from source archive to dest. All files are
+    extracted in a single pass, i.e. the archive is read only once. The names
+    are given to TAR as null-terminated list in a temporary file.
+    
+    @param sourcear: path of archive
+    @param restore_files: list of paths (as stored in the snapshot)
+    @param dest: directory to extract into (the root directory if None)
+    @param bckupsuffix: If set a backup suffix option is set to backup existing files
+    @param splitsize: If set the split options are added supposing the size of the archives is this variable
+    @type splitsize: Integer in 1024 Bytes
+    @param recursive: If False only the given members are extracted but not
+                      the content of given directories
+    @param launcher: the launcher used for TAR (the singleton if None); give
+                     a `TarBackendLauncher` for running several extractions
+                     concurrently
+    """
+    _names = [_file.lstrip(_FOP.pathsep) for _file in restore_files]
+    _fd, _fileslist = tempfile.mkstemp(prefix = "restore_", suffix = ".list",
+                                       dir = ConfigurationFileHandler().get_user_tempdir())
+    try:
+        os.write(_fd, "".join(["%s\0" % _name for _name in _names]))
+    finally:
+        os.close(_fd)
+    LogFactory.getLogger().debug("%s files to extract listed in `%s`" % (len(_names), _fileslist))
+    _opts = ["--null", "--no-unquote", "--files-from=%s" % _fileslist]
+    if not recursive:
+        _opts.insert(0, "--no-recursion")
+    try:
+        __extract(sourcear, eff_local_sourcear, _names, _opts, dest, bckupsuffix, splitsize,
+                  launcher, recursive)
+    finally:
+        __remove_tempfiles([_fileslist])
+
+
+def __extract(sourcear, eff_local_sourcear, names, names_opts, dest, bckupsuffix, splitsize,
+              launcher = None, recursive = True):
+    """Launches TAR for extracting from source archive. If the archive has
+    a member index, only the parts of the archive containing the members
+    are read (see module `memberindex`).
+    
+    @param names: the names of the members to extract
+    @param names_opts: the names of the members to extract resp. the options
+                       giving them
+    """
     _logger = log.LogFactory().getLogger()
     _logger.debug("input param `sourcear`: %s" % sourcear)
     _logger.debug("input param `eff_local_sourcear`: %s" % eff_local_sourcear)
-    restore_file = restore_file.lstrip(_FOP.pathsep)    # strip leading separator (as TAR did before)
     # tar option  -p, --same-permissions, --preserve-permissions:
     # ignore umask when extracting files (the default for root)
 
     options = ["-xp", "--ignore-failed-read", "--backup=existing", "--totals"]
 
-    archType = getArchiveType(sourcear)
-    _logger.debug("Archive type: %s" % archType)
-    if archType == "tar" :
-        pass
-    elif archType == "gzip" :
-        options.insert(1, "--gzip")
-    elif archType == "bzip2" :
-        options.insert(1, "--bzip2")
-    else :
-        raise SBException (_("Invalid archive type."))
+    _members = memberindex.open_members(sourcear, names, recursive)
+    if _members is None:
+        archType = getArchiveType(sourcear)
+        _logger.debug("Archive type: %s" % archType)
+        options[1:1] = get_decompress_opts(archType)
 
     if system.is_superuser():
         options.append("--same-owner")
@@ -116,18 +288,30 @@ def extract(sourcear, eff_local_sourcear, restore_file, dest , bckupsuffix = Non
     if bckupsuffix :
         options.append("--suffix=" + bckupsuffix)
 
-    if splitsize > 0:
+    _split_stream = chunks.is_split_archive(sourcear)
+    if splitsize > 0 and not _split_stream and _members is None:
         options.extend(["-L %s" % splitsize , "-F %s" % util.get_resource_file("multipleTarScript")])
         if eff_local_sourcear is None:
             raise exceptions.FileAccessException(_("Effective path for `%s` is not available") % sourcear)
 
-    _launcher = TarBackendLauncherSingleton()
-    if eff_local_sourcear is None:
+    _launcher = launcher
+    if _launcher is None:
+        _launcher = TarBackendLauncherSingleton()
+    if _members is not None:
+        # only the uncompressed members are passed to TAR
+        _launcher.set_stdin_file(_members)
+    elif _split_stream:
+        # the parts are reassembled while streaming into TAR
+        _launcher.set_stdin_file(chunks.ChunkReader(sourcear))
+    elif dedup.is_dedup_archive(sourcear):
+        # the chunks are read from the store while streaming into TAR
+        _launcher.set_stdin_file(dedup.DedupReader(sourcear))
+    elif eff_local_sourcear is None:
         _launcher.set_stdin_file(sourcear)
     else:
         options.append("--file=%s" % eff_local_sourcear)
 
-    options.append(restore_file)
+    options.extend(names_opts)
 
     _launcher.launch_sync(options, env = {})
     retVal = _launcher.get_returncode()
@@ -137,60 +321,6 @@ def extract(sourcear, eff_local_sourcear, restore_file, dest , bckupsuffix = Non
     __finish_tar(retVal, outstr, errStr)
 
 
-# extract2 is currently (series 0.2) only used in SnapshotManager.makeTmpTAR
-def extract2(sourcear, fileslist, dest, bckupsuffix = None, additionalOpts = None):
-    """Extract the files listed in the 'fileslist' file to dest. This method 
-    has been created to optimize the time spent by giving to tar a complete 
-    list of file to extract.
-    
-    Use this if ever you have to extract more than 1 dir .
-    
-    @param sourcear:
-    @param fileslist: a path to the file containing the list
-    @param dest: destination
-    @param bckupsuffix: 
-    @param additionalOpts: a list of options to add
-    """
-    # tar option  -p, --same-permissions, --preserve-permissions:
-    # ignore umask when extracting files (the default for root)
-    options = ["-xp", "--ignore-failed-read", '--backup=existing']
-
-    archType = getArchiveType(sourcear)
-    if archType == "tar" :
-        pass
-    elif archType == "gzip" :
-        options.insert(1, "--gzip")
-    elif archType == "bzip2" :
-        options.insert(1, "--bzip2")
-    else :
-        raise SBException (_("Invalid archive type."))
-
-    if system.is_superuser():
-        options.append("--same-owner")
-
-    if dest:
-        options.append("--directory=" + dest)
-    else:
-        options.append("--directory=" + _FOP.pathsep)
-
-    if bckupsuffix:
-        options.append("--suffix=" + bckupsuffix)
-
-    if additionalOpts and type(additionalOpts) == list:
-        options.extend(additionalOpts)
-
-    options.extend(['--file=' + sourcear, '--null',
-                    '--files-from=' + _FOP.normpath(fileslist)])
-
-    outStr, errStr, retval = util.launch("tar", options)
-    if retval != 0 :
-        LogFactory.getLogger().debug("output was : " + outStr)
-        raise SBException("Error when extracting : " + errStr)
-    if outStr.strip() == "":
-        outStr = "(nothing)"
-    LogFactory.getLogger().debug("output was: " + outStr)
-
-
 def appendToTarFile(desttar, fileslist, workingdir, additionalOpts):
     """
     @param desttar: The tar file to wich append
@@ -202,14 +332,7 @@ def appendToTarFile(desttar, fileslist, workingdir, additionalOpts):
     options = ["--append", "--ignore-failed-read"]
 
     archType = getArchiveType(desttar)
-    if archType == "tar" :
-        pass
-    elif archType == "gzip" :
-        options.insert(1, "--gzip")
-    elif archType == "bzip2" :
-        options.insert(1, "--bzip2")
-    else :
-        raise SBException (_("Invalid archive type."))
+    options[1:1] = get_decompress_opts(archType)
 
     if additionalOpts and type(additionalOpts) == list :
         options.extend(additionalOpts)
@@ -230,11 +353,15 @@ def appendToTarFile(desttar, fileslist, workingdir, additionalOpts):
     LogFactory.getLogger().debug("output was: " + outStr)
 
 
-def __prepare_common_opts(snapshot, targethandler, publish_progress, use_io_pipe):
+def __prepare_common_opts(snapshot, targethandler, publish_progress, use_io_pipe,
+                          memberlist = None):
     """Prepares common TAR options used when full or incremental
     backups are being made.  
     
     :param snapshot: The snapshot to fill in
+    :param memberlist: if given, the archive is written uncompressed (it is
+                       compressed by an `memberindex.IndexedArchiveWriter`)
+                       and the members are listed in this file
     :return: a list of options to be use to launch tar
     
     :todo: Check whether it's necessary to escape white spaces in path names!
@@ -253,9 +380,9 @@ def __prepare_common_opts(snapshot, targethandler, publish_progress, use_io_pipe
               ]
 
     # includes and excludes
-    tmp_incl = _FOP.normpath(ConfigurationFileHandler().get_user_tempdir(),
+    tmp_incl = _FOP.normpath(snapshot.get_tempdir(),
                                  _FOP.get_basename(snapshot.getIncludeFListFile()))
-    tmp_excl = _FOP.normpath(ConfigurationFileHandler().get_user_tempdir(),
+    tmp_excl = _FOP.normpath(snapshot.get_tempdir(),
                                  _FOP.get_basename(snapshot.getExcludeFListFile()))
 
     LogFactory.getLogger().debug("Temporary includes file: `%s`" % tmp_incl)
@@ -272,17 +399,16 @@ def __prepare_common_opts(snapshot, targethandler, publish_progress, use_io_pipe
     if snapshot.isFollowLinks() :
         options.append("--dereference")
 
-    archivename = "files.tar"
-    if snapshot.getFormat() == "gzip":
-        options.insert(0, "--gzip")
-        archivename += ".gz"
-    elif snapshot.getFormat() == "bzip2":
-        options.insert(0, "--bzip2")
-        archivename += ".bz2"
-    elif snapshot.getFormat() == "none":
-        pass
-    else:
+    _cformat = snapshot.getFormat()
+    if _cformat not in ARCHIVE_EXTENSIONS:
         LogFactory.getLogger().debug("Setting compression to default 'none'")
+        _cformat = "none"
+    archivename = get_archive_name(_cformat)
+    if memberlist is None:
+        options[0:0] = get_compress_opts(_cformat, snapshot.get_compress_threads())
+    else:
+        options.extend(["--block-number", "--verbose", "--quoting-style=escape",
+                        "--index-file=%s" % memberlist])
 
     _ar_path = _FOP.normpath(tdir, archivename)
     if use_io_pipe:
@@ -294,34 +420,11 @@ def __prepare_common_opts(snapshot, targethandler, publish_progress, use_io_pipe
             raise exceptions.FileAccessException(_("Unable to get effective path for `%s`") % _ar_path)
         options.append('--file=%s' % _larpath)
 
-    # progress signal
-#TODO: improve calculation of number of checkpoints based on estimated transfer rate.
-    if publish_progress is True:
-        one_mb = 1000000
-        one_gb = 1000 * one_mb
-        _snpsize = snapshot.get_space_required()
-        if _snpsize < (50 * one_mb):
-            _ncheckp = 10
-        elif _snpsize < (500 * one_mb):
-            _ncheckp = 50
-        elif _snpsize < (5 * one_gb):
-            _ncheckp = 250
-        else:
-            _ncheckp = 500
-
-        _checkpsize = _snpsize / _ncheckp
-        _checkp = int(_checkpsize / constants.TAR_RECORDSIZE)
-        if _checkp > 0:
-            # LP: #875634
-            # Sometimes the calculation of the space required goes badly wrong
-            # and we could end-up with _checkp=1 for 30GB to save, making tar
-            # VERY slow. Fix: set minimum value to 100
-            _checkp = max(100, _checkp)
-            options.append("--checkpoint=%s" % _checkp)
-            _progessf = util.get_resource_file(resource_name = "sbackup-progress")
-            options.append('--checkpoint-action=exec=%s' % _progessf)
-
-    if LogFactory.getLogger().isEnabledFor(5):
+    # progress is echoed by TAR and read within this process
+    if publish_progress is not None:
+        options.extend(progress.get_checkpoint_opts())
+
+    if LogFactory.getLogger().isEnabledFor(5) and memberlist is None:
         options.append("--verbose")
 
     return (options, _ar_path, tmp_incl, tmp_excl)
@@ -329,8 +432,9 @@ def __prepare_common_opts(snapshot, targethandler, publish_progress, use_io_pipe
 
 def __add_split_opts(snapshot, options, size):
     """
-    Compiles and add the split management options to the TAR line.
-    Valid for read and create actions
+    Compiles and add the split management options to the TAR line
+    (TAR's multi-volume mode). Valid for read and create actions.
+    Compressed archives are split using `__use_split_stream` instead.
     @param snapshot: The snapshot to process
     @type snapshot: Snapshot
     @param options: the option in which to append
@@ -340,11 +444,92 @@ def __add_split_opts(snapshot, options, size):
     @raise SBException: if the snapshot format is other than none
     """
     if snapshot.getFormat() != "none" :
-        raise SBException(_("For the moment split functionality is not compatible with compress option."))
+        raise SBException(_("Multi-volume archives are only supported for uncompressed snapshots."))
     options.extend(["-L %s" % str(size), "-F %s" % util.get_resource_file("multipleTarScript")])
     return options
 
 
+def __use_split_stream(snapshot):
+    """Returns True if the archive of the given snapshot is split after
+    compression, i.e. the compressed stream written by TAR is cut into parts
+    (see module `chunks`). Uncompressed archives are split using TAR's
+    multi-volume mode. Deduplicated archives are not split.
+    """
+    return snapshot.getSplitedSize() > 0 and snapshot.getFormat() not in ("none", dedup.FORMAT)
+
+
+def __use_dedup(snapshot):
+    """Returns True if the archive of the given snapshot is stored in the
+    chunk store of the target (see module `dedup`).
+    """
+    return snapshot.getFormat() == dedup.FORMAT
+
+
+def __use_member_index(snapshot):
+    """Returns True if a member index is written for the archive of the
+    given snapshot (see module `memberindex`). The archive is compressed in
+    frames by sbackup in this case; archives compressed using several threads
+    and multi-volume archives are not indexed.
+    """
+    _cformat = snapshot.getFormat()
+    if not snapshot.get_member_index() or not memberindex.supports_index(_cformat):
+        return False
+    if _cformat == "none":
+        return snapshot.getSplitedSize() == 0
+    return snapshot.get_compress_threads() <= 1
+
+
+def __get_archive_writer(snapshot, ar_path, split_stream, memberlist):
+    """Returns the destination TAR's output is written into or None if TAR
+    writes the archive itself.
+    """
+    _writer = None
+    if __use_dedup(snapshot):
+        _writer = dedup.DedupWriter(ar_path)
+    elif split_stream:
+        _writer = chunks.ChunkWriter(ar_path, snapshot.getSplitedSize() * constants.TAR_VOLUME_SIZE_UNIT_IN_BYTES)
+    if memberlist is not None:
+        if _writer is None:
+            _writer = _FOP.openfile_for_write(ar_path)
+        _writer = memberindex.IndexedArchiveWriter(_writer, snapshot.getFormat())
+    return _writer
+
+
+def __get_memberlist(snapshot):
+    """Returns the path of the temporary file TAR lists the members in or
+    None if no member index is written.
+    """
+    _memberlist = None
+    if __use_member_index(snapshot):
+        _memberlist = _FOP.normpath(snapshot.get_tempdir(),
+                                    "%s.members" % get_archive_name(snapshot.getFormat()))
+    return _memberlist
+
+
+def __commit_member_index(ar_path, writer, memberlist):
+    """Writes the member index of the archive. Failures are not fatal: the
+    archive is read as a whole when restoring in this case.
+    """
+    if not isinstance(writer, memberindex.IndexedArchiveWriter):
+        return
+    try:
+        memberindex.write_index(ar_path, writer, memberlist)
+    except Exception, error:
+        LogFactory.getLogger().warning(_("Unable to write member index of archive: %s") % error)
+
+
+def __get_progress_engine(snapshot, publish_progress):
+    if publish_progress is None:
+        return None
+    _total = snapshot.get_space_required()
+    if _total <= 0:
+        _total = progress.UNKNOWN
+    return progress.ProgressEngine(_total, publish_progress)
+
+def __finish_progress(engine):
+    if engine is not None:
+        engine.finish()
+
 def __copy_temp_snarfile_into_snapshot(tmp_snarfile, snarfile):
     try:
         _FOP.copyfile(tmp_snarfile, snarfile)
@@ -363,6 +548,13 @@ def __remove_tempfiles(tmp_files):
 
 
 def mk_archive(snapshot, targethandler, publish_progress, supports_publish):
+    """Creates the archive of the given snapshot.
+
+    @param publish_progress: callable the progress (`progress.ProgressInfo`)
+                             is passed to or None
+    @param supports_publish: whether the target supports publishing the
+                             progress of multi-volume archives
+    """
     if snapshot.isfull():
         _mk_tar_full(snapshot, targethandler, publish_progress, supports_publish)
     else:
@@ -381,20 +573,28 @@ def _mk_tar_incr(snapshot, targethandler, publish_progress, supports_publish):
              "TAR_OPTIONS" : "--no-wildcards --anchored --no-wildcards-match-slash" }
     _use_io_pipe = targethandler.get_use_iopipe()
     _splitsize = snapshot.getSplitedSize()
-    if _splitsize > 0:
+    _split_stream = __use_split_stream(snapshot)
+    _memberlist = __get_memberlist(snapshot)
+    if _split_stream or _memberlist is not None or __use_dedup(snapshot):
+        _use_io_pipe = True
+    elif _splitsize > 0:
         _use_io_pipe = False
-        publish_progress = publish_progress and supports_publish
-        _env["SBACKUP_VOLUME_SIZE"] = str(_splitsize * constants.TAR_VOLUME_SIZE_UNIT_IN_BYTES)
+        if not supports_publish:
+            publish_progress = None
 
     options, ar_path, tmp_incl, tmp_excl = __prepare_common_opts(snapshot, targethandler,
-                                                                 publish_progress, _use_io_pipe)
+                                                                 publish_progress, _use_io_pipe,
+                                                                 _memberlist)
+    _tmp_files = [tmp_incl, tmp_excl]
+    if _memberlist is not None:
+        _tmp_files.append(_memberlist)
 
-    if _splitsize > 0:
+    if _splitsize > 0 and not _split_stream:
         options = __add_split_opts(snapshot, options, _splitsize)
 
     base_snarfile = snapshot.getBaseSnapshot().getSnarFile()
     snarfile = snapshot.getSnarFile()
-    tmp_snarfile = _FOP.normpath(ConfigurationFileHandler().get_user_tempdir(),
+    tmp_snarfile = _FOP.normpath(snapshot.get_tempdir(),
                                  _FOP.get_basename(snarfile))
 
     LogFactory.getLogger().debug("Snapshot's base snarfile: %s" % base_snarfile)
@@ -405,7 +605,7 @@ def _mk_tar_incr(snapshot, targethandler, publish_progress, supports_publish):
     if not _FOP.path_exists(base_snarfile) :
         LogFactory.getLogger().error(_("Unable to find the SNAR file to make an incremental backup."))
         LogFactory.getLogger().error(_("Falling back to full backup."))
-        _mk_tar_full(snapshot, targethandler, publish_progress, _use_io_pipe)
+        _mk_tar_full(snapshot, targethandler, publish_progress, supports_publish)
     else:
         try:
             _FOP.copyfile(base_snarfile, tmp_snarfile)
@@ -425,7 +625,14 @@ def _mk_tar_incr(snapshot, targethandler, publish_progress, supports_publish):
 
         # launch TAR with empty environment
         _launcher = TarBackendLauncherSingleton()
-        if _use_io_pipe:
+        _launcher.set_transfer_bufsize(snapshot.get_transfer_bufsize())
+        _engine = __get_progress_engine(snapshot, publish_progress)
+        if _engine is not None:
+            _launcher.set_progress_callback(_engine.update_records)
+        _writer = __get_archive_writer(snapshot, ar_path, _split_stream, _memberlist)
+        if _writer is not None:
+            _launcher.set_stdout_file(_writer)
+        elif _use_io_pipe:
             _launcher.set_stdout_file(ar_path)
         try:
             _launcher.launch_sync(options, env = _env)
@@ -433,10 +640,12 @@ def _mk_tar_incr(snapshot, targethandler, publish_progress, supports_publish):
             outstr = _launcher.get_stdout()
             errStr = _launcher.get_stderr()
             __finish_tar(retVal, outstr, errStr)
+            __finish_progress(_engine)
+            __commit_member_index(ar_path, _writer, _memberlist)
             __copy_temp_snarfile_into_snapshot(tmp_snarfile, snarfile)
 
         finally:
-            __remove_tempfiles([tmp_snarfile, tmp_incl, tmp_excl])
+            __remove_tempfiles([tmp_snarfile] + _tmp_files)
 
 
 def _mk_tar_full(snapshot, targethandler, publish_progress, supports_publish):
@@ -453,19 +662,27 @@ def _mk_tar_full(snapshot, targethandler, publish_progress, supports_publish):
              "TAR_OPTIONS" : "--no-wildcards --anchored --no-wildcards-match-slash" }
     _use_io_pipe = targethandler.get_use_iopipe()
     _splitsize = snapshot.getSplitedSize()
-    if _splitsize > 0:
+    _split_stream = __use_split_stream(snapshot)
+    _memberlist = __get_memberlist(snapshot)
+    if _split_stream or _memberlist is not None or __use_dedup(snapshot):
+        _use_io_pipe = True
+    elif _splitsize > 0:
         _use_io_pipe = False
-        publish_progress = publish_progress and supports_publish
-        _env["SBACKUP_VOLUME_SIZE"] = str(_splitsize * constants.TAR_VOLUME_SIZE_UNIT_IN_BYTES)
+        if not supports_publish:
+            publish_progress = None
 
     options, ar_path, tmp_incl, tmp_excl = __prepare_common_opts(snapshot, targethandler,
-                                                                 publish_progress, _use_io_pipe)
+                                                                 publish_progress, _use_io_pipe,
+                                                                 _memberlist)
+    _tmp_files = [tmp_incl, tmp_excl]
+    if _memberlist is not None:
+        _tmp_files.append(_memberlist)
 
-    if _splitsize > 0:
+    if _splitsize > 0 and not _split_stream:
         options = __add_split_opts(snapshot, options, _splitsize)
 
     snarfile = snapshot.getSnarFile()
-    tmp_snarfile = _FOP.normpath(ConfigurationFileHandler().get_user_tempdir(),
+    tmp_snarfile = _FOP.normpath(snapshot.get_tempdir(),
                                  _FOP.get_basename(snarfile))
 
     LogFactory.getLogger().debug("Snapshot's snarfile: %s" % snarfile)
@@ -481,7 +698,14 @@ def _mk_tar_full(snapshot, targethandler, publish_progress, supports_publish):
 
     # launch TAR with empty environment
     _launcher = TarBackendLauncherSingleton()
-    if _use_io_pipe:
+    _launcher.set_transfer_bufsize(snapshot.get_transfer_bufsize())
+    _engine = __get_progress_engine(snapshot, publish_progress)
+    if _engine is not None:
+        _launcher.set_progress_callback(_engine.update_records)
+    _writer = __get_archive_writer(snapshot, ar_path, _split_stream, _memberlist)
+    if _writer is not None:
+        _launcher.set_stdout_file(_writer)
+    elif _use_io_pipe:
         _launcher.set_stdout_file(ar_path)
     try:
         _launcher.launch_sync(options, env = _env)
@@ -489,9 +713,11 @@ def _mk_tar_full(snapshot, targethandler, publish_progress, supports_publish):
         outstr = _launcher.get_stdout()
         errStr = _launcher.get_stderr()
         __finish_tar(retVal, outstr, errStr)
+        __finish_progress(_engine)
+        __commit_member_index(ar_path, _writer, _memberlist)
         __copy_temp_snarfile_into_snapshot(tmp_snarfile, snarfile)
     finally:
-        __remove_tempfiles([tmp_snarfile, tmp_incl, tmp_excl])
+        __remove_tempfiles([tmp_snarfile] + _tmp_files)
 
 
 def __finish_tar(exitcode, output_str, error_str):
@@ -578,8 +804,11 @@ def get_dumpdir_from_list(lst_dumpdirs, filename):
     return _res
 
 
-class TarBackendLauncherSingleton(object):
-    __metaclass__ = structs.Singleton
+class TarBackendLauncher(object):
+    """Launches a single TAR process. Use `TarBackendLauncherSingleton`
+    unless several processes must run concurrently (the singleton can be
+    terminated from everywhere, e.g. when the backup is canceled).
+    """
 
     _cmd = "/bin/tar"
 
@@ -595,13 +824,42 @@ class TarBackendLauncherSingleton(object):
         self._stdout = None
         self._stderr = None
         self._returncode = None
+        self._transfer_stats = None
+
+        # size of the buffers used when copying the archive stream
+        self._bufsize = transfer.DEFAULT_BUFSIZE
+        # callable checkpoints echoed by TAR are passed to
+        self._progress_callback = None
+
+    def set_progress_callback(self, callback):
+        """Sets the callable the numbers of checkpoints echoed by TAR (see
+        `progress.get_checkpoint_opts`) are passed to. It is called from a
+        separate thread.
+        """
+        self._progress_callback = callback
+
+    def set_transfer_bufsize(self, bufsize):
+        """Sets the size of the buffers used when the archive stream is
+        copied from/to the pipe of TAR (see module `transfer`).
+        """
+        self._bufsize = bufsize
 
     def set_stdin_file(self, path):
+        """Sets the file piped into stdin of TAR.
+
+        @param path: path of the file or a file-like object providing `read`
+                     and `close` (e.g. a `chunks.ChunkReader`)
+        """
         if self._stdout_f is not None:
             raise AssertionError("Redirecting stdin and stdout is not supported")
         self._stdin_f = path
 
     def set_stdout_file(self, path):
+        """Sets the file stdout of TAR is written into.
+
+        @param path: path of the file or a file-like object providing `write`
+                     and `close` (e.g. a `chunks.ChunkWriter`)
+        """
         if self._stdin_f is not None:
             raise AssertionError("Redirecting stdin and stdout is not supported")
         self._stdout_f = path
@@ -625,6 +883,16 @@ class TarBackendLauncherSingleton(object):
 
         _stdout_param = None
         _stdin_param = None
+        # the archive is copied from/to the pipe of TAR unless TAR can access
+        # it directly (local files)
+        _arsrc = None
+        _ardst = None
+        _use_transfer = False
+        # stderr is read by a thread if checkpoints are echoed
+        _stderr_param = errptr
+        _reader = None
+        if self._progress_callback is not None:
+            _stderr_param = subprocess.PIPE
 
         try:
             _logger.debug("Lauching: %s" % (" ".join(self._argv)))
@@ -635,68 +903,100 @@ class TarBackendLauncherSingleton(object):
             else:
                 assert self._stdin_f is None
                 _logger.debug("Output archive: %s" % self._stdout_f)
-                _stdout_param = subprocess.PIPE
-                _ardst = _FOP.openfile_for_write(self._stdout_f)
+                if isinstance(self._stdout_f, types.StringTypes):
+                    _ardst = _FOP.openfile_for_write(self._stdout_f)
+                else:
+                    _ardst = self._stdout_f
+                if transfer.is_local_file(_ardst):
+                    _stdout_param = _ardst
+                else:
+                    _stdout_param = subprocess.PIPE
+                    _use_transfer = True
 
             if self._stdin_f is not None:
                 assert self._stdout_f is None
                 _logger.debug("Input archive: %s" % self._stdin_f)
-                _stdin_param = subprocess.PIPE
-                _arsrc = _FOP.openfile_for_read(self._stdin_f)
+                if isinstance(self._stdin_f, types.StringTypes):
+                    _arsrc = _FOP.openfile_for_read(self._stdin_f)
+                else:
+                    _arsrc = self._stdin_f
+                if transfer.is_local_file(_arsrc):
+                    _stdin_param = _arsrc
+                else:
+                    _stdin_param = subprocess.PIPE
+                    _use_transfer = True
 
             self._proc = subprocess.Popen(self._argv, stdin = _stdin_param, stdout = _stdout_param,
-                                          stderr = errptr, env = env)
+                                          stderr = _stderr_param, env = env)
             _logger.debug("Subprocess created")
-            if self._stdout_f is not None:
-                _arsrc = self._proc.stdout
-            if self._stdin_f is not None:
-                _ardst = self._proc.stdin
-
-            if (self._stdin_f is not None) or (self._stdout_f is not None):
-                shutil.copyfileobj(_arsrc, _ardst)
-                _arsrc.close()
-                _ardst.close()
+            if self._progress_callback is not None:
+                _reader = progress.CheckpointReader(self._proc.stderr, self._progress_callback)
+                _reader.start()
+
+            if _use_transfer:
+                if self._stdout_f is not None:
+                    _arsrc = self._proc.stdout
+                if self._stdin_f is not None:
+                    _ardst = self._proc.stdin
+                _transfer = transfer.Transfer(_arsrc, _ardst, bufsize = self._bufsize)
+                self._transfer_stats = _transfer.run()
+                _logger.info(_("Archive stream transferred: %s") % self._transfer_stats)
+                self.__close_archive_streams(_arsrc, _ardst)
                 self._proc.wait()
             else:
-                self._proc.communicate(input = None)
+                # TAR accesses the local archive by means of its own descriptor
+                self.__close_archive_streams(_arsrc, _ardst)
+                self._proc.wait()
 
-        except (exceptions.BackupCanceledError, exceptions.SigTerminatedError), error:
+        except (exceptions.BackupCanceledError, exceptions.SigTerminatedError, SBException), error:
+            # SBException is raised e.g. if a part of a split archive is corrupted
             self.terminate()
 
-            if (self._stdin_f is not None) or (self._stdout_f is not None):
-                _arsrc.close()
-                _ardst.close()
+            self.__close_archive_streams(_arsrc, _ardst)
             # todo: remove code duplication
             self._returncode = self._proc.returncode
-            os.close(errptr)    # Close log handle
-            self._stderr = local_file_utils.readfile(errfile)
+            self.__collect_stderr(errptr, errfile, _reader)
             if self._stdout_f is None:
                 os.close(outptr)
                 self._stdout = local_file_utils.readfile(outfile)
-            local_file_utils.delete(errfile)
 
             self._clear_proc()
             raise error
 
         self._returncode = self._proc.returncode
-        os.close(errptr)    # Close log handle
-        self._stderr = local_file_utils.readfile(errfile)
+        self.__collect_stderr(errptr, errfile, _reader)
         if self._stdout_f is None:
             os.close(outptr)
             self._stdout = local_file_utils.readfile(outfile)
-        local_file_utils.delete(errfile)
 
         self._clear_proc()
 
+    def __collect_stderr(self, errptr, errfile, reader):
+        os.close(errptr)    # Close log handle
+        if reader is None:
+            self._stderr = local_file_utils.readfile(errfile)
+        else:
+            reader.join(_STDERR_JOIN_TIMEOUT)
+            self._stderr = reader.get_output()
+        local_file_utils.delete(errfile)
+
+    def __close_archive_streams(self, arsrc, ardst):
+        for _fobj in (arsrc, ardst):
+            if _fobj is not None:
+                _fobj.close()
+
     def _clear_returns(self):
         self._stdout = None
         self._stderr = None
         self._returncode = None
+        self._transfer_stats = None
 
     def _clear_proc(self):
         self._proc = None
         self._stdin_f = None
         self._stdout_f = None
+        self._bufsize = transfer.DEFAULT_BUFSIZE
+        self._progress_callback = None
         self._argv = []
 
     def is_running(self):
@@ -718,6 +1018,12 @@ class TarBackendLauncherSingleton(object):
     def get_returncode(self):
         return self._returncode
 
+    def get_transfer_stats(self):
+        """Returns the metrics (`transfer.TransferStats`) of the last copy of
+        the archive stream or None if the archive was accessed by TAR.
+        """
+        return self._transfer_stats
+
     def terminate(self):
         if self.is_running():
             try:
@@ -726,6 +1032,10 @@ class TarBackendLauncherSingleton(object):
                 log.LogFactory.getLogger().warning(_("Unable to terminate backend process: %s") % error)
 
 
+class TarBackendLauncherSingleton(TarBackendLauncher):
+    __metaclass__ = structs.Singleton
+
+
 class Dumpdir(object):
     """This is actually a single dumdir entry.
     
@@ -858,6 +1168,18 @@ class SnapshotFile(object):
     __SEP = '\000'
     __entrySEP = 2 * __SEP
 
+    # size of blocks (in bytes) read at once when parsing the file
+    READ_BLOCKSIZE = 1024 * 1024
+
+    # suffix of the index file stored next to the snar file
+    INDEX_SUFFIX = ".idx"
+    # the index file consists of a header (magic, version, size of the data
+    # in the snar file, number of entries, length of the snar file's header),
+    # the snar file's header and the entries (see `SnapshotFileIndex`)
+    __INDEX_MAGIC = "SBSNARIDX"
+    __INDEX_VERSION = 2
+    __INDEX_HEADER = struct.Struct(">9sHQQI")
+
     # Infos on indices in a record 
     REC_NFS = 0
     REC_MTIME_SEC = 1
@@ -978,6 +1300,114 @@ class SnapshotFile(object):
 #
 #        fd.close()
 
+    def __read_header(self, fd):
+        """Reads the header from the given (opened) snar file. The header
+        consists of the first line and 2 entries separated with NULL.
+
+        @return: tuple of the header (a string) and the data that was read
+                 beyond the header
+        @raise SBException: if the header is incomplete
+        """
+        _buf = ""
+        _pos = -1
+        _nsep = 0
+        while _nsep < 2:
+            _pos = _buf.find(self.__SEP, _pos + 1)
+            if _pos == -1:
+                _pos = len(_buf) - 1
+                _block = fd.read(self.READ_BLOCKSIZE)
+                if not _block:
+                    raise SBException(_("The snarfile header is incomplete."))
+                _buf = "%s%s" % (_buf, _block)
+            else:
+                _nsep += 1
+        return (_buf[:_pos + 1], _buf[_pos + 1:])
+
+    def __iter_raw_records(self):
+        """Iterator over the records in the snar file as raw strings (i.e.
+        NUL separated fields, each field terminated by NUL).
+
+        The file is read in blocks of `READ_BLOCKSIZE` bytes and the blocks
+        are split at record separators at once instead of reading the file
+        byte by byte. Incomplete data at the end of the file is ignored.
+
+        @return: tuples of the byte offset of the record within the file
+                 and the record itself
+        """
+        fd = _FOP.openfile_for_read(self.snpfile)
+        try:
+#TODO: Handle empty files properly
+            _header, _buf = self.__read_header(fd)
+            # offset of the beginning of `_buf` within the file
+            _bufoffset = len(_header)
+            _eof = False
+            while not _eof:
+                _block = fd.read(self.READ_BLOCKSIZE)
+                if _block:
+                    _buf = "%s%s" % (_buf, _block)
+                else:
+                    _eof = True
+                if self.__entrySEP not in _buf:
+                    continue
+                _records = _buf.split(self.__entrySEP)
+                # the last part is incomplete (or empty); keep it for the next block
+                _buf = _records.pop()
+                for _record in _records:
+                    _stripped = _record.lstrip(self.__SEP)
+                    if _stripped:
+                        _offset = _bufoffset + len(_record) - len(_stripped)
+                        # splitting removed the terminating NUL of the last field
+                        yield (_offset, "%s%s" % (_stripped, self.__SEP))
+                    _bufoffset += len(_record) + len(self.__entrySEP)
+        finally:
+            fd.close()
+
+    def __read_raw_record_at(self, offset):
+        """Reads the single record that starts at the given byte `offset`
+        within the snar file (as returned by `__iter_raw_records`).
+
+        @return: the raw record or None if there is no complete record
+        """
+        fd = _FOP.openfile_for_read(self.snpfile)
+        try:
+            fd.seek(offset)
+            _buf = ""
+            _pos = -1
+            # most records are small: start with small blocks
+            _blocksize = min(4096, self.READ_BLOCKSIZE)
+            while _pos == -1:
+                _block = fd.read(_blocksize)
+                _blocksize = min(2 * _blocksize, self.READ_BLOCKSIZE)
+                if not _block:
+                    return None
+                _start = max(0, len(_buf) - 1)
+                _buf = "%s%s" % (_buf, _block)
+                _pos = _buf.find(self.__entrySEP, _start)
+        finally:
+            fd.close()
+        return _buf[:_pos + 1]
+
+    @classmethod
+    def __format_record(cls, line):
+        """Formats a raw record (fields separated and terminated by NUL)
+        into a list [nfs,mtime_sec,mtime_nano,dev_no,i_no,name,contents]
+        where contents is a list of Dumpdirs.
+        """
+        nfs, mtime_sec, mtime_nano, dev_no, i_no, name, contents = line.split(cls.__SEP, 6)
+        return [nfs, mtime_sec, mtime_nano, dev_no, i_no, name, cls.parse_content(contents)]
+
+    @classmethod
+    def parse_content(cls, contents):
+        """Parses the raw content of a record (NUL separated entries) into
+        a list of Dumpdirs.
+        """
+        _dumpdirs = []
+        if contents:
+            for d in contents.rstrip(cls.__SEP).split(cls.__SEP):
+                if d:
+                    _dumpdirs.append(Dumpdir(d))
+        return _dumpdirs
+
     def parseFormat2(self):
         """Iterator method that gives each line entry in SNAR-file.
         A line contains informations about a directory and its content.
@@ -990,52 +1420,8 @@ class SnapshotFile(object):
                'parseFormat2Iter'!
         """
 
-        def formatDumpDirs(content):
-            """
-            Subroutine to format a content into dump dirs
-            """
-            result = []
-            if content :
-                for d in content.rstrip('\0').split('\0'):
-                    if d :
-                        result.append(Dumpdir(d))
-            return result
-
-        def format(line):
-            """
-            subroutine to format a line including NUL char to have and array
-            """
-            nfs, mtime_sec, mtime_nano, dev_no, i_no, name, contents = line.lstrip("\0").split("\0", 6)
-            return [nfs, mtime_sec, mtime_nano, dev_no, i_no, name, formatDumpDirs(contents)]
-
-
-        fd = _FOP.openfile_for_read(self.snpfile)
-        # skip header which is the first line and 2 entries separated with NULL in this case
-#TODO: Handle empty files properly
-        n = 0
-        while n < 2 :
-            c = fd.read(1)
-            if len(c) != 1:
-                raise SBException(_("The snarfile header is incomplete."))
-            if c == '\0':
-                n += 1
-
-        currentline = ""
-        c = fd.read(1)
-        last_c = ''
-
-        while c:
-            currentline += c
-            if c == '\0' and last_c == '\0' :
-                # we got a line
-                yield format(currentline)
-
-                currentline = ''
-                last_c = ''
-            else :
-                last_c = c
-            c = fd.read(1)
-        fd.close
+        for _offset, _line in self.__iter_raw_records():
+            yield self.__format_record(_line)
 
     def getHeader(self):
         """
@@ -1044,20 +1430,13 @@ class SnapshotFile(object):
         @raise SBException: if the header is incomplete
         """
         fd = _FOP.openfile_for_read(self.snpfile)
-#TODO: Handle empty files properly
-        header = ""
-        n = 0
-        while n < 2 :
-            c = fd.read(1)
-            if len(c) != 1:
-                raise SBException(_("The snarfile header is incomplete."))
-            if c == '\0':
-                n += 1
-            header += c
         try:
-            _FOP.close_stream(fd)
-        except exceptions.FileAlreadyClosedError, error:
-            log.LogFactory.getLogger().warn(_("File was already closed (ignored): %s") % error)
+            header = self.__read_header(fd)[0]
+        finally:
+            try:
+                _FOP.close_stream(fd)
+            except exceptions.FileAlreadyClosedError, error:
+                log.LogFactory.getLogger().warn(_("File was already closed (ignored): %s") % error)
 
         return header
 
@@ -1083,16 +1462,46 @@ class SnapshotFile(object):
         Write a record in the snar file. A record is a tuple with 6 entries + a content that is a dict
         @param record: A tuple that contains the record to add. [nfs,mtime_sec,mtime_nano,dev_no,i_no,name,contents] where contents is a dict of {file:'control'}
         """
+        fd = _FOP.openfile_for_append(self.snpfile)
+        fd.write(self.__create_raw_record(record))
+        fd.close()
+
+    def addRecords(self, records):
+        """Writes several records into the snar file. The file is opened
+        only once and the records are written in a buffered manner.
+
+        @param records: iterable of records (see `addRecord`)
+        @return: the number of written records
+        """
+        _count = 0
+        _buf = []
+        _bufsize = 0
+        fd = _FOP.openfile_for_append(self.snpfile)
+        try:
+            for _record in records:
+                _raw = self.__create_raw_record(_record)
+                _buf.append(_raw)
+                _bufsize += len(_raw)
+                _count += 1
+                if _bufsize >= self.READ_BLOCKSIZE:
+                    fd.write("".join(_buf))
+                    _buf = []
+                    _bufsize = 0
+            fd.write("".join(_buf))
+        finally:
+            fd.close()
+        return _count
+
+    def __create_raw_record(self, record):
+        """Creates the raw record (including the record separator) as it is
+        written into the snar file.
+        """
         if len(record) != 7:
             raise ValueError("Record must contain of 7 elments. Got %s instead." % str(len(record)))
 
         woContent, contents = record[:-1], record[-1]
         strContent = self.createContent(contents)   # compute contents
-        toAdd = "%s%s%s" % (self.__SEP.join(woContent), self.__SEP, strContent)
-
-        fd = _FOP.openfile_for_append(self.snpfile)
-        fd.write("%s%s" % (toAdd, self.__entrySEP))
-        fd.close()
+        return "%s%s%s%s" % (self.__SEP.join(woContent), self.__SEP, strContent, self.__entrySEP)
 
 
     def createContent(self, contentList):
@@ -1143,46 +1552,168 @@ class SnapshotFile(object):
         """
         _snardict = {}
 
-        fd = _FOP.openfile_for_read(self.snpfile)
-#TODO: Handle empty files properly
-        header = ""
-        n = 0
-        while n < 2 :
-            c = fd.read(1)
-            if len(c) != 1:
-                raise SBException(_("The snarfile header is incomplete."))
-            if c == '\0':
-                n += 1
-            header += c
-        # skip header which is the first line and 2 entries separated with NULL in this case
-#FIXME: remove code duplication here and in `getHeader`
-
-        currentline = ""
-        last_c = ''
-        c = fd.read(1)
-        while c:
-            currentline += c
-            if c == '\0' and last_c == '\0' :
-                # we got a line
-                nfs, mtime_sec, mtime_nano, dev_no, i_no, _dirname, \
-                    _content = currentline.lstrip("\0").split("\0", 6)
-                _snardict[_dirname] = Dumpdir.DIRECTORY
-                _content_t = _content.rstrip('\0').split('\0')
-                for _entry in _content_t:
-                    _entry = _entry.strip("\0")
-                    if _entry:
-                        _epath = _FOP.joinpath(_dirname, _entry[1:])
-                        _snardict[_epath] = _entry[0]
-
-                currentline = ''
-                last_c = ''
-            else :
-                last_c = c
-            c = fd.read(1)
+        for _offset, _line in self.__iter_raw_records():
+            nfs, mtime_sec, mtime_nano, dev_no, i_no, _dirname, \
+                _content = _line.split("\0", 6)
+            _snardict[_dirname] = Dumpdir.DIRECTORY
+            _content_t = _content.rstrip('\0').split('\0')
+            for _entry in _content_t:
+                if _entry:
+                    _epath = _FOP.joinpath(_dirname, _entry[1:])
+                    _snardict[_epath] = _entry[0]
 
-        fd.close
         return _snardict
 
+    def iter_paths_format2(self):
+        """Iterator that returns the paths (directories and their entries)
+        contained in the snapshot file, i.e. the keys of the dictionary
+        returned by `get_dict_format2`, without keeping them in memory.
+        Paths might be returned more than once.
+
+        @warning: only compatible tar version 2 of Tar format
+        """
+        for _offset, _line in self.__iter_raw_records():
+            _dirname, _content = _line.split("\0", 6)[5:]
+            yield _dirname
+            for _entry in _content.rstrip('\0').split('\0'):
+                if _entry:
+                    yield _FOP.joinpath(_dirname, _entry[1:])
+
+    def get_raw_contents(self):
+        """Returns the (unparsed) content of the directories contained in the
+        snapshot file as dictionary that maps the names of the directories
+        (without trailing separator) to the raw content of their records.
+        If a directory is contained more than once, the first record is used.
+
+        @see: `parse_content`
+        """
+        _contents = {}
+        for _offset, _line in self.__iter_raw_records():
+            _dirname, _content = _line.split(self.__SEP, 6)[self.REC_DIRNAME:]
+            _dirname = _dirname.rstrip(_FOP.pathsep)
+            if _dirname not in _contents:
+                _contents[_dirname] = _content
+        return _contents
+
+    def get_index_filename(self):
+        """Returns the path of the index file belonging to this snar file.
+        """
+        return "%s%s" % (self.snpfile, self.INDEX_SUFFIX)
+
+    def build_index(self):
+        """Parses the snar file and returns an index that maps the names
+        of the directories (without trailing separator) to the byte offsets
+        of their records within the snar file. If a directory is contained
+        more than once, the first record is indexed.
+
+        @return: the index held in memory
+        @rtype: SnapshotFileIndex
+        """
+        _offsets = {}
+        _size = len(self.getHeader())
+        for _offset, _line in self.__iter_raw_records():
+            _dirname = _line.split(self.__SEP, 6)[self.REC_DIRNAME]
+            _dirname = _dirname.rstrip(_FOP.pathsep)
+            if _dirname not in _offsets:
+                _offsets[_dirname] = _offset
+            # the record is followed by the record separator
+            _size = _offset + len(_line) + len(self.__SEP)
+
+        _entries = [(SnapshotFileIndex.get_key(_dirname), _offset)
+                    for _dirname, _offset in _offsets.iteritems()]
+        _entries.sort()
+        _table = "".join([SnapshotFileIndex.ENTRY.pack(*_entry) for _entry in _entries])
+        return SnapshotFileIndex(self.getHeader(), _size, len(_entries), table = _table)
+
+    def write_index(self):
+        """Builds the index of this snar file and writes it into the
+        index file (see `get_index_filename`).
+
+        @return: the written index
+        @rtype: SnapshotFileIndex
+        """
+        _index = self.build_index()
+        _header = self.__INDEX_HEADER.pack(self.__INDEX_MAGIC, self.__INDEX_VERSION,
+                                           _index.size, _index.count, len(_index.header))
+        _FOP.writetofile(self.get_index_filename(),
+                         "".join([_header, _index.header, _index.get_table()]))
+        return _index
+
+    def load_index(self):
+        """Opens the index of this snar file stored in the index file. The
+        index is only returned if it is consistent with the snar file (i.e.
+        header and size of the data in the snar file are unchanged) and
+        complete. The entries are read from the index file on lookup.
+
+        @return: the index or None if it does not exist or is outdated
+        @rtype: SnapshotFileIndex
+        """
+        _idxfile = self.get_index_filename()
+        if not _FOP.path_exists(_idxfile):
+            return None
+        try:
+            fd = _FOP.openfile_for_read(_idxfile)
+            try:
+                _header = fd.read(self.__INDEX_HEADER.size)
+                if len(_header) != self.__INDEX_HEADER.size:
+                    _header = None
+                else:
+                    _magic, _version, _size, _count, _hlen = self.__INDEX_HEADER.unpack(_header)
+                    _snarheader = fd.read(_hlen)
+            finally:
+                fd.close()
+            _filesize = _FOP.get_size(_idxfile)
+        except Exception, error:
+            LogFactory.getLogger().warning(_("Unable to read index file `%(file)s`: %(error)s")
+                                 % {"file" : _idxfile, "error" : error})
+            return None
+
+        if _header is None or \
+           _magic != self.__INDEX_MAGIC or \
+           _version != self.__INDEX_VERSION or \
+           _snarheader != self.getHeader() or \
+           _filesize != self.__INDEX_HEADER.size + _hlen + _count * SnapshotFileIndex.ENTRY.size or \
+           not self.__is_size(_size):
+            LogFactory.getLogger().debug("Index file `%s` is outdated." % _idxfile)
+            return None
+        return SnapshotFileIndex(_snarheader, _size, _count, idxfile = _idxfile,
+                                 table_offset = self.__INDEX_HEADER.size + _hlen)
+
+    def __is_size(self, size):
+        """Checks whether the data in the snar file ends after `size` bytes,
+        i.e. only NULs follow.
+        """
+        if not isinstance(size, (int, long)) or size < 1:
+            return False
+        fd = _FOP.openfile_for_read(self.snpfile)
+        try:
+            fd.seek(size - 1)
+            _res = (len(fd.read(1)) == 1)
+            while _res:
+                _block = fd.read(self.READ_BLOCKSIZE)
+                if not _block:
+                    break
+                _res = (_block.strip(self.__SEP) == "")
+        finally:
+            fd.close()
+        return _res
+
+    def get_record_at(self, offset):
+        """Returns the record that starts at the given byte `offset` within
+        the snar file (as stored in the index).
+
+        @return: [nfs,mtime_sec,mtime_nano,dev_no,i_no,name,contents] where
+                 contents is a list of Dumpdirs or None if there is no
+                 complete record at the given offset
+        """
+        _line = self.__read_raw_record_at(offset)
+        if _line is None:
+            return None
+        try:
+            return self.__format_record(_line)
+        except ValueError:
+            return None
+
 #    def get_dict_format2(self):
 #        """        
 #        @warning: only compatible tar version 2 of Tar format
@@ -1215,6 +1746,137 @@ class SnapshotFile(object):
 #        return _snardict
 
 
+class SnapshotFileIndex(object):
+    """Index of the records of a snar file (see `SnapshotFile.build_index`).
+    The index is a table of fixed-width entries (key of the directory name,
+    offset of the record) sorted by key. Entries are looked up by binary
+    search, either in memory or by seeking within the index file; the index
+    file is not read as a whole.
+
+    Since different names may share a key, the name of the record found at
+    an offset must be compared with the looked up name.
+    """
+
+    ENTRY = struct.Struct(">8sQ")
+
+    def __init__(self, header, size, count, table = None, idxfile = None, table_offset = 0):
+        """
+        @param header: the header of the snar file
+        @param size: the size of the data in the snar file
+        @param count: the number of entries
+        @param table: the entries (if held in memory)
+        @param idxfile: the index file the entries are stored in (if not
+                        held in memory)
+        @param table_offset: the position of the entries within `idxfile`
+        """
+        if (table is None) == (idxfile is None):
+            raise ValueError("Either table or index file expected.")
+        self.header = header
+        self.size = size
+        self.count = count
+        self.__table = table
+        self.__idxfile = idxfile
+        self.__table_offset = table_offset
+
+    @classmethod
+    def get_key(cls, dirname):
+        """Returns the key the given directory name (without trailing
+        separator) is stored under.
+        """
+        return hashlib.md5(dirname).digest()[:8]
+
+    def get_table(self):
+        """Returns the entries held in memory.
+        """
+        return self.__table
+
+    def get_offsets(self, dirname):
+        """Returns the offsets of the records possibly belonging to the given
+        directory name (without trailing separator).
+        """
+        _key = self.get_key(dirname)
+        if self.__table is not None:
+            return self.__lookup(_key, self.__read_table_entry)
+        fd = _FOP.openfile_for_read(self.__idxfile)
+        try:
+            return self.__lookup(_key, lambda idx: self.__read_file_entry(fd, idx))
+        finally:
+            fd.close()
+
+    def __lookup(self, key, read_entry):
+        # find the first entry whose key is not less than the given key
+        _low = 0
+        _high = self.count
+        while _low < _high:
+            _mid = (_low + _high) // 2
+            if read_entry(_mid)[0] < key:
+                _low = _mid + 1
+            else:
+                _high = _mid
+        _offsets = []
+        while _low < self.count:
+            _key, _offset = read_entry(_low)
+            if _key != key:
+                break
+            _offsets.append(_offset)
+            _low += 1
+        return _offsets
+
+    def __read_table_entry(self, idx):
+        return self.ENTRY.unpack_from(self.__table, idx * self.ENTRY.size)
+
+    def __read_file_entry(self, fd, idx):
+        fd.seek(self.__table_offset + idx * self.ENTRY.size)
+        _data = fd.read(self.ENTRY.size)
+        if len(_data) != self.ENTRY.size:
+            raise SBException(_("Index file `%s` is truncated.") % self.__idxfile)
+        return self.ENTRY.unpack(_data)
+
+
+class SnapshotContentMap(object):
+    """Provides the content of the directories stored in a snapshot file.
+    The snapshot file is parsed only once; the content of a directory is
+    converted into Dumpdirs when it is requested.
+    """
+
+    def __init__(self, snapshotFile):
+        """
+        @param snapshotFile: the snapshot file
+        @type snapshotFile: SnapshotFile
+        """
+        if not isinstance(snapshotFile, SnapshotFile) :
+            raise TypeError(_("A SnapshotFile is required"))
+        self.__contents = snapshotFile.get_raw_contents()
+
+    def __len__(self):
+        return len(self.__contents)
+
+    def hasPath(self, dirpath):
+        return dirpath.rstrip(_FOP.pathsep) in self.__contents
+
+    def getContent(self, dirpath):
+        """Returns the content of the given directory.
+
+        @return: list of Dumpdirs
+        @raise SBException: if the path isn't found in the snapshot file
+        """
+        _content = self.__contents.get(dirpath.rstrip(_FOP.pathsep))
+        if _content is None:
+            raise SBException(_("Directory does not exist: %s.") % dirpath)
+        return SnapshotFile.parse_content(_content)
+
+    def getContentDict(self, dirpath):
+        """Returns the content of the given directory as dictionary that
+        maps the file names to their Dumpdirs.
+
+        @raise SBException: if the path isn't found in the snapshot file
+        """
+        _res = {}
+        for _ddir in self.getContent(dirpath):
+            _res.setdefault(_ddir.getFilename(), _ddir)
+        return _res
+
+
 class SnapshotFileWrapper(object):
     """Something like an Interface class.
     
@@ -1255,6 +1917,11 @@ class MemSnapshotFile(SnapshotFileWrapper, SBdict):
     def get_snapfile_path(self):
         return self.__snapshotFile.get_filename()
 
+    def get_snapfile_obj(self):
+        """Returns the wrapped instance of the snapshot file.
+        """
+        return self.__snapshotFile
+
     def hasPath(self, path):
         """
         Checks if a path is include in the SNAR file
@@ -1272,6 +1939,15 @@ class MemSnapshotFile(SnapshotFileWrapper, SBdict):
         self.__snapshotFile.addRecord(record)
         self[record[-2]] = record[-1]
 
+    def addRecords(self, records):
+        """Writes several records in the snar file (see `SnapshotFile.addRecords`).
+        """
+        def _iter_records():
+            for _record in records:
+                self[_record[-2]] = _record[-1]
+                yield _record
+        return self.__snapshotFile.addRecords(_iter_records())
+
     def getHeader(self):
         self.__snapshotFile.getHeader()
 
@@ -1324,11 +2000,43 @@ class ProcSnapshotFile(SnapshotFileWrapper):
         SnapshotFileWrapper.__init__(self)
 
         self.__snapshotFile = snapshotFile
+        self.__index = None
 
     def __str__(self):
         _str = "Snar file: '%s'" % self.__snapshotFile
         return _str
 
+    def __get_index(self):
+        """Returns the index of the snar file. It is loaded from the index
+        file or - if it does not exist or is outdated - built and written
+        on first access.
+        """
+        if self.__index is None:
+            _index = self.__snapshotFile.load_index()
+            if _index is None:
+                try:
+                    _index = self.__snapshotFile.write_index()
+                except Exception, error:
+                    LogFactory.getLogger().warning(_("Unable to write index of snar file: %s") % error)
+                    _index = self.__snapshotFile.build_index()
+            self.__index = _index
+        return self.__index
+
+    def __get_record(self, path):
+        """Returns the record of the directory `path` from the snar file
+        by means of the index or None if the path is not contained.
+        """
+        _path = path.rstrip(_FOP.pathsep)
+        for _offset in self.__get_index().get_offsets(_path):
+            _record = self.__snapshotFile.get_record_at(_offset)
+            if _record is None:
+                raise SBException(_("Index of snar file '%s' is corrupted.")
+                                  % self.get_snapfile_path())
+            # other directories may share the key
+            if _record[SnapshotFile.REC_DIRNAME].rstrip(_FOP.pathsep) == _path:
+                return _record
+        return None
+
     def get_snapfile_path(self):
         return self.__snapshotFile.get_filename()
 
@@ -1347,10 +2055,7 @@ class ProcSnapshotFile(SnapshotFileWrapper):
         @return: True if the file is included, False otherwise
         @rtype: boolean
         """
-        for f in self.__snapshotFile.parseFormat2():
-            if f[SnapshotFile.REC_DIRNAME].rstrip(_FOP.pathsep) == path.rstrip(_FOP.pathsep):
-                return True
-        return False
+        return self.__get_record(path) is not None
 
     def hasFile(self, _file):
         """
@@ -1360,9 +2065,10 @@ class ProcSnapshotFile(SnapshotFileWrapper):
         @rtype: boolean
         """
         dir, inFile = _file.rsplit(_FOP.pathsep, 1)
-        if not self.hasPath(dir):
+        _record = self.__get_record(dir)
+        if _record is None:
             return False
-        for f in self.getContent(dir):
+        for f in _record[SnapshotFile.REC_CONTENT]:
             if f.getFilename() == inFile and f.getControl() != Dumpdir.UNCHANGED:
                 return True
         return False
@@ -1391,6 +2097,16 @@ class ProcSnapshotFile(SnapshotFileWrapper):
         @param record: A tuple that contains the record to add. [nfs,mtime_sec,mtime_nano,dev_no,i_no,name,contents] where contents is a dict of {file:'control'}
         """
         self.__snapshotFile.addRecord(record)
+        self.__index = None
+
+    def addRecords(self, records):
+        """Writes several records in the snar file using a single file
+        handle (see `SnapshotFile.addRecords`).
+
+        @return: the number of written records
+        """
+        self.__index = None
+        return self.__snapshotFile.addRecords(records)
 
     def getHeader(self):
         return self.__snapshotFile.getHeader()
@@ -1404,6 +2120,7 @@ class ProcSnapshotFile(SnapshotFileWrapper):
         @type timeofBackup: datetime
         """
         self.__snapshotFile.setHeader(timeofBackup)
+        self.__index = None
 
     def getContent(self, dirpath):
         """convenance method to get the content of a directory.
@@ -1416,10 +2133,10 @@ class ProcSnapshotFile(SnapshotFileWrapper):
         
         @raise SBException: if the path isn't found in the snapshot file
         """
-        for f in self.__snapshotFile.parseFormat2():
-            if f[SnapshotFile.REC_DIRNAME].rstrip(_FOP.pathsep) == dirpath.rstrip(_FOP.pathsep):
-                return f[SnapshotFile.REC_CONTENT]
-        raise SBException(_("Directory does not exist: %s.") % dirpath)
+        _record = self.__get_record(dirpath)
+        if _record is None:
+            raise SBException(_("Directory does not exist: %s.") % dirpath)
+        return _record[SnapshotFile.REC_CONTENT]
 
     def getFirstItems(self):
         """
@@ -0,0 +1,195 @@
+#   Simple Backup - transfer of archive streams from/to the TAR process
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+:mod:`transfer` --- transfer of archive streams from/to the TAR process
+=======================================================================
+
+.. module:: transfer
+   :synopsis: buffered transfer of archive streams using a writer thread
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+When TAR cannot access the archive directly (e.g. remote targets accessed
+using GIO, split archives), the archive stream is copied between TAR's pipe
+and the archive. The source is read by the calling thread while a writer
+thread writes into the destination. Both are decoupled by a bounded queue of
+buffers, i.e. reading blocks only if the destination is slower than the
+source for more than the queued buffers (back pressure).
+
+The source is read by the calling (main) thread since exceptions raised by
+signal handlers (cancellation of backups, SIGTERM) are delivered to the main
+thread only.
+
+"""
+
+from gettext import gettext as _
+import Queue
+import sys
+import threading
+import time
+
+from sbackup.util import log
+
+
+# size of the buffers read from the source
+DEFAULT_BUFSIZE = 1024 * 1024
+
+# max. number of buffers waiting for being written
+DEFAULT_NBUFFERS = 8
+
+# interval (seconds) to check for failures of the writer while waiting
+_WAIT_INTERVAL = 0.5
+
+_JOIN_TIMEOUT = 10
+
+_MEBIBYTE = 1024.0 * 1024.0
+
+
+def is_local_file(fobj):
+    """Returns True if the given file-like object is a local file (including
+    files on FUSE mounts) providing a file descriptor. Such files can be
+    passed to the TAR process directly, i.e. no transfer is required.
+    """
+    return isinstance(fobj, file)
+
+
+class TransferStats(object):
+    """Metrics of a transfer.
+    """
+
+    def __init__(self):
+        self.nbytes = 0
+        self.nbuffers = 0
+        self.elapsed = 0.0
+        # time the reader waited for free buffers, i.e. the destination
+        # was slower than the source
+        self.read_wait = 0.0
+        # time the writer waited for data, i.e. the source was slower
+        self.write_wait = 0.0
+        self.max_queued = 0
+
+    def __str__(self):
+        return _("%(size).1f MiB in %(time).1f s (%(rate).1f MiB/s); waited %(rwait).1f s for destination, %(wwait).1f s for source; max. %(queued)s buffers queued")\
+                % { "size" : self.nbytes / _MEBIBYTE, "time" : self.elapsed,
+                    "rate" : self.get_throughput() / _MEBIBYTE,
+                    "rwait" : self.read_wait, "wwait" : self.write_wait,
+                    "queued" : self.max_queued }
+
+    def get_throughput(self):
+        """Returns the average throughput in bytes per second.
+        """
+        if self.elapsed <= 0:
+            return 0.0
+        return self.nbytes / self.elapsed
+
+
+class Transfer(object):
+    """Copies the data read from a source into a destination using a writer
+    thread. The file-like objects are not closed.
+    """
+
+    def __init__(self, source, destination, bufsize = DEFAULT_BUFSIZE,
+                 nbuffers = DEFAULT_NBUFFERS):
+        """
+        @param source: file-like object providing `read`
+        @param destination: file-like object providing `write`
+        @param bufsize: size of the buffers read from the source
+        @param nbuffers: max. number of buffers queued for writing
+        """
+        if bufsize < 1 or nbuffers < 1:
+            raise ValueError("Size and number of buffers must be positive")
+        self.__source = source
+        self.__destination = destination
+        self.__bufsize = bufsize
+        self.__queue = Queue.Queue(nbuffers)
+        self.__stats = TransferStats()
+        self.__aborted = False
+        self.__error = None
+
+    def get_stats(self):
+        return self.__stats
+
+    def __write(self):
+        _stats = self.__stats
+        try:
+            while not self.__aborted:
+                _start = time.time()
+                _data = self.__queue.get()
+                _stats.write_wait += time.time() - _start
+                if _data is None:
+                    break
+                self.__destination.write(_data)
+        except Exception:
+            self.__error = sys.exc_info()
+            self.__aborted = True
+
+    def __put(self, data):
+        """Queues the given data. Waits in short intervals in order to notice
+        failures of the writer.
+        """
+        _start = time.time()
+        while True:
+            if self.__error is not None:
+                raise self.__error[0], self.__error[1], self.__error[2]
+            try:
+                self.__queue.put(data, True, _WAIT_INTERVAL)
+                break
+            except Queue.Full:
+                pass
+        self.__stats.read_wait += time.time() - _start
+        self.__stats.max_queued = max(self.__stats.max_queued, self.__queue.qsize())
+
+    def __abort(self, writer):
+        self.__aborted = True
+        try:
+            self.__queue.put_nowait(None)
+        except Queue.Full:
+            pass
+        writer.join(_JOIN_TIMEOUT)
+        if writer.isAlive():
+            log.LogFactory.getLogger().warning(_("Writing of the archive stream does not finish."))
+
+    def run(self):
+        """Copies the data. Exceptions raised while reading or writing
+        (and by signal handlers) are propagated.
+
+        @return: metrics of the transfer
+        @rtype: TransferStats
+        """
+        _start = time.time()
+        _writer = threading.Thread(target = self.__write, name = "ArchiveWriter")
+        _writer.setDaemon(True)
+        _writer.start()
+        try:
+            while True:
+                _data = self.__source.read(self.__bufsize)
+                if not _data:
+                    break
+                self.__stats.nbytes += len(_data)
+                self.__stats.nbuffers += 1
+                self.__put(_data)
+            self.__put(None)
+            while _writer.isAlive():
+                _writer.join(_WAIT_INTERVAL)
+        except:
+            self.__abort(_writer)
+            raise
+        if self.__error is not None:
+            raise self.__error[0], self.__error[1], self.__error[2]
+        self.__stats.elapsed = time.time() - _start
+        return self.__stats
@@ -32,6 +32,8 @@ from gettext import gettext as _
 
 import traceback
 import sys
+import os
+import subprocess
 import smtplib
 import socket
 import datetime
@@ -47,6 +49,7 @@ from sbackup.pkginfo import Infos
 from sbackup.core.ConfigManager import ConfigManager, get_profiles
 from sbackup.core.ConfigManager import ConfigurationFileHandler
 from sbackup.core.profile_handler import BackupProfileHandler
+from sbackup.core import scheduler
 
 from sbackup.util import enable_backup_cancel_signal, enable_termsignal
 from sbackup.util import get_resource_file
@@ -270,33 +273,96 @@ class SBackupProc(object):
         self.__notify_init_errors()
 
         for confm in self.__confm:
+            self.__profilename = confm.getProfileName()
+            self.logger = log.LogFactory.getLogger(self.__profilename)
+
+            _lock = lock.ApplicationLock(lockfile = scheduler.get_profile_lockfile(self.__profilename),
+                                         processname = constants.BACKUP_COMMAND,
+                                         pid = system.get_pid())
             try:
-                self.__profilename = confm.getProfileName()
-                self.logger = log.LogFactory.getLogger(self.__profilename)
+                _lock.lock()
+            except exceptions.InstanceRunningError:
+                self.__notify_error(_("Another backup of profile `%s` is already running.")\
+                                    % self.__profilename,
+                                    _("Backup of profile is not being started:"))
+                self.__exitcode = constants.EXCODE_INSTANCE_ALREADY_RUNNING
+                continue
+            except exceptions.ApplicationLockError:
+                self.__notify_error(_("Unable to lock profile `%s`.") % self.__profilename,
+                                    _("Backup of profile is not being started:"))
+                self.__exitcode = constants.EXCODE_GENERAL_ERROR
+                continue
 
-                self.__bprofilehdl = BackupProfileHandler(confm, self.__state, self.__dbus_conn,
-                                          self.__use_indicator, self.__full_snp)
+            try:
+                try:
+                    self.__bprofilehdl = BackupProfileHandler(confm, self.__state, self.__dbus_conn,
+                                              self.__use_indicator, self.__full_snp)
 
-                self.__write_errors_to_log()
+                    self.__write_errors_to_log()
 
-                self.__bprofilehdl.do_hook('pre-backup')
-                self.__bprofilehdl.prepare()
-                self.__bprofilehdl.process()
-                self.__exitcode = self.__bprofilehdl.finish()
-                self.__bprofilehdl.do_hook('post-backup')
+                    self.__bprofilehdl.do_hook('pre-backup')
+                    self.__bprofilehdl.prepare()
+                    self.__bprofilehdl.process()
+                    self.__exitcode = self.__bprofilehdl.finish()
+                    self.__bprofilehdl.do_hook('post-backup')
 
-            except exceptions.BackupCanceledError:
-                self.__on_backup_canceled()
+                except exceptions.BackupCanceledError:
+                    self.__on_backup_canceled()
 
-            except (SystemExit, KeyboardInterrupt, Exception), error:
-                self.__on_backup_error(error)
+                except (SystemExit, KeyboardInterrupt, Exception), error:
+                    self.__on_backup_error(error)
 
-            self.__on_proc_finish()
-            self.__bprofilehdl = None
+                self.__on_proc_finish()
+                self.__bprofilehdl = None
+            finally:
+                _lock.unlock()
 
         self.__terminate_notifiers()
         return self.__exitcode
 
+    def run_parallel(self, launcher, target_limit = scheduler.DEFAULT_TARGET_LIMIT,
+                     cpu_budget = None):
+        """Processes the backups of all profiles concurrently (see module
+        `scheduler`). Each profile is processed by a separate backup process
+        started using the given launcher.
+
+        :param launcher: callable that starts the backup process of a given
+                         `scheduler.ProfileJob`
+        :param target_limit: max. number of backups writing to the same target
+        :param cpu_budget: max. number of compression threads at a time
+        """
+        self.__notify_init_errors()
+        self.__write_errors_to_log()
+
+        _exitcode = constants.EXCODE_SUCCESS
+        _jobs = []
+        for confm in self.__confm:
+            try:
+                _jobs.append(scheduler.ProfileJob.from_config(confm))
+            except Exception, error:
+                self.__notify_error(error, _("Unable to schedule backup of profile `%s`:")\
+                                    % confm.getProfileName())
+                _exitcode = constants.EXCODE_BACKUP_ERROR
+
+        _scheduler = scheduler.ProfileScheduler(_jobs, launcher, target_limit, cpu_budget)
+        try:
+            _retc = _scheduler.run()
+            if _retc != constants.EXCODE_SUCCESS:
+                _exitcode = _retc
+        except exceptions.BackupCanceledError:
+            self.logger.warning(_("Backup was canceled by user."))
+            self.__state.set_state('backup-canceled')
+            _exitcode = constants.EXCODE_BACKUP_ERROR
+        except exceptions.SigTerminatedError, error:
+            self.__notify_error(error, _("An error occurred during the backup:"))
+            _exitcode = constants.EXCODE_BACKUP_ERROR
+
+        # no profiles found: keep the initial exit code (as `run` does)
+        if len(self.__confm) > 0:
+            self.__exitcode = _exitcode
+        self.__terminate_notifiers()
+        return self.__exitcode
+
     def __on_backup_canceled(self):
         try:
             self.logger.warning(_("Backup was canceled by user."))
@@ -380,6 +446,8 @@ class SBackupApp(object):
         self.__dbus_avail = False
         self.__configfile = None
 
+        self.__locked = False
+
         self.__backupproc = None
         self.__notifiers = []
         # we establish a connection to ensure its presence for progress action
@@ -421,7 +489,9 @@ class SBackupApp(object):
         self.__dbus_conn = dbus_support.DBusProviderFacade(constants.BACKUP_PROCESS_NAME)
         try:
             self.__dbus_conn.connect()
-            self.__dbus_conn.set_backup_pid(pid = system.get_pid())
+            # backups started by the scheduler: the scheduler's PID is kept
+            if not self.__options_given.scheduled:
+                self.__dbus_conn.set_backup_pid(pid = system.get_pid())
             self.__dbus_avail = True
         except exceptions.DBusException:
             print "Unable to launch DBus service"
@@ -466,7 +536,8 @@ class SBackupApp(object):
         """
         if (self.__dbus_avail) and (self.__dbus_conn is not None):
             self.__dbus_conn.quit()
-        self.__lock.unlock()
+        if self.__locked:
+            self.__lock.unlock()
         log.shutdown_logging()
 
 
@@ -508,6 +579,25 @@ class SBackupApp(object):
               action = "store_true", dest = "full_snapshot", default = False,
               help = "create full snapshot")
 
+        parser.add_option("--parallel",
+              action = "store_true", dest = "parallel", default = False,
+              help = "process the profiles concurrently")
+
+        parser.add_option("--target-limit", dest = "target_limit", type = "int",
+              metavar = "N", default = scheduler.DEFAULT_TARGET_LIMIT,
+              help = "max. number of concurrent backups writing to the same target "\
+                     "(default: %default; implies --parallel)")
+
+        parser.add_option("--cpu-budget", dest = "cpu_budget", type = "int",
+              metavar = "N", default = None,
+              help = "max. number of compression threads used by concurrent backups "\
+                     "(default: number of CPUs; implies --parallel)")
+
+        # used for the backup processes started by the scheduler
+        parser.add_option("--scheduled",
+              action = "store_true", dest = "scheduled", default = False,
+              help = optparse.SUPPRESS_HELP)
+
         (options, args) = parser.parse_args(self.__argv[1:])
         if len(args) > 0:
             parser.error("You must not provide any non-option argument")
@@ -517,6 +607,19 @@ class SBackupApp(object):
                 parser.error("Given configuration file does not exist")
             self.__configfile = options.configfile
 
+        if options.target_limit < 1:
+            parser.error("The limit of backups per target must be positive")
+        if options.cpu_budget is not None:
+            if options.cpu_budget < 1:
+                parser.error("The CPU budget must be positive")
+            options.parallel = True
+        if options.target_limit != scheduler.DEFAULT_TARGET_LIMIT:
+            options.parallel = True
+        if options.scheduled:
+            if options.parallel or not options.configfile:
+                parser.error("Option --scheduled requires a configuration file and excludes --parallel")
+            options.use_indicator = False
+
         self.__options_given = options
 
         if self.__options_given.use_dbus == True:
@@ -524,6 +627,19 @@ class SBackupApp(object):
         else:
             self.__use_indicator = False
 
+    def __launch_scheduled(self, job):
+        """Starts the backup process for the given `scheduler.ProfileJob`.
+        The processes publish their progress over D-Bus (if enabled) naming
+        their profile but do not use the indicator application.
+        """
+        _cmd = [sys.executable, os.path.abspath(self.__argv[0]),
+                "--config-file", job.conffile, "--scheduled", "--no-indicator"]
+        if self.__options_given.full_snapshot:
+            _cmd.append("--full")
+        if not (self.__options_given.use_dbus and self.__dbus_avail):
+            _cmd.append("--no-dbus")
+        return subprocess.Popen(_cmd, close_fds = True)
+
     def __on_already_running(self, error):
         """Handler for the case a backup process is already running.
         Fuse is not initialized yet.
@@ -551,7 +667,11 @@ class SBackupApp(object):
             self.launch_externals()
             self.create_notifiers()
 
-            self.__lock.lock()
+            # backups started by the scheduler are protected by the lock of
+            # the scheduler and the lock of their profile
+            if not self.__options_given.scheduled:
+                self.__lock.lock()
+                self.__locked = True
             system.very_nice()
             system.set_grp("admin")
 
@@ -560,7 +680,12 @@ class SBackupApp(object):
                                               self.__dbus_conn,
                                               self.__use_indicator,
                                               self.__options_given.full_snapshot)
-            self.__exitcode = self.__backupproc.run()
+            if self.__options_given.parallel:
+                self.__exitcode = self.__backupproc.run_parallel(self.__launch_scheduled,
+                                                                 self.__options_given.target_limit,
+                                                                 self.__options_given.cpu_budget)
+            else:
+                self.__exitcode = self.__backupproc.run()
 
         except exceptions.InstanceRunningError, error:
             self.__on_already_running(error)
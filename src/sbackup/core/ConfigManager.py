@@ -36,6 +36,8 @@ import re
 
 from sbackup.pkginfo import Infos
 
+from sbackup.ar_backend import transfer
+
 from sbackup import util
 
 from sbackup.util import local_file_utils
@@ -475,6 +477,149 @@ class ConfigManager(ConfigParser.ConfigParser):
                             raise exceptions.NonValidOptionException(_msg)
         return _res
 
+    def get_collector_threads(self):
+        """Returns the number of threads used for inspecting the file system
+        when collecting files. If the option is not set, 1 is returned
+        (i.e. files are collected within the calling thread).
+        """
+        _section = "general"
+        _option = "collectorthreads"
+        _nthreads = 1
+        if self.has_option(_section, _option):
+            _val = int(self.get(_section, _option))
+            if _val > 1:
+                _nthreads = _val
+        return _nthreads
+
+    def get_snar_memory_limit(self):
+        """Returns the max. size (in MiB) of the snar file of the base snapshot
+        whose content is kept in memory when collecting files. Larger snar files
+        are processed using less memory. If the option is not set, 0 is
+        returned (i.e. no limit).
+        """
+        _section = "general"
+        _option = "snarmemlimit"
+        _limit = 0
+        if self.has_option(_section, _option):
+            _val = int(self.get(_section, _option))
+            if _val > 0:
+                _limit = _val
+        return _limit
+
+    def get_delta_threshold(self):
+        """Returns the min. size (in MiB) of files whose changed blocks are
+        stored instead of the whole file (see module `delta`). If the option
+        is not set, 0 is returned (i.e. disabled).
+        """
+        _section = "general"
+        _option = "deltathreshold"
+        _threshold = 0
+        if self.has_option(_section, _option):
+            _val = int(self.get(_section, _option))
+            if _val > 0:
+                _threshold = _val
+        return _threshold
+
+    def get_collector_cache_file(self):
+        """Returns the file the results of checking directories are cached
+        in (see module `dircache`). The file is stored in the user's data
+        directory and named after the profile. If the option is not set,
+        None is returned (i.e. the cache is disabled).
+        """
+        _section = "general"
+        _option = "collectorcache"
+        _path = None
+        if self.has_option(_section, _option):
+            if int(self.get(_section, _option)) == 1:
+                _path = self.__get_profile_datafile("collector-%s.cache")
+        return _path
+
+    def get_change_journal_file(self):
+        """Returns the journal the change journal service records changed
+        directories in (see module `journal_service`). The file is stored
+        in the user's data directory and named after the profile. If the
+        option is not set, None is returned (i.e. the journal is disabled).
+        """
+        _section = "general"
+        _option = "changejournal"
+        _path = None
+        if self.has_option(_section, _option):
+            if int(self.get(_section, _option)) == 1:
+                _path = self.__get_profile_datafile("journal-%s.log")
+        return _path
+
+    def __get_profile_datafile(self, template):
+        """Returns the path of a file in the user's data directory whose
+        name is made of the given template and the profile name.
+        """
+        _name = re.sub(r"[^A-Za-z0-9_.-]", "_", self.getProfileName())
+        return os.path.join(self.__conffile_hdl.get_user_datadir(), template % _name)
+
+    def get_compress_threads(self):
+        """Returns the number of threads used for compressing the archive.
+        If the option is not set, 1 is returned (i.e. TAR's built-in
+        compression is used).
+        """
+        _section = "general"
+        _option = "compressthreads"
+        _nthreads = 1
+        if self.has_option(_section, _option):
+            _val = int(self.get(_section, _option))
+            if _val > 1:
+                _nthreads = _val
+        return _nthreads
+
+    def get_purge_consolidate(self):
+        """Returns whether snapshots other snapshots rely on are removed
+        when purging (their childs are rebased). If the option is not set,
+        False is returned.
+        """
+        _section = "general"
+        _option = "purgeconsolidate"
+        _res = False
+        if self.has_option(_section, _option):
+            _res = (int(self.get(_section, _option)) == 1)
+        return _res
+
+    def get_purge_threads(self):
+        """Returns the max. number of snapshots removed concurrently when
+        purging. If the option is not set, 1 is returned.
+        """
+        _section = "general"
+        _option = "purgethreads"
+        _nthreads = 1
+        if self.has_option(_section, _option):
+            _val = int(self.get(_section, _option))
+            if _val > 1:
+                _nthreads = _val
+        return _nthreads
+
+    def get_member_index(self):
+        """Returns whether an index of the members is written for the
+        archives (see module `memberindex`). If the option is not set, False
+        is returned (i.e. TAR compresses and writes the archive itself).
+        """
+        _section = "general"
+        _option = "memberindex"
+        _res = False
+        if self.has_option(_section, _option):
+            _res = (int(self.get(_section, _option)) == 1)
+        return _res
+
+    def get_transfer_bufsize(self):
+        """Returns the size (in bytes) of the buffers used when the archive
+        stream is copied (option given in KiB). If the option is not set,
+        the default size is returned.
+        """
+        _section = "general"
+        _option = "transferbuffer"
+        _size = transfer.DEFAULT_BUFSIZE
+        if self.has_option(_section, _option):
+            _val = int(self.get(_section, _option))
+            if _val > 0:
+                _size = _val * 1024
+        return _size
+
     def get_followlinks(self):
         _section = "general"
         _option = "followlinks"
@@ -1322,6 +1467,16 @@ class ConfigManagerStaticData(object):
                            'purge'         : str,
                            'followlinks'     : int,
                            'stop_if_no_target' : int,
+                           'collectorthreads' : int,
+                           'snarmemlimit' : int,
+                           'deltathreshold' : int,
+                           'collectorcache' : int,
+                           'changejournal' : int,
+                           'compressthreads' : int,
+                           'purgeconsolidate' : int,
+                           'purgethreads' : int,
+                           'memberindex' : int,
+                           'transferbuffer' : int,
                         'packagecmd'    : str},
      'log'             : {'level' : int , 'file' : str },
      'report'         : {'from' :str, 'to' : str, 'smtpserver' : str,
@@ -1346,7 +1501,7 @@ class ConfigManagerStaticData(object):
                                     "monthly"    : 3
                                 }
 
-    __cformats = ['none', 'gzip', 'bzip2']
+    __cformats = ['none', 'gzip', 'bzip2', 'xz', 'zstd', 'dedup']
 
     __splitsize = {    0        : _('Unlimited'),
                         100        : _('100 MiB'),
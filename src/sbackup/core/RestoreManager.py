@@ -21,14 +21,22 @@
 from gettext import gettext as _
 import tempfile
 import datetime
+import threading
+import Queue
 
 
 from sbackup.core import SnapshotManager
+from sbackup.core import revertplan
 from sbackup.fs_backend import fam
 
 from sbackup.util import exceptions
 from sbackup.util import log
 from sbackup.ar_backend import tar
+from sbackup.ar_backend import delta
+
+
+# max. number of archives read concurrently when reverting
+_REVERT_THREADS = 4
 
 
 class RestoreManager(object):
@@ -75,6 +83,12 @@ class RestoreManager(object):
         self.logger.debug("Restore as\n\tsnapshot: `%s`\n\tfile (path in snapshot): `%s`\n\trestore target: `%s`"\
                           % (snapshot, _file, target))
 
+        _deltas = self.__get_delta_restorer(snapshot)
+        if _deltas is not None and _deltas.get_entry(_file) is not None:
+            # large file stored by blocks; not contained in the archive
+            self.__restore_delta_file_as(_deltas, _file, target, backupFlag)
+            return
+
         if not snapshot.getSnapshotFileInfos().hasPath(_file) and not snapshot.getSnapshotFileInfos().hasFile(_file):
             if failOnNotFound:
                 raise exceptions.SBException(_("File '%s' not found in the backup snapshot files list") % _file)
@@ -104,6 +118,7 @@ class RestoreManager(object):
 
                 tar.extract(snapshot.getArchive(), _larpath, _file, _tmpdir,
                             bckupsuffix = suffix, splitsize = snapshot.getSplitedSize())
+                self.__restore_delta_files(_deltas, _file, _tmpdir, None)
 
                 _file_in_target = self._fop.joinpath(target, self._fop.get_basename(_file))
                 _file_in_tmpdir = self._fop.joinpath(_tmpdir, _file)
@@ -129,6 +144,7 @@ class RestoreManager(object):
                 self._fop.makedirs(target)
                 tar.extract(snapshot.getArchive(), _larpath, _file, target,
                             splitsize = snapshot.getSplitedSize())
+                self.__restore_delta_files(_deltas, _file, target, None)
             else :
                 # Target = None , extract at the place it belongs
                 if self._fop.path_exists(_file) :
@@ -139,6 +155,187 @@ class RestoreManager(object):
                     # file doesn't exist nothing to move, just extract
                     tar.extract(snapshot.getArchive(), _larpath, _file, target,
                                 splitsize = snapshot.getSplitedSize())
+                self.__restore_delta_files(_deltas, _file, None, suffix)
+
+    def __get_delta_restorer(self, snapshot, history = None):
+        """Returns the `delta.DeltaRestorer` for the large files stored by
+        blocks in the given snapshot or None if there are no such files.
+        """
+        if not delta.has_index(snapshot.getPath()):
+            return None
+        if history is None:
+            snpman = SnapshotManager.SnapshotManager(self._fop.get_dirname(snapshot.getPath()))
+            history = snpman.getSnpHistory(snapshot)
+        return delta.DeltaRestorer([_snp.getPath() for _snp in history])
+
+    def __restore_delta_file_as(self, restorer, _file, target, backupFlag):
+        """Restores a single large file stored by blocks to target (see
+        `restoreAs` for the meaning of target).
+        """
+        suffix = None
+        if backupFlag :
+            now = datetime.datetime.now().isoformat("_").replace(":", ".")
+            suffix = ".before_restore_" + now
+        if not target:
+            _dest = _file
+        elif not self._fop.path_exists(target):
+            self._fop.makedirs(target)
+            _dest = self._fop.joinpath(target, _file)
+            suffix = None
+        elif self._fop.is_dir(target):
+            _dest = self._fop.joinpath(target, self._fop.get_basename(_file))
+        else:
+            # the file is restored under new name
+            _dest = target
+        restorer.restore_file(_file, _dest, suffix)
+
+    def __restore_delta_files(self, restorer, path, dest, suffix):
+        """Restores the large files stored by blocks that are contained in
+        the given path into the directory `dest` (to their original location
+        if None).
+        """
+        if restorer is None:
+            return
+        _files = sorted(restorer.list_files(path))
+        if len(_files) > 0:
+            self.logger.info(_("Restoring %s large files stored by blocks") % len(_files))
+        for _file in _files:
+            if dest is None:
+                _dest = _file
+            else:
+                _dest = self._fop.joinpath(dest, _file)
+            restorer.restore_file(_file, _dest, suffix)
+
+    def restore_files(self, snapshot, files, target = None, backupFlag = True,
+                      failOnNotFound = True):
+        """Restore several files or directories from the given snapshot to
+        target (or to their old location if None is given). All files are
+        extracted using a single TAR process, i.e. the archive is read once.
+        Existing files are moved to "*.before_restore_$time" files.
+
+        @param snapshot: the snapshot to restore from
+        @param files: list of files/directories (paths in snapshot)
+        @param target: where to restore the files (they are restored into
+                       this directory; a single file can be restored under
+                       new name)
+        @param backupFlag: Set to false to make no backup when restoring (default = True)
+        @param failOnNotFound: set to False if we don't want to fail if a file is not found (default is True)
+        """
+        if snapshot is None:
+            raise exceptions.SBException("Please provide a Snapshot")
+        if not files:
+            raise exceptions.SBException("Please provide a File/directory")
+
+        _deltas = self.__get_delta_restorer(snapshot)
+        _files = self.__get_files_to_restore(snapshot, files, failOnNotFound, _deltas)
+        if len(_files) == 0:
+            self.logger.warning(_("No files to restore from snapshot [%s].") % snapshot.getName())
+            return
+
+        if len(_files) == 1 and target and self._fop.path_exists(target)\
+           and not self._fop.is_dir(target):
+            # the single file is restored under new name
+            self.restoreAs(snapshot, _files[0], target, backupFlag, failOnNotFound)
+            return
+
+        self.logger.debug("Restore files\n\tsnapshot: `%s`\n\tfiles (paths in snapshot): `%s`\n\trestore target: `%s`"\
+                          % (snapshot, "`, `".join(_files), target))
+
+        if target and self._fop.path_exists(target) and not self._fop.is_dir(target):
+            raise exceptions.SBException(_("Unable to restore several files into file '%s'.") % target)
+
+        _larpath = self.__get_eff_archive_path(snapshot)
+        # large files stored by blocks are not contained in the archive
+        _tarfiles = [_file for _file in _files
+                     if _deltas is None or _deltas.get_entry(_file) is None]
+
+        suffix = None
+        if backupFlag :
+            now = datetime.datetime.now().isoformat("_").replace(":", ".")
+            suffix = ".before_restore_" + now
+
+        if target and self._fop.path_exists(target):
+            self.logger.debug("Restore target is an existing directory")
+            _tmpdir = tempfile.mkdtemp(dir = target, prefix = 'sbackup-restore_')
+            self.logger.debug("Restore tempdir: `%s`" % _tmpdir)
+            try:
+                if len(_tarfiles) > 0:
+                    tar.extract_files(snapshot.getArchive(), _larpath, _tarfiles, _tmpdir,
+                                      bckupsuffix = suffix, splitsize = snapshot.getSplitedSize())
+                for _file in _files:
+                    self.__restore_delta_files(_deltas, _file, _tmpdir, None)
+                for _file in _files:
+                    self.__move_into_target(_tmpdir, _file, target, suffix)
+            finally:
+                self._fop.force_delete(_tmpdir)
+        else:
+            if target:
+                self._fop.makedirs(target)
+                suffix = None
+            if len(_tarfiles) > 0:
+                tar.extract_files(snapshot.getArchive(), _larpath, _tarfiles, target,
+                                  bckupsuffix = suffix, splitsize = snapshot.getSplitedSize())
+            for _file in _files:
+                self.__restore_delta_files(_deltas, _file, target, suffix)
+
+    def __get_eff_archive_path(self, snapshot):
+        _snpname = self._fop.get_basename(snapshot.getName())
+        _arname = self._fop.get_basename(snapshot.getArchive())
+        _larpath = self.__fam_target_hdl.get_eff_fullpath(_snpname, _arname)
+        self.logger.debug("eff. local path to archive: %s" % _larpath)
+        return _larpath
+
+    def __move_into_target(self, tmpdir, _file, target, suffix):
+        """Moves the file extracted into `tmpdir` into the target directory.
+        Existing files are backed up if a suffix is given.
+        """
+        if _file.strip(self._fop.pathsep) == "":
+            # the whole snapshot was extracted
+            for _fname in self._fop.listdir(tmpdir):
+                self.__move_into_target(tmpdir, _fname, target, suffix)
+            return
+        _file_in_target = self._fop.joinpath(target, self._fop.get_basename(_file))
+        _file_in_tmpdir = self._fop.joinpath(tmpdir, _file)
+        self.logger.debug("File in restore target: `%s`" % _file_in_target)
+        self.logger.debug("File in restore tempdir: `%s`" % _file_in_tmpdir)
+        if suffix:
+            if self._fop.path_exists(_file_in_target):
+                self._fop.force_move(_file_in_target, "%s%s" % (_file_in_target, suffix))
+        self._fop.force_move(_file_in_tmpdir, _file_in_target)
+
+    def __get_files_to_restore(self, snapshot, files, failOnNotFound, deltas = None):
+        """Returns the list of the given files normalized with leading
+        separator. Files not contained in the snapshot are skipped (or an
+        exception is raised) and duplicates as well as files within other
+        given directories are removed.
+        """
+        _infos = snapshot.getSnapshotFileInfos()
+        _files = []
+        for _file in files:
+            _file = "%s%s" % (self._fop.pathsep, _file.lstrip(self._fop.pathsep))
+            if deltas is not None and deltas.get_entry(_file) is not None:
+                _files.append(_file)
+                continue
+            if not _infos.hasPath(_file) and not _infos.hasFile(_file):
+                if failOnNotFound:
+                    raise exceptions.SBException(_("File '%s' not found in the backup snapshot files list") % _file)
+                self.logger.warning(_("File '%(filename)s' not found in snapshot's [%(snapshotname)s] files list, Skipped.")\
+                                    % {"filename": _file, "snapshotname" : snapshot.getName()})
+                continue
+            _files.append(_file)
+
+        # parents are sorted before their content
+        _files.sort()
+        _result = []
+        for _file in _files:
+            _contained = False
+            for _parent in _result:
+                if _file == _parent or _file.startswith(_parent.rstrip(self._fop.pathsep) + self._fop.pathsep):
+                    _contained = True
+                    break
+            if not _contained:
+                _result.append(_file)
+        return _result
 
     def revert(self, snapshot, directory):
         """
@@ -158,13 +355,18 @@ class RestoreManager(object):
         pass
 
 
-    def revertAs(self, snapshot, directory, targetdir):
+    def revertAs(self, snapshot, directory, targetdir, nthreads = _REVERT_THREADS):
         """
         Revert a directory to its snapshot date state into a directory.
-        We will restore the directory starting from the base snapshot to the selected one and clean the restore directory each time.
+        The snar files of the snapshot and its base snapshots are used for
+        determining the archive holding the final version of each file (see
+        `revertplan`). Each file is extracted only once; the archives of the
+        base snapshots are read concurrently. The directories are extracted
+        from the archive of the given snapshot at last.
         @param snapshot : The snapshot from which to revert 
         @param dir : the dir to revert, use self._fop.pathsep for the whole snapshot
         @param targetdir: The dir in which to restore files 
+        @param nthreads: max. number of archives read concurrently
         """
         if not snapshot:
             raise exceptions.SBException("Please provide a Snapshot")
@@ -173,16 +375,103 @@ class RestoreManager(object):
 
         snpman = SnapshotManager.SnapshotManager(self._fop.get_dirname(snapshot.getPath()))
         history = snpman.getSnpHistory(snapshot)
-        history.reverse()
-        _cnt = 0
-        for snp in history:
-            self.logger.debug("Restoring '%(dirname)s' from snapshot '%(snapshotname)s'"\
-                              % { "dirname" : directory, "snapshotname" : snp.getName() })
-            _bak = False
-            if _cnt == 0:
-                _bak = True
-            _cnt += 1
-
-            self.restoreAs(snp, directory, targetdir, backupFlag = _bak,
-                           failOnNotFound = False)
+        _deltas = self.__get_delta_restorer(snapshot, history)
+        _path = "%s%s" % (self._fop.pathsep, directory.strip(self._fop.pathsep))
+        if _deltas is not None and _deltas.get_entry(_path) is not None:
+            # large file stored by blocks; not contained in any archive
+            _plan = revertplan.RevertPlan(_path, [_snp.getName() for _snp in history])
+        else:
+            _planner = revertplan.RevertPlanner(history, snapshot.read_excludeflist_from_file())
+            _plan = _planner.plan(directory)
+        if _plan.is_empty() and (_deltas is None or len(_deltas.list_files(_plan.path)) == 0):
+            self.logger.warning(_("Nothing to revert for '%s'.") % _plan.path)
+            return
+        self.logger.info(_plan.get_report())
+
+        now = datetime.datetime.now().isoformat("_").replace(":", ".")
+        suffix = ".before_restore_" + now
+
+        if targetdir and self._fop.path_exists(targetdir):
+            if not self._fop.is_dir(targetdir):
+                raise exceptions.SBException(_("Unable to revert '%(path)s' into file '%(target)s'.")\
+                                             % { "path" : _plan.path, "target" : targetdir })
+            _tmpdir = tempfile.mkdtemp(dir = targetdir, prefix = 'sbackup-restore_')
+            self.logger.debug("Restore tempdir: `%s`" % _tmpdir)
+            try:
+                self.__extract_revert_plan(history, _plan, _tmpdir, suffix, nthreads, _deltas)
+                self.__move_into_target(_tmpdir, _plan.path, targetdir, suffix)
+            finally:
+                self._fop.force_delete(_tmpdir)
+        else:
+            if targetdir:
+                self._fop.makedirs(targetdir)
+            self.__extract_revert_plan(history, _plan, targetdir, suffix, nthreads, _deltas)
+
+    def __extract_revert_plan(self, history, plan, dest, suffix, nthreads, deltas = None):
+        """Extracts the members given in the plan. The archives of the base
+        snapshots are read concurrently; the archive of the reverted snapshot
+        is read at last since it contains the directories (their permissions
+        and times of modification must be set after their content was
+        extracted). Large files stored by blocks are restored before.
+        """
+        _snps = {}
+        for _snp in history:
+            _snps[_snp.getName()] = _snp
+        _reverted = history[0].getName()
+
+        def _make_task(snapshot, launcher, recursive):
+            def _task():
+                self.logger.debug("Restoring %(count)s members from snapshot '%(snapshotname)s'"\
+                                  % { "count" : len(plan.get_members(snapshot.getName())),
+                                      "snapshotname" : snapshot.getName() })
+                tar.extract_files(snapshot.getArchive(), self.__get_eff_archive_path(snapshot),
+                                  plan.get_members(snapshot.getName()), dest,
+                                  bckupsuffix = suffix, splitsize = snapshot.getSplitedSize(),
+                                  recursive = recursive, launcher = launcher)
+            return _task
+
+        _tasks = []
+        for _name in plan.get_snapshots():
+            if _name != _reverted:
+                _tasks.append(_make_task(_snps[_name], tar.TarBackendLauncher(), True))
+        _errors = _run_concurrently(_tasks, nthreads)
+        if len(_errors) > 0:
+            raise exceptions.SBException(_("Unable to revert '%(path)s': %(error)s")\
+                                         % { "path" : plan.path, "error" : _errors[0] })
+
+        self.__restore_delta_files(deltas, plan.path, dest, suffix)
+        if _reverted in plan.get_snapshots():
+            _make_task(history[0], None, False)()
+
+
+def _run_concurrently(tasks, nthreads):
+    """Runs the given callables using up to `nthreads` threads.
+    
+    @return: list of errors that occurred
+    """
+    _queue = Queue.Queue()
+    for _task in tasks:
+        _queue.put(_task)
+    _errors = []
+
+    def _work():
+        while True:
+            try:
+                _task = _queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                _task()
+            except Exception, error:
+                _errors.append(error)
 
+    _nthreads = min(nthreads, len(tasks))
+    if _nthreads <= 1:
+        _work()
+    else:
+        _threads = [threading.Thread(target = _work) for _idx in range(_nthreads)]
+        for _thread in _threads:
+            _thread.start()
+        for _thread in _threads:
+            _thread.join()
+    return _errors
@@ -32,22 +32,31 @@
 from gettext import gettext as _
 import traceback
 import datetime
-import time
 import types
+import threading
+import Queue
 
 from sbackup.pkginfo import Infos
 from sbackup.fs_backend import fam
 
 from sbackup.ar_backend import tar
+from sbackup.ar_backend import streams
+from sbackup.ar_backend import dedup
+from sbackup.ar_backend import delta
+from sbackup.ar_backend import memberindex
 from sbackup.ar_backend.tar import SnapshotFile
 from sbackup.ar_backend.tar import Dumpdir
 from sbackup.ar_backend.tar import SnapshotFileWrapper
 from sbackup.ar_backend.tar import ProcSnapshotFile
+from sbackup.ar_backend.tar import SnapshotContentMap
 from sbackup.ar_backend.tar import get_dumpdir_from_list
 
 import sbackup.util as Util
 from sbackup.util import constants
 from sbackup.core.snapshot import Snapshot
+from sbackup.core import catalog
+from sbackup.core import purgeplan
+from sbackup.core.ConfigManager import ConfigurationFileHandler
 from sbackup.util.log import LogFactory
 from sbackup.util.exceptions import SBException
 from sbackup.util.exceptions import NotValidSnapshotException
@@ -58,6 +67,9 @@ from sbackup.util.exceptions import FileAccessException
 
 
 _EXT_CORRUPT_SNP = ".corrupt"
+# suffixes of snapshot directories used while rebasing
+_EXT_REBASE_TMP = ".rebase"
+_EXT_REBASE_OLD = ".rebased"
 
 
 class SnapshotManager(object):
@@ -66,12 +78,17 @@ class SnapshotManager(object):
     :todo: Remove instance variables 'status' and implement an observer\
            pattern or progress function hooks! 
     
-    :note: Rebasing of snapshots is disabled due to severe performance issues.
+    :note: Rebasing merges the snar files in linear time and streams the\
+           members of the archives; no archive is extracted.
     """
 
-    def __init__(self, destination):
+    def __init__(self, destination, use_catalog = True):
         """Default constructor. Takes the path to the target backup
         directory as parameter.
+        
+        :param use_catalog: whether the snapshots are listed using the
+                            snapshot catalog stored in the target directory
+                            (see module `catalog`)
         """
         if not isinstance(destination, types.StringTypes):
             raise TypeError("Destination path of type string expected. Got %s instead"\
@@ -86,6 +103,9 @@ class SnapshotManager(object):
         # The list of the snapshots is stored the first time it's used,
         # so we don't have to re-get it later
         self.__snapshots = None
+        self.__catalog = None
+        if use_catalog:
+            self.__catalog = catalog.SnapshotCatalog(destination)
 
         # helper variables for displaying status messages
         self.statusMessage = None
@@ -185,42 +205,145 @@ class SnapshotManager(object):
 
     def _read_snps_from_disk_allformats(self, read_only = True):
         """Reads snapshots from the defined/set target directory and
-        stores them in according class attribute.
+        stores them in according class attribute. If the snapshot catalog
+        is valid, the snapshots are read from the catalog. Otherwise the
+        snapshot directories are read and (if not `read_only`) the catalog
+        is re-created.
         
         Unreadable snapshots are being renamed.
         """
-        self.__snapshots = []
-        listing = self._fop.listdir_fullpath(self.__dest_path)
+        if self.__read_snps_from_catalog():
+            return
 
-        for _snppath in listing :
-            _snpname = self._fop.get_basename(_snppath)
-            try:
-                self._fop.test_dir_access(_snppath)
-            except FileAccessException, error:
-                self.logger.info("Unable to access `%s'. Skipped." % _snppath)
-                continue
-
-            if _snpname.endswith(_EXT_CORRUPT_SNP):
-                self.logger.info("Corrupt snapshot `%s` found. Skipped." % _snpname)
-                continue
-            try:
-                self.__snapshots.append(Snapshot(_snppath))
-            except NotValidSnapshotException, error :
-                if isinstance(error, NotValidSnapshotNameException) :
-                    self.logger.info(_("Invalid snapshot `%(name)s` found: Name of snapshot not valid.")\
-                                        % { 'name': str(_snpname) })
-                else: # rename only if name was valid but snapshot was invalid
-                    self.logger.info(_("Invalid snapshot `%(name)s` found: %(error_cause)s.")\
-                                        % { 'name': str(_snpname), 'error_cause' :error })
-                    if not read_only:
-                        self.logger.info("Invalid snapshot `%s` is being renamed." % _snpname)
-                        if _snppath.endswith(".inc") or _snppath.endswith(".ful"):
-                            _ren_snppath = "%s%s" % (_snppath[:-4], _EXT_CORRUPT_SNP)
-                        else:
-                            _ren_snppath = "%s%s" % (_snppath, _EXT_CORRUPT_SNP)
-                        self._fop.rename(_snppath, _ren_snppath)
+        # the snapshot directories are read at once; infos retrieved when
+        # listing the target are re-used when the snapshots are read
+        self._fop.begin_info_cache()
+        try:
+            self.__snapshots = []
+            listing = self._fop.listdir_fullpath(self.__dest_path)
+
+            for _snppath in listing :
+                _snpname = self._fop.get_basename(_snppath)
+                if catalog.is_catalog_file(_snpname) or _snpname == dedup.STORE_DIRNAME:
+                    continue
+                try:
+                    self._fop.test_dir_access(_snppath)
+                except FileAccessException, error:
+                    self.logger.info("Unable to access `%s'. Skipped." % _snppath)
+                    continue
+
+                if _snpname.endswith(_EXT_CORRUPT_SNP):
+                    self.logger.info("Corrupt snapshot `%s` found. Skipped." % _snpname)
+                    continue
+                try:
+                    self.__snapshots.append(Snapshot(_snppath))
+                except NotValidSnapshotException, error :
+                    if isinstance(error, NotValidSnapshotNameException) :
+                        self.logger.info(_("Invalid snapshot `%(name)s` found: Name of snapshot not valid.")\
+                                            % { 'name': str(_snpname) })
+                    else: # rename only if name was valid but snapshot was invalid
+                        self.logger.info(_("Invalid snapshot `%(name)s` found: %(error_cause)s.")\
+                                            % { 'name': str(_snpname), 'error_cause' :error })
+                        if not read_only:
+                            self.logger.info("Invalid snapshot `%s` is being renamed." % _snpname)
+                            if _snppath.endswith(".inc") or _snppath.endswith(".ful"):
+                                _ren_snppath = "%s%s" % (_snppath[:-4], _EXT_CORRUPT_SNP)
+                            else:
+                                _ren_snppath = "%s%s" % (_snppath, _EXT_CORRUPT_SNP)
+                            self._fop.rename(_snppath, _ren_snppath)
+        finally:
+            self._fop.end_info_cache()
 
         self.__snapshots.sort(key = Snapshot.getName, reverse = True)
+        if not read_only:
+            self.__write_catalog()
+
+    def __read_snps_from_catalog(self):
+        """Reads the snapshots from the snapshot catalog.
+        
+        :return: True if the snapshots were read, False if the catalog is
+                 not used, missing or outdated
+        """
+        if self.__catalog is None or not self.__catalog.load():
+            return False
+        _snapshots = []
+        try:
+            for _entry in self.__catalog.get_entries():
+                _snppath = self._fop.joinpath(self.__dest_path, _entry.name)
+                _snapshots.append(Snapshot(_snppath, entry = _entry))
+        except NotValidSnapshotException, error:
+            self.logger.warning(_("Snapshot catalog contains invalid snapshot: %s") % error)
+            self.__catalog.invalidate()
+            return False
+        self.logger.debug("%s snapshots read from snapshot catalog." % len(_snapshots))
+        self.__snapshots = _snapshots
+        return True
+
+    def __write_catalog(self):
+        """Re-creates the snapshot catalog from the snapshots read from disk.
+        """
+        if self.__catalog is None:
+            return
+        try:
+            _entries = [catalog.CatalogEntry.from_snapshot(_snp) for _snp in self.__snapshots]
+        except Exception, error:
+            self.logger.warning(_("Unable to create snapshot catalog: %s") % error)
+            self.__catalog.invalidate()
+            return
+        self.__catalog.set_entries(_entries)
+        self.__commit_catalog()
+
+    def __commit_catalog(self):
+        try:
+            self.__catalog.commit()
+        except Exception, error:
+            self.logger.warning(_("Unable to write snapshot catalog: %s") % error)
+            self.__catalog.invalidate()
+
+    def __can_update_catalog(self):
+        """Checks whether the snapshot catalog can be updated after snapshots
+        were changed. This is the case if the catalog was read resp. written
+        by this manager and was not written by others since. Otherwise the
+        catalog is removed; it is re-created when the snapshots are read
+        next time.
+        """
+        if self.__catalog is None:
+            return False
+        if self.__catalog.is_loaded() and self.__catalog.is_unchanged():
+            return True
+        self.__catalog.invalidate()
+        return False
+
+    def register_snapshot(self, snapshot):
+        """Adds the given snapshot to the snapshot catalog after it was
+        committed.
+        
+        :param snapshot: the committed snapshot
+        :type snapshot: `Snapshot`
+        """
+        if self.__can_update_catalog():
+            self.__catalog.add(catalog.CatalogEntry.from_snapshot(snapshot))
+            self.__commit_catalog()
+
+    def __unregister_snapshot(self, snapshot):
+        """Removes the given (removed) snapshot from the snapshot catalog.
+        """
+        if self.__can_update_catalog():
+            self.__catalog.remove(snapshot.getName())
+            self.__commit_catalog()
+
+    def get_archive_size(self, snapshot):
+        """Returns the size of the archive of the given snapshot in bytes. The
+        size is taken from the snapshot catalog if available.
+        
+        :return: the size or `catalog.SIZE_UNKNOWN`
+        """
+        _entry = None
+        if self.__catalog is not None:
+            _entry = self.__catalog.get_entry(snapshot.getName())
+        if _entry is not None and _entry.size != catalog.SIZE_UNKNOWN:
+            return _entry.size
+        return catalog.get_archive_size(snapshot)
 
     def get_snapshots(self, fromDate = None, toDate = None, byDate = None,
                       forceReload = False):
@@ -326,6 +449,10 @@ class SnapshotManager(object):
         The method returns a list containing files that needs to be extracted
         from the archive that was merged in. 
         
+        Both snar files are parsed only once and the result is written using
+        a single file handle, i.e. the time required for merging grows
+        linearly with the size of the snar files.
+        
         :todo: Do we need to consider the order of the snar files?
         :todo: Needs more refactoring! (CQS)
         
@@ -349,35 +476,40 @@ class SnapshotManager(object):
                         "SnapshotFileWrapper "\
                         "type! Got %s instead." % type(res_snpfinfo))
 
-#        print "Parent (base) snar file:\n%s" % src_snpfinfo
         # list for storage of files that need to be extracted from merge source
         files_to_extract = []
-
-        for target_record in target_snpfinfo.iterRecords():
-            _tmp_dumpdirs = []
-#TODO: A similar method to getContent would be nice!
-            _curdir = target_record[SnapshotFile.REC_DIRNAME]
-            # get the content (dumpdir entries) for current directory
-            _curcontent = target_snpfinfo.getContent(_curdir)
-            for _dumpdir in _curcontent:
-#                print "\n  now processing dumpdir: %s" % _dumpdir
-                _ctrl = _dumpdir.getControl()
-                _filen = _dumpdir.getFilename()
-                _ddir_final = None
-                _was_excluded = False
-                if _ctrl == Dumpdir.UNCHANGED:
-                    # Item was explicitly excluded and is therefore not included in child
-#                    _filenfull = os.path.join(_curdir, _filen)
-#                    print "Full path: %s" % (_filenfull)
-                    if self._fop.joinpath(_curdir, _filen) in target_excludes:
-                        self.logger.debug("Path '%s' was excluded. Not merged." % _filen)
-                        _was_excluded = True
-                    else:
+        # content of the source snar file is read once in advance
+        _src_contents = SnapshotContentMap(src_snpfinfo.get_snapfile_obj())
+
+        def _iter_merged_records():
+            """Iterator over the merged records; the target snar file is
+            parsed only once.
+            """
+            _cursrcdir = None
+            _cursrccontent = None
+            for target_record in target_snpfinfo.iterRecords():
+                _tmp_dumpdirs = []
+                _curdir = target_record[SnapshotFile.REC_DIRNAME]
+                for _dumpdir in target_record[SnapshotFile.REC_CONTENT]:
+                    _ctrl = _dumpdir.getControl()
+                    _filen = _dumpdir.getFilename()
+                    _ddir_final = None
+                    if _ctrl == Dumpdir.UNCHANGED:
+                        # Item was explicitly excluded and is therefore not included in child
+                        if self._fop.joinpath(_curdir, _filen) in target_excludes:
+                            self.logger.debug("Path '%s' was excluded. Not merged." % _filen)
+                            continue
                         # Item has not changed and is therefore not included in child (i.e. target) snapshot.
                         # look for the item in the parent (i.e. base/source) snapshot
-                        _basedumpd = get_dumpdir_from_list(\
-                                                src_snpfinfo.getContent(_curdir),
-                                                _filen)
+                        if _cursrcdir != _curdir:
+                            _cursrccontent = _src_contents.getContentDict(_curdir)
+                            _cursrcdir = _curdir
+                        _basedumpd = _cursrccontent.get(_filen)
+                        if _basedumpd is None:
+                            raise SBException(_("Unable to find `%(file)s` in snapshot file "\
+                                                "'%(snar)s'.")
+                                              % { "file" : self._fop.joinpath(_curdir, _filen),
+                                                  "snar" : src_snpfinfo.get_snapfile_path() })
                         _base_ctrl = _basedumpd.getControl()
 
                         if _base_ctrl == Dumpdir.UNCHANGED:
@@ -392,68 +524,198 @@ class SnapshotManager(object):
                                               "('%s') in snapshot file '%s'."\
                                               % (_ctrl, target_snpfinfo.get_snapfile_path()))
 
-                elif _ctrl == Dumpdir.DIRECTORY:
-                    _ddir_final = _dumpdir
+                    elif _ctrl == Dumpdir.DIRECTORY:
+                        _ddir_final = _dumpdir
 
-                elif _ctrl == Dumpdir.INCLUDED:
-                    _ddir_final = _dumpdir
-                else:
-                    raise SBException("Found unexpected control code "\
-                                      "('%s') in snapshot file '%s'."\
-                                      % (_ctrl, target_snpfinfo.get_snpfile_Path()))
+                    elif _ctrl == Dumpdir.INCLUDED:
+                        _ddir_final = _dumpdir
+                    else:
+                        raise SBException("Found unexpected control code "\
+                                          "('%s') in snapshot file '%s'."\
+                                          % (_ctrl, target_snpfinfo.get_snapfile_path()))
 
-                if not _was_excluded:
                     _tmp_dumpdirs.append(_ddir_final)
-            # end of loop over dumpdirs 
-            _final_record = target_record[:SnapshotFile.REC_CONTENT]
-            _final_record.append(_tmp_dumpdirs)
-            # write to the SnarFile
-            res_snpfinfo.addRecord(_final_record)
+                # end of loop over dumpdirs
+                _final_record = target_record[:SnapshotFile.REC_CONTENT]
+                _final_record.append(_tmp_dumpdirs)
+                yield _final_record
+
+        # write to the SnarFile using a single file handle
+        _nrecords = res_snpfinfo.addRecords(_iter_merged_records())
+        self.logger.debug("%s records merged." % _nrecords)
         return files_to_extract
 
-    def __makeSnpFull(self, snapshot):
-        """Make an inc snapshot to a full one.
-                
+    def rebaseSnapshot(self, torebase, newbase = None):
+        """Rebases the snapshot `torebase` on `newbase`: the content of the
+        snapshots between both (in the snapshot history) is merged into the
+        rebased snapshot, so that these snapshots are no longer required
+        by the rebased one. If no new base is given, the whole history is
+        merged and the snapshot is converted into a full snapshot.
+        
+        The archives are not extracted; the members are streamed from the
+        archives in the history straight into the new archive.
+        
+        :param torebase: the (incremental) snapshot to be rebased
+        :param newbase: the new base or None (convert into full snapshot)
+        :return: the rebased snapshot
+        :rtype: Snapshot
+        
+        :postcondition: The snapshot has the same childs as before.
+        
+        """
+        if torebase.isfull():
+            self.logger.info(_("Snapshot '%s' is already Full, nothing to do (not changing it to full).") % torebase.getName())
+            return torebase
+
+        _history = self.getSnpHistory(torebase)
+        if newbase is None:
+            _chain = _history
+        else:
+            _names = [_snp.getName() for _snp in _history]
+            if newbase.getName() not in _names[1:]:
+                raise SBException(_("Snapshot '%(newbase)s' is not a predecessor of '%(snapshot)s'.")\
+                                  % { "newbase" : newbase.getName(), "snapshot" : torebase.getName() })
+            _chain = _history[:_names.index(newbase.getName())]
+            if len(_chain) == 1:
+                self.logger.info(_("Snapshot '%(snapshot)s' is already based on '%(newbase)s'.")\
+                                 % { "newbase" : newbase.getName(), "snapshot" : torebase.getName() })
+                return torebase
+
+        for _snp in _chain:
+            if _snp.getSplitedSize() > 0 and _snp.getFormat() == "none":
+                raise SBException(_("Snapshot '%s' is split into uncompressed volumes and cannot be rebased.")\
+                                  % _snp.getName())
+
+        self.logger.info(_("Rebasing snapshot '%(snapshot)s' (merging %(nsnps)s snapshots).")\
+                         % { "snapshot" : torebase.getName(), "nsnps" : len(_chain) - 1 })
+        _excludes = torebase.read_excludeflist_from_file()
+        _tmpdir = ConfigurationFileHandler().get_user_tempdir()
+        _tmpsnars = []
+        try:
+            # merge the snar files step by step; the archives of the merged
+            # snapshots contain the files to be copied
+            _target = torebase.getSnapshotFileInfos()
+            _sources = [(torebase.getArchive(), None)]
+            for _base in _chain[1:]:
+                _tmpsnar = self._fop.normpath(_tmpdir, "%s.merged.snar" % _base.getName())
+                _tmpsnars.append(_tmpsnar)
+                _res = self._copy_empty_snar(torebase, _tmpsnar)
+                _files = self._merge_snarfiles(_target, _excludes,
+                                               _base.getSnapshotFileInfos(), _res)
+                _sources.append((_base.getArchive(), _files))
+                _target = _res
+
+            _res_snp = self.__write_rebased_snapshot(torebase, newbase, _target, _sources,
+                                                     _chain)
+        finally:
+            for _tmpsnar in _tmpsnars:
+                if self._fop.path_exists(_tmpsnar):
+                    self._fop.delete(_tmpsnar)
+        return _res_snp
+
+    def convertToFullSnapshot(self, snapshot):
+        """Converts the given incremental snapshot into a full snapshot
+        (see `rebaseSnapshot`).
+        
         :param snapshot: the snapshot to be converted
         :type snapshot: `Snapshot`
         :return: the new full snapshot
         :rtype: Snapshot
-                
-        :todo: Is it really neccessary to create a new snapshot or is it enough to call `setPath`?
-                -> It is necessary since paths to e.g. snar file have changed.
-        
-        :postcondition: The snapshot has the same childs as before.
+        """
+        return self.rebaseSnapshot(snapshot, None)
+
+    def __write_rebased_snapshot(self, torebase, newbase, snpfinfo, sources, chain):
+        """Writes the rebased snapshot into a temporary directory and
+        replaces the original snapshot by it afterwards.
         
+        :param snpfinfo: the merged snar file
+        :param sources: archives and files to be copied into the new archive
+                        (see `streams.write_consolidated_archive`)
+        :param chain: the merged snapshots (most recent first)
         """
-        if snapshot.isfull():
-            self.logger.info(_("Snapshot '%s' is already Full, nothing to do (not changing it to full).") % snapshot.getName())
-            res_snp = snapshot
+        _srcpath = torebase.getPath()
+        _cformat = torebase.getFormat()
+        _splitsize = torebase.getSplitedSize()
+        _arname = tar.get_archive_name(_cformat)
+        _snarname = self._fop.get_basename(torebase.getSnarFile())
+        if newbase is None:
+            _name = "%sful" % torebase.getName()[:-3]
         else:
-            childs = self._retrieve_childsnps(snapshot)
-
-            if childs:
-                fulname = snapshot.getName()[:-3] + 'ful'
-                for _snp in childs:
-                    _snp.setBase(fulname)
-                    _snp.commitbasefile()
-
-            path = snapshot.getPath()
-            self._fop.rename(self._fop.joinpath(path, 'base'), self._fop.joinpath(path, 'base.old'))
-            self._fop.rename(path, path[:-3] + 'ful')
-            res_snp = Snapshot(path[:-3] + 'ful')
-
-            # post-condition check
-            # all childs are preserved
-            postcond_child_names = self._retrieve_childsnps_names(res_snp)
-
-            if len(childs) != len(postcond_child_names):
-                raise AssertionError("Renaming of base of child snapshots was "\
-                                     "not successful.")
-            for _chl in childs:
-                if _chl.getName() not in postcond_child_names:
-                    raise AssertionError("Renaming of base of child snapshots "\
-                                         "was not successful.")
+            _name = torebase.getName()
+        _dstpath = self._fop.joinpath(self.__dest_path, _name)
+        _tmppath = "%s%s" % (_srcpath, _EXT_REBASE_TMP)
+        _oldpath = "%s%s" % (_srcpath, _EXT_REBASE_OLD)
+        _childs = self._retrieve_childsnps(torebase)
+
+        if self._fop.path_exists(_tmppath):
+            self._fop.force_delete(_tmppath)
+        self._fop.makedir(_tmppath)
+        self._fop.chmod_no_rwx_grp_oth(_tmppath)
+
+        # files that are replaced (the archive is possibly split into parts)
+        _skip = ["base", "ver", "format", _snarname, "%s%s" % (_snarname, SnapshotFile.INDEX_SUFFIX),
+                 delta.INDEX_FILENAME, delta.ARCHIVE_FILENAME]
+        for _fname in self._fop.listdir(_srcpath):
+            if _fname in _skip or _fname == _arname or _fname.startswith("%s." % _arname):
+                continue
+            self._fop.copyfile(self._fop.joinpath(_srcpath, _fname),
+                               self._fop.joinpath(_tmppath, _fname))
+
+        _partsize = 0
+        if _splitsize > 0:
+            _partsize = _splitsize * constants.TAR_VOLUME_SIZE_UNIT_IN_BYTES
+        # the member index is written again if the snapshot was indexed
+        _indexed = memberindex.has_index(torebase.getArchive())
+        streams.write_consolidated_archive(self._fop.joinpath(_tmppath, _arname), _cformat,
+                                           sources,
+                                           SnapshotContentMap(snpfinfo.get_snapfile_obj()),
+                                           partsize = _partsize, indexed = _indexed)
+
+        # the changed blocks of large files are merged as well
+        delta.merge_deltas([_snp.getPath() for _snp in chain], _tmppath,
+                           complete = (newbase is None))
+
+        _snarfile = self._fop.joinpath(_tmppath, _snarname)
+        self._fop.copyfile(snpfinfo.get_snapfile_path(), _snarfile)
+        try:
+            SnapshotFile(_snarfile).write_index()
+        except Exception, error:
+            self.logger.warning(_("Unable to commit index of snar file: %s") % error)
+        self._fop.writetofile(self._fop.joinpath(_tmppath, "format"),
+                              "%s\n%s" % (_cformat, _splitsize))
+        if newbase is not None:
+            self._fop.writetofile(self._fop.joinpath(_tmppath, "base"), newbase.getName())
+        # the version is written at last: it marks the snapshot as valid
+        self._fop.writetofile(self._fop.joinpath(_tmppath, "ver"), torebase.getVersion())
+
+        # replace the original snapshot
+        self._fop.rename(_srcpath, _oldpath)
+        self._fop.rename(_tmppath, _dstpath)
+        if _name != torebase.getName():
+            for _snp in _childs:
+                _snp.setBase(_name)
+                _snp.commitbasefile()
+        self._fop.force_delete(_oldpath)
+
+        res_snp = Snapshot(_dstpath)
+        if self.__can_update_catalog():
+            self.__catalog.remove(torebase.getName())
+            self.__catalog.add(catalog.CatalogEntry.from_snapshot(res_snp))
+            for _snp in _childs:
+                self.__catalog.set_base(_snp.getName(), _name)
+            self.__commit_catalog()
+        self.get_snapshots(forceReload = True)
 
+        # post-condition check
+        # all childs are preserved
+        postcond_child_names = self._retrieve_childsnps_names(res_snp)
+        if len(_childs) != len(postcond_child_names):
+            raise AssertionError("Renaming of base of child snapshots was "\
+                                 "not successful.")
+        for _chl in _childs:
+            if _chl.getName() not in postcond_child_names:
+                raise AssertionError("Renaming of base of child snapshots "\
+                                     "was not successful.")
         return res_snp
 
     def _retrieve_childsnps(self, snapshot):
@@ -483,8 +745,12 @@ class SnapshotManager(object):
         if not self.is_standalone_snapshot(snapshot):
             raise RemoveSnapshotHasChildsError("The given snapshot '%s' is not stand-alone." % snapshot)
         self.logger.info("Removing '%s'" % snapshot.getName())
+        _dedup = (snapshot.getFormat() == dedup.FORMAT)
         self._fop.delete(snapshot.getPath())
+        self.__unregister_snapshot(snapshot)
         self.get_snapshots(forceReload = True)
+        if _dedup:
+            self.collect_garbage()
 
     def is_standalone_snapshot(self, snapshot):
         _res = False
@@ -509,8 +775,12 @@ class SnapshotManager(object):
         """Removes snapshot directory forcefully.
         """
         self.logger.debug("Removing '%s'" % snapshot.getName())
+        _dedup = (snapshot.getFormat() == dedup.FORMAT)
         self._fop.delete(snapshot.getPath())
+        self.__unregister_snapshot(snapshot)
         self.get_snapshots(forceReload = True)
+        if _dedup:
+            self.collect_garbage()
 
     def compareSnapshots(self, snap1, snap2):
         """Compare 2 snapshots and return and SBdict with the
@@ -548,172 +818,149 @@ class SnapshotManager(object):
 
         return result
 
-    def purge(self, purge, no_purge_snp):
-        """Public method that processes purging of archive directory.
+    def plan_purge(self, purge, no_purge_snp, consolidate = False):
+        """Computes the snapshots to be removed when purging without
+        removing anything (see `purge`).
         
-        :param mode: for the moment, only "log" and "simple" are supported
-        :param no_purge: name of snapshot not being purged 
+        :return: the plan of removals and rebases
+        :rtype: `purgeplan.PurgePlan`
+        """
+        _planner = purgeplan.PurgePlanner(self.get_snapshots(forceReload = True),
+                                          no_purge_snp, consolidate)
+        return _planner.plan(purge)
+
+    def purge(self, purge, no_purge_snp, consolidate = False, nthreads = 1,
+              dry_run = False):
+        """Public method that processes purging of archive directory. The
+        snapshots to be removed are planned at once; the plan is executed
+        afterwards.
         
-        :todo: We should try to remove the snapshots from fresh to old to avoid multiple re-base operations!
+        :param purge: "log" or the max. age of snapshots in days
+        :param no_purge_snp: name of snapshot not being purged 
+        :param consolidate: if set, snapshots that other snapshots rely on
+                            are removed as well; their childs are rebased
+                            (resp. converted into full snapshots)
+        :param nthreads: max. number of snapshots removed concurrently
+        :param dry_run: if set, the plan is reported but not executed
+        :return: the executed plan
+        :rtype: `purgeplan.PurgePlan`
         
         """
-        self.get_snapshots(forceReload = True)
-        if purge == "log":
-            self._do_log_purge(no_purge_snp)
-        else:
-            self._do_cutoff_purge(purge, no_purge_snp)
-        self.get_snapshots(forceReload = True)
-
-    def _do_log_purge(self, no_purge_snp = ""):
-        """Logarithmic purge
-        Keep progressivelly less backups into the past:
-        Keep all backups from yesterday
-        Keep one backup per day from last week.
-        Keep one backup per week from last month.
-        Keep one backup per month from last year.
-        Keep one backup per quarter from 2nd last year.
-        Keep one backup per year further in past.        
-        """
-
-        self.logger.info("Logarithmic purging")
-        # compute years since begin of epoch: we need to go back this far
-        _years_epoch = int(time.time() / (constants.SECONDS_IN_DAY * constants.DAYS_IN_YEAR))
-
-        purge_plan = [ { "title" : "Last week", "nperiod" : 7,
-                         "interval" : 1 },
-                       { "title" : "Last month", "nperiod" : 3,
-                         "interval" : constants.DAYS_IN_WEEK },
-                       { "title" : "Last year", "nperiod" : 11,
-                         "interval" : constants.DAYS_IN_MONTH },
-                       { "title" : "2nd last year", "nperiod" : 4,
-                         "interval" : constants.DAYS_IN_QUARTER },
-                       { "title" : "remaining years", "nperiod" : _years_epoch,
-                         "interval" : constants.DAYS_IN_YEAR }
-                     ]
-
-        _max_age = 2    # start value
-        for pent in purge_plan:
-            self.logger.info("Logarithm Purging [%s]" % pent["title"])
-            _max_age = self.__purge_period(start = (_max_age - 1), nperiod = pent["nperiod"],
-                                           interval = pent["interval"], no_purge_snp = no_purge_snp)
-
-    def __purge_period(self, start, nperiod, interval, no_purge_snp):
-        """period is given as `start` age and interval length in days.
-        The period is repeated `nperiod` times.
-        Within these timespans the defined number of backups must remain.
+        _plan = self.plan_purge(purge, no_purge_snp, consolidate)
+        _sizes = {}
+        for _name in _plan.get_removed():
+            _snp = self.__get_snapshot_by_name(_name)
+            if _snp is not None:
+                _sizes[_name] = self.get_archive_size(_snp)
+        self.logger.info(_plan.get_report(_sizes))
+        if not dry_run:
+            self.__execute_purge_plan(_plan, nthreads)
+            self.get_snapshots(forceReload = True)
+            if len(_plan.get_steps()) > 0:
+                self.collect_garbage()
+        return _plan
+
+    def collect_garbage(self):
+        """Removes the chunks of deduplicated archives (see module `dedup`)
+        that are no longer referenced by any snapshot. The references are
+        counted over the archives of all snapshots; if any of them cannot be
+        read, nothing is removed.
+        
+        :return: the number of removed chunks
         """
-        _number_to_keep = 1
-        for j in range(0, nperiod):
-            _min_age = start + (j * interval)
-            _max_age = _min_age + (interval + 1)
-            self._do_purge_in_timespan(_min_age, _max_age, _number_to_keep, no_purge_snp)
-        return _max_age
-
-    def _do_purge_in_timespan(self, min_age, max_age, number_to_keep, no_purge_snp = ""):
-        """Simple purging is processed: all snapshots in timespan (i.e. younger
-        than `max_age` and older than `min_age` are removed. Only freestanding
-        snapshots are removed.
-        Given snapshot `no_purge_snp` is never removed.
-        The removal is terminated if `number_to_keep` snapshots remain.
+        _store = self._fop.joinpath(self.__dest_path, dedup.STORE_DIRNAME)
+        if not self._fop.path_exists(_store):
+            return 0
+        try:
+            _archives = []
+            for _snp in self.get_snapshots(forceReload = True):
+                if _snp.getFormat() == dedup.FORMAT:
+                    _archives.append(_snp.getArchive())
+            return dedup.collect_garbage(_store, _archives)
+        except (SBException, IOError, OSError), error:
+            self.logger.warning(_("Unable to remove unreferenced chunks: %s") % error)
+        return 0
+
+    def __get_snapshot_by_name(self, name):
+        for _snp in self.get_snapshots():
+            if _snp.getName() == name:
+                return _snp
+        return None
+
+    def __execute_purge_plan(self, plan, nthreads):
+        """Executes the steps of the given purge plan. Rebases are processed
+        one after another, independent removals are processed concurrently.
         """
-        _min_age = int(round(min_age))
-        _max_age = int(round(max_age))
-        assert _max_age > _min_age, "Given parameter max. age should be greater than min. age"
-
-        if _min_age > 0:
-            self.logger.debug("Purge in timespan\nRemove freestanding snapshots younger "\
-                              "than %(max_age)s and older than %(min_age)s days."\
-                              % {"max_age" : _max_age, "min_age" : _min_age})
-
-            while True:
-                _was_removed = False
-                snapshots = self.get_snapshots()    # sort order: idx 0 = most recent
-                snapshots = _get_snapshots_younger_than(snapshots, _max_age)
-                snapshots = _get_snapshots_older_than(snapshots, _min_age)
-
-                # debugging output
-                if self.logger.isEnabledFor(5):
-                    self.logger.debug("Snapshots in timespan - re-sorted]")
-                    for csnp in snapshots:
-                        self.logger.debug(str(csnp))
-                ###
-
-                _nsnps = len(snapshots)
-                _maxidx = _nsnps - number_to_keep    # biggest valid index
-                if _nsnps <= number_to_keep:
-                    break
-                for _idx in range(_maxidx):
-                    snp = snapshots[_idx]
-                    if snp.getName() == no_purge_snp:
-                        self.logger.debug("`%s` skipped.")
-                        continue
-
-                    self.logger.debug("Checking '%s' for childs." % (snp))
-                    childs = self._retrieve_childsnps(snapshot = snp)
-                    if len(childs) == 0:
-                        self.logger.debug("Snapshot '%s' has no childs "\
-                                        "-> is being removed." % (snp))
-                        self.remove_snapshot_forced(snapshot = snp) # it's freestanding
-                        _was_removed = True
-                        break
-                if _was_removed is False:
-                    break
-
-    def _do_cutoff_purge(self, purge, no_purge_snp = ""):
-        """Simple cut-off purging is processed: all snapshots older than
-        a certain value are removed. During removal of snapshots the
-        snapshot state (full, inc) is considered.
+        for _step in plan.get_steps():
+            _action = _step[0]
+            if _action.is_removal():
+                self.__remove_snapshots([_action.name for _action in _step], nthreads)
+            else:
+                _snp = self.__get_snapshot_by_name(_action.name)
+                if _snp is None:
+                    raise SBException(_("Snapshot '%s' not found ") % _action.name)
+                _newbase = None
+                if _action.newbase is not None:
+                    _newbase = self.__get_snapshot_by_name(_action.newbase)
+                    if _newbase is None:
+                        raise SBException(_("Snapshot '%s' not found ") % _action.newbase)
+                self.rebaseSnapshot(_snp, _newbase)
+
+    def __remove_snapshots(self, names, nthreads):
+        """Removes the given snapshots (without checking for childs) using up
+        to `nthreads` threads.
         """
-        try:
-            purge = int(purge)
-        except ValueError:
-            purge = 0
-        if purge > 0:
-            self.logger.info("Simple purge - remove freestanding snapshots older "\
-                             "than %s days." % purge)
-
-            while True:
-                _was_removed = False
-                snapshots = _get_snapshots_older_than(self.get_snapshots(), purge)
-                for snp in snapshots:
-                    if snp.getName() == no_purge_snp:
-                        self.logger.debug("`%s` skipped.")
-                        continue
-
-                    self.logger.debug("Checking '%s' for childs." % (snp))
-                    childs = self._retrieve_childsnps(snapshot = snp)
-                    if len(childs) == 0:
-                        self.logger.debug("Snapshot '%s' has no childs "\
-                                        "-> is being removed." % (snp))
-                        self.remove_snapshot_forced(snapshot = snp)
-                        _was_removed = True
-                        break
-                if _was_removed is not True:
-                    break
-
-
-def _get_snapshots_younger_than(snapshots, age):
-    _res = []
-    for snp in snapshots:
-        date = snp.getDate()
-        snp_age = (datetime.date.today() - datetime.date(date['year'],
-                                                         date['month'],
-                                                         date['day'])).days
-        if snp_age < age:
-            _res.append(snp)
-    return _res
+        _snps = []
+        for _name in names:
+            _snp = self.__get_snapshot_by_name(_name)
+            if _snp is None:
+                raise SBException(_("Snapshot '%s' not found ") % _name)
+            self.logger.info("Removing '%s'" % _name)
+            _snps.append(_snp)
+        _errors = _delete_concurrently(self._fop, [_snp.getPath() for _snp in _snps], nthreads)
+        if len(_errors) > 0:
+            if self.__catalog is not None:
+                self.__catalog.invalidate()
+            self.get_snapshots(forceReload = True)
+            raise SBException(_("Unable to remove snapshot: %s") % _errors[0])
+        if self.__can_update_catalog():
+            for _snp in _snps:
+                self.__catalog.remove(_snp.getName())
+            self.__commit_catalog()
+        self.get_snapshots(forceReload = True)
 
 
-def _get_snapshots_older_than(snapshots, age):
-    _res = []
-    for snp in snapshots:
-        date = snp.getDate()
-        snp_age = (datetime.date.today() - datetime.date(date['year'],
-                                                    date['month'],
-                                                    date['day'])).days
-        if snp_age > age:
-            _res.append(snp)
-    return _res
+def _delete_concurrently(fop, paths, nthreads):
+    """Deletes the given paths using up to `nthreads` threads.
+    
+    :return: list of errors that occurred
+    """
+    _queue = Queue.Queue()
+    for _path in paths:
+        _queue.put(_path)
+    _errors = []
+
+    def _work():
+        while True:
+            try:
+                _path = _queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                fop.delete(_path)
+            except Exception, error:
+                _errors.append(error)
+
+    _nthreads = min(nthreads, len(paths))
+    if _nthreads <= 1:
+        _work()
+    else:
+        _threads = [threading.Thread(target = _work) for _idx in range(_nthreads)]
+        for _thread in _threads:
+            _thread.start()
+        for _thread in _threads:
+            _thread.join()
+    return _errors
 
 
 def debug_print_snarfile(filename):
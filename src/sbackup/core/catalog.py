@@ -0,0 +1,317 @@
+#   Simple Backup - catalog of the snapshots stored in a backup target
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+:mod:`catalog` --- catalog of the snapshots stored in a backup target
+=====================================================================
+
+.. module:: catalog
+   :synopsis: cached listing of the snapshots stored in a backup target
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+The catalog is a file in the root of the backup target that holds the
+basic informations of each snapshot (name, version, format, base, split
+size and size of the archive). Listing the snapshots from the catalog
+requires reading a single file instead of several files per snapshot, which
+matters for remote targets.
+
+The catalog is replaced atomically when it is written. It is only used if
+it lists exactly the snapshots found in the target directory (one listing
+of the directory is compared with the entries), i.e. snapshots added,
+removed or renamed by other means invalidate the catalog.
+
+"""
+
+from gettext import gettext as _
+
+from sbackup.fs_backend import fam
+
+from sbackup.ar_backend import chunks
+from sbackup.ar_backend import dedup
+
+from sbackup.util.exceptions import SBException
+from sbackup.util import log
+
+
+CATALOG_FILENAME = "snapshots.catalog"
+CATALOG_HEADER = "# sbackup snapshot catalog 1"
+
+# size of archives that could not be determined
+SIZE_UNKNOWN = -1
+
+# extensions of the names of full and incremental snapshots
+_SNP_EXTENSIONS = (".ful", ".inc")
+
+_SUFFIX_TMP = ".tmp"
+_NO_BASE = "-"
+
+_FOP = fam.get_file_operations_facade_instance()
+
+
+def is_catalog_file(name):
+    """Returns True if the given name (not path) is the name of the
+    catalog or of its temporary file.
+    """
+    return name in (CATALOG_FILENAME, "%s%s" % (CATALOG_FILENAME, _SUFFIX_TMP))
+
+def is_snapshot_name(name):
+    """Returns True if the given name (not path) found in the target
+    directory is supposed to be the name of a snapshot.
+    """
+    return name.endswith(_SNP_EXTENSIONS)
+
+def get_archive_size(snapshot):
+    """Returns the size (in bytes) of the archive of the given snapshot. If
+    the archive is split, the sizes of all parts are summed up. The size of
+    deduplicated archives is the size of the referenced (uncompressed) chunks.
+
+    @return: the size or `SIZE_UNKNOWN` if the size cannot be determined
+    """
+    try:
+        _archive = snapshot.getArchive()
+        if chunks.is_split_archive(_archive):
+            _size = 0
+            for _part in chunks.read_manifest(_archive):
+                _size += _part[1]
+        elif dedup.is_dedup_archive(_archive):
+            _size = dedup.get_archive_size(_archive)
+        else:
+            _size = _FOP.get_size(_archive)
+    except Exception, error:
+        log.LogFactory.getLogger().debug("Unable to determine size of archive of `%s`: %s"\
+                                         % (snapshot.getName(), error))
+        _size = SIZE_UNKNOWN
+    return _size
+
+
+class CatalogEntry(object):
+    """The informations about a single snapshot stored in the catalog.
+    """
+
+    def __init__(self, name, version, cformat, base = None, splitsize = 0,
+                 size = SIZE_UNKNOWN):
+        """
+        @param name: name of the snapshot
+        @param base: name of the base snapshot or None for full snapshots
+        @param size: size of the archive in bytes
+        """
+        self.name = name
+        self.version = version
+        self.cformat = cformat
+        self.base = base
+        self.splitsize = splitsize
+        self.size = size
+
+    def __str__(self):
+        return self.to_line()
+
+    def __eq__(self, other):
+        return isinstance(other, CatalogEntry) and self.to_line() == other.to_line()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, size = None):
+        """Creates the entry for the given (committed) snapshot.
+
+        @param size: the size of the archive; it is determined if not given
+        """
+        if size is None:
+            size = get_archive_size(snapshot)
+        return cls(snapshot.getName(), snapshot.getVersion(), snapshot.getFormat(),
+                   snapshot.getBase(), snapshot.getSplitedSize(), size)
+
+    @classmethod
+    def from_line(cls, line):
+        """Creates an entry from a line of the catalog file.
+
+        @raise ValueError: if the line is invalid
+        """
+        _fields = line.split("\t")
+        if len(_fields) != 6:
+            raise ValueError("Invalid number of fields: %s" % len(_fields))
+        _name, _version, _cformat, _base, _splitsize, _size = _fields
+        if _base == _NO_BASE:
+            _base = None
+        return cls(_name, _version, _cformat, _base, int(_splitsize), int(_size))
+
+    def to_line(self):
+        _base = self.base
+        if not _base:
+            _base = _NO_BASE
+        return "\t".join([self.name, str(self.version), self.cformat, _base,
+                          str(self.splitsize), str(self.size)])
+
+
+class SnapshotCatalog(object):
+    """The catalog of the snapshots stored in a backup target. The entries
+    are kept in memory; changes are written using `commit`.
+    """
+
+    def __init__(self, destination):
+        """
+        @param destination: path of the backup target
+        """
+        self.__logger = log.LogFactory.getLogger()
+        self.__dest_path = destination
+        self.__path = _FOP.joinpath(destination, CATALOG_FILENAME)
+        # dictionary of entries (name : CatalogEntry); None if not loaded
+        self.__entries = None
+        # time of modification of the catalog file when it was read/written
+        self.__mtime = None
+
+    def get_path(self):
+        return self.__path
+
+    def is_loaded(self):
+        return self.__entries is not None
+
+    def is_valid(self, names):
+        """Returns True if the catalog lists exactly the snapshots contained
+        in the given listing of the target directory.
+
+        @param names: the names (not paths) found in the target directory
+        """
+        self.__check_loaded()
+        _snpnames = set([_name for _name in names if is_snapshot_name(_name)])
+        return _snpnames == set(self.__entries.iterkeys())
+
+    def is_unchanged(self):
+        """Returns True if the catalog file was not written by others since
+        it was read resp. written by this object.
+        """
+        if self.__mtime is None:
+            return False
+        try:
+            return _FOP.get_mtime(self.__path) == self.__mtime
+        except Exception, error:
+            self.__logger.debug("Unable to access snapshot catalog: %s" % error)
+            return False
+
+    def load(self):
+        """Reads the catalog file if it is valid (see `is_valid`). The target
+        directory is listed once for validating the catalog.
+
+        @return: True if the catalog was loaded, False otherwise
+        """
+        self.__entries = None
+        self.__mtime = None
+        try:
+            _names = _FOP.listdir(self.__dest_path)
+        except Exception, error:
+            self.__logger.debug("Unable to list target for snapshot catalog: %s" % error)
+            return False
+        if CATALOG_FILENAME not in _names:
+            self.__logger.debug("Snapshot catalog `%s` is missing." % self.__path)
+            return False
+        try:
+            _mtime = _FOP.get_mtime(self.__path)
+            _lines = _FOP.readfile(self.__path).splitlines()
+            if len(_lines) == 0 or _lines[0] != CATALOG_HEADER:
+                raise ValueError("Invalid header")
+            _entries = {}
+            for _line in _lines[1:]:
+                if _line:
+                    _entry = CatalogEntry.from_line(_line)
+                    _entries[_entry.name] = _entry
+        except Exception, error:
+            self.__logger.warning(_("Snapshot catalog `%(path)s` is invalid: %(error)s")\
+                                  % { 'path' : self.__path, 'error' : error })
+            return False
+        self.__entries = _entries
+        if not self.is_valid(_names):
+            self.__logger.debug("Snapshot catalog `%s` is outdated." % self.__path)
+            self.__entries = None
+            return False
+        self.__mtime = _mtime
+        return True
+
+    def get_entries(self):
+        """Returns the list of entries sorted by name of the snapshots (the
+        most recent first).
+
+        @raise SBException: if the catalog is not loaded
+        """
+        self.__check_loaded()
+        _entries = self.__entries.values()
+        _entries.sort(key = lambda _entry: _entry.name, reverse = True)
+        return _entries
+
+    def get_entry(self, name):
+        """Returns the entry of the given snapshot or None.
+        """
+        if self.__entries is None:
+            return None
+        return self.__entries.get(name, None)
+
+    def set_entries(self, entries):
+        """Replaces all entries (e.g. after the target directory was read).
+        """
+        self.__entries = {}
+        for _entry in entries:
+            self.__entries[_entry.name] = _entry
+
+    def add(self, entry):
+        """Adds the given entry; an existing entry of same name is replaced.
+        """
+        self.__check_loaded()
+        self.__entries[entry.name] = entry
+
+    def remove(self, name):
+        self.__check_loaded()
+        if name in self.__entries:
+            del self.__entries[name]
+
+    def set_base(self, name, base):
+        """Sets the base of the entry of the given snapshot.
+        """
+        self.__check_loaded()
+        if name in self.__entries:
+            self.__entries[name].base = base
+
+    def commit(self):
+        """Writes the catalog. The file is written into a temporary file first
+        which replaces the catalog afterwards.
+        """
+        self.__check_loaded()
+        _lines = [CATALOG_HEADER]
+        for _entry in self.get_entries():
+            _lines.append(_entry.to_line())
+        _tmppath = "%s%s" % (self.__path, _SUFFIX_TMP)
+        _FOP.writetofile(_tmppath, "\n".join(_lines) + "\n")
+        _FOP.force_move(_tmppath, self.__path)
+        self.__mtime = _FOP.get_mtime(self.__path)
+        self.__logger.debug("Snapshot catalog written (%s snapshots)." % len(self.__entries))
+
+    def invalidate(self):
+        """Removes the catalog file (e.g. if the catalog cannot be kept up
+        to date). It is re-created when the target is read next time.
+        """
+        self.__entries = None
+        self.__mtime = None
+        try:
+            if _FOP.path_exists(self.__path):
+                _FOP.delete(self.__path)
+        except Exception, error:
+            self.__logger.warning(_("Unable to remove snapshot catalog `%(path)s`: %(error)s")\
+                                  % { 'path' : self.__path, 'error' : error })
+
+    def __check_loaded(self):
+        if self.__entries is None:
+            raise SBException("Snapshot catalog is not loaded.")
@@ -37,6 +37,7 @@ import time
 
 
 from sbackup.fs_backend import fam
+from sbackup.ar_backend import dedup
 from sbackup.core.SnapshotManager import SnapshotManager
 from sbackup.core import snapshot
 
@@ -180,9 +181,18 @@ class BackupProfileHandler(object):
         _compr = self.config.get_compress_format()
         self.logger.info(_("Setting compression format to `%s`") % _compr)
         self.__snapshot.setFormat(_compr)
+        _nthreads = self.config.get_compress_threads()
+        if _compr != "none" and _nthreads > 1:
+            self.logger.info(_("Setting number of compression threads to %s") % _nthreads)
+        self.__snapshot.set_compress_threads(_nthreads)
+        self.__snapshot.set_member_index(self.config.get_member_index())
+        self.__snapshot.set_transfer_bufsize(self.config.get_transfer_bufsize())
 
         if self.config.has_option("general", "splitsize"):
             _chunks = int(self.config.get("general", "splitsize"))
+            if _chunks and _compr == dedup.FORMAT:
+                self.logger.warning(_("Deduplicated archives are not split. Option `splitsize` is ignored."))
+                _chunks = 0
             self.__snapshot.setSplitedSize(_chunks)
             if _chunks:
                 self.logger.info(_("Setting size of archive chunks to %s")\
@@ -195,18 +205,26 @@ class BackupProfileHandler(object):
             self.logger.info(_("Option 'Follow symbolic links' is enabled."))
         else:
             self.logger.info(_("Option 'Follow symbolic links' is disabled."))
+        if self.config.get_delta_threshold() > 0:
+            self.logger.info(_("Only changed blocks of files larger than %s MiB are stored.")\
+                             % self.config.get_delta_threshold())
+        if self.config.get_collector_cache_file() is not None:
+            self.logger.info(_("Directory cache `%s` is used.") % self.config.get_collector_cache_file())
+        if self.config.get_change_journal_file() is not None:
+            self.logger.info(_("Change journal `%s` is used.") % self.config.get_change_journal_file())
 
         self.__collect_files()
 
-        _publish_progress = True
-        if self.__dbus_conn is None:
-            _publish_progress = False
+        _publish_progress = None
+        if self.__dbus_conn is not None:
+            _publish_progress = self.__publish_progress
         _supports_publish = self.__fam_target_hdl.get_supports_publish()
 
         self.logger.info(_("Snapshot is being committed"))
         self.__state.set_state('start')
 #        self.__state.set_state('commit')
         self.__snapshot.commit(self.__fam_target_hdl, _publish_progress, _supports_publish)
+        self.__snpman.register_snapshot(self.__snapshot)
 
 #TODO: add state purging
         # purge
@@ -215,13 +233,23 @@ class BackupProfileHandler(object):
             purge = self.config.get("general", "purge")
         if purge is not None:
             try:
-                self.__snpman.purge(purge, self.__snapshot.getName()) # do not purge created snapshot
+                self.__snpman.purge(purge, self.__snapshot.getName(), # do not purge created snapshot
+                                    consolidate = self.config.get_purge_consolidate(),
+                                    nthreads = self.config.get_purge_threads())
             except exceptions.SBException, sberror:
                 self.logger.error(_("Error while purging old snapshots: %s") % sberror)
 
         self.logger.info(_("Backup process finished."))
         self.__state.set_state('finish')
 
+    def __publish_progress(self, progress):
+        """Publishes the progress (`progress.ProgressInfo`) of the creation
+        of the archive over D-Bus. The profile is named since backups of
+        several profiles may run concurrently.
+        """
+        progress.profile = self.config.getProfileName()
+        self.__dbus_conn.emit_progress_signal(progress.serialize())
+
     def __collect_files(self):
         """Fill snapshot's include and exclude lists and retrieve some information
         about the snapshot (uncompressed size, file count).
@@ -247,6 +275,9 @@ class BackupProfileHandler(object):
         self.logger.info(_("Number of items forced to be excluded: %s.") % _stats.get_count_items_excl_forced())
         self.logger.info(_("Number of items to be excluded by config: %s.") % _stats.get_count_items_excl_config())
         self.logger.info(_("Maximum free size required is '%s'.") % _snpsize_hr)
+        _syscalls = _stats.get_count_syscalls()
+        self.logger.debug("System calls issued while collecting files: %s" % ", ".join(\
+                                ["%s=%s" % (_name, _syscalls[_name]) for _name in sorted(_syscalls)]))
 
         if _freespace == constants.FREE_SPACE_UNKNOWN:
             self.logger.warning("Unable to query available space on target: Operation not supported")
@@ -0,0 +1,379 @@
+#   Simple Backup - planning of the removal of snapshots
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+:mod:`purgeplan` --- planning of the removal of snapshots
+=========================================================
+
+.. module:: purgeplan
+   :synopsis: computes the snapshots to be removed when purging
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+The dependencies between the snapshots (base and childs) are set up once.
+Purging is simulated on these dependencies and results in a plan of actions
+(removals and rebases) that is executed afterwards. Neither the target
+directory nor the snapshots are accessed while planning.
+
+"""
+
+from gettext import gettext as _
+import datetime
+import time
+
+import sbackup.util as Util
+from sbackup.util import constants
+from sbackup.util import log
+
+
+ACTION_REMOVE = "remove"
+ACTION_REBASE = "rebase"
+
+
+def is_same_snapshot(name, other):
+    """Checks whether the snapshot named `name` is the snapshot named `other`.
+    The type of the snapshot (full or incremental) is not considered since
+    it changes if the snapshot is converted into a full snapshot.
+    """
+    if not name or not other:
+        return False
+    return name[:-4] == other[:-4]
+
+
+class PurgeAction(object):
+    """A single step of purging: either the removal of a snapshot or the
+    rebase of a snapshot (on a new base or into a full snapshot).
+    """
+
+    def __init__(self, action, name, newbase = None, depends = None):
+        """
+        @param action: `ACTION_REMOVE` or `ACTION_REBASE`
+        @param name: name of the snapshot
+        @param newbase: name of the new base when rebasing; None converts
+                        the snapshot into a full snapshot
+        @param depends: names of snapshots whose removal must be finished
+                        before this snapshot is removed
+        """
+        self.action = action
+        self.name = name
+        self.newbase = newbase
+        if depends is None:
+            depends = set()
+        self.depends = depends
+
+    def __str__(self):
+        if self.action == ACTION_REMOVE:
+            _res = _("remove '%s'") % self.name
+        elif self.newbase is None:
+            _res = _("convert '%s' into full snapshot") % self.name
+        else:
+            _res = _("rebase '%(name)s' on '%(base)s'") % { "name" : self.name,
+                                                            "base" : self.newbase }
+        return _res
+
+    def is_removal(self):
+        return self.action == ACTION_REMOVE
+
+
+class PurgePlan(object):
+    """The ordered list of actions that results from purging. The actions
+    are given in a dependency-safe order, i.e. a snapshot is not removed
+    before all snapshots relying on it were removed or rebased.
+    """
+
+    def __init__(self):
+        self.__actions = []
+        self.__kept = []
+
+    def add(self, action):
+        self.__actions.append(action)
+
+    def set_kept(self, names):
+        self.__kept = names
+
+    def get_actions(self):
+        return self.__actions
+
+    def get_kept(self):
+        """Returns the names of the snapshots that remain after purging.
+        """
+        return self.__kept
+
+    def get_removed(self):
+        """Returns the names of the snapshots that are removed.
+        """
+        return [_action.name for _action in self.__actions if _action.is_removal()]
+
+    def is_empty(self):
+        return len(self.__actions) == 0
+
+    def get_steps(self):
+        """Returns the actions grouped into steps that are processed one
+        after another. A step contains either a single rebase or removals
+        that do not depend on each other (i.e. that can be processed
+        concurrently).
+
+        @return: list of lists of actions
+        """
+        _steps = []
+        _levels = []
+        _level_of = {}
+        for _action in self.__actions:
+            if not _action.is_removal():
+                _steps.extend(_levels)
+                _steps.append([_action])
+                _levels = []
+                _level_of = {}
+                continue
+            _level = 0
+            for _name in _action.depends:
+                if _name in _level_of:
+                    _level = max(_level, _level_of[_name] + 1)
+            _level_of[_action.name] = _level
+            if _level == len(_levels):
+                _levels.append([])
+            _levels[_level].append(_action)
+        _steps.extend(_levels)
+        return _steps
+
+    def get_report(self, sizes = None):
+        """Returns a human readable description of the plan.
+
+        @param sizes: optional dictionary with the sizes of the snapshots
+                      (name : size in bytes; negative if unknown)
+        """
+        if sizes is None:
+            sizes = {}
+        _removed = self.get_removed()
+        _nrebased = len(self.__actions) - len(_removed)
+        _lines = [_("Purge plan: %(removed)s snapshot(s) to remove, %(rebased)s to rebase, "\
+                    "%(kept)s kept.") % { "removed" : len(_removed), "rebased" : _nrebased,
+                                          "kept" : len(self.__kept) }]
+        _total = 0
+        for _action in self.__actions:
+            _size = sizes.get(_action.name, -1)
+            if _action.is_removal() and _size >= 0:
+                _total += _size
+                _lines.append("  %s (%s)" % (_action, Util.get_humanreadable_size_str(\
+                                            size_in_bytes = _size, binary_prefixes = True)))
+            else:
+                _lines.append("  %s" % _action)
+        if _total > 0:
+            _lines.append(_("Space freed by removed archives: %s")\
+                          % Util.get_humanreadable_size_str(size_in_bytes = _total,
+                                                            binary_prefixes = True))
+        return "\n".join(_lines)
+
+
+class _SnapshotNode(object):
+    """A snapshot within the dependency graph.
+    """
+
+    def __init__(self, name, base, age):
+        self.name = name
+        self.base = base
+        self.age = age
+        # names of snapshots relying on this snapshot
+        self.childs = set()
+        # names of former childs that were removed
+        self.removed_childs = set()
+
+    def isfull(self):
+        return self.name.endswith(".ful")
+
+
+class PurgePlanner(object):
+    """Computes the snapshots to be removed using the logarithmic or the
+    cut-off scheme. Freestanding snapshots are removed. Snapshots that other
+    snapshots rely on are only removed if consolidation is enabled: their
+    childs are rebased on their base (resp. converted into full snapshots)
+    before.
+    """
+
+    def __init__(self, snapshots, no_purge_snp = "", consolidate = False, today = None):
+        """
+        @param snapshots: the snapshots (`Snapshot`) to be considered
+        @param no_purge_snp: name of snapshot not being purged
+        @param consolidate: whether snapshots with childs are removed
+        @param today: the date the age of snapshots refers to (default: today)
+        """
+        self.logger = log.LogFactory.getLogger()
+        self.__no_purge_snp = no_purge_snp
+        self.__consolidate = consolidate
+        if today is None:
+            today = datetime.date.today()
+
+        self.__nodes = {}
+        for _snp in snapshots:
+            _date = _snp.getDate()
+            _age = (today - datetime.date(_date['year'], _date['month'], _date['day'])).days
+            self.__nodes[_snp.getName()] = _SnapshotNode(_snp.getName(), _snp.getBase(), _age)
+        for _node in self.__nodes.values():
+            if _node.base in self.__nodes:
+                self.__nodes[_node.base].childs.add(_node.name)
+
+    def plan(self, purge):
+        """Returns the plan for the given purge setting (`log` or the max.
+        age in days).
+
+        @rtype: PurgePlan
+        """
+        _plan = PurgePlan()
+        if purge == "log":
+            self.__plan_log(_plan)
+        else:
+            self.__plan_cutoff(purge, _plan)
+        _plan.set_kept([_node.name for _node in self.__get_sorted_nodes()])
+        return _plan
+
+    def __get_sorted_nodes(self):
+        """Returns the nodes sorted from the most recent to the oldest snapshot.
+        """
+        _nodes = self.__nodes.values()
+        _nodes.sort(key = lambda _node: _node.name, reverse = True)
+        return _nodes
+
+    def __plan_log(self, plan):
+        """Logarithmic purge
+        Keep progressivelly less backups into the past:
+        Keep all backups from yesterday
+        Keep one backup per day from last week.
+        Keep one backup per week from last month.
+        Keep one backup per month from last year.
+        Keep one backup per quarter from 2nd last year.
+        Keep one backup per year further in past.
+        """
+        self.logger.info("Logarithmic purging")
+        # compute years since begin of epoch: we need to go back this far
+        _years_epoch = int(time.time() / (constants.SECONDS_IN_DAY * constants.DAYS_IN_YEAR))
+
+        purge_plan = [ { "title" : "Last week", "nperiod" : 7,
+                         "interval" : 1 },
+                       { "title" : "Last month", "nperiod" : 3,
+                         "interval" : constants.DAYS_IN_WEEK },
+                       { "title" : "Last year", "nperiod" : 11,
+                         "interval" : constants.DAYS_IN_MONTH },
+                       { "title" : "2nd last year", "nperiod" : 4,
+                         "interval" : constants.DAYS_IN_QUARTER },
+                       { "title" : "remaining years", "nperiod" : _years_epoch,
+                         "interval" : constants.DAYS_IN_YEAR }
+                     ]
+
+        _max_age = 2    # start value
+        for pent in purge_plan:
+            self.logger.info("Logarithm Purging [%s]" % pent["title"])
+            _max_age = self.__plan_period(start = (_max_age - 1), nperiod = pent["nperiod"],
+                                          interval = pent["interval"], plan = plan)
+
+    def __plan_period(self, start, nperiod, interval, plan):
+        """period is given as `start` age and interval length in days.
+        The period is repeated `nperiod` times.
+        Within these timespans the defined number of backups must remain.
+        """
+        _number_to_keep = 1
+        for j in range(0, nperiod):
+            _min_age = start + (j * interval)
+            _max_age = _min_age + (interval + 1)
+            self.__plan_timespan(_min_age, _max_age, _number_to_keep, plan)
+        return _max_age
+
+    def __plan_timespan(self, min_age, max_age, number_to_keep, plan):
+        """All snapshots in timespan (i.e. younger than `max_age` and older
+        than `min_age`) are removed until `number_to_keep` snapshots remain.
+        """
+        _min_age = int(round(min_age))
+        _max_age = int(round(max_age))
+        assert _max_age > _min_age, "Given parameter max. age should be greater than min. age"
+
+        if _min_age > 0:
+            _candidates = [_node for _node in self.__get_sorted_nodes()
+                           if _min_age < _node.age < _max_age]
+            self.__plan_removals(_candidates, number_to_keep, plan)
+
+    def __plan_cutoff(self, purge, plan):
+        """All snapshots older than a certain value are removed.
+        """
+        try:
+            purge = int(purge)
+        except ValueError:
+            purge = 0
+        if purge > 0:
+            self.logger.info("Simple purge - remove freestanding snapshots older "\
+                             "than %s days." % purge)
+            _candidates = [_node for _node in self.__get_sorted_nodes() if _node.age > purge]
+            self.__plan_removals(_candidates, 0, plan)
+
+    def __plan_removals(self, candidates, number_to_keep, plan):
+        """Removes snapshots from the given candidates (sorted from the most
+        recent to the oldest) until `number_to_keep` snapshots remain. The
+        oldest candidates are kept.
+        """
+        while len(candidates) > number_to_keep:
+            _removable = candidates[:len(candidates) - number_to_keep]
+            _node = None
+            for _cand in _removable:
+                if not self.__is_protected(_cand) and len(_cand.childs) == 0:
+                    _node = _cand
+                    break
+            if _node is None and self.__consolidate:
+                for _cand in _removable:
+                    if not self.__is_protected(_cand):
+                        _node = _cand
+                        self.__plan_consolidation(_node, plan)
+                        break
+            if _node is None:
+                break
+            self.__remove_node(_node, plan)
+            candidates.remove(_node)
+
+    def __is_protected(self, node):
+        return is_same_snapshot(node.name, self.__no_purge_snp)
+
+    def __plan_consolidation(self, node, plan):
+        """Rebases the childs of the given snapshot on its base (resp.
+        converts them into full snapshots).
+        """
+        self.logger.debug("Snapshot '%s' is removed after rebasing its childs." % node.name)
+        _newbase = None
+        if not node.isfull():
+            _newbase = node.base
+        for _name in sorted(node.childs, reverse = True):
+            _child = self.__nodes[_name]
+            plan.add(PurgeAction(ACTION_REBASE, _child.name, _newbase))
+            node.childs.discard(_name)
+            if _newbase is None:
+                self.__rename_node(_child, "%sful" % _child.name[:-3])
+                _child.base = None
+            else:
+                _child.base = _newbase
+                self.__nodes[_newbase].childs.add(_child.name)
+
+    def __rename_node(self, node, name):
+        del self.__nodes[node.name]
+        node.name = name
+        self.__nodes[name] = node
+        for _name in node.childs:
+            self.__nodes[_name].base = name
+
+    def __remove_node(self, node, plan):
+        self.logger.debug("Snapshot '%s' has no childs -> is being removed." % node.name)
+        plan.add(PurgeAction(ACTION_REMOVE, node.name, depends = node.removed_childs))
+        del self.__nodes[node.name]
+        if node.base in self.__nodes:
+            _base = self.__nodes[node.base]
+            _base.childs.discard(node.name)
+            _base.removed_childs.add(node.name)
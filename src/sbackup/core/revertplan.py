@@ -0,0 +1,222 @@
+#   Simple Backup - planning of the revert of directories
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+:mod:`revertplan` --- planning of the revert of directories
+===========================================================
+
+.. module:: revertplan
+   :synopsis: computes the archive each file is extracted from when reverting
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+Reverting a directory to the state of an incremental snapshot requires the
+files stored in the archives of the whole chain of snapshots down to the
+last full snapshot. The snar files of the chain are used to determine for
+each file the snapshot holding its final version (i.e. the most recent
+snapshot the file was included in). Each file is therefore extracted from
+a single archive only.
+
+The snar file of the reverted snapshot is read once; the snar files of the
+base snapshots are only accessed (by means of their index) for directories
+containing files that were not changed.
+
+"""
+
+from gettext import gettext as _
+
+from sbackup.fs_backend import fam
+
+from sbackup.ar_backend.tar import Dumpdir
+from sbackup.ar_backend.tar import SnapshotFile
+
+from sbackup.util.exceptions import SBException
+from sbackup.util import log
+
+
+_FOP = fam.get_file_operations_facade_instance()
+
+
+class RevertPlan(object):
+    """The members to be extracted from the archives of the snapshots when
+    reverting a path. Members are stored with leading separator, i.e. as
+    paths in the snapshot.
+    """
+
+    def __init__(self, path, names):
+        """
+        @param path: the reverted path
+        @param names: names of the snapshots in the chain (most recent first)
+        """
+        self.path = path
+        self.__names = names
+        # dictionary (snapshot name : list of members)
+        self.__members = {}
+
+    def add(self, name, member):
+        self.__members.setdefault(name, []).append(member)
+
+    def get_snapshots(self):
+        """Returns the names of the snapshots members are extracted from
+        (most recent first).
+        """
+        return [_name for _name in self.__names if _name in self.__members]
+
+    def get_members(self, name):
+        return self.__members.get(name, [])
+
+    def get_count(self):
+        _count = 0
+        for _members in self.__members.values():
+            _count += len(_members)
+        return _count
+
+    def is_empty(self):
+        return len(self.__members) == 0
+
+    def get_report(self):
+        _lines = [_("Revert plan for '%(path)s': %(count)s members from %(used)s of %(total)s archives.")\
+                  % { "path" : self.path, "count" : self.get_count(),
+                      "used" : len(self.__members), "total" : len(self.__names) }]
+        for _name in self.get_snapshots():
+            _lines.append("- %s: %s" % (_name, len(self.__members[_name])))
+        return "\n".join(_lines)
+
+
+class RevertPlanner(object):
+    """Computes the members extracted from each archive of a snapshot chain
+    when reverting a path (see `RevertPlan`).
+    """
+
+    def __init__(self, history, excludes = None):
+        """
+        @param history: the snapshot to revert to and its predecessors till
+                        the last full snapshot (most recent first, see
+                        `SnapshotManager.getSnpHistory`)
+        @param excludes: set of paths excluded from the reverted snapshot;
+                         excluded files are not taken from base snapshots
+        """
+        if len(history) == 0:
+            raise SBException("Please provide a snapshot to process")
+        self.__logger = log.LogFactory.getLogger()
+        self.__history = history
+        if excludes is None:
+            excludes = set()
+        self.__excludes = excludes
+
+    def plan(self, path):
+        """Computes the plan for reverting the given file or directory.
+        Directories are extracted from the archive of the reverted snapshot
+        (they are stored in each incremental archive) while files are
+        extracted from the archive of the most recent snapshot they were
+        included in.
+
+        @return: the plan
+        @rtype: RevertPlan
+        @raise SBException: if the path is not contained in the snapshot
+        """
+        _path = "%s%s" % (_FOP.pathsep, path.strip(_FOP.pathsep))
+        _snp = self.__history[0]
+        _plan = RevertPlan(_path, [_hsnp.getName() for _hsnp in self.__history])
+        # files that were not changed (dictionary directory : set of files)
+        _pending = {}
+
+        _snpfinfo = _snp.getSnapshotFileInfos()
+        if _path == _FOP.pathsep or _snpfinfo.hasPath(_path):
+            self.__plan_directory(_snp, _snpfinfo, _path, _plan, _pending)
+        else:
+            _dir, _fname = _path.rsplit(_FOP.pathsep, 1)
+            _ddir = None
+            if _snpfinfo.hasPath(_dir):
+                for _entry in _snpfinfo.getContent(_dir):
+                    if _entry.getFilename() == _fname:
+                        _ddir = _entry
+                        break
+            if _ddir is None:
+                raise SBException(_("File '%s' not found in the backup snapshot files list") % _path)
+            self.__add_entry(_snp, _dir, _ddir, _plan, _pending)
+
+        for _base in self.__history[1:]:
+            if len(_pending) == 0:
+                break
+            self.__resolve(_base, _pending, _plan)
+
+        if len(_pending) > 0:
+            _count = 0
+            for _files in _pending.values():
+                _count += len(_files)
+            self.__logger.debug("%s unchanged files are not stored in any archive." % _count)
+        return _plan
+
+    def __plan_directory(self, snapshot, snpfinfo, path, plan, pending):
+        """Reads the snar file of the reverted snapshot and adds the content
+        of the given directory.
+        """
+        _prefix = "%s%s" % (path.rstrip(_FOP.pathsep), _FOP.pathsep)
+        for _record in snpfinfo.iterRecords():
+            _dirname = _record[SnapshotFile.REC_DIRNAME]
+            if _dirname != path and not _dirname.startswith(_prefix):
+                continue
+            plan.add(snapshot.getName(), _dirname)
+            for _ddir in _record[SnapshotFile.REC_CONTENT]:
+                self.__add_entry(snapshot, _dirname, _ddir, plan, pending)
+
+    def __add_entry(self, snapshot, dirname, ddir, plan, pending):
+        _ctrl = ddir.getControl()
+        _fname = ddir.getFilename()
+        if _ctrl == Dumpdir.INCLUDED:
+            plan.add(snapshot.getName(), _FOP.joinpath(dirname, _fname))
+        elif _ctrl == Dumpdir.UNCHANGED:
+            if _FOP.joinpath(dirname, _fname) in self.__excludes:
+                self.__logger.debug("Path '%s' was excluded. Not reverted." % _fname)
+            else:
+                pending.setdefault(dirname, set()).add(_fname)
+        elif _ctrl == Dumpdir.DIRECTORY:
+            # directories are added when their record is read
+            pass
+        else:
+            raise SBException("Found unexpected control code ('%s') in snapshot file '%s'."\
+                              % (_ctrl, snapshot.getSnarFile()))
+
+    def __resolve(self, snapshot, pending, plan):
+        """Looks up the pending files in the snar file of the given base
+        snapshot. Files included in its archive are added to the plan and
+        removed from `pending`.
+        """
+        _snpfinfo = snapshot.getSnapshotFileInfos()
+        for _dirname in pending.keys():
+            _files = pending[_dirname]
+            _remaining = set()
+            if _snpfinfo.hasPath(_dirname):
+                for _ddir in _snpfinfo.getContent(_dirname):
+                    _fname = _ddir.getFilename()
+                    if _fname not in _files:
+                        continue
+                    _files.discard(_fname)
+                    _ctrl = _ddir.getControl()
+                    if _ctrl == Dumpdir.INCLUDED:
+                        plan.add(snapshot.getName(), _FOP.joinpath(_dirname, _fname))
+                    elif _ctrl == Dumpdir.UNCHANGED:
+                        _remaining.add(_fname)
+            for _fname in _files:
+                self.__logger.warning(_("Unable to find `%(file)s` in snapshot file '%(snar)s'.")\
+                                      % { "file" : _FOP.joinpath(_dirname, _fname),
+                                          "snar" : snapshot.getSnarFile() })
+            if len(_remaining) > 0:
+                pending[_dirname] = _remaining
+            else:
+                del pending[_dirname]
@@ -0,0 +1,255 @@
+#   Simple Backup - concurrent processing of backup profiles
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+:mod:`scheduler` --- concurrent processing of backup profiles
+=============================================================
+
+.. module:: scheduler
+   :synopsis: runs the backups of several profiles concurrently
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+Each profile is processed by a separate backup process (the process
+handles a single profile as usual). The scheduler starts the processes
+in order of the profiles while respecting the following limits:
+
+ * the number of backups writing to the same target (i.e. the same local
+   device resp. the same remote host) at a time
+ * the number of compression threads (see option `compressthreads`) used
+   by all running backups (CPU budget); a backup requiring more threads
+   than the budget is started if no other backup is running
+
+"""
+
+from gettext import gettext as _
+import os
+import re
+import signal
+import time
+
+from sbackup.util import constants
+from sbackup.util import exceptions
+from sbackup.util import pathparse
+from sbackup.util import log
+
+
+# interval (seconds) of checking the backup processes
+POLL_INTERVAL = 1.0
+
+# default max. number of backups writing to the same target at a time
+DEFAULT_TARGET_LIMIT = 1
+
+_LOCKFILE_TEMPLATE = "sbackup-profile-%s.lock"
+
+
+def get_cpu_count():
+    """Returns the number of CPUs (1 if unknown).
+    """
+    try:
+        _count = os.sysconf("SC_NPROCESSORS_ONLN")
+    except (ValueError, OSError, AttributeError):
+        _count = 1
+    return max(1, _count)
+
+
+def get_profile_lockfile(profilename):
+    """Returns the path of the lock file of the given profile. The lock
+    file is located in the directory of the application lock file.
+    """
+    _name = re.sub(r"[^A-Za-z0-9_.-]", "_", profilename)
+    return os.path.join(os.path.dirname(constants.LOCKFILE_BACKUP_FULL_PATH),
+                        _LOCKFILE_TEMPLATE % _name)
+
+
+def get_target_key(destination):
+    """Returns a key identifying the resource the given destination
+    (URI resp. path) is written to: local destinations are identified by the
+    device of the nearest existing directory, remote ones by scheme and host.
+    """
+    _uri = pathparse.UriParser()
+    _uri.set_and_parse_uri(uri = destination)
+    if _uri.is_local():
+        _path = _uri.query_display_name()
+        while not os.path.exists(_path) and _path != os.path.dirname(_path):
+            _path = os.path.dirname(_path)
+        try:
+            return "dev:%s" % os.stat(_path).st_dev
+        except OSError:
+            return "file:%s" % _path
+    return "%s://%s" % (_uri.uri_scheme, _uri.hostname)
+
+
+class ProfileJob(object):
+    """The backup of a single profile.
+    """
+
+    def __init__(self, profilename, conffile, target, cpu_cost = 1):
+        """
+        @param profilename: name of the profile
+        @param conffile: path of the configuration file of the profile
+        @param target: key of the target (see `get_target_key`)
+        @param cpu_cost: number of compression threads used by the backup
+        """
+        self.profilename = profilename
+        self.conffile = conffile
+        self.target = target
+        self.cpu_cost = max(1, cpu_cost)
+        # the backup process (as returned by the `launcher` of the scheduler)
+        self.process = None
+        self.returncode = None
+
+    def __str__(self):
+        return "%s (target: %s, threads: %s)" % (self.profilename, self.target, self.cpu_cost)
+
+    @classmethod
+    def from_config(cls, confm):
+        """Creates the job for the profile of the given configuration manager.
+        """
+        return cls(confm.getProfileName(), confm.conffile,
+                   get_target_key(confm.get_destination_path()),
+                   confm.get_compress_threads())
+
+
+class ProfileScheduler(object):
+    """Runs the backups of several profiles concurrently within the given
+    resource limits.
+    """
+
+    def __init__(self, jobs, launcher, target_limit = DEFAULT_TARGET_LIMIT,
+                 cpu_budget = None):
+        """
+        @param jobs: the jobs in order of processing
+        @param launcher: callable that starts the backup process of a given
+                         job and returns an object providing `poll` and
+                         `send_signal` (e.g. a `subprocess.Popen` instance)
+        @param target_limit: max. number of backups writing to the same target
+        @param cpu_budget: max. number of compression threads used at a time
+                           (defaults to the number of CPUs)
+        """
+        if target_limit < 1:
+            raise ValueError("The limit of backups per target must be positive")
+        if cpu_budget is None:
+            cpu_budget = get_cpu_count()
+        self.__logger = log.LogFactory.getLogger()
+        self.__pending = list(jobs)
+        self.__running = []
+        self.__finished = []
+        self.__launcher = launcher
+        self.__target_limit = target_limit
+        self.__cpu_budget = max(1, cpu_budget)
+
+    def get_finished(self):
+        return self.__finished
+
+    def __get_cpu_used(self):
+        _used = 0
+        for _job in self.__running:
+            _used += _job.cpu_cost
+        return _used
+
+    def __get_target_count(self, target):
+        _count = 0
+        for _job in self.__running:
+            if _job.target == target:
+                _count += 1
+        return _count
+
+    def __start_jobs(self):
+        """Starts pending jobs in order. Jobs waiting for their target are
+        skipped while jobs waiting for CPU block later jobs (otherwise jobs
+        requiring many threads may never start).
+        """
+        for _job in self.__pending[:]:
+            if self.__get_target_count(_job.target) >= self.__target_limit:
+                continue
+            _used = self.__get_cpu_used()
+            if _used > 0 and _used + _job.cpu_cost > self.__cpu_budget:
+                break
+            self.__logger.info(_("Starting backup of profile `%s`.") % _job)
+            self.__pending.remove(_job)
+            try:
+                _job.process = self.__launcher(_job)
+            except (OSError, exceptions.SBException), error:
+                self.__logger.error(_("Unable to start backup of profile `%(profile)s`: %(error)s")\
+                                    % { "profile" : _job.profilename, "error" : error })
+                _job.returncode = constants.EXCODE_GENERAL_ERROR
+                self.__finished.append(_job)
+                continue
+            self.__running.append(_job)
+
+    def __poll_jobs(self):
+        for _job in self.__running[:]:
+            _retc = _job.process.poll()
+            if _retc is not None:
+                _job.returncode = _retc
+                self.__running.remove(_job)
+                self.__finished.append(_job)
+                self.__logger.info(_("Backup of profile `%(profile)s` finished (exit code: %(code)s).")\
+                                   % { "profile" : _job.profilename, "code" : _retc })
+
+    def __signal_running(self, signum):
+        for _job in self.__running:
+            try:
+                _job.process.send_signal(signum)
+            except OSError, error:
+                self.__logger.warning(_("Unable to signal backup of profile `%(profile)s`: %(error)s")\
+                                      % { "profile" : _job.profilename, "error" : error })
+
+    def __wait_running(self, interval):
+        """Waits for the running backups (not interruptible by canceling).
+        """
+        while len(self.__running) > 0:
+            try:
+                self.__poll_jobs()
+                if len(self.__running) > 0:
+                    time.sleep(interval)
+            except (exceptions.BackupCanceledError, exceptions.SigTerminatedError):
+                pass
+
+    def run(self, interval = POLL_INTERVAL):
+        """Processes all jobs. When the backup is canceled (resp. terminated)
+        the signal is forwarded to the running backups, pending backups are
+        not started and the exception is re-raised after the running
+        backups finished.
+
+        @return: the exit code (the first exit code other than success)
+        """
+        try:
+            while len(self.__pending) > 0 or len(self.__running) > 0:
+                self.__start_jobs()
+                self.__poll_jobs()
+                if len(self.__running) > 0 or len(self.__pending) > 0:
+                    time.sleep(interval)
+        except exceptions.BackupCanceledError:
+            self.__logger.warning(_("Canceling %s running backups.") % len(self.__running))
+            self.__pending = []
+            self.__signal_running(constants.BACKUP_CANCEL_SIG)
+            self.__wait_running(interval)
+            raise
+        except exceptions.SigTerminatedError:
+            self.__pending = []
+            self.__signal_running(signal.SIGTERM)
+            self.__wait_running(interval)
+            raise
+
+        _exitcode = constants.EXCODE_SUCCESS
+        for _job in self.__finished:
+            if _job.returncode != constants.EXCODE_SUCCESS:
+                _exitcode = _job.returncode
+                break
+        return _exitcode
@@ -31,11 +31,16 @@
 
 from gettext import gettext as _
 import re
+import tempfile
 import types
 
 
 from sbackup.fs_backend import fam
 from sbackup.ar_backend import tar
+from sbackup.ar_backend import chunks
+from sbackup.ar_backend import dedup
+from sbackup.ar_backend import delta
+from sbackup.ar_backend import transfer
 
 from sbackup.core.ConfigManager import ConfigurationFileHandler
 
@@ -46,9 +51,16 @@ from sbackup.util.exceptions import NotValidSnapshotException
 from sbackup.util import constants
 from sbackup.util import structs
 from sbackup.util import log
+from sbackup.util import exclusion
 
 
-AVAIL_SNP_FORMATS = ["none", "bzip2", "gzip"]
+AVAIL_SNP_FORMATS = ["none", "bzip2", "gzip", "xz", "zstd", dedup.FORMAT]
+
+# structures available for storing the include and exclude file lists
+FLIST_TYPE_TREE = "tree"
+FLIST_TYPE_FLAT = "flat"
+AVAIL_FLIST_TYPES = {FLIST_TYPE_TREE : structs.SBdict,
+                     FLIST_TYPE_FLAT : structs.FlatPathDict}
 
 
 class Snapshot(object):
@@ -59,10 +71,16 @@ class Snapshot(object):
     __validname_re = re.compile(r"^(\d{4})-(\d{2})-(\d{2})_(\d{2})[\:\.](\d{2})[\:\.](\d{2})\.\d+\..*?\.(.+)$")
 
 
-    def __init__ (self, path):
+    def __init__ (self, path, flist_type = FLIST_TYPE_FLAT, entry = None):
         """The snapshot constructor.
         
         :param path : the path to the snapshot dir.
+        :param flist_type : the structure used for the include and exclude file
+                            lists (one of `AVAIL_FLIST_TYPES`)
+        :param entry : the entry of the snapshot catalog (`catalog.CatalogEntry`)
+                       the snapshot is opened from. Version, format, base and
+                       split size are taken from the entry and the snapshot
+                       directory is not accessed.
         
         :todo: Any distinction between creation of a new snapshot and opening\
                an existing one from disk would be useful! The reason is that\
@@ -88,26 +106,45 @@ class Snapshot(object):
         self.__snarfile = None
 
         # explicitely defined include and exclude file lists; these lists are filled from the configuration
-        self.__includeFlist = structs.SBdict()
+        if flist_type not in AVAIL_FLIST_TYPES:
+            raise ValueError("Unknown type of file list: %s" % flist_type)
+        _flist_class = AVAIL_FLIST_TYPES[flist_type]
+        self.__includeFlist = _flist_class()
         self.__includeFlistFile = None # Str
-        self.__excludeFlist = structs.SBdict()
+        self.__excludeFlist = _flist_class()
         self.__excludeFlistFile = None # Str
+        # large files stored by blocks instead of TAR (see module `delta`)
+        self.__delta_files = []
 
         self.__space_required = constants.SPACE_REQUIRED_UNKNOWN
         self.__splitedSize = 0
+        # number of threads used for compressing the archive
+        self.__compress_threads = 1
+        # whether an index of the archive members is written
+        self.__member_index = False
+        # size of the buffers used when copying the archive stream
+        self.__transfer_bufsize = transfer.DEFAULT_BUFSIZE
         self.__excludes = False
+        # matcher prepared from the Regex excludes (see `get_excludes_matcher`)
+        self.__excludes_matcher = None
 
         self.__packages = False
         self.__version = False
         self.__snapshotpath = None
 
         self.__baseSnapshot = None
+        # local directory holding the temporary files of the commit
+        self.__tempdir = None
+        # whether the informations were taken from the snapshot catalog
+        self.__from_catalog = False
 
         # set some attributes
         self.setPath(path)    # sets path and validates name
 
         # check if it's an existing snapshot
-        if self._fop.path_exists(self.__snapshotpath):
+        if entry is not None:
+            self.__set_from_catalog_entry(entry)
+        elif self._fop.path_exists(self.__snapshotpath):
             self.__validateSnapshot(self.__snapshotpath, self.__name)
         else : # Snapshot for creation
             self._fop.makedir(self.__snapshotpath)
@@ -150,7 +187,7 @@ class Snapshot(object):
     def getIncludeFlist(self):
         """Returns the list of files included into this snapshot.
 
-        @rtype: SBDict
+        @rtype: SBdict or FlatPathDict
         """
         return self.__includeFlist
 
@@ -191,19 +228,19 @@ class Snapshot(object):
         the properties to None. Sub-paths are also considered.
         """
         if self.__excludeFlist.has_key(path):
-            self.__excludeFlist[path][0] = None
+            self.__excludeFlist[path] = None
 
     def disable_path_in_incl_filelist(self, path):
         """Searches for the given `path` in the list of included files and set
         the properties to None. Sub-paths are also considered.
         """
         if self.__includeFlist.has_key(path):
-            self.__includeFlist[path][0] = None
+            self.__includeFlist[path] = None
 
     def getExcludeFlist(self):
         """
         get the Exclude file list
-        @rtype: list
+        @rtype: SBdict or FlatPathDict
         """
         return self.__excludeFlist
 
@@ -244,6 +281,8 @@ class Snapshot(object):
         """
         Returns the compression format of the snapshot (from the "format" file or default value)
         """
+        if self.__from_catalog:
+            return self.__format
         _formatf = self._fop.joinpath(self.getPath(), "format")
         if self._fop.path_exists(_formatf):
             self.__format = self._fop.readfile(_formatf).split('\n')[0]
@@ -257,7 +296,7 @@ class Snapshot(object):
         you need to reset `self.__base` to None before.
         
         """
-        if not self.__base:
+        if not self.__base and not self.__from_catalog:
             basefile = self._fop.joinpath(self.__snapshotpath, "base")
             if not self._fop.path_exists(basefile):
                 self.__base = None
@@ -290,23 +329,12 @@ class Snapshot(object):
         """
         problem = False
 
-        if self.getFormat() == "none":
-            _arn = self._fop.joinpath(self.getPath(), "files.tar")
+        if self.getFormat() in AVAIL_SNP_FORMATS:
+            _arn = self._fop.joinpath(self.getPath(), tar.get_archive_name(self.getFormat()))
             if self._fop.path_exists(_arn):
                 return _arn
-            else :
-                problem = True
-
-        elif self.getFormat() == "gzip":
-            _arn = self._fop.joinpath(self.getPath(), "files.tar.gz")
-            if self._fop.path_exists(_arn):
-                return _arn
-            else :
-                problem = True
-
-        elif self.getFormat() == "bzip2":
-            _arn = self._fop.joinpath(self.getPath(), "files.tar.bz2")
-            if self._fop.path_exists(_arn) :
+            elif chunks.is_split_archive(_arn):
+                # the archive was split into parts after compression
                 return _arn
             else :
                 problem = True
@@ -354,6 +382,15 @@ class Snapshot(object):
                 self.__excludes = self._fop.pickleload(excludefile)
                 return self.__excludes
 
+    def get_excludes_matcher(self):
+        """Returns the matcher for the Regex excludes of this snapshot. The
+        Regex are prepared (i.e. compiled) once and re-used until the excludes
+        are changed.
+        """
+        if self.__excludes_matcher is None:
+            self.__excludes_matcher = exclusion.ExcludeRegexMatcher(self.getExcludes())
+        return self.__excludes_matcher
+
     def getPackages(self) :
         "Return the packages"
         if self.__packages : return self.__packages
@@ -394,11 +431,32 @@ class Snapshot(object):
 
         @todo: Implement CQS pattern !
         """
+        if self.__from_catalog:
+            return self.__splitedSize
         _formatf = self._fop.joinpath(self.getPath(), "format")
         if self._fop.path_exists(_formatf):
             self.__splitedSize = int(self._fop.readfile(_formatf).split('\n')[1])
         return self.__splitedSize
 
+    def get_compress_threads(self):
+        """
+        @return: the number of threads used for compressing the archive
+        """
+        return self.__compress_threads
+
+    def get_member_index(self):
+        """
+        @return: True if an index of the archive members is written
+        """
+        return self.__member_index
+
+    def get_transfer_bufsize(self):
+        """
+        @return: the size (in bytes) of the buffers used when copying the
+                 archive stream
+        """
+        return self.__transfer_bufsize
+
     def isfull(self):
         """
         @return: True if the snapshot is full and false if inc
@@ -409,10 +467,11 @@ class Snapshot(object):
     def isFollowLinks(self):
         return self.__followlinks
 
-    def commit(self, targethandler, publish_progress = False, supports_publish = True):
+    def commit(self, targethandler, publish_progress = None, supports_publish = True):
         """Commit snapshot data (i.e. write to disk)
         
-        :param publish_progress: Flag whether to call checkpoint script
+        :param publish_progress: callable the progress of TAR is passed to
+                                 (see `progress.ProgressEngine`) or None
         :param use_io_pipe: Flag whether to use pipes instead of files defined as parameters for archive
                             writing (should be hidden in FAM)
         
@@ -423,10 +482,41 @@ class Snapshot(object):
         self.commitFormatfile()
         self.commitexcludefile()
         self.commitpackagefile()
-        self.commitflistFiles()
-        self.__commit_archive(targethandler, publish_progress, supports_publish)
+        try:
+            self.commitflistFiles()
+            self.commitdeltafiles()
+            self.__commit_archive(targethandler, publish_progress, supports_publish)
+        finally:
+            self.remove_tempdir()
+        self.commitsnarindexfile()
         self.commitverfile()
 
+    def get_tempdir(self):
+        """Returns the local directory the temporary files of the commit
+        (file lists, snar file, list of archive members) are written into.
+        The directory is created on first use within the user's temporary
+        directory. Since it is used by this snapshot only, the snapshots of
+        several profiles can be committed at the same time.
+        """
+        if self.__tempdir is None:
+            self.__tempdir = tempfile.mkdtemp(prefix = "commit_",
+                                    dir = ConfigurationFileHandler().get_user_tempdir())
+            self.logger.debug("Temporary directory of commit: `%s`" % self.__tempdir)
+        return self.__tempdir
+
+    def remove_tempdir(self):
+        """Removes the temporary directory of the commit (see `get_tempdir`)
+        including the files left in it.
+        """
+        if self.__tempdir is None:
+            return
+        try:
+            self._fop.delete(self.__tempdir)
+        except (OSError, IOError), error:
+            self.logger.warning(_("Unable to remove temporary directory `%(dir)s`: %(error)s")\
+                                % { 'dir' : self.__tempdir, 'error': error })
+        self.__tempdir = None
+
     def addToIncludeFlist (self, item) :
         """
         Add an item to be backup into the snapshot.
@@ -449,6 +539,16 @@ class Snapshot(object):
         """
         self.__excludeFlist[item] = "0"
 
+    def add_delta_file(self, path):
+        """Adds a large file that is stored by blocks (see module `delta`).
+        The file is excluded from the TAR archive.
+        """
+        self.__delta_files.append(path)
+        self.addToExcludeFlist(path)
+
+    def get_delta_files(self):
+        return self.__delta_files
+
     def check_and_clean_flists(self):
         """Checks include and exclude flists for entries contained in both lists.
         Entries stored in both lists are removed from the exclude list (include overrides
@@ -505,6 +605,7 @@ class Snapshot(object):
     def setExcludes(self, excludes) :
         "Set the content of excludes (the list of Regex excludes)"
         self.__excludes = excludes
+        self.__excludes_matcher = None
 
     def setPackages(self, packages = "") :
         """
@@ -522,6 +623,32 @@ class Snapshot(object):
             raise TypeError("The size parameter must be an integer")
         self.__splitedSize = size
 
+    def set_compress_threads(self, nthreads):
+        """
+        @param nthreads: The number of threads used for compressing the archive
+        
+        """
+        if type(nthreads) != int:
+            raise TypeError("The number of threads must be an integer")
+        self.__compress_threads = nthreads
+
+    def set_member_index(self, activate):
+        """
+        @param activate: boolean to activate writing of a member index
+        """
+        if type(activate) != bool :
+            raise TypeError("the activate parameter must be a boolean")
+        self.__member_index = activate
+
+    def set_transfer_bufsize(self, bufsize):
+        """
+        @param bufsize: size (in bytes) of the buffers used when copying the
+                        archive stream
+        """
+        if type(bufsize) != int or bufsize < 1:
+            raise TypeError("The size of buffers must be a positive integer")
+        self.__transfer_bufsize = bufsize
+
     def setFollowLinks(self, activate):
         """
         @param activate: boolean to activate symlinks follow up 
@@ -531,6 +658,20 @@ class Snapshot(object):
         self.__followlinks = activate
 
     # Private
+    def __set_from_catalog_entry(self, entry):
+        """Takes the informations about this snapshot from the given entry
+        of the snapshot catalog.
+        """
+        if entry.name != self.__name:
+            raise SBException("Catalog entry `%s` does not match snapshot `%s`."\
+                              % (entry.name, self.__name))
+        self.__version = entry.version
+        self.__format = entry.cformat
+        self.__splitedSize = entry.splitsize
+        if not self.isfull():
+            self.__base = entry.base
+        self.__from_catalog = True
+
     def __validateSnapshot(self, path, name):
         """
         Validate the snapshot
@@ -573,6 +714,19 @@ class Snapshot(object):
         self._fop.writetofile(_verf, _ver)
         self.logger.debug("Commit `ver` file `%s` with info `%s`" % (_verf, _ver))
 
+    def commitsnarindexfile(self):
+        """Commits the index of the snar file on the disk. The index allows
+        the lookup of directories without parsing the whole snar file. Since
+        the index is re-created on demand, a failure is not fatal.
+        """
+        if not self._fop.path_exists(self.getSnarFile()):
+            self.logger.debug("No snar file found. Index is not committed.")
+            return
+        try:
+            tar.SnapshotFile(self.getSnarFile()).write_index()
+        except Exception, error:
+            self.logger.warning(_("Unable to commit index of snar file: %s") % error)
+
     def commitbasefile(self):
         """In case this snapshot is an incremental snapshot, base file is
         committed to the disk. If not, this method shouldn't be called.
@@ -615,9 +769,9 @@ class Snapshot(object):
 
         # commit temporary lists
 #FIXME: unify creation and storage of tmp. files and names
-        tmp_incl = self._fop.normpath(ConfigurationFileHandler().get_user_tempdir(),
+        tmp_incl = self._fop.normpath(self.get_tempdir(),
                                      self._fop.get_basename(self.getIncludeFListFile()))
-        tmp_excl = self._fop.normpath(ConfigurationFileHandler().get_user_tempdir(),
+        tmp_excl = self._fop.normpath(self.get_tempdir(),
                                      self._fop.get_basename(self.getExcludeFListFile()))
 
         self._fop.writetofile(tmp_incl,
@@ -625,6 +779,18 @@ class Snapshot(object):
         self._fop.writetofile(tmp_excl,
                               "\n".join(self.__excludeFlist.getEffectiveFileList()))
 
+    def commitdeltafiles(self):
+        """Stores the large files (see `add_delta_file`) by blocks. Only the
+        blocks changed since the base snapshot are stored.
+        """
+        if len(self.__delta_files) == 0:
+            return
+        _basepath = None
+        if not self.isfull():
+            _basepath = self.getBaseSnapshot().getPath()
+        self.logger.info(_("Storing %s large files by blocks") % len(self.__delta_files))
+        delta.write_deltas(self.getPath(), self.__delta_files, _basepath)
+
     def commitpackagefile(self):
         " Commit packages file on the disk"
         _packf = self._fop.joinpath(self.getPath(), "packages")
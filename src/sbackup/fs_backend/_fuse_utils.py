@@ -175,6 +175,14 @@ class FuseOperations(interfaces.IOperations):
     def is_dir(cls, path):
         return local_file_utils.is_dir(path)
 
+    @classmethod
+    def get_mtime(cls, path):
+        return local_file_utils.get_mtime(path)
+
+    @classmethod
+    def get_size(cls, path):
+        return local_file_utils.get_size(path)
+
     @classmethod
     def close_stream(cls, file_desc):
         try:
@@ -182,6 +190,16 @@ class FuseOperations(interfaces.IOperations):
         except IOError, error:
             raise exceptions.FileAlreadyClosedError(_("Error while closing stream: %s") % error)
 
+    @classmethod
+    def begin_info_cache(cls):
+        """Nothing to do: local file operations are not cached.
+        """
+        pass
+
+    @classmethod
+    def end_info_cache(cls):
+        pass
+
 def get_scheme_from_service(service):
     if not isinstance(service, types.IntType):
         raise TypeError
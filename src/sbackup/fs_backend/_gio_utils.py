@@ -143,6 +143,81 @@ class PathInfo(object):
         return _res_str
 
 
+# attributes queried at once for any file; all information required by
+# `GioOperations` is retrieved with a single request
+_INFO_ATTRIBUTES = ",".join([gio.FILE_ATTRIBUTE_STANDARD_NAME,
+                             gio.FILE_ATTRIBUTE_STANDARD_TYPE,
+                             gio.FILE_ATTRIBUTE_STANDARD_SIZE,
+                             gio.FILE_ATTRIBUTE_TIME_MODIFIED,
+                             gio.FILE_ATTRIBUTE_TIME_MODIFIED_USEC])
+
+
+class _FileInfoCache(object):
+    """Cache of file infos retrieved by `GioOperations`. Files are identified
+    by their URI. Complete listings of directories are cached as well, hence
+    entries not contained in a listing are known to not exist.
+    """
+
+    def __init__(self):
+        # dictionary URI -> `gio.FileInfo`
+        self.__infos = {}
+        # dictionary URI of directory -> list of infos of entries
+        self.__listings = {}
+
+    def get_info(self, gfile):
+        """Returns a pair (flag whether the info is known, info or None if
+        the file does not exist).
+        """
+        _uri = gfile.get_uri()
+        if _uri in self.__infos:
+            return (True, self.__infos[_uri])
+        _parent = gfile.get_parent()
+        if _parent is not None:
+            _listing = self.__listings.get(_parent.get_uri())
+            if _listing is not None:
+                _name = gfile.get_basename()
+                for _info in _listing:
+                    if _info.get_name() == _name:
+                        break
+                else:
+                    return (True, None)
+        return (False, None)
+
+    def set_info(self, gfile, info):
+        self.__infos[gfile.get_uri()] = info
+
+    def get_listing(self, gfile):
+        """Returns the infos of the entries of the given directory or None
+        if the directory was not listed yet.
+        """
+        return self.__listings.get(gfile.get_uri())
+
+    def set_listing(self, gfile, infos):
+        """Stores the listing retrieved without following symbolic links.
+        Infos of symbolic links are not stored since they differ from the
+        infos of the link targets.
+        """
+        for _info in infos:
+            if _info.get_file_type() != gio.FILE_TYPE_SYMBOLIC_LINK:
+                self.set_info(gfile.get_child(_info.get_name()), _info)
+        self.__listings[gfile.get_uri()] = infos
+
+    def invalidate(self, gfile):
+        """Removes the given file (resp. directory including its entries)
+        and the listing of its parent directory from the cache.
+        """
+        _uri = gfile.get_uri()
+        _prefix = "%s/" % _uri.rstrip("/")
+        for _cached in (self.__infos, self.__listings):
+            for _key in _cached.keys():
+                if _key == _uri or _key.startswith(_prefix):
+                    del _cached[_key]
+        _parent = gfile.get_parent()
+        if _parent is not None:
+            self.__listings.pop(_parent.get_uri(), None)
+            self.__infos.pop(_parent.get_uri(), None)
+
+
 #TODO: implement interface?
 class GioMountHandler(object):
     """Handles mounting process for a single URI.
@@ -439,9 +514,117 @@ class GioOperations(interfaces.IOperations):
 
     pathsep = system.PATHSEP
 
+    # cache of file infos (only used between `begin_info_cache` and `end_info_cache`)
+    __info_cache = None
+    __info_cache_depth = 0
+
     def __init__(self):
         interfaces.IOperations.__init__(self)
 
+    @classmethod
+    def begin_info_cache(cls):
+        """Starts caching of file infos and directory listings. Only use the
+        cache while the files are not modified by other means than this
+        class (e.g. by TAR writing to the effective path). Calls can be
+        nested; the cache is discarded by the outermost `end_info_cache`.
+        """
+        if cls.__info_cache_depth == 0:
+            cls.__info_cache = _FileInfoCache()
+        cls.__info_cache_depth += 1
+
+    @classmethod
+    def end_info_cache(cls):
+        cls.__info_cache_depth -= 1
+        if cls.__info_cache_depth == 0:
+            cls.__info_cache = None
+
+    @classmethod
+    def __invalidate(cls, *gfiles):
+        if cls.__info_cache is not None:
+            for _gfile in gfiles:
+                cls.__info_cache.invalidate(_gfile)
+
+    @classmethod
+    def _query_info(cls, gfile):
+        """Returns the info of the given file (see `_INFO_ATTRIBUTES`) or
+        None if the file does not exist.
+        """
+        if cls.__info_cache is not None:
+            _known, _info = cls.__info_cache.get_info(gfile)
+            if _known:
+                return _info
+        try:
+            _info = gfile.query_info(attributes = _INFO_ATTRIBUTES, flags = gio.FILE_QUERY_INFO_NONE,
+                                     cancellable = None)
+        except gio.Error, error:
+            if error.code == gio.ERROR_NOT_FOUND:
+                _info = None
+            else:
+                raise
+        if cls.__info_cache is not None:
+            cls.__info_cache.set_info(gfile, _info)
+        return _info
+
+    @classmethod
+    def _query_infos(cls, gfiles):
+        """Returns the infos of the given files (see `_query_info`). The
+        infos not cached are queried concurrently, i.e. the requests are
+        pipelined rather than waiting for each response in turn.
+        """
+        _infos = [None] * len(gfiles)
+        _pending = []
+        for _idx, _gfile in enumerate(gfiles):
+            _known = False
+            if cls.__info_cache is not None:
+                _known, _infos[_idx] = cls.__info_cache.get_info(_gfile)
+            if not _known:
+                _pending.append(_idx)
+        if len(_pending) == 1:
+            _infos[_pending[0]] = cls._query_info(gfiles[_pending[0]])
+        elif len(_pending) > 1:
+            _loop = glib.MainLoop()
+            _state = { 'pending' : len(_pending), 'error' : None }
+
+            def _query_done_cb(gfile, result, idx):
+                try:
+                    _infos[idx] = gfile.query_info_finish(result)
+                except gio.Error, error:
+                    if error.code != gio.ERROR_NOT_FOUND and _state['error'] is None:
+                        _state['error'] = error
+                _state['pending'] -= 1
+                if _state['pending'] == 0:
+                    _loop.quit()
+
+            for _idx in _pending:
+                gfiles[_idx].query_info_async(_INFO_ATTRIBUTES, _query_done_cb,
+                                              flags = gio.FILE_QUERY_INFO_NONE,
+                                              user_data = _idx)
+            _loop.run()
+            if _state['error'] is not None:
+                raise _state['error']
+            if cls.__info_cache is not None:
+                for _idx in _pending:
+                    cls.__info_cache.set_info(gfiles[_idx], _infos[_idx])
+        return _infos
+
+    @classmethod
+    def _list_infos(cls, gfile):
+        """Returns the infos of the entries of the given directory retrieved
+        by a single request. Symbolic links are not followed, i.e. their
+        type is `gio.FILE_TYPE_SYMBOLIC_LINK`.
+        
+        @raise gio.Error: if the directory cannot be listed
+        """
+        if cls.__info_cache is not None:
+            _infos = cls.__info_cache.get_listing(gfile)
+            if _infos is not None:
+                return _infos
+        _infos = list(gfile.enumerate_children(_INFO_ATTRIBUTES,
+                                               flags = gio.FILE_QUERY_INFO_NOFOLLOW_SYMLINKS))
+        if cls.__info_cache is not None:
+            cls.__info_cache.set_listing(gfile, _infos)
+        return _infos
+
     @classmethod
     def path_exists(cls, path):
         # Be careful: `gfile.query_exists()' returns True even if path is not
@@ -450,12 +633,17 @@ class GioOperations(interfaces.IOperations):
         # over ftp to check whether it is actually existing and readable.
         # This caused a regression (LP #1190224) which let the backup fail.
         _gfileobj = gio.File(path)
+        if cls.__info_cache is not None:
+            _known, _info = cls.__info_cache.get_info(_gfileobj)
+            if _known:
+                return _info is not None
         _res = _gfileobj.query_exists()
         return _res
 
     @classmethod
     def openfile_for_write(cls, path):
         _gfileobj = gio.File(path)
+        cls.__invalidate(_gfileobj)
 #FIXME: etag should be set to None though it doesn't work then!
         _ostr = _gfileobj.replace(etag = '', make_backup = False)
         return _ostr
@@ -469,6 +657,7 @@ class GioOperations(interfaces.IOperations):
     @classmethod
     def openfile_for_append(cls, path):
         _gfileobj = gio.File(path)
+        cls.__invalidate(_gfileobj)
         _ostr = _gfileobj.append_to()
         return _ostr
 
@@ -480,11 +669,14 @@ class GioOperations(interfaces.IOperations):
         _src = gio.File(src)
         _dest = gio.File(dest)
 
+        # the infos of source and destination are queried at once
+        _src_info, _dest_info = cls._query_infos([_src, _dest])
         # the source must be a file and exist
-        if not cls.path_exists(src):
+        if _src_info is None:
             raise IOError("Given copy source `%s` does not exist" % _src.get_parse_name())
-        if cls.__isfile(_src):
-            _src, _dest = cls._prepare_copy(_src, _dest)
+        if _src_info.get_file_type() == gio.FILE_TYPE_REGULAR:
+            _src, _dest = cls._prepare_copy(_src, _dest, _dest_info)
+            cls.__invalidate(_dest)
             _src.copy(_dest, flags = gio.FILE_COPY_OVERWRITE)
             try:
                 _src.copy_attributes(_dest, flags = gio.FILE_COPY_ALL_METADATA)
@@ -497,12 +689,14 @@ class GioOperations(interfaces.IOperations):
             _logger.warning("Given copy source `%s` is not a file. Skipped." % _src.get_parse_name())
 
     @classmethod
-    def _prepare_copy(cls, src_gfile, dst_gfile):
+    def _prepare_copy(cls, src_gfile, dst_gfile, dst_info):
         """Helper function that prepares the given paths for copying
         using 'nssb_copy'.
         
         Source must be a file or symbolic link to a file!
         
+        @param dst_info: the info of the destination (None if not existing)
+        
         @todo: Implement test case for symbolic links!
         """
         _src_uri = src_gfile.get_uri()
@@ -510,7 +704,7 @@ class GioOperations(interfaces.IOperations):
 
         _src_file = cls.__basename(src_gfile)
 
-        if cls.__isdir(dst_gfile):
+        if dst_info is not None and dst_info.get_file_type() == gio.FILE_TYPE_DIRECTORY:
             _dstu = cls.joinpath(_dst_uri, _src_file)
             _dst = gio.File(_dstu)
         elif _dst_uri.endswith(cls.pathsep):
@@ -531,6 +725,7 @@ class GioOperations(interfaces.IOperations):
     def _copy_metadata(cls, src, dest):
         _src = gio.File(src)
         _dest = gio.File(dest)
+        cls.__invalidate(_dest)
         _src.copy_attributes(_dest, flags = gio.FILE_COPY_ALL_METADATA)
 
     @classmethod
@@ -549,15 +744,17 @@ class GioOperations(interfaces.IOperations):
         # read/write
         try:
             _gfile = gio.File(path)
+            cls.__invalidate(_gfile)
             _gfile.delete()
         except gio.Error, error:
             raise IOError(str(error))
 
     @classmethod
     def _rmtree_recurse(cls, path):
-        _listing = cls.listdir_fullpath(path)
-        for _ent in _listing:
-            if (cls.is_dir(_ent) is True) and (cls.is_link(_ent) is False):
+        # the types of entries are retrieved along with the listing
+        for _info in cls._list_infos(gio.File(path)):
+            _ent = cls.joinpath(path, _info.get_name())
+            if _info.get_file_type() == gio.FILE_TYPE_DIRECTORY:
                 cls._rmtree_recurse(_ent)
             else:
                 cls._rm_file(_ent)
@@ -581,9 +778,10 @@ class GioOperations(interfaces.IOperations):
             _logger.warning(_msg)
             return
 
-        if cls.is_dir(path) and recursive is True:
-            for _entryp in cls.listdir_fullpath(path):
-                if (cls.is_dir(_entryp) is True)  and (cls.is_link(_entryp) is False):
+        if recursive is True and cls.is_dir(path):
+            for _info in cls._list_infos(_gfileobj):
+                _entryp = cls.joinpath(path, _info.get_name())
+                if _info.get_file_type() == gio.FILE_TYPE_DIRECTORY:
                     cls._add_write_permission(_entryp)
                 else:
                     cls._add_write_permission(_entryp, recursive = False)
@@ -615,6 +813,7 @@ class GioOperations(interfaces.IOperations):
     def force_move(cls, src, dst):
         _gsrc = gio.File(src)
         _gdst = gio.File(dst)
+        cls.__invalidate(_gsrc, _gdst)
         try:
             _gsrc.move(_gdst, flags = gio.FILE_COPY_OVERWRITE)
         except gio.Error:
@@ -637,15 +836,15 @@ class GioOperations(interfaces.IOperations):
         :type dst: string
     
         """
-        names = cls.listdir(src)
+        infos = cls._list_infos(gio.File(src))
         if not cls.path_exists(dst):
             cls.makedirs(dst)
 #        errors = []
-        for name in names:
-            srcname = cls.joinpath(src, name)
-            dstname = cls.joinpath(dst, name)
+        for info in infos:
+            srcname = cls.joinpath(src, info.get_name())
+            dstname = cls.joinpath(dst, info.get_name())
 #            try:
-            if cls.is_dir(srcname) and not cls.is_link(srcname):
+            if info.get_file_type() == gio.FILE_TYPE_DIRECTORY:
                 cls._copytree(srcname, dstname)
             else:
                 cls.copyfile(srcname, dstname)
@@ -684,34 +883,23 @@ class GioOperations(interfaces.IOperations):
             _res = True
         return _res
 
-    @classmethod
-    def __isfile(cls, gfile):
-        """Private helper method that takes `gio.File` rather pathname.
-        """
-        _res = False
-        _ftype = cls._query_file_type(gfile)
-        if _ftype == gio.FILE_TYPE_REGULAR:
-            _res = True
-        return _res
-
     @classmethod
     def _query_file_type(cls, gfile):
-        try:
-            _info = gfile.query_info(attributes = "standard::type", flags = gio.FILE_QUERY_INFO_NONE,
-                                       cancellable = None)
+        _ftype = None
+        _info = cls._query_info(gfile)
+        if _info is not None:
             _ftype = _info.get_file_type()
-        except gio.Error, error:
-            if error.code == gio.ERROR_NOT_FOUND:
-                _ftype = None
-            else:
-                raise
         return _ftype
 
     @classmethod
     def test_dir_access(cls, path):
         _gfileobj = gio.File(path)
         try:
-            _gfileobj.enumerate_children('standard::name')
+            if cls.__info_cache is None:
+                _gfileobj.enumerate_children('standard::name')
+            else:
+                # the listing is likely to be used afterwards
+                cls._list_infos(_gfileobj)
         except gio.Error, error:
             raise exceptions.FileAccessException(get_gio_errmsg(error,
                                         "Unable to list directory content"))
@@ -729,7 +917,7 @@ class GioOperations(interfaces.IOperations):
         listing = []
         _gfileobj = gio.File(path)
         try:
-            _infos = _gfileobj.enumerate_children('standard::name')
+            _infos = cls._list_infos(_gfileobj)
         except gio.Error, error:
             if error.code == gio.ERROR_NOT_DIRECTORY:
                 _msg = get_gio_errmsg(error, "Unable to list directory content")
@@ -773,11 +961,17 @@ class GioOperations(interfaces.IOperations):
     @classmethod
     def makedir(cls, path):
         _gfileobj = gio.File(path)
+        cls.__invalidate(_gfileobj)
         _gfileobj.make_directory()
 
     @classmethod
     def makedirs(cls, path):
         _gfileobj = gio.File(path)
+        # missing parent directories are created too
+        _gparent = _gfileobj
+        while _gparent is not None:
+            cls.__invalidate(_gparent)
+            _gparent = _gparent.get_parent()
         _gfileobj.make_directory_with_parents(gio.Cancellable())
 
     @classmethod
@@ -835,7 +1029,7 @@ class GioOperations(interfaces.IOperations):
     @classmethod
     def rename(cls, src, dst):
         _gfileobj = gio.File(src)
-        _info = _gfileobj.query_info('standard::name')
+        cls.__invalidate(_gfileobj, gio.File(dst))
         _dst = cls.get_basename(dst)
         _gfileobj.set_display_name(_dst)
 
@@ -855,6 +1049,32 @@ class GioOperations(interfaces.IOperations):
         _ostr.write(content)
         _ostr.close()
 
+    @classmethod
+    def get_mtime(cls, path):
+        """Returns the time of last modification (in seconds since epoch).
+        """
+        _info = cls.__query_existing_info(path)
+        return _info.get_attribute_uint64(gio.FILE_ATTRIBUTE_TIME_MODIFIED) + \
+               _info.get_attribute_uint32(gio.FILE_ATTRIBUTE_TIME_MODIFIED_USEC) / 1000000.0
+
+    @classmethod
+    def get_size(cls, path):
+        _info = cls.__query_existing_info(path)
+        return _info.get_size()
+
+    @classmethod
+    def __query_existing_info(cls, path):
+        """Returns the info of the given file.
+        
+        @raise gio.Error: if the file does not exist
+        """
+        _gfileobj = gio.File(path)
+        _info = cls._query_info(_gfileobj)
+        if _info is None:
+            # repeat the query to raise the original error
+            _info = _gfileobj.query_info(attributes = _INFO_ATTRIBUTES)
+        return _info
+
     @classmethod
     def close_stream(cls, file_desc):
         try:
@@ -0,0 +1,279 @@
+#   Simple Backup - Change Journal Service
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+:mod:`sbackup.journal_service` -- Change Journal Service
+=========================================================
+
+.. module:: journal_service
+   :synopsis: Records changed directories of a profile's includes.
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+The service watches the directories included in the backup of a profile
+using inotify and records changed directories in the profile's change
+journal (see module `sbackup.util.changejournal`). When making incremental
+snapshots, only the recorded directories are checked for changes (requires
+the directory cache to be enabled too). Modifying the content or the
+attributes of a file records its directory, hence the files of directories
+not recorded are counted using the stats stored in the directory cache.
+
+The service runs in the foreground until it is stopped. Since the journal is
+only complete while the service is running, the first backup after the
+service was (re-)started is made by checking all directories.
+
+"""
+
+from gettext import gettext as _
+import errno
+import os
+import signal
+import optparse
+
+from sbackup.pkginfo import Infos
+from sbackup.core.ConfigManager import ConfigManager, ConfigurationFileHandler
+from sbackup.util import changejournal
+from sbackup.util import constants
+from sbackup.util import inotify
+from sbackup.util import log
+from sbackup.util.exceptions import SBException
+
+
+__START = "start"
+__STOP = "stop"
+__valid_args = [__START, __STOP]
+
+# events changing a directory's entries or the checked attributes of entries
+_WATCH_MASK = inotify.IN_MODIFY | inotify.IN_ATTRIB | inotify.IN_CLOSE_WRITE |\
+              inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO | inotify.IN_CREATE |\
+              inotify.IN_DELETE | inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF |\
+              inotify.IN_ONLYDIR | inotify.IN_DONT_FOLLOW
+
+# seconds to wait for events before checking the period
+_READ_TIMEOUT = 1.0
+
+
+class ChangeJournalService(object):
+    """Watches the given directories and records changed directories in the
+    journal.
+    """
+
+    def __init__(self, journal, includes, excludes = None, period = changejournal.PERIOD):
+        """
+        @param journal: the journal file
+        @param includes: list of directories to watch (including sub-directories)
+        @param excludes: list of directories not to watch
+        """
+        self.__logger = log.LogFactory.getLogger()
+        self.__journal = journal
+        self.__includes = includes
+        self.__excludes = set(excludes or [])
+        self.__period = period
+
+        self.__inotify = None
+        self.__writer = None
+        # dictionary watch descriptor -> watched directory
+        self.__watches = {}
+        self.__sync_wd = None
+        self.__sync_prefix = changejournal.get_sync_prefix(journal)
+        self.__stopped = False
+
+    def stop(self):
+        """Stops the service (processing of events is finished first).
+        """
+        self.__stopped = True
+
+    def main(self):
+        """Watches the directories until `stop` is called.
+        """
+        self.__inotify = inotify.Inotify()
+        self.__writer = changejournal.JournalWriter(self.__journal, self.__period)
+        try:
+            self.__sync_wd = self.__inotify.add_watch(os.path.dirname(self.__journal),
+                                                      inotify.IN_CLOSE_WRITE | inotify.IN_ONLYDIR)
+            for _path in self.__includes:
+                if os.path.isdir(_path):
+                    self.__watch_tree(_path)
+            self.__logger.info(_("Watching %s directories.") % len(self.__watches))
+            self.__writer.start_session(os.getpid())
+
+            while not self.__stopped:
+                for _event in self.__inotify.read_events(_READ_TIMEOUT):
+                    self.__process_event(_event)
+                self.__writer.check_period()
+                self.__writer.flush()
+        finally:
+            self.__writer.close()
+            self.__inotify.close()
+            self.__watches = {}
+
+    def __is_excluded(self, path):
+        return path in self.__excludes
+
+    def __watch_tree(self, path, changed = False):
+        """Watches the given directory and its sub-directories. Directories
+        are watched before listing them, hence no entries are missed.
+
+        @param changed: whether to record the directories as changed
+        """
+        _dirs = [path]
+        while _dirs:
+            _path = _dirs.pop()
+            if self.__is_excluded(_path):
+                continue
+            try:
+                _wd = self.__inotify.add_watch(_path, _WATCH_MASK)
+            except OSError, error:
+                if error.errno == errno.ENOSPC:
+                    raise SBException(_("Max. number of inotify watches reached. Please "\
+                                        "increase `/proc/sys/fs/inotify/max_user_watches`."))
+                # vanished or not accessible directories are not part of the
+                # backup; changes are recorded in the parent directory
+                self.__logger.debug("Directory `%s` not watched: %s" % (_path, error))
+                continue
+            self.__watches[_wd] = _path
+            if changed:
+                self.__writer.add_changed(_path)
+            try:
+                _names = os.listdir(_path)
+            except OSError, error:
+                self.__logger.debug("Directory `%s` not listed: %s" % (_path, error))
+                continue
+            for _name in _names:
+                _child = os.path.join(_path, _name)
+                if os.path.isdir(_child) and not os.path.islink(_child):
+                    _dirs.append(_child)
+
+    def __unwatch_tree(self, path):
+        _prefix = path.rstrip(os.sep) + os.sep
+        for _wd, _path in self.__watches.items():
+            if _path == path or _path.startswith(_prefix):
+                del self.__watches[_wd]
+                self.__inotify.rm_watch(_wd)
+
+    def __process_event(self, event):
+        if event.mask & inotify.IN_Q_OVERFLOW:
+            self.__logger.warning(_("Events were lost. Change journal is incomplete until now."))
+            self.__writer.add_overflow()
+            return
+
+        if event.wd == self.__sync_wd and event.name.startswith(self.__sync_prefix):
+            self.__writer.add_sync(event.name[len(self.__sync_prefix):])
+
+        _path = self.__watches.get(event.wd)
+        if _path is None:
+            return
+        if event.mask & inotify.IN_IGNORED:
+            del self.__watches[event.wd]
+            return
+
+        self.__writer.add_changed(_path)
+        if event.name and event.mask & inotify.IN_ISDIR:
+            _child = os.path.join(_path, event.name)
+            if event.mask & inotify.IN_MOVED_FROM:
+                self.__unwatch_tree(_child)
+            elif event.mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                # cached records of directories formerly at the same paths
+                # must not be used
+                self.__watch_tree(_child, changed = True)
+
+
+def get_journal_settings(conffile = None):
+    """Returns the journal file and the directories to watch resp. to
+    exclude as configured for the given profile.
+
+    @raise SBException: if the change journal is not enabled
+    """
+    if conffile is None:
+        conffile = ConfigurationFileHandler().get_conffile()
+    _config = ConfigManager(conffile)
+    _journal = _config.get_change_journal_file()
+    if _journal is None:
+        raise SBException(_("Change journal is not enabled for profile `%s`.")\
+                          % _config.getProfileName())
+    _includes = []
+    _excludes = []
+    for _path, _value in (_config.get_dirconfig_local() or []):
+        _path = os.path.normpath(_path)
+        if _value == 1:
+            _includes.append(_path)
+        else:
+            _excludes.append(_path)
+    return (_journal, _includes, _excludes)
+
+
+def __launch_service(journal, includes, excludes):
+    _service = ChangeJournalService(journal, includes, excludes)
+
+    def _handle_signal(signum, frame):    #IGNORE:W0613
+        _service.stop()
+
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
+    _service.main()
+
+
+def __stop_service(journal):
+    _pid = None
+    if os.path.exists(journal):
+        _pid = changejournal.ChangeJournal(journal).get_session_pid()
+    if _pid is None:
+        print "Simple Backup change journal service is not running"
+    else:
+        try:
+            os.kill(_pid, signal.SIGTERM)
+        except OSError, error:
+            if error.errno != errno.ESRCH:
+                raise
+            print "Simple Backup change journal service is not running"
+
+
+def parse_cmdline(argv):
+    usage = "Usage: %prog " + __START + "|" + __STOP + " [options] (use -h or --help for more infos)"
+    version = "%prog " + Infos.VERSION
+    prog = constants.JOURNALSERVICE_FILE
+
+    parser = optparse.OptionParser(usage = usage, version = version, prog = prog)
+    parser.add_option("--config-file", dest = "configfile",
+                      metavar = "FILE", default = None,
+                      help = "set the configuration file of the profile to watch")
+
+    (options, args) = parser.parse_args(argv[1:])
+    if len(args) != 1:
+        parser.error("No command given")
+    cmd = args[0]
+    if cmd not in __valid_args:
+        parser.error("Unknown command given")
+
+    return (cmd, options)
+
+
+def run(args):
+    try:
+        _cmd, _options = parse_cmdline(argv = args)
+        _journal, _includes, _excludes = get_journal_settings(_options.configfile)
+        if _cmd == __START:
+            os.nice(5)
+            __launch_service(_journal, _includes, _excludes)
+        elif _cmd == __STOP:
+            __stop_service(_journal)
+        exitcode = constants.EXCODE_SUCCESS
+
+    except (SBException, OSError, IOError), error:
+        print "Error in Simple Backup change journal service:\n%s" % str(error)
+        exitcode = constants.EXCODE_GENERAL_ERROR
+    return exitcode
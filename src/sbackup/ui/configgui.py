@@ -862,15 +862,9 @@ class SBconfigGTK(GladeGnomeApp):
         else :
             self.configman.remove_option("general", "format")
 
-        if selected == cformats.index("none"):
-            # 'none' -> activate split functionality
-            self.widgets['splitsizevbox'].set_sensitive(True)
-        else :
-            self.widgets["splitsizeCB"].set_active(1)
-            self.widgets['splitsizevbox'].set_sensitive(False)
-            if self.configman.has_option("general", "splitsize"):
-                self.configman.remove_option("general", "splitsize")
-            self.on_splitsizeCB_changed()
+        # split functionality is available for compressed archives as well
+        # but not for deduplicated archives
+        self.widgets['splitsizevbox'].set_sensitive(self.configman.get_compress_format() != "dedup")
         self.isConfigChanged()
 
     def on_cmb_set_remote_service_changed(self, *args): #IGNORE:W0613
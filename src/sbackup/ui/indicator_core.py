@@ -37,6 +37,7 @@ from sbackup.util import constants
 from sbackup.util import system
 from sbackup.util import lock
 from sbackup.util import exceptions
+from sbackup.util import progress
 from sbackup.ui import misc
 
 
@@ -758,14 +759,19 @@ class SBackupdIndicatorHandler(object):
         self.__warning_present = False
 
         self._menuitem_status_tmpl = {"profile"        : _("Profile: %s"),
+                                      "profiles"       : _("Profiles: %s"),
+                                      "profile_progress" : _("%(profile)s: %(progress)s"),
                                       "size_of_backup" : _("Size of backup: %s"),
                                       "progress"       : _("%.1f%% processed"),
+                                      "progress_rate"  : _("%(progress)s (%(rate)s/s)"),
                                       "remaining_time" : _("Remaining time: %s")}
 
         self._targetnotfound_run_timer = False
         self._targetnotfound_clock = 0
         self._starttime_backup = None
         self._time_est_total = 0
+        # progress of profiles backed up concurrently
+        self._profiles_progress = progress.ProfilesProgress()
 
     def get_keep_alive(self):
         return self.__options.keep_alive
@@ -885,45 +891,118 @@ class SBackupdIndicatorHandler(object):
         return _res
 
     def get_progress_menu_label(self, checkpoint):
+        """
+        :param checkpoint: the published progress (see `progress.ProgressInfo`)
+        """
         self.__update_properties()
-        checkpoint = int(checkpoint)
+        try:
+            _progress = progress.ProgressInfo.deserialize(checkpoint)
+        except ValueError:
+            _progress = progress.ProgressInfo(0)
+        if _progress.profile is None:
+            return self.__get_single_progress_menu_label(_progress, self.get_profilename())
+
+        # backups of several profiles may run concurrently
+        self._profiles_progress.update(_progress)
+        _current = self._profiles_progress.get_progress()
+        if len(_current) == 1:
+            menu_msg = self.__get_single_progress_menu_label(_progress, _progress.profile)
+        else:
+            menu_msg = self.__get_profiles_progress_menu_label(_current)
+        return menu_msg
+
+    def __get_single_progress_menu_label(self, info, profilename):
         space_str = self.__get_space_required_str()
+        _total = info.total
+        if _total <= 0:
+            _total = self._space_required
 
         # values valid?
-        if (self._space_required > 0) and (checkpoint > 0):
-            _done = (checkpoint - 1) * constants.TAR_RECORDSIZE
-            _percent = (float(_done) / float(self._space_required)) * 100.0
+        if (_total > 0) and (info.done > 0):
+            _percent = (float(info.done) / float(_total)) * 100.0
             _percent = min(100.0, max(0.01, _percent))
 
-            _time_passed = time.time() - self._starttime_backup
-            _time_est_total = (_time_passed / _percent) * 100.0
-            _time_est_remain = _time_est_total - _time_passed
-
-            if _time_est_remain < 60:
-                _time_str = _("less than 1 minute")
-            elif _time_est_remain < 120:
-                _time_str = _("about 2 minutes")
-            elif _time_est_remain < 180:
-                _time_str = _("about 3 minutes")
-            elif _time_est_remain < 240:
-                _time_str = _("about 4 minutes")
-            elif _time_est_remain < 300:
-                _time_str = _("about 5 minutes")
-            else:
-                _time_str = _("about %.0f minutes") % (round((_time_est_remain / 60)))
-
-            menu_msg = {"profile"        : self._menuitem_status_tmpl["profile"] % self.get_profilename(),
+            _time_est_remain = info.remaining
+            if _time_est_remain == progress.UNKNOWN:
+                _time_passed = time.time() - self._starttime_backup
+                _time_est_total = (_time_passed / _percent) * 100.0
+                _time_est_remain = _time_est_total - _time_passed
+            _time_str = self.__get_remaining_time_str(_time_est_remain)
+
+            _progress_str = self._menuitem_status_tmpl["progress"] % _percent
+            if info.rate > 0:
+                _rate_str = util.get_humanreadable_size_str(size_in_bytes = info.rate,
+                                                            binary_prefixes = True)
+                _progress_str = self._menuitem_status_tmpl["progress_rate"]\
+                                    % { "progress" : _progress_str, "rate" : _rate_str }
+
+            menu_msg = {"profile"        : self._menuitem_status_tmpl["profile"] % profilename,
                         "size_of_backup" : self._menuitem_status_tmpl["size_of_backup"] % space_str,
-                        "progress"       : self._menuitem_status_tmpl["progress"] % _percent,
+                        "progress"       : _progress_str,
                         "remaining_time" : self._menuitem_status_tmpl["remaining_time"] % _time_str}
 
         else: # values invalid, but something is in progress
-            menu_msg = {"profile"        : self._menuitem_status_tmpl["profile"] % self.get_profilename(),
+            menu_msg = {"profile"        : self._menuitem_status_tmpl["profile"] % profilename,
                         "size_of_backup" : self._menuitem_status_tmpl["size_of_backup"] % space_str,
                         "progress"       : _("In progress"),
                         "remaining_time" : self._menuitem_status_tmpl["remaining_time"] % _("unknown")}
         return menu_msg
 
+    def __get_profiles_progress_menu_label(self, current):
+        """Returns the menu labels for the progress of several profiles
+        (list of `progress.ProgressInfo`) at once.
+        """
+        _names = []
+        _progress_strs = []
+        _space = 0
+        _time_est_remain = 0
+        for _progress in current:
+            _names.append(_progress.profile)
+            _percent = _progress.get_percent()
+            if _percent == progress.UNKNOWN:
+                _progress_str = _("In progress")
+            else:
+                _progress_str = self._menuitem_status_tmpl["progress"] % _percent
+            _progress_strs.append(self._menuitem_status_tmpl["profile_progress"]\
+                                    % { "profile" : _progress.profile, "progress" : _progress_str })
+            if _progress.total > 0:
+                _space += _progress.total
+            if _progress.remaining == progress.UNKNOWN:
+                _time_est_remain = progress.UNKNOWN
+            elif _time_est_remain != progress.UNKNOWN:
+                _time_est_remain = max(_time_est_remain, _progress.remaining)
+
+        if _space > 0:
+            space_str = util.get_humanreadable_size_str(size_in_bytes = _space,
+                                                        binary_prefixes = True)
+        else:
+            space_str = _("unknown")
+        if _time_est_remain == progress.UNKNOWN:
+            _time_str = _("unknown")
+        else:
+            _time_str = self.__get_remaining_time_str(_time_est_remain)
+
+        menu_msg = {"profile"        : self._menuitem_status_tmpl["profiles"] % ", ".join(_names),
+                    "size_of_backup" : self._menuitem_status_tmpl["size_of_backup"] % space_str,
+                    "progress"       : "; ".join(_progress_strs),
+                    "remaining_time" : self._menuitem_status_tmpl["remaining_time"] % _time_str}
+        return menu_msg
+
+    def __get_remaining_time_str(self, time_est_remain):
+        if time_est_remain < 60:
+            _time_str = _("less than 1 minute")
+        elif time_est_remain < 120:
+            _time_str = _("about 2 minutes")
+        elif time_est_remain < 180:
+            _time_str = _("about 3 minutes")
+        elif time_est_remain < 240:
+            _time_str = _("about 4 minutes")
+        elif time_est_remain < 300:
+            _time_str = _("about 5 minutes")
+        else:
+            _time_str = _("about %.0f minutes") % (round((time_est_remain / 60)))
+        return _time_str
+
     def get_finished_menu_label(self):
         self.__update_properties()
         space_str = self.__get_space_required_str()
@@ -0,0 +1,275 @@
+#   Simple Backup - checking of read access to files
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+
+"""This module provides the check whether files can be read by the
+backup process.
+
+Usually the permission is checked using `access(2)` which neither opens
+the file nor can hang. Files on file systems for which `access` is not
+reliable or which can hang (FUSE, network file systems) and special files
+are actually opened. These opens are performed by worker threads and
+abandoned after a timeout, i.e. a hanging open doesn't block the caller
+for longer than the timeout.
+"""
+
+import os
+import errno
+import stat
+import threading
+import Queue
+
+from sbackup.util import constants
+from sbackup.util import log
+from sbackup.util.exceptions import TimeoutError
+
+
+# types of file systems for which files are actually opened
+SUSPICIOUS_FS_TYPES = ("nfs", "nfs4", "cifs", "smbfs", "smb3", "ncpfs",
+                       "afs", "coda", "9p", "davfs", "ceph", "glusterfs",
+                       "fuse", "fuseblk")
+SUSPICIOUS_FS_TYPE_PREFIXES = ("fuse.",)
+
+PROC_MOUNTS = "/proc/mounts"
+
+# results of the check
+READABLE = 0
+NOT_READABLE = 1
+TIMED_OUT = 2
+
+
+def get_mounts(mounts_file = PROC_MOUNTS):
+    """Returns the mounted file systems as list of pairs (mount point, type)
+    sorted by length of the mount points (longest first). If the mounts
+    cannot be read, an empty list is returned.
+    """
+    _res = []
+    try:
+        _fobj = open(mounts_file, "r")
+        try:
+            for _line in _fobj:
+                _fields = _line.split()
+                if len(_fields) < 3:
+                    continue
+                # special characters (e.g. spaces) are octal escaped
+                _mntpoint = _fields[1].decode("string_escape")
+                _res.append((_mntpoint, _fields[2]))
+        finally:
+            _fobj.close()
+    except (IOError, OSError), error:
+        log.LogFactory.getLogger().warning("Unable to read mounted file systems from `%s`: %s"\
+                                           % (mounts_file, error))
+    _res.sort(key = lambda _mnt: len(_mnt[0]), reverse = True)
+    return _res
+
+
+def is_suspicious_fs_type(fstype):
+    """Returns True if files on file systems of given type must be opened
+    in order to check read access.
+    """
+    if fstype in SUSPICIOUS_FS_TYPES:
+        return True
+    for _prefix in SUSPICIOUS_FS_TYPE_PREFIXES:
+        if fstype.startswith(_prefix):
+            return True
+    return False
+
+
+class _OpenRequest(object):
+    """A single request of opening a file processed by `_OpenWorkerPool`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.error = None
+        self.done = threading.Event()
+
+
+class _OpenWorkerPool(object):
+    """Threads that open files. A thread hanging in an `open` call is
+    abandoned and replaced by a new thread (up to a limit of abandoned
+    threads).
+    """
+
+    def __init__(self, nthreads, max_abandoned):
+        self.__nthreads = nthreads
+        self.__max_abandoned = max_abandoned
+        self.__nabandoned = 0
+        self.__queue = Queue.Queue()
+        self.__lock = threading.Lock()
+        self.__threads = []
+        for _idx in range(nthreads):
+            self.__start_thread()
+
+    def __start_thread(self):
+        _thread = threading.Thread(target = self.__work)
+        _thread.setDaemon(True)
+        _thread.start()
+        self.__threads.append(_thread)
+
+    def __work(self):
+        while True:
+            _req = self.__queue.get()
+            if _req is None:
+                break
+            try:
+                # non-blocking in order to not wait for writers of FIFOs etc.
+                _fd = os.open(_req.path, os.O_RDONLY | os.O_NONBLOCK)
+                os.close(_fd)
+            except Exception, error:    #IGNORE:W0703
+                _req.error = error
+            _req.done.set()
+
+    def open(self, path, timeout):
+        """Opens (and closes) the given `path` within a worker thread.
+
+        @return: None if the file was opened, the error if opening failed
+        @raise TimeoutError: if the file could not be opened within `timeout`
+        """
+        _req = _OpenRequest(path)
+        self.__queue.put(_req)
+        _req.done.wait(timeout)
+        if not _req.done.isSet():
+            self.__abandon_thread()
+            raise TimeoutError("Opening of `%s` timed out." % path)
+        return _req.error
+
+    def __abandon_thread(self):
+        """A thread (probably) hangs: start a replacement if the limit
+        of abandoned threads is not reached yet.
+        """
+        self.__lock.acquire()
+        try:
+            if self.__nabandoned < self.__max_abandoned:
+                self.__nabandoned += 1
+                self.__start_thread()
+        finally:
+            self.__lock.release()
+
+    def stop(self):
+        """Stops the threads. Hanging threads are left behind.
+        """
+        for _thread in self.__threads:
+            self.__queue.put(None)
+        for _thread in self.__threads:
+            _thread.join(0.1)
+
+
+class ReadAccessChecker(object):
+    """Checks whether files can be read. The checker is safe to be used
+    from several threads.
+    """
+
+    def __init__(self, timeout = constants.TIMEOUT_OPEN_FILE_SECONDS,
+                       nthreads = 2, max_abandoned = 8, mounts = None):
+        """
+        @param timeout: time in seconds after an open is considered hanging
+        @param nthreads: number of threads that open files
+        @param max_abandoned: max. number of hanging threads that are replaced
+        @param mounts: mounted file systems as returned by `get_mounts`
+        """
+        self.__logger = log.LogFactory.getLogger()
+        self.__timeout = timeout
+        if mounts is None:
+            mounts = get_mounts()
+        self.__mounts = mounts
+        # cache: device number -> whether files must be opened
+        self.__suspicious_devs = {}
+        # devices on which an open timed out
+        self.__hanging_devs = set()
+        self.__pool = _OpenWorkerPool(nthreads, max_abandoned)
+
+    def __get_fs_type(self, path):
+        """Returns the type of the file system `path` is stored on.
+        """
+        for _mntpoint, _fstype in self.__mounts:
+            if _mntpoint == os.sep or path == _mntpoint or \
+               path.startswith(_mntpoint.rstrip(os.sep) + os.sep):
+                return _fstype
+        return None
+
+    def __is_suspicious(self, path, stats, islink):
+        _dev = stats.st_dev
+        _res = self.__suspicious_devs.get(_dev)
+        if _res is None:
+            _path = path
+            if islink:
+                # stats are those of the link target
+                _path = os.path.realpath(path)
+            _fstype = self.__get_fs_type(_path)
+            _res = (_fstype is not None) and is_suspicious_fs_type(_fstype)
+            if _res:
+                self.__logger.debug("Files on `%s` (type %s) are opened for checking read access."\
+                                    % (_path, _fstype))
+            self.__suspicious_devs[_dev] = _res
+        return _res
+
+    def __get_access_error(self, path):
+        """Returns the reason why `path` is not accessable (e.g. the target
+        of a symbolic link does not exist).
+        """
+        try:
+            os.stat(path)
+        except OSError, error:
+            return error
+        return OSError(errno.EACCES, os.strerror(errno.EACCES), path)
+
+    def __is_special(self, stats):
+        _mode = stats.st_mode
+        return not (stat.S_ISREG(_mode) or stat.S_ISDIR(_mode) or stat.S_ISLNK(_mode))
+
+    def is_opened(self, path, stats, islink = False):
+        """Returns True if the file `path` is actually opened when checked
+        (i.e. it is a special file or is stored on a suspicious file system).
+        The parameters are the same as for `check`.
+        """
+        if self.__is_special(stats):
+            return True
+        return self.__is_suspicious(path, stats, islink)
+
+    def check(self, path, stats, islink = False):
+        """Checks whether the file `path` can be read.
+
+        @param stats: the stats of the file (of the link target if the link is followed)
+        @param islink: True if `stats` are those of a followed link's target
+
+        @return: tuple of result (READABLE, NOT_READABLE or TIMED_OUT) and
+                 the error (or None)
+        """
+        if not self.is_opened(path, stats, islink):
+            if os.access(path, os.R_OK):
+                return (READABLE, None)
+            return (NOT_READABLE, self.__get_access_error(path))
+
+        if stats.st_dev in self.__hanging_devs:
+            return (TIMED_OUT, None)
+        try:
+            _error = self.__pool.open(path, self.__timeout)
+        except TimeoutError:
+            if not self.__is_special(stats):
+                # further files on this file system would hang too
+                self.__hanging_devs.add(stats.st_dev)
+            return (TIMED_OUT, None)
+        if _error is None:
+            return (READABLE, None)
+        return (NOT_READABLE, _error)
+
+    def close(self):
+        """Stops the worker threads.
+        """
+        self.__pool.stop()
@@ -0,0 +1,237 @@
+#   Simple Backup - journal of changed directories
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+
+"""This module provides reading and writing of the journal of changed
+directories. The journal is written by the journal service (see
+`sbackup.journal_service`) and read when collecting files for an incremental
+snapshot (see `filecollect.FileCollector`).
+
+The journal is an append-only text file; each line consists of a record type
+and its value separated by a tab:
+
+ * ``S <time> <pid>`` -- the service started watching; the journal is complete
+   since the given time
+ * ``T <time>`` -- start of a period; directories are listed once per period
+ * ``C <path>`` -- the entries of the directory (or the directory itself) changed
+ * ``O <time>`` -- events were lost; the journal is complete since the given time
+ * ``Y <token>`` -- acknowledgement of a synchronization request
+ * ``E <time>`` -- the service stopped watching
+
+The journal is truncated when the service is started. Since events are
+processed asynchronously, readers request a synchronization by creating a
+file in the journal's directory (see `get_sync_prefix`) and wait for its
+acknowledgement: all changes made before the request are recorded then.
+"""
+
+from gettext import gettext as _
+import os
+import time
+import uuid
+
+from sbackup.util import log
+
+
+_SESSION = "S"
+_PERIOD = "T"
+_CHANGED = "C"
+_OVERFLOW = "O"
+_SYNC = "Y"
+_END = "E"
+
+_SEP = "\t"
+
+# seconds after which a new period is started
+PERIOD = 60.0
+# seconds to wait for the service to acknowledge a synchronization
+SYNC_TIMEOUT = 10.0
+_SYNC_INTERVAL = 0.05
+
+
+def get_sync_prefix(journal):
+    """Returns the prefix of the names of files requesting a synchronization
+    of the given journal. The files are created in the journal's directory.
+    """
+    return "%s.sync." % os.path.basename(journal)
+
+def _encode(path):
+    return path.encode("string_escape")
+
+def _decode(value):
+    return value.decode("string_escape")
+
+def _read_records(journal, offset = 0):
+    """Returns the complete records (pairs of type and value) of the given
+    journal starting at `offset`.
+    """
+    _fobj = open(journal, "rb")
+    try:
+        _fobj.seek(offset)
+        _data = _fobj.read()
+    finally:
+        _fobj.close()
+    _records = []
+    for _line in _data.split("\n")[:-1]:
+        _kind, _sep, _value = _line.partition(_SEP)
+        _records.append((_kind, _value))
+    return _records
+
+
+class JournalWriter(object):
+    """Writes the journal. Each directory is recorded once per period.
+    """
+
+    def __init__(self, journal, period = PERIOD):
+        self.__journal = journal
+        self.__period = period
+        self.__period_start = None
+        # directories recorded within the current period
+        self.__changed = set()
+        self.__fobj = open(journal, "wb")
+
+    def __write(self, kind, value):
+        self.__fobj.write("%s%s%s\n" % (kind, _SEP, value))
+
+    def start_session(self, pid):
+        """Records that the journal is complete from now on.
+        """
+        self.__write(_SESSION, "%r%s%s" % (time.time(), _SEP, pid))
+        self.__start_period()
+        self.flush()
+
+    def __start_period(self):
+        self.__period_start = time.time()
+        self.__changed.clear()
+        self.__write(_PERIOD, repr(self.__period_start))
+
+    def check_period(self):
+        """Starts a new period if the current one has expired.
+        """
+        if time.time() - self.__period_start >= self.__period:
+            self.__start_period()
+
+    def add_changed(self, path):
+        if path not in self.__changed:
+            self.__changed.add(path)
+            self.__write(_CHANGED, _encode(path))
+
+    def add_overflow(self):
+        """Records that events were lost; the journal is complete from now on.
+        """
+        self.__write(_OVERFLOW, repr(time.time()))
+
+    def add_sync(self, token):
+        """Acknowledges the synchronization request with the given token.
+        """
+        self.__write(_SYNC, token)
+        self.flush()
+
+    def flush(self):
+        self.__fobj.flush()
+
+    def close(self):
+        if self.__fobj is not None:
+            self.__write(_END, repr(time.time()))
+            self.__fobj.close()
+            self.__fobj = None
+
+
+class ChangeJournal(object):
+    """Read access to the journal of changed directories.
+    """
+
+    def __init__(self, journal):
+        self.__logger = log.LogFactory.getLogger()
+        self.__journal = journal
+
+    def sync(self, timeout = SYNC_TIMEOUT):
+        """Requests a synchronization and waits max. `timeout` seconds for
+        its acknowledgement.
+
+        @return: True if all changes made before are recorded, False otherwise
+        """
+        _token = uuid.uuid4().hex
+        _offset = os.path.getsize(self.__journal)
+        _syncfile = os.path.join(os.path.dirname(self.__journal),
+                                 "%s%s" % (get_sync_prefix(self.__journal), _token))
+        open(_syncfile, "w").close()
+        try:
+            _end = time.time() + timeout
+            while True:
+                if (_SYNC, _token) in _read_records(self.__journal, _offset):
+                    return True
+                if time.time() > _end:
+                    return False
+                time.sleep(_SYNC_INTERVAL)
+                # the journal is truncated if the service was restarted
+                _offset = min(_offset, os.path.getsize(self.__journal))
+        finally:
+            os.remove(_syncfile)
+
+    def get_session_pid(self):
+        """Returns the PID of the service writing the journal or None if
+        the service stopped.
+        """
+        _pid = None
+        for _kind, _value in _read_records(self.__journal):
+            if _kind == _SESSION:
+                _pid = int(_value.split(_SEP)[1])
+            elif _kind == _END:
+                _pid = None
+        return _pid
+
+    def get_changed_dirs(self, since, timeout = SYNC_TIMEOUT):
+        """Returns the set of directories changed since the given time. None
+        is returned if the journal is not complete since this time (e.g. the
+        service was started later, events were lost or the service does not
+        respond).
+        """
+        if not os.path.exists(self.__journal):
+            self.__logger.info(_("Change journal `%s` does not exist.") % self.__journal)
+            return None
+        try:
+            if not self.sync(timeout):
+                self.__logger.warning(_("Change journal service does not respond."))
+                return None
+            _records = _read_records(self.__journal)
+        except (IOError, OSError), error:
+            self.__logger.warning(_("Unable to read change journal `%(file)s`: %(error)s")\
+                                  % { 'file' : self.__journal, 'error' : error })
+            return None
+
+        _complete_since = None
+        _changed = set()
+        for _kind, _value in _records:
+            if _kind == _CHANGED:
+                _changed.add(_decode(_value))
+            elif _kind == _PERIOD:
+                if float(_value) <= since:
+                    # directories recorded before were changed before `since`
+                    _changed = set()
+            elif _kind == _SESSION:
+                _complete_since = float(_value.split(_SEP)[0])
+                _changed = set()
+            elif _kind == _OVERFLOW:
+                _complete_since = float(_value)
+            elif _kind == _END:
+                _complete_since = None
+
+        if _complete_since is None or _complete_since > since:
+            self.__logger.info(_("Change journal is not complete since the base snapshot."))
+            return None
+        return _changed
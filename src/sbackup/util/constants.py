@@ -36,6 +36,7 @@ DAYS_IN_WEEK = 7
 
 
 TIMEOUT_RETRY_TARGET_CHECK_SECONDS = 300
+TIMEOUT_OPEN_FILE_SECONDS = 5   # opening a file may hang (LP Bug 184713)
 INTERVAL_RETRY_TARGET_CHECK_SECONDS = 5
 
 INDICATOR_LAUNCH_PAUSE_SECONDS = 3
@@ -75,6 +76,7 @@ BACKUP_CANCEL_SIG = signal.SIGUSR1
 
 # Name definitions
 DBUSSERVICE_FILE = "sbackup-dbusservice"
+JOURNALSERVICE_FILE = "sbackup-journald"
 INDICATORAPP_FILE = "sbackup-indicator"
 INDICATORAPP_NAME = "Simple Backup Indicator Application"
 
@@ -105,8 +107,8 @@ LOCALE_DOMAIN = "sbackup"
 NOTIFICATION_DOMAIN = "sbackup"
 
 
-# dbus constants - keep copies of these up-to-date in `sbackup-progress`
-#                  and `org.sbackupteam.SimpleBackup.conf` and `Makefile`
+# dbus constants - keep copies of these up-to-date in
+#                  `org.sbackupteam.SimpleBackup.conf` and `Makefile`
 #                  configuration file name = dbus service!
 DBUS_SERVICE = "org.sbackupteam.SimpleBackup"
 DBUS_OBJ_PATH = "/SBackupProcess"
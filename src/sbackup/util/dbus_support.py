@@ -341,6 +341,18 @@ class DBusProviderFacade(_DBusConnection):
         assert isinstance(res, types.BooleanType)
         return res
 
+    def emit_progress_signal(self, progress):
+        """Publishes the progress of the backup over the signal dbus.
+
+        :param progress: the progress as string (see `progress.ProgressInfo`)
+        """
+        if not isinstance(progress, types.StringTypes):
+            raise TypeError("Parameter of string type expected. Got %s instead." % str(type(progress)))
+        self.ensure_connectivity()
+        res = self.__call_remote(self._backup_obj.emit_progress_signal, progress)
+        assert isinstance(res, types.BooleanType)
+        return res
+
     def set_backup_pid(self, pid):
         if not isinstance(pid, types.IntType):
             raise TypeError("Parameter of integer type expected. Got %s instead." % str(type(pid)))
@@ -0,0 +1,255 @@
+#   Simple Backup - cache of directory metadata for collecting files
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+
+"""This module provides a persistent cache of the results of checking
+directories when collecting files (see `filecollect.FileCollector`).
+
+For each directory the time of modification, the time of change, the inode
+and the checked direct entries (excluded by name, sub-directories, files
+along with their stats) are stored. The entries of a directory can only
+change if its time of modification changes. Hence, if a directory was not
+modified since the base snapshot, the cached entries are used for an
+incremental backup without listing the directory and matching the names
+again. The cached files are still stat'ed and checked for read access and
+size since their content and permissions can change without modifying the
+directory.
+
+Files excluded because they exceeded the max. size are cached along with
+their stats like other files, i.e. their size is checked again. Files
+excluded because they were not readable can become part of the backup
+without changing the directory; directories containing such files are not
+cached. The cache is discarded if the settings affecting the exclusion of
+files (see `get_fingerprint`) change.
+
+If a complete journal of changed directories is available (see module
+`changejournal`), unchanged directories are taken from the cache without
+checking the directories themselves. Since the journal records changes of
+the content and the attributes of files as changes of their directory, the
+files of unchanged directories are counted using the cached stats, i.e.
+they are neither stat'ed nor checked for read access.
+"""
+
+from gettext import gettext as _
+import collections
+import hashlib
+import os
+import threading
+import time
+import cPickle as pickle
+
+from sbackup.util import log
+
+
+# kinds of cached directory entries
+EXCLUDED = 0
+DIRECTORY = 1
+FILE = 2
+DELTA_FILE = 3
+
+_CACHE_VERSION = 3
+
+# the stats of cached files required for counting them
+FileStats = collections.namedtuple("FileStats", "st_size st_mtime st_ctime st_mode")
+
+
+def get_fingerprint(*settings):
+    """Returns the fingerprint of the given settings (any representable
+    objects). Cached entries are only used with equal fingerprints.
+    """
+    return hashlib.md5(repr(settings)).hexdigest()
+
+def get_file_stats(fstats):
+    """Returns the `FileStats` of a file taken from the given stats.
+    """
+    return FileStats(fstats.st_size, fstats.st_mtime, fstats.st_ctime, fstats.st_mode)
+
+
+class DirectoryRecord(object):
+    """The checked direct entries of a directory.
+    """
+
+    def __init__(self):
+        # list of (name, kind, flag whether the entry is a symbolic link,
+        # `FileStats` of files or None)
+        self.entries = []
+        self.cacheable = True
+
+    def add(self, name, kind, islink = False, stats = None):
+        self.entries.append((name, kind, islink, stats))
+
+    def set_stats(self, index, stats):
+        """Replaces the stats of the entry at the given index (e.g. of a file
+        modified since the record was written).
+        """
+        _name, _kind, _islink, _stats = self.entries[index]
+        self.entries[index] = (_name, _kind, _islink, stats)
+
+    def reserve(self):
+        """Reserves the position of an entry that is added later (e.g. by
+        another thread) using the returned `_ReservedEntry`. This way the
+        entries are stored in the order of the directory listing.
+        """
+        self.entries.append(None)
+        return _ReservedEntry(self, len(self.entries) - 1)
+
+    def set_uncacheable(self):
+        self.cacheable = False
+
+
+class _ReservedEntry(object):
+    """An entry of a `DirectoryRecord` at a reserved position. It provides
+    the interface of `DirectoryRecord` for adding a single entry.
+    
+    @note: An entry that is not added leaves a gap; this only happens for
+           paths making the record uncacheable.
+    """
+
+    def __init__(self, record, index):
+        self.__record = record
+        self.__index = index
+
+    def add(self, name, kind, islink = False, stats = None):
+        self.__record.entries[self.__index] = (name, kind, islink, stats)
+
+    def set_uncacheable(self):
+        self.__record.set_uncacheable()
+
+
+class DirectoryCache(object):
+    """Cache of directory records, stored in a file. The cache is
+    thread-safe; records are added while collecting and written by `save`.
+    """
+
+    def __init__(self, path, fingerprint):
+        """
+        @param path: the file the cache is stored in
+        @param fingerprint: fingerprint of the current settings
+        """
+        self.__logger = log.LogFactory.getLogger()
+        self.__path = path
+        self.__fingerprint = fingerprint
+        # time the records of this run are collected since
+        self.__time = time.time()
+        # dictionary path -> (mtime, ctime, inode, device, record)
+        self.__cached = {}
+        self.__cached_time = None
+        # directories seen in the current run
+        self.__current = {}
+        self.__lock = threading.Lock()
+        self.__nhits = 0
+
+    def __str__(self):
+        return self.__path
+
+    def load(self):
+        """Reads the cache file. The cache is left empty if the file does
+        not exist, cannot be read or was written using other settings.
+        """
+        self.__cached = {}
+        self.__cached_time = None
+        if not os.path.exists(self.__path):
+            return
+        try:
+            _fobj = open(self.__path, "rb")
+            try:
+                _data = pickle.load(_fobj)
+            finally:
+                _fobj.close()
+            if _data[0] == _CACHE_VERSION:
+                _version, _fingerprint, _time, _dirs = _data
+            else:
+                _version = _data[0]
+        except Exception, error:    #IGNORE:W0703
+            self.__logger.warning(_("Unable to read directory cache `%(file)s`: %(error)s")\
+                                  % { 'file' : self.__path, 'error' : error })
+            return
+        if _version != _CACHE_VERSION or _fingerprint != self.__fingerprint:
+            self.__logger.info(_("Settings changed since directory cache was written. Cache is not used."))
+            return
+        self.__cached = _dirs
+        self.__cached_time = _time
+        self.__logger.debug("%s directories read from cache `%s`" % (len(_dirs), self.__path))
+
+    def save(self):
+        """Writes the directories seen in the current run into the cache file.
+        """
+        _dirs = {}
+        for _path, _item in self.__current.iteritems():
+            if _item[4].cacheable:
+                _dirs[_path] = _item
+        _dirname = os.path.dirname(self.__path)
+        if not os.path.isdir(_dirname):
+            os.makedirs(_dirname)
+        _tmppath = "%s.tmp" % self.__path
+        _fobj = open(_tmppath, "wb")
+        try:
+            pickle.dump((_CACHE_VERSION, self.__fingerprint, self.__time, _dirs), _fobj,
+                        pickle.HIGHEST_PROTOCOL)
+        finally:
+            _fobj.close()
+        os.rename(_tmppath, self.__path)
+        self.__logger.info(_("Directory cache: %(nhits)s of %(ndirs)s directories unchanged.")\
+                           % { 'nhits' : self.__nhits, 'ndirs' : len(self.__current) })
+
+    def get_record(self, path, fstats, base_time):
+        """Returns the cached record of the given directory if the directory
+        was not modified since the given time and since the record was
+        written; None otherwise.
+        """
+        _item = self.__cached.get(path)
+        if _item is None or max(fstats.st_mtime, fstats.st_ctime) > base_time:
+            return None
+        if _item[:4] != (fstats.st_mtime, fstats.st_ctime, fstats.st_ino, fstats.st_dev):
+            return None
+        return self.__use_record(path, _item)
+
+    def get_unchanged_record(self, path):
+        """Returns the cached record of the given directory without checking
+        it. The directory must be known to be unchanged since the records
+        were collected (see `get_time_of_records`).
+        """
+        _item = self.__cached.get(path)
+        if _item is None:
+            return None
+        return self.__use_record(path, _item)
+
+    def __use_record(self, path, item):
+        self.__current[path] = item
+        self.__lock.acquire()
+        try:
+            self.__nhits += 1
+        finally:
+            self.__lock.release()
+        return item[4]
+
+    def get_time_of_records(self):
+        """Returns the time the cached records were collected since (i.e.
+        the start of the run that wrote the cache) or None if no records
+        were read.
+        """
+        return self.__cached_time
+
+    def add_record(self, path, fstats):
+        """Returns a new (empty) record for the given directory that is
+        stored when the cache is saved.
+        """
+        _record = DirectoryRecord()
+        self.__current[path] = (fstats.st_mtime, fstats.st_ctime, fstats.st_ino,
+                                fstats.st_dev, _record)
+        return _record
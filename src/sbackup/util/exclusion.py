@@ -0,0 +1,288 @@
+#   Simple Backup - matching of paths against exclusion rules
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+
+"""This module provides matching of paths against the regular expressions
+defined as exclusion rules.
+
+Instead of searching every path with each expression in turn the rules
+are prepared once:
+
+* rules that only test for a literal suffix (e.g. `\.mp3$`) are evaluated
+  using a set lookup of the path's ending
+* the remaining rules are merged into a single alternation that is searched
+  in one pass; only if it matches, the rules are tested one by one in
+  order to determine the rule that matched
+* rules starting with an anchored literal prefix (e.g. `^/home/john/tmp`)
+  are only considered for directories they can match in; the merged
+  expression is cached per directory.
+
+The result is the same as searching the path with each rule in turn: the
+first matching rule (in order of definition) is reported.
+"""
+
+from gettext import gettext as _
+import re
+
+from sbackup import util
+from sbackup.util import log
+
+
+# characters with special meaning in regular expressions
+_SPECIAL_CHARS = ".^$*+?{}[]\\|()"
+_QUANTIFIERS = "*+?{"
+
+# patterns that cannot be merged with others (backreferences, global flags...)
+_UNMERGEABLE_RE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(|\(\?[iLmsux]+\)")
+
+# max. number of groups in a single expression (limited by module `re`)
+_MAX_GROUPS = 99
+
+# max. number of directories the merged expressions are cached for
+_MAX_CACHED_DIRS = 1024
+
+
+def _parse_literal(pattern, start):
+    """Parses literal characters (including escaped special characters) in
+    `pattern` beginning at `start`.
+
+    @return: tuple of the literal string and the index of the first character
+             that is not part of the literal
+    """
+    _lit = []
+    _idx = start
+    _len = len(pattern)
+    while _idx < _len:
+        _char = pattern[_idx]
+        if _char == "\\":
+            if _idx + 1 < _len and not pattern[_idx + 1].isalnum():
+                _lit.append(pattern[_idx + 1])
+                _idx += 2
+                continue
+            break
+        if _char in _SPECIAL_CHARS:
+            break
+        _lit.append(_char)
+        _idx += 1
+    return ("".join(_lit), _idx)
+
+
+def get_literal_suffix(pattern):
+    """Returns the literal suffix if the given pattern only matches paths
+    ending with a literal string (e.g. `\.mp3$` or `.*~$`), None otherwise.
+    """
+    _start = 0
+    if pattern.startswith(".*"):
+        _start = 2
+    _lit, _idx = _parse_literal(pattern, _start)
+    if _lit and _idx == len(pattern) - 1 and pattern[_idx] == "$":
+        return _lit
+    return None
+
+
+def get_literal_prefix(pattern):
+    """Returns the literal prefix if the given pattern is anchored at the
+    beginning of paths (e.g. `^/home/john/tmp`), None otherwise.
+    """
+    if not pattern.startswith("^") or "|" in pattern:
+        return None
+    _lit, _idx = _parse_literal(pattern, 1)
+    if _idx < len(pattern) and pattern[_idx] in _QUANTIFIERS:
+        # the last character is quantified, i.e. it might be optional
+        _lit = _lit[:-1]
+    if _lit:
+        return _lit
+    return None
+
+
+class _Rule(object):
+    """A single exclusion rule.
+    """
+
+    def __init__(self, index, pattern):
+        self.index = index
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.mergeable = (_UNMERGEABLE_RE.search(pattern) is None)
+        self.suffix = None
+        self.prefix = None
+        if self.mergeable:
+            self.suffix = get_literal_suffix(pattern)
+            self.prefix = get_literal_prefix(pattern)
+
+
+class _MergedRules(object):
+    """A list of rules searched in (mostly) one pass.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.__regexes = []
+        _chunk = []
+        _ngroups = 0
+        for _rule in rules:
+            if not _rule.mergeable:
+                self.__regexes.append(_rule.regex)
+                continue
+            if _ngroups + _rule.regex.groups > _MAX_GROUPS:
+                self.__add_merged(_chunk)
+                _chunk = []
+                _ngroups = 0
+            _chunk.append(_rule)
+            _ngroups += _rule.regex.groups
+        self.__add_merged(_chunk)
+
+    def __add_merged(self, rules):
+        if len(rules) == 0:
+            return
+        if len(rules) == 1:
+            self.__regexes.append(rules[0].regex)
+            return
+        _merged = "|".join(["(?:%s)" % _rule.pattern for _rule in rules])
+        try:
+            self.__regexes.append(re.compile(_merged))
+        except (re.error, AssertionError):
+            # e.g. group names defined in multiple rules
+            for _rule in rules:
+                self.__regexes.append(_rule.regex)
+
+    def search(self, path, max_index):
+        """Returns the first rule (with an index lower than `max_index`) that
+        matches the given path or None.
+        """
+        for _regex in self.__regexes:
+            if _regex.search(path) is not None:
+                break
+        else:
+            return None
+        for _rule in self.rules:
+            if _rule.index >= max_index:
+                break
+            if _rule.regex.search(path) is not None:
+                return _rule
+        return None
+
+
+class ExcludeRegexMatcher(object):
+    """Matches paths against a list of regular expressions.
+    """
+
+    def __init__(self, regexes, pathsep = "/"):
+        """
+        @param regexes: the regular expressions (as strings); empty and
+                        invalid expressions are skipped
+        """
+        self.__logger = log.LogFactory.getLogger()
+        self.__pathsep = pathsep
+        self.__rules = []
+        # literal suffix rules: length of suffix -> {suffix : first rule}
+        self.__suffixes = {}
+        self.__prefix_rules = []
+        # indices of rules that are always considered
+        self.__other_rules = set()
+        # cache: directory -> merged rules applicable to its entries
+        self.__dir_cache = {}
+        # cache: indices of applicable prefix rules -> merged rules
+        self.__merged_cache = {}
+
+        self.__set_rules(regexes)
+
+    def __set_rules(self, regexes):
+        if not regexes:
+            return
+        for _regex in regexes:
+            if util.is_empty_regexp(_regex):
+                self.__logger.warning(_("Empty regular expression found. Skipped."))
+            elif not util.is_valid_regexp(_regex):
+                self.__logger.warning(_("Invalid regular expression ('%s') found. Skipped.") % _regex)
+            else:
+                self.__rules.append(_Rule(len(self.__rules), _regex))
+
+        for _rule in self.__rules:
+            if _rule.suffix is not None:
+                _byending = self.__suffixes.setdefault(len(_rule.suffix), {})
+                if _rule.suffix not in _byending:
+                    _byending[_rule.suffix] = _rule
+            elif _rule.prefix is not None:
+                self.__prefix_rules.append(_rule)
+            else:
+                self.__other_rules.add(_rule.index)
+
+    def get_patterns(self):
+        """Returns the (valid) patterns in order of definition.
+        """
+        return [_rule.pattern for _rule in self.__rules]
+
+    def __match_suffix(self, path):
+        """Returns the first literal suffix rule matching the path or None.
+        """
+        _res = None
+        _ends = [path]
+        if path.endswith("\n"):
+            # `$` matches before a trailing newline as well
+            _ends.append(path[:-1])
+        for _len, _byending in self.__suffixes.iteritems():
+            for _end in _ends:
+                _rule = _byending.get(_end[-_len:])
+                if _rule is not None and (_res is None or _rule.index < _res.index):
+                    _res = _rule
+        return _res
+
+    def __get_merged_rules(self, dirname):
+        """Returns the merged rules that are applicable to entries of the
+        directory `dirname`.
+        """
+        _merged = self.__dir_cache.get(dirname)
+        if _merged is None:
+            _dirprefix = dirname
+            if not _dirprefix.endswith(self.__pathsep):
+                _dirprefix = "%s%s" % (_dirprefix, self.__pathsep)
+            _live = set()
+            for _rule in self.__prefix_rules:
+                if _rule.prefix.startswith(_dirprefix) or \
+                   _dirprefix.startswith(_rule.prefix):
+                    _live.add(_rule.index)
+            _key = tuple(sorted(_live))
+            _merged = self.__merged_cache.get(_key)
+            if _merged is None:
+                _rules = [_rule for _rule in self.__rules
+                          if (_rule.index in _live) or (_rule.index in self.__other_rules)]
+                _merged = _MergedRules(_rules)
+                self.__merged_cache[_key] = _merged
+            if len(self.__dir_cache) >= _MAX_CACHED_DIRS:
+                self.__dir_cache.clear()
+            self.__dir_cache[dirname] = _merged
+        return _merged
+
+    def match(self, path):
+        """Returns the pattern of the first rule matching the given path or
+        None if no rule matches.
+        """
+        if len(self.__rules) == 0:
+            return None
+        _res = self.__match_suffix(path)
+        _max_index = len(self.__rules)
+        if _res is not None:
+            _max_index = _res.index
+        _dirname = path.rsplit(self.__pathsep, 1)[0]
+        _rule = self.__get_merged_rules(_dirname).search(path, _max_index)
+        if _rule is not None:
+            _res = _rule
+        if _res is None:
+            return None
+        return _res.pattern
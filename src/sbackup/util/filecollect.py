@@ -20,13 +20,27 @@
 
 from gettext import gettext as _
 import os
-import re
+import stat
 import types
+import threading
+import Queue
+import logging
+
+# scandir (available from Python 3.5 or as separate module) provides
+# the type of directory entries without additional system calls
+_scandir = getattr(os, "scandir", None)
+if _scandir is None:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
 
-from sbackup import util
 
 from sbackup.util import local_file_utils
-from sbackup.util import exceptions
+from sbackup.util import accesscheck
+from sbackup.util import dircache
+from sbackup.util import changejournal
+from sbackup.util import structs
 from sbackup.util import log
 
 
@@ -58,6 +72,9 @@ class FileCollectorStats(object):
         self.__nexcl_forced = 0L
         self.__nexcl_config = 0L
 
+        # number of system calls issued while collecting (by name)
+        self.__nsyscalls = {}
+
     def set_followlinks(self, followlinks):
         if not isinstance(followlinks, types.BooleanType):
             raise TypeError("Expected parameter of boolean type. "\
@@ -123,6 +140,12 @@ class FileCollectorStats(object):
         """
         return self.__nexcl_config
 
+    def get_count_syscalls(self):
+        """Returns the number of system calls issued while collecting
+        files as dictionary (name of call: count).
+        """
+        return dict(self.__nsyscalls)
+
     def clear(self):
         """Clears collected data.
         """
@@ -135,6 +158,26 @@ class FileCollectorStats(object):
         self.__nexcl_forced = 0L
         self.__nexcl_config = 0L
         self.__nfiles_new = 0L
+        self.__nsyscalls = {}
+
+    def add_stats(self, stats):
+        """The counters of the given `FileCollectorStats` object are added
+        to the counters of this object.
+        """
+        if not isinstance(stats, FileCollectorStats):
+            raise TypeError("Expected parameter of type 'FileCollectorStats'. "\
+                            "Got %s instead." % type(stats))
+        self.__size_in_bytes += stats.__size_in_bytes
+        self.__ndirs += stats.__ndirs
+        self.__nfiles += stats.__nfiles
+        self.__nsymlinks += stats.__nsymlinks
+        self.__nfiles_incl += stats.__nfiles_incl
+        self.__nfiles_skip += stats.__nfiles_skip
+        self.__nfiles_new += stats.__nfiles_new
+        self.__nexcl_forced += stats.__nexcl_forced
+        self.__nexcl_config += stats.__nexcl_config
+        for _name, _count in stats.__nsyscalls.iteritems():
+            self.__nsyscalls[_name] = self.__nsyscalls.get(_name, 0L) + _count
 
     def add_size(self, value):
         """The given value is added to the cumulated file size.
@@ -169,6 +212,9 @@ class FileCollectorStats(object):
     def count_excl_config(self):
         self.__nexcl_config += 1
 
+    def count_syscall(self, name):
+        self.__nsyscalls[name] = self.__nsyscalls.get(name, 0L) + 1
+
 
 class FileCollectorParentSnapshotFacade(object):
     """Class that provides simplified access to attributes of the parent
@@ -183,9 +229,13 @@ class FileCollectorParentSnapshotFacade(object):
         self.__base_backup_time = None
         self.__base_snardict = None
 
-    def set_base_snar(self, basesnar):
+    def set_base_snar(self, basesnar, memory_limit = 0):
         """Sets the snapshot file (snar) of the base (parent) snapshot.
         
+        @param memory_limit: if the snar file is larger than this size (in MiB)
+                             its content is not kept in a dictionary but in
+                             a memory-bounded `MappedHashSet`; 0 = no limit
+        
         @note: This implies that the current snapshot is incremental.
         
         """
@@ -194,7 +244,25 @@ class FileCollectorParentSnapshotFacade(object):
 #                            "Got %s instead." % type(basesnar))
         self.__base_snar = basesnar
         self.__set_base_backup_time(basesnar.get_time_of_backup())
-        self.__set_base_snardict(basesnar.get_dict_format2())
+        if self.__exceeds_memory_limit(basesnar, memory_limit):
+            self.__logger.info(_("Snapshot file of base snapshot exceeds %s MiB. "\
+                                 "Its content is not kept in memory.") % memory_limit)
+            self.__set_base_snardict(structs.MappedHashSet(basesnar.iter_paths_format2()))
+        else:
+            self.__set_base_snardict(basesnar.get_dict_format2())
+
+    def __exceeds_memory_limit(self, basesnar, memory_limit):
+        """Returns True if the size of the given snar file exceeds the
+        `memory_limit` (in MiB).
+        """
+        if memory_limit <= 0:
+            return False
+        try:
+            _size = os.path.getsize(basesnar.get_filename())
+        except OSError, error:
+            self.__logger.warning(_("Unable to get size of snapshot file: %s") % error)
+            return False
+        return _size > (memory_limit * 1024 * 1024)
 
     def __set_base_backup_time(self, backup_time):
         """Sets the time the parent backup was created. The time is
@@ -209,13 +277,16 @@ class FileCollectorParentSnapshotFacade(object):
     def __set_base_snardict(self, snardict):
         """Sets the dictonary containing the parent snapshot file (snar file).
         """
-        if not isinstance(snardict, types.DictionaryType):
+        if not isinstance(snardict, (types.DictionaryType, structs.MappedHashSet)):
             raise TypeError("Expected parameter of dictionary type. "\
                             "Got %s instead." % type(snardict))
+        if isinstance(self.__base_snardict, structs.MappedHashSet):
+            self.__base_snardict.close()
         self.__base_snardict = snardict
 
     def get_base_snardict(self):
         """Returns the dictonary containing the parent snapshot file (snar file).
+        Only membership tests (`path in snardict`) are supported in any case.
         """
         return self.__base_snardict
 
@@ -225,6 +296,166 @@ class FileCollectorParentSnapshotFacade(object):
         return self.__base_backup_time
 
 
+class _FileCollectorSink(object):
+    """Receives the results of checking paths for exclusion (i.e. paths to be
+    excluded, log messages and counters) and applies them at once to the
+    snapshot, the logger and the stats of the collector.
+    """
+
+    def __init__(self, snapshot, stats, logger):
+        self.__snapshot = snapshot
+        self.__logger = logger
+        self.stats = stats
+
+    def exclude(self, path):
+        self.__snapshot.addToExcludeFlist(path)
+
+    def add_delta_file(self, path):
+        self.__snapshot.add_delta_file(path)
+
+    def log(self, level, msg):
+        self.__logger.log(level, msg)
+
+
+# marks recorded files stored by blocks (log events start with the level)
+_DELTA_EVENT = "delta"
+
+
+class _FileCollectorRecordSink(object):
+    """Records the results of checking a sub-tree for exclusion in order to
+    apply them later. The results of sub-trees checked by other threads are
+    inserted at the position the sub-tree was encountered. This way the
+    results are applied in the same order as if the whole tree was checked
+    by a single thread.
+    """
+
+    def __init__(self, followlinks, logger):
+        self.__logger = logger
+        self.__followlinks = followlinks
+        self.__events = []
+        self.stats = FileCollectorStats(followlinks)
+
+    def exclude(self, path):
+        self.__events.append((path,))
+
+    def add_delta_file(self, path):
+        self.__events.append((_DELTA_EVENT, path))
+
+    def log(self, level, msg):
+        # records only messages that would be actually logged
+        if self.__logger.isEnabledFor(level):
+            self.__events.append((level, msg))
+
+    def create_subsink(self):
+        """Returns a new sink for a sub-tree.
+        """
+        return _FileCollectorRecordSink(self.__followlinks, self.__logger)
+
+    def add_subsink(self, sink):
+        """Inserts the results of a sub-tree (recorded by the given `sink`)
+        at the current position.
+        """
+        self.__events.append(sink)
+
+    def apply(self, sink):
+        """Applies the recorded results to the given `sink`.
+        """
+        for _event in self.__events:
+            if isinstance(_event, _FileCollectorRecordSink):
+                _event.apply(sink)
+            elif len(_event) == 1:
+                sink.exclude(_event[0])
+            elif _event[0] == _DELTA_EVENT:
+                sink.add_delta_file(_event[1])
+            else:
+                sink.log(_event[0], _event[1])
+        sink.stats.add_stats(self.stats)
+        self.__events = []
+
+
+class _FileCollectorWorkerPool(object):
+    """Bounded pool of threads checking sub-trees for exclusion. A sub-tree
+    is only handed over to the pool if there are idle threads; otherwise
+    the caller has to check it itself.
+    """
+
+    def __init__(self, nthreads, func):
+        self.__nthreads = nthreads
+        self.__func = func
+        self.__queue = Queue.Queue()
+        self.__lock = threading.Condition()
+        self.__pending = 0
+        self.__error = None
+
+        for _idx in range(nthreads):
+            _thread = threading.Thread(target = self.__work)
+            _thread.setDaemon(True)
+            _thread.start()
+
+    def __work(self):
+        while True:
+            _task = self.__queue.get()
+            if _task is None:
+                break
+            try:
+                if self.__error is None:
+                    self.__func(*_task)
+            except Exception, error:    #IGNORE:W0703
+                self.__error = error
+            self.__lock.acquire()
+            try:
+                self.__pending -= 1
+                if self.__pending == 0:
+                    self.__lock.notifyAll()
+            finally:
+                self.__lock.release()
+
+    def submit(self, *args):
+        """Submits a task to the pool (unconditionally).
+        """
+        self.__lock.acquire()
+        try:
+            self.__pending += 1
+        finally:
+            self.__lock.release()
+        self.__queue.put(args)
+
+    def try_submit(self, *args):
+        """Submits a task to the pool if there are idle threads.
+        
+        @return: True if the task was submitted, False otherwise
+        """
+        self.__lock.acquire()
+        try:
+            if self.__pending >= self.__nthreads:
+                return False
+            self.__pending += 1
+        finally:
+            self.__lock.release()
+        self.__queue.put(args)
+        return True
+
+    def join(self):
+        """Waits until all tasks are done. An error that occurred in a
+        task is raised here.
+        """
+        self.__lock.acquire()
+        try:
+            while self.__pending > 0:
+                # waiting with timeout keeps the main thread responsive to signals
+                self.__lock.wait(1.0)
+        finally:
+            self.__lock.release()
+        if self.__error is not None:
+            raise self.__error
+
+    def stop(self):
+        """Stops the threads (after the remaining tasks are done).
+        """
+        for _idx in range(self.__nthreads):
+            self.__queue.put(None)
+
+
 class FileCollector(object):
     """Responsible for the process of collecting files that are being backuped.
     The collecting process comprises of:
@@ -247,14 +478,20 @@ class FileCollector(object):
         self.__collect_stats = FileCollectorStats()
         self.__configuration = None
 
-        # stats of last processed file
-        self.__stat_func = None
-        self.__fstats = None
-        self.__fislink = None
-        self.__fisdir = None
-        # list of Regular Expressions defining exclusion rules
-        self.__excl_regex = []
-# TODO: put list of compiled regex into `Snapshot` (i.e. compile them when setting the excludes). 
+        self.__followlinks = False
+        # min. size (in bytes) of files stored by blocks (0 = disabled)
+        self.__delta_threshold = 0
+        # receives results of checking paths (see `_check_for_excludes`)
+        self.__sink = None
+        # worker threads (if paths are checked concurrently)
+        self.__pool = None
+        self.__access_checker = None
+        # cache of the entries of unchanged directories (if enabled)
+        self.__dircache = None
+        # directories changed since the base snapshot (if the journal is complete)
+        self.__changed_dirs = None
+        # matches paths against the Regular Expressions defining exclusion rules
+        self.__excl_matcher = None
 
         self.set_snapshot(snp)
         self.set_configuration(configuration)
@@ -287,7 +524,7 @@ class FileCollector(object):
 #            raise TypeError("Expected parameter of type 'SnapshotFile'. "\
 #                            "Got %s instead." % type(parent))
         self.__set_isfull(isfull = False)
-        self.__parent.set_base_snar(parent)
+        self.__parent.set_base_snar(parent, self.__configuration.get_snar_memory_limit())
 
     def get_stats(self):
         """Returns the collector stats object.
@@ -296,15 +533,11 @@ class FileCollector(object):
 
     def __prepare_collecting(self):
         """The actual process of collecting is prepared (i.e. stats are cleared etc.).
-        
-        @note: Depending on setting `Follow links` are functions for testing file existance and
-               retrieval of file stats selected here.
         """
-        if self.__snapshot.isFollowLinks():
-            self.__stat_func = os.stat
-        else:
-            self.__stat_func = os.lstat
+        self.__followlinks = self.__snapshot.isFollowLinks()
+        self.__delta_threshold = self.__configuration.get_delta_threshold() * 1024 * 1024
         self.__collect_stats.clear()
+        self.__sink = _FileCollectorSink(self.__snapshot, self.__collect_stats, self.__logger)
 
     def __set_isfull(self, isfull):
         """Sets attribute `__isfull` to the given boolean value.
@@ -323,59 +556,79 @@ class FileCollector(object):
                                  "inconsistent. Found value in snapshot: %s."\
                                  % self.__snapshot.isfull())
 
-    def __is_not_accessable(self, path):
-        """Tests whether the given `path` can be accessed (i.e. exists and is readable).
+    def __get_path_infos(self, path, sink, islink = None):
+        """Retrieves the stats of the given `path` and whether it is a directory
+        and/or a symbolic link. All infos are derived from a single stat call
+        (two calls for symbolic links that are followed).
+        
+        @param islink: whether the path is a symbolic link if known from the
+                       directory listing, None otherwise
+        
+        @return: tuple (stats, isdir, islink) or None if the path is not accessable
+        
+        @note: The stats of symbolic links are the stats of the link target if
+               `followlinks` is set, those of the link itself otherwise. Whether
+               a link that is not followed targets a directory is not checked
+               since such links are counted as files anyway.  
         """
-        # get the stats, If not possible, the file has to be exclude, return True
+        # get the stats, If not possible, the file has to be exclude, return None
         try:
-            self.__fstats = self.__stat_func(path)
-            self.__fisdir = local_file_utils.is_dir(path)
-            self.__fislink = local_file_utils.is_link(path)
+            if islink is True and self.__followlinks:
+                _fstats = None
+            else:
+                sink.stats.count_syscall("lstat")
+                _fstats = os.lstat(path)
+                islink = stat.S_ISLNK(_fstats.st_mode)
+
+            if islink:
+                _fisdir = False
+                if self.__followlinks:
+                    sink.stats.count_syscall("stat")
+                    _fstats = os.stat(path)
+                    _fisdir = stat.S_ISDIR(_fstats.st_mode)
+            else:
+                _fisdir = stat.S_ISDIR(_fstats.st_mode)
+            _fislink = islink
         except Exception, _exc:    #IGNORE:W0703
-            self.__logger.warning(_("File '%(file)s' is not accessable with error '%(error)s'.")\
+            sink.log(logging.WARNING, _("File '%(file)s' is not accessable with error '%(error)s'.")\
                                     % {'file' : path, 'error' : str(_exc)})
-            self.__fstats = None
-            self.__fisdir = None
-            self.__fislink = None
-            return True
+            return None
+        return (_fstats, _fisdir, _fislink)
 
+    def __is_not_readable(self, path, infos, sink):
+        """Tests whether the given `path` can be read (see `accesscheck`).
+        """
         # refuse a file if we don't have read access
-        # The open() statement may hang indefinitely (LP Bug 184713)
-        # taken from: http://docs.python.org/library/signal.html#example
-        _res = False
-        try:
-            util.set_timeout_alarm(timeout = 5)
-            fdscr = os.open(path, os.R_OK)
-            os.close(fdscr)
-        except exceptions.TimeoutError, _exc:
-            self.__logger.warning(_("File '%(file)s' cannot be opened for read access. Operation timed out.")\
+        _fstats, _fisdir, _fislink = infos
+        _islink = (_fislink and self.__followlinks)
+        if self.__access_checker.is_opened(path, _fstats, _islink):
+            sink.stats.count_syscall("open")
+        else:
+            sink.stats.count_syscall("access")
+        _res, _error = self.__access_checker.check(path, _fstats, _islink)
+        if _res == accesscheck.READABLE:
+            return False
+
+        if _res == accesscheck.TIMED_OUT:
+            sink.log(logging.WARNING, _("File '%(file)s' cannot be opened for read access. Operation timed out.")\
                                     % {'file' : path})
-            _res = True
-        except Exception, _exc:    #IGNORE:W0703
-            self.__logger.warning(_("File '%(file)s' cannot be opened for read access with error '%(error)s'.")\
-                                    % {'file': path, 'error' : str(_exc)})
-            _res = True
-
-        util.set_timeout_alarm(timeout = 0)
-            # when file does not exist, the `open` fails and variable `fdscr` is not defined here
-#            try:
-#                os.close(fdscr)
-#            except OSError:
-#                pass    
-        return _res
+        else:
+            sink.log(logging.WARNING, _("File '%(file)s' cannot be opened for read access with error '%(error)s'.")\
+                                    % {'file': path, 'error' : str(_error)})
+        return True
 
-    def __is_circular_symlink(self, path):
-        if self.__fislink:
+    def __is_circular_symlink(self, path, infos, sink):
+        if infos[2]:
             if self.__snapshot.isFollowLinks():
                 ln_target = local_file_utils.get_link_abs(path)
                 if path.startswith(ln_target):
-                    self.__logger.info(_("Symbolic link '%(path)s' -> '%(ln_target)s' is a circular symlink.")\
+                    sink.log(logging.INFO, _("Symbolic link '%(path)s' -> '%(ln_target)s' is a circular symlink.")\
                                 % {'path' : path, 'ln_target' : ln_target})
                     return True
         #test passed
         return False
 
-    def _is_excluded_by_name(self, path):
+    def _is_excluded_by_name(self, path, sink):
         """Decides whether or not a path has to be excluded by
         its name using the lists of defined
         * snapshot destination
@@ -385,26 +638,25 @@ class FileCollector(object):
         @return: True if the file has to be excluded, false if not
         """
         if path == self.__configuration.get_target_dir():
-            self.__logger.info(_("File '%(file)s' is backup's target directory.") % {'file' : path})
+            sink.log(logging.INFO, _("File '%(file)s' is backup's target directory.") % {'file' : path})
             return True
         
         # if the file is in exclude list, return true
         if self.__snapshot.is_path_in_excl_filelist(path):
-            self.__logger.info(_("Path '%(file)s' defined in excludes list.") % {'file' : path})
+            sink.log(logging.INFO, _("Path '%(file)s' defined in excludes list.") % {'file' : path})
             return True
 
         # if the file matches an exclude regexp, return true
 # TODO: Regex are applied to the full path. Add a choice to apply Regex only to files, directories etc.
-        for _regex in self.__excl_regex:
-            _regex_res = _regex.search(path)
-            if _regex_res is not None:
-                self.__logger.info(_("File '%(file)s' matches regular expression '%(regex)s'.")\
-                                    % {'file' : path, 'regex' : str(_regex.pattern)})
-                return True
+        _pattern = self.__excl_matcher.match(path)
+        if _pattern is not None:
+            sink.log(logging.INFO, _("File '%(file)s' matches regular expression '%(regex)s'.")\
+                                % {'file' : path, 'regex' : str(_pattern)})
+            return True
         #all tests passed
         return False
 
-    def _is_excluded_by_size(self, path):
+    def _is_excluded_by_size(self, path, infos, sink):
         """Decides whether or not a file is to be excluded by the configuration.
         It is not decided for the incremental exclusion.
 
@@ -415,33 +667,42 @@ class FileCollector(object):
         """
         #if the file is too big
         if self.__configuration.is_maxsize_enable():
-            if self.__fstats.st_size > self.__configuration.get_maxsize_limit():
-                self.__logger.info(_("File '%(file)s' exceeds maximum file size ( %(filesize)s > %(maxsize)s).")\
-                                    % {'file' : path, 'filesize' : str(self.__fstats.st_size),
+            _fstats = infos[0]
+            if _fstats.st_size > self.__configuration.get_maxsize_limit():
+                sink.log(logging.INFO, _("File '%(file)s' exceeds maximum file size ( %(filesize)s > %(maxsize)s).")\
+                                    % {'file' : path, 'filesize' : str(_fstats.st_size),
                                        'maxsize' : str(self.__configuration.get_maxsize_limit())})
                 return True
         #all tests passed
         return False
 
-    def _is_excluded_by_force(self, path):
+    def _is_excluded_by_force(self, path, infos, sink):
         """Private interface method which checks for forced exclusion of given `path` by
         calling the according test methods in turn. If this method returns True, the
         path *must* be excluded irrespectively it is explicitely included etc.
 
+        @param infos: the infos as returned by `__get_path_infos`
+
         @return: True if the file has to be excluded, false if not
         """
-        if self.__is_not_accessable(path) is True:
+        if infos is None:
+            return True
+        elif self.__is_not_readable(path, infos, sink) is True:
             return True
-        elif self.__is_circular_symlink(path) is True:
+        elif self.__is_circular_symlink(path, infos, sink) is True:
             return True
         return False
 
-    def _check_for_excludes(self, path): #, force_exclusion=False):
+    def _check_for_excludes(self, path, sink, islink = None, record = None): #, force_exclusion=False):
         """Checks given `path` for exclusion and adds it to the `ExcludeFlist` if
         required. Sub-directories are only entered in the case the `path` is not
         excluded.
         
         @param path: The path being checked for exclusion
+        @param sink: receives the paths to exclude, log messages and counters
+        @param islink: whether the path is a symbolic link if known, None otherwise
+        @param record: the record of the parent directory the result is added
+                       to (see `dircache`) or None
         
         @note: Links are always backuped; TAR follows links (i.e. dereferences them = stores the actual
                content) only if option `followlinks` is set. A link targeting a directory yields
@@ -449,110 +710,288 @@ class FileCollector(object):
         """
         _excluded = False
         _stop_checking = False
-
-        if self._is_excluded_by_name(path):
-            if not self.__snapshot.is_subpath_in_incl_filelist(path):
-                # add to exclude list, if not explicitly included; since paths can be nested,
-                # it is checked for sub-paths instead of full paths
-                self.__snapshot.addToExcludeFlist(path)
-                self.__collect_stats.count_excl_config()
-                _excluded = True
-            
-        elif self._is_excluded_by_force(path):
-            # force exclusion e.g. path is defined in includes list but does not exist/is not accessable
-            self.__snapshot.addToExcludeFlist(path)
-            self.__collect_stats.count_excl_forced()
+        _infos = None
+
+        if self._is_excluded_by_name(path, sink) and \
+           not self.__snapshot.is_subpath_in_incl_filelist(path):
+            # add to exclude list, if not explicitly included; since paths can be nested,
+            # it is checked for sub-paths instead of full paths
+            sink.exclude(path)
+            sink.stats.count_excl_config()
             _excluded = True
+            if record is not None:
+                record.add(os.path.basename(path), dircache.EXCLUDED)
 
-        elif self._is_excluded_by_size(path):
-            if not self.__snapshot.is_subpath_in_incl_filelist(path):
-                # add to exclude list, if not explicitly included; since paths can be nested,
-                # it is checked for sub-paths instead of full paths
-                self.__snapshot.addToExcludeFlist(path)
-                self.__collect_stats.count_excl_config()
+        else:
+            _infos = self.__get_path_infos(path, sink, islink)
+            if self._is_excluded_by_force(path, _infos, sink):
+                # force exclusion e.g. path is defined in includes list but does not exist/is not accessable
+                sink.exclude(path)
+                sink.stats.count_excl_forced()
                 _excluded = True
+                if record is not None:
+                    # the file might become readable without modifying the directory
+                    record.set_uncacheable()
+
+            elif self._is_excluded_by_size(path, _infos, sink):
+                if not self.__snapshot.is_subpath_in_incl_filelist(path):
+                    # add to exclude list, if not explicitly included; since paths can be nested,
+                    # it is checked for sub-paths instead of full paths
+                    sink.exclude(path)
+                    sink.stats.count_excl_config()
+                    _excluded = True
+                    if record is not None:
+                        if _infos[1]:
+                            record.set_uncacheable()
+                        else:
+                            # the size is checked again when the cached entry is used
+                            record.add(os.path.basename(path), self.__get_file_kind(_infos[0]),
+                                       _infos[2], dircache.get_file_stats(_infos[0]))
 
         if not _excluded:
-            # path was not excluded, so do further tests (stats, enter dir...)            
-            if self.__fislink:
-                self.__logger.debug("Symbolic link found: '%(path)s' -> '%(ln_target)s'."\
+            # path was not excluded, so do further tests (stats, enter dir...)
+            _fstats, _fisdir, _fislink = _infos
+            if _fislink:
+                sink.log(logging.DEBUG, "Symbolic link found: '%(path)s' -> '%(ln_target)s'."\
                                 % {'path' : path, 'ln_target' : local_file_utils.get_link(path)})
-                self.__collect_stats.count_symlink()
+                sink.stats.count_symlink()
                 if not self.__snapshot.isFollowLinks():
                     # if `followlinks` is *disabled*, just count the link and finish
                     _stop_checking = True
 
-            if self.__fisdir:
+            if _fisdir:
                 if _stop_checking:    # i.e. `followlinks` is not enabled
-                    self.__collect_stats.count_file()
-                    self.__cumulate_size(path)
+                    sink.stats.count_file()
+                    self.__cumulate_size(path, _fstats, sink)
+                    if record is not None:
+                        record.add(os.path.basename(path), dircache.FILE, True,
+                                   dircache.get_file_stats(_fstats))
                 else:
+                    if record is not None:
+                        record.add(os.path.basename(path), dircache.DIRECTORY, _fislink)
                     # if it's a directory, enter inside
                     try:
-                        for _dir_item in local_file_utils.listdir(path) :
-                            _dir_item = local_file_utils.joinpath(path, _dir_item)
-                            self._check_for_excludes(path = _dir_item)
-                        self.__collect_stats.count_dir()    # the directory `path`
+                        self.__check_directory(path, _fstats, sink)
+                        sink.stats.count_dir()    # the directory `path`
                     except OSError, _exc:
-                        self.__logger.warning(_("Error while checking directory '%(dir)s': %(error)s.")\
+                        sink.log(logging.WARNING, _("Error while checking directory '%(dir)s': %(error)s.")\
                                               % {'dir' : path, 'error' : str(_exc)})
-                        self.__snapshot.addToExcludeFlist(path)    # problems with `path` -> exclude it
-                        self.__collect_stats.count_excl_forced()
+                        sink.exclude(path)    # problems with `path` -> exclude it
+                        sink.stats.count_excl_forced()
             else:
                 # it's a file (may also a link target in case of enabled `followlinks` option)
-                self.__collect_stats.count_file()
-                self.__cumulate_size(path)
+                sink.stats.count_file()
+                self.__cumulate_size(path, _fstats, sink)
+                if record is not None:
+                    record.add(os.path.basename(path), self.__get_file_kind(_fstats), _fislink,
+                               dircache.get_file_stats(_fstats))
+
+    def __check_directory(self, path, fstats, sink):
+        """Checks the entries of the given directory. For incremental
+        snapshots the entries of directories not modified since the base
+        snapshot are taken from the directory cache (if enabled). If the
+        change journal is complete, directories not recorded in the journal
+        are considered as not modified.
+        
+        @raise OSError: if the directory cannot be listed
+        """
+        _record = None
+        if self.__dircache is not None:
+            if self.__changed_dirs is not None:
+                if path not in self.__changed_dirs:
+                    _record = self.__dircache.get_unchanged_record(path)
+            elif not self.__isfull:
+                _record = self.__dircache.get_record(path, fstats,
+                                                     self.__parent.get_base_backup_time())
+            if _record is not None:
+                self.__apply_record(path, _record, sink)
+                return
+            _record = self.__dircache.add_record(path, fstats)
+        try:
+            for _dir_item, _islink in self.__list_dir(path, sink):
+                self.__check_subtree(_dir_item, sink, _islink, _record)
+        except OSError:
+            if _record is not None:
+                _record.set_uncacheable()
+            raise
+
+    def __apply_record(self, path, record, sink):
+        """Applies the cached entries of an unchanged directory. Files are
+        checked again since they can be modified, exceed the max. size or
+        become unreadable without modifying the directory; only the listing
+        of the directory and the matching of names are saved. If the change
+        journal states the directory was not modified, its files were not
+        modified either and are counted using the cached stats. Sub-directories
+        are checked unless the change journal states they were not modified.
+        """
+        for _idx, (_name, _kind, _islink, _stats) in enumerate(record.entries):
+            _path = local_file_utils.joinpath(path, _name)
+            if _kind == dircache.DIRECTORY:
+                _subrecord = None
+                if self.__changed_dirs is not None and not _islink\
+                   and _path not in self.__changed_dirs:
+                    _subrecord = self.__dircache.get_unchanged_record(_path)
+                if _subrecord is None:
+                    self.__check_subtree(_path, sink, _islink)
+                else:
+                    self.__apply_record(_path, _subrecord, sink)
+                    sink.stats.count_dir()
+            elif _kind == dircache.EXCLUDED:
+                sink.exclude(_path)
+                sink.stats.count_excl_config()
+            elif self.__changed_dirs is not None:
+                self.__check_unchanged_file(_path, sink, (_stats, False, _islink))
+            else:
+                _fstats = self.__check_cached_file(_path, sink, _islink, record)
+                if _fstats is not None:
+                    record.set_stats(_idx, dircache.get_file_stats(_fstats))
+
+    def __check_cached_file(self, path, sink, islink, record):
+        """Checks a file taken from the directory cache like `_check_for_excludes`
+        except for its name. A file that became excluded makes the `record`
+        uncacheable, hence the directory is listed again next time.
+        
+        @return: the stats of the file if it is still a cacheable file, None otherwise
+        """
+        _infos = self.__get_path_infos(path, sink, islink)
+        if _infos is not None and _infos[1]:
+            # the target of a followed link was replaced by a directory
+            record.set_uncacheable()
+            self._check_for_excludes(path, sink, islink)
+        elif self._is_excluded_by_force(path, _infos, sink):
+            sink.exclude(path)
+            sink.stats.count_excl_forced()
+            record.set_uncacheable()
+        elif self._is_excluded_by_size(path, _infos, sink):
+            if not self.__snapshot.is_subpath_in_incl_filelist(path):
+                sink.exclude(path)
+                sink.stats.count_excl_config()
+            else:
+                self.__count_file(path, _infos, sink)
+            return _infos[0]
+        else:
+            self.__count_file(path, _infos, sink)
+            return _infos[0]
+        return None
+
+    def __check_unchanged_file(self, path, sink, infos):
+        """Checks a file of a directory the change journal states was not
+        modified using the stats stored in the directory cache. Since the
+        journal records modifications of the content and the attributes of
+        files, neither the stats nor the read access are retrieved again.
+        """
+        if self._is_excluded_by_size(path, infos, sink) and \
+           not self.__snapshot.is_subpath_in_incl_filelist(path):
+            sink.exclude(path)
+            sink.stats.count_excl_config()
+        else:
+            self.__count_file(path, infos, sink)
 
-    def __cumulate_size(self, path):
+    def __count_file(self, path, infos, sink):
+        """Counts the given file (resp. symbolic link not followed) and
+        cumulates its size.
+        """
+        _fstats, _fisdir, _fislink = infos
+        if _fislink:
+            sink.stats.count_symlink()
+        sink.stats.count_file()
+        self.__cumulate_size(path, _fstats, sink)
+
+    def __list_dir(self, path, sink):
+        """Lists the directory `path`. If available, `scandir` is used in
+        order to retrieve the type of entries along with their names.
+        
+        @return: list of tuples (full path of entry, flag whether the entry is
+                 a symbolic link or None if unknown)
+        @raise OSError: if the directory cannot be listed
+        """
+        if _scandir is None:
+            sink.stats.count_syscall("listdir")
+            _res = []
+            for _entry in local_file_utils.listdir(path):
+                _res.append((local_file_utils.joinpath(path, _entry), None))
+        else:
+            sink.stats.count_syscall("scandir")
+            _res = []
+            for _entry in _scandir(path):
+                try:
+                    _islink = _entry.is_symlink()
+                except OSError:
+                    _islink = None
+                _res.append((local_file_utils.joinpath(path, _entry.name), _islink))
+        return _res
+
+    def __check_subtree(self, path, sink, islink = None, record = None):
+        """Checks the sub-tree given by `path` for exclusion. The sub-tree is
+        handed over to an idle worker thread if available; otherwise it is
+        checked within the current thread.
+        """
+        if self.__pool is not None:
+            if record is not None:
+                # keeps the order of entries independent of the threads
+                record = record.reserve()
+            _subsink = sink.create_subsink()
+            if self.__pool.try_submit(path, _subsink, islink, record):
+                sink.add_subsink(_subsink)
+                return
+        self._check_for_excludes(path, sink, islink, record)
+
+    def __is_delta_file(self, fstats):
+        """Returns True if the file is stored by blocks instead of TAR (see
+        module `delta`).
+        """
+        return self.__delta_threshold > 0 and fstats.st_size >= self.__delta_threshold\
+               and stat.S_ISREG(fstats.st_mode)
+
+    def __get_file_kind(self, fstats):
+        """Returns the kind of the directory cache entry of a file.
+        """
+        if self.__is_delta_file(fstats):
+            return dircache.DELTA_FILE
+        return dircache.FILE
+
+    def __cumulate_size(self, path, fstats, sink):
         """
         
         Files not contained in SNAR file are backuped in any case!
         (e.g. a directory was added to the includes)
+        
+        Large files stored by blocks are not contained in the SNAR file; they
+        are counted as included if modified since the base backup.
         """
-#        self.__logger.debug("%s" % path)
         _incl_file = False
-        if self.__isfull:        # full snapshots do not have a base snar file
+        if self.__is_delta_file(fstats):
+            sink.add_delta_file(path)
+            _incl_file = self.__isfull or \
+                         max(fstats.st_mtime, fstats.st_ctime) > self.__parent.get_base_backup_time()
+        elif self.__isfull:        # full snapshots do not have a base snar file
             _incl_file = True
         else:
             # we don't look at the access time since this was even modified during the last backup 
-            ftime = max(self.__fstats.st_mtime,
-                        self.__fstats.st_ctime)
+            ftime = max(fstats.st_mtime, fstats.st_ctime)
             if path in self.__parent.get_base_snardict():
-#                self.__logger.debug("%s: is in snapshot file." % path)
                 if ftime > self.__parent.get_base_backup_time():
-                    self.__logger.debug("Delta=%s - %s: %s > %s" % ((ftime - self.__parent.get_base_backup_time()),
+                    sink.log(logging.DEBUG, "Delta=%s - %s: %s > %s" % ((ftime - self.__parent.get_base_backup_time()),
                                                                      path, ftime,
                                                                      self.__parent.get_base_backup_time()))
                     _incl_file = True
 
             else:
-                self.__logger.debug("%s: No yet included - included." % path)
-                self.__collect_stats.count_new_file()
+                sink.log(logging.DEBUG, "%s: No yet included - included." % path)
+                sink.stats.count_new_file()
                 _incl_file = True
 
         if _incl_file:
-            self.__collect_stats.count_incl_file()
-            self.__collect_stats.add_size(self.__fstats.st_size)
+            sink.stats.count_incl_file()
+            sink.stats.add_size(fstats.st_size)
         else:
-            self.__collect_stats.count_skip_file()
+            sink.stats.count_skip_file()
 
-    def __compile_excl_regex(self):
-        """Prepares (i.e. compiles) Regular Expressions used for excluding files from flist.
+    def __prepare_excl_regex(self):
+        """Prepares the Regular Expressions used for excluding files from flist.
         """
         self.__logger.debug("Prepare Regular Expressions used for file exclusion.")
-        _rexclude = []
-        _snp_excl = self.__snapshot.getExcludes()
-        if _snp_excl:
-            for _regex in _snp_excl:
-                if util.is_empty_regexp(_regex):
-                    self.__logger.warning(_("Empty regular expression found. Skipped."))
-                else:
-                    if util.is_valid_regexp(_regex):
-                        _regex_c = re.compile(_regex)
-                        _rexclude.append(_regex_c)
-                    else:
-                        self.__logger.warning(_("Invalid regular expression ('%s') found. Skipped.") % _regex)
-        self.__excl_regex = _rexclude
+        self.__excl_matcher = self.__snapshot.get_excludes_matcher()
 
     def __prepare_explicit_flists(self):
         """Paths (i.e. directories and files) defined in the configuration are added
@@ -604,17 +1043,100 @@ class FileCollector(object):
         the backup.
         """
         self.__prepare_collecting()
-        self.__compile_excl_regex()
+        self.__prepare_excl_regex()
         self.__prepare_explicit_flists()
-        util.enable_timeout_alarm()
 
         # We have now every thing we need , the rexclude, excludelist, includelist and already stored 
         self.__logger.debug("Creation of the complete exclude list.")
 
-        # walk recursively into paths defined as includes (therefore don't call nested paths)
-        for _incl in self.__snapshot.get_eff_incl_filelst_not_nested():
-            _incl = local_file_utils.normpath(_incl)
-            self._check_for_excludes(_incl)
+        self.__prepare_dircache()
+        self.__access_checker = accesscheck.ReadAccessChecker()
+        try:
+            _nthreads = self.__configuration.get_collector_threads()
+            if _nthreads > 1:
+                self.__collect_files_concurrently(_nthreads)
+            else:
+                # walk recursively into paths defined as includes (therefore don't call nested paths)
+                for _incl in self.__snapshot.get_eff_incl_filelst_not_nested():
+                    _incl = local_file_utils.normpath(_incl)
+                    self._check_for_excludes(_incl, self.__sink)
+        finally:
+            self.__access_checker.close()
+            self.__access_checker = None
+
+        if self.__dircache is not None:
+            try:
+                self.__dircache.save()
+            except (IOError, OSError), error:
+                self.__logger.warning(_("Unable to write directory cache `%(file)s`: %(error)s")\
+                                      % { 'file' : self.__dircache, 'error' : error })
+            self.__dircache = None
+            self.__changed_dirs = None
+
+    def __prepare_dircache(self):
+        """Reads the directory cache if enabled. The cache is only valid for
+        the current settings affecting the exclusion of files.
+        """
+        self.__dircache = None
+        _cachefile = self.__configuration.get_collector_cache_file()
+        if _cachefile is None:
+            return
+        _config = self.__configuration
+        _fingerprint = dircache.get_fingerprint(sorted(_config.get_dirconfig_local() or []),
+                                                self.__snapshot.getExcludes(),
+                                                _config.is_maxsize_enable(),
+                                                _config.get_maxsize_limit(),
+                                                _config.get_target_dir(),
+                                                self.__followlinks,
+                                                self.__delta_threshold)
+        self.__dircache = dircache.DirectoryCache(_cachefile, _fingerprint)
+        self.__dircache.load()
+        self.__prepare_changed_dirs()
+
+    def __prepare_changed_dirs(self):
+        """Reads the directories changed since the base snapshot from the
+        change journal (if enabled). The journal must be complete since the
+        cached records were collected too.
+        """
+        self.__changed_dirs = None
+        _journal = self.__configuration.get_change_journal_file()
+        if _journal is None or self.__isfull:
+            return
+        if self.__followlinks:
+            self.__logger.info(_("Change journal is not used since symbolic links are followed."))
+            return
+        _since = self.__dircache.get_time_of_records()
+        if _since is None:
+            return
+        _since = min(_since, self.__parent.get_base_backup_time())
+        self.__changed_dirs = changejournal.ChangeJournal(_journal).get_changed_dirs(_since)
+        if self.__changed_dirs is not None:
+            self.__logger.info(_("Change journal: %s directories changed since base snapshot.")\
+                               % len(self.__changed_dirs))
+
+    def __collect_files_concurrently(self, nthreads):
+        """Checks the includes for exclusion using the given number of threads.
+        The results of the sub-trees are recorded and afterwards applied in
+        the order of a single-threaded walk, therefore the resulting lists and
+        stats are the same.
+        """
+        self.__logger.debug("Checking files using %s threads." % nthreads)
+        _followlinks = self.__snapshot.isFollowLinks()
+        _sinks = []
+        self.__pool = _FileCollectorWorkerPool(nthreads, self._check_for_excludes)
+        try:
+            for _incl in self.__snapshot.get_eff_incl_filelst_not_nested():
+                _incl = local_file_utils.normpath(_incl)
+                _sink = _FileCollectorRecordSink(_followlinks, self.__logger)
+                _sinks.append(_sink)
+                self.__pool.submit(_incl, _sink)
+            self.__pool.join()
+        finally:
+            self.__pool.stop()
+            self.__pool = None
+
+        for _sink in _sinks:
+            _sink.apply(self.__sink)
 
 
 class FileCollectorConfigFacade(object):
@@ -629,6 +1151,12 @@ class FileCollectorConfigFacade(object):
         self.__maxsize_enabled = False
         self.__maxsize = 0
 
+        self.__nthreads = 1
+        self.__snar_memory_limit = 0
+        self.__delta_threshold = 0
+        self.__cachefile = None
+        self.__journal = None
+
         self.__dirconfig = None
         self.__dirconfig_set = False
 
@@ -644,6 +1172,11 @@ class FileCollectorConfigFacade(object):
         self.__configuration = configuration
         self.__set_maxsize_limit_from_config()
         self.__set_dirconfig_from_config()
+        self.__set_collector_threads_from_config()
+        self.__set_snar_memory_limit_from_config()
+        self.__set_delta_threshold_from_config()
+        self.__set_cachefile_from_config()
+        self.__set_journal_from_config()
 
     def __set_maxsize_limit_from_config(self):
         if self.__configuration is None:
@@ -660,6 +1193,31 @@ class FileCollectorConfigFacade(object):
         else:
             self.__dirconfig_set = True
 
+    def __set_collector_threads_from_config(self):
+        if self.__configuration is None:
+            raise ValueError("No configuration set.")
+        self.__nthreads = self.__configuration.get_collector_threads()
+
+    def __set_snar_memory_limit_from_config(self):
+        if self.__configuration is None:
+            raise ValueError("No configuration set.")
+        self.__snar_memory_limit = self.__configuration.get_snar_memory_limit()
+
+    def __set_delta_threshold_from_config(self):
+        if self.__configuration is None:
+            raise ValueError("No configuration set.")
+        self.__delta_threshold = self.__configuration.get_delta_threshold()
+
+    def __set_cachefile_from_config(self):
+        if self.__configuration is None:
+            raise ValueError("No configuration set.")
+        self.__cachefile = self.__configuration.get_collector_cache_file()
+
+    def __set_journal_from_config(self):
+        if self.__configuration is None:
+            raise ValueError("No configuration set.")
+        self.__journal = self.__configuration.get_change_journal_file()
+
     def is_maxsize_enable(self):
         return self.__maxsize_enabled
 
@@ -669,6 +1227,35 @@ class FileCollectorConfigFacade(object):
     def get_target_dir(self):
         return self.__eff_local_targetdir
 
+    def get_collector_threads(self):
+        """Returns the number of threads used for collecting files.
+        """
+        return self.__nthreads
+
+    def get_snar_memory_limit(self):
+        """Returns the max. size (in MiB) of the base snar file whose content
+        is kept in memory (0 = no limit).
+        """
+        return self.__snar_memory_limit
+
+    def get_delta_threshold(self):
+        """Returns the min. size (in MiB) of files stored by blocks
+        (0 = disabled).
+        """
+        return self.__delta_threshold
+
+    def get_collector_cache_file(self):
+        """Returns the file the directory cache is stored in (None if
+        the cache is disabled).
+        """
+        return self.__cachefile
+
+    def get_change_journal_file(self):
+        """Returns the journal of changed directories (None if the journal
+        is disabled).
+        """
+        return self.__journal
+
     def get_dirconfig_local(self):
         """Returns the directory configuration stored in a list of pairs (name, value).
         
@@ -0,0 +1,171 @@
+#   Simple Backup - minimal binding of the Linux inotify API
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+
+"""
+:mod:`sbackup.util.inotify` -- binding of the Linux inotify API
+================================================================
+
+.. module:: inotify
+   :synopsis: Minimal binding of the Linux inotify API using ctypes
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+Only the functions required for watching directories (see module
+`sbackup.journal_service`) are provided; no further packages are needed.
+
+"""
+
+from gettext import gettext as _
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+
+from sbackup.util.exceptions import SBException
+
+
+# events (see inotify(7))
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_OPEN = 0x00000020
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0x80000
+
+_EVENT_HEADER = "iIII"
+_EVENT_HEADER_SIZE = struct.calcsize(_EVENT_HEADER)
+_READ_SIZE = 64 * 1024
+
+
+_libc = None
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno = True)
+        if not hasattr(_libc, "inotify_init1"):
+            raise SBException(_("The inotify API is not available on this system."))
+    return _libc
+
+
+class Event(object):
+    """A single event read from the inotify instance.
+    """
+    __slots__ = ("wd", "mask", "cookie", "name")
+
+    def __init__(self, wd, mask, cookie, name):
+        self.wd = wd
+        self.mask = mask
+        self.cookie = cookie
+        self.name = name
+
+    def __repr__(self):
+        return "Event(wd=%s, mask=%#x, cookie=%s, name=%r)" % (self.wd, self.mask,
+                                                                self.cookie, self.name)
+
+
+class Inotify(object):
+    """An inotify instance. Watches are identified by the watch descriptors
+    returned by `add_watch`.
+    """
+
+    def __init__(self):
+        self.__libc = _get_libc()
+        self.__fd = self.__libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.__fd < 0:
+            self.__raise_error(_("Unable to initialize inotify"))
+
+    def __raise_error(self, msg):
+        _errno = ctypes.get_errno()
+        raise OSError(_errno, "%s: %s" % (msg, os.strerror(_errno)))
+
+    def fileno(self):
+        return self.__fd
+
+    def add_watch(self, path, mask):
+        """Adds a watch for `path` (or modifies the existing one).
+
+        @return: the watch descriptor
+        @raise OSError: if the watch cannot be added (ENOSPC if the max.
+                        number of watches is reached)
+        """
+        _wd = self.__libc.inotify_add_watch(self.__fd, path, ctypes.c_uint32(mask))
+        if _wd < 0:
+            self.__raise_error(_("Unable to watch `%s`") % path)
+        return _wd
+
+    def rm_watch(self, wd):
+        """Removes the given watch. Watches that were already removed by
+        the kernel are ignored.
+        """
+        if self.__libc.inotify_rm_watch(self.__fd, wd) < 0:
+            if ctypes.get_errno() != errno.EINVAL:
+                self.__raise_error(_("Unable to remove watch"))
+
+    def read_events(self, timeout = None):
+        """Returns the available events. Waits max. `timeout` seconds
+        (infinitely if None) for events; an empty list is returned if no
+        events are available within this time.
+        """
+        try:
+            _ready = select.select([self.__fd], [], [], timeout)[0]
+        except select.error, error:
+            if error.args[0] == errno.EINTR:
+                return []
+            raise
+        if not _ready:
+            return []
+        try:
+            _data = os.read(self.__fd, _READ_SIZE)
+        except OSError, error:
+            if error.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+        _events = []
+        _pos = 0
+        while _pos < len(_data):
+            _wd, _mask, _cookie, _len = struct.unpack_from(_EVENT_HEADER, _data, _pos)
+            _pos += _EVENT_HEADER_SIZE
+            _name = _data[_pos:_pos + _len].rstrip("\0")
+            _pos += _len
+            _events.append(Event(_wd, _mask, _cookie, _name))
+        return _events
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
@@ -182,6 +182,22 @@ class IOperations(object):
     def is_dir(cls, path):
         raise NotImplementedError(_get_notimplemented_msg("IOperations", "is_dir"))
 
+    @classmethod
+    def get_mtime(cls, path):
+        raise NotImplementedError(_get_notimplemented_msg("IOperations", "get_mtime"))
+
+    @classmethod
+    def get_size(cls, path):
+        raise NotImplementedError(_get_notimplemented_msg("IOperations", "get_size"))
+
     @classmethod
     def close_stream(cls, file_desc):
         raise NotImplementedError(_get_notimplemented_msg("IOperations", "close_stream"))
+
+    @classmethod
+    def begin_info_cache(cls):
+        raise NotImplementedError(_get_notimplemented_msg("IOperations", "begin_info_cache"))
+
+    @classmethod
+    def end_info_cache(cls):
+        raise NotImplementedError(_get_notimplemented_msg("IOperations", "end_info_cache"))
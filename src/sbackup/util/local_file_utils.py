@@ -60,6 +60,8 @@ chmod = os.chmod
 get_dirname = os.path.dirname
 get_basename = os.path.basename
 is_mount = os.path.ismount
+get_mtime = os.path.getmtime
+get_size = os.path.getsize
 
 # TDOD: Evaluate alternate implementations:
 #def path_exists(path):
@@ -0,0 +1,269 @@
+#   Simple Backup - progress of the creation of archives
+#
+#   Copyright (c)2010: Jean-Peer Lorenz <peer.loz@gmx.net>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 2 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+"""
+:mod:`progress` --- progress of the creation of archives
+========================================================
+
+.. module:: progress
+   :synopsis: computes and publishes the progress of TAR processes
+.. moduleauthor:: Jean-Peer Lorenz <peer.loz@gmx.net>
+
+TAR reports its progress using checkpoints echoed to stderr (see option
+`--checkpoint-action=echo`) which are read by a `CheckpointReader` within
+the backup process. The `ProgressEngine` computes percentage, throughput and
+remaining time from the number of processed bytes and publishes them in
+limited intervals. The published `ProgressInfo` is passed as string over
+D-Bus (see `ProgressInfo.serialize`). Since the backups of several profiles
+may run concurrently (see module `scheduler`), the progress names its
+profile; `ProfilesProgress` keeps the latest progress of each profile.
+
+"""
+
+from gettext import gettext as _
+import re
+import threading
+import time
+
+from sbackup.util import constants
+from sbackup.util import log
+
+
+# number of records (see `constants.TAR_RECORDSIZE`) between checkpoints
+CHECKPOINT_RECORDS = 100
+
+# min. interval (seconds) between publishing the progress
+PUBLISH_INTERVAL = 2.0
+
+# weight of the most recent throughput when smoothing
+_RATE_SMOOTHING = 0.3
+
+# seconds after which the progress of a profile is dropped if not updated
+PROFILE_EXPIRY = 10 * PUBLISH_INTERVAL
+
+CHECKPOINT_MARKER = "SBACKUP-CHECKPOINT "
+_CHECKPOINT_RE = re.compile(r"%s(\d+)\s*$" % CHECKPOINT_MARKER)
+
+_SERIALIZE_PREFIX = "progress"
+_SERIALIZE_SEP = ":"
+
+UNKNOWN = -1
+
+
+def get_checkpoint_opts():
+    """Returns the TAR options for echoing checkpoints.
+    """
+    return ["--checkpoint=%s" % CHECKPOINT_RECORDS,
+            "--checkpoint-action=echo=%s%%u" % CHECKPOINT_MARKER]
+
+
+class ProgressInfo(object):
+    """The progress at a time. Unknown values are set to `UNKNOWN`.
+    """
+
+    def __init__(self, done, total = UNKNOWN, rate = UNKNOWN, remaining = UNKNOWN,
+                 profile = None):
+        """
+        @param done: number of processed bytes
+        @param total: number of bytes expected in total
+        @param rate: throughput in bytes per second
+        @param remaining: estimated remaining time in seconds
+        @param profile: name of the profile being backed up or None
+        """
+        self.done = done
+        self.total = total
+        self.rate = rate
+        self.remaining = remaining
+        self.profile = profile
+
+    def __str__(self):
+        return self.serialize()
+
+    def get_percent(self):
+        """Returns the processed percentage (at most 100.0) or `UNKNOWN`.
+        """
+        if self.total <= 0:
+            return UNKNOWN
+        return min(100.0, (self.done * 100.0) / self.total)
+
+    def serialize(self):
+        """Returns the progress as string. The profile (if any) is the last
+        field, hence it may contain the separator.
+        """
+        _parts = [_SERIALIZE_PREFIX, str(int(self.done)), str(int(self.total)),
+                  str(int(self.rate)), str(int(self.remaining))]
+        if self.profile is not None:
+            _parts.append(self.profile)
+        return _SERIALIZE_SEP.join(_parts)
+
+    @classmethod
+    def deserialize(cls, value):
+        """Returns the progress given as string (see `serialize`). A plain
+        number is treated as TAR checkpoint (legacy format).
+
+        @raise ValueError: if the string is invalid
+        """
+        if not isinstance(value, unicode):
+            value = str(value)
+        _parts = value.split(_SERIALIZE_SEP, 5)
+        if len(_parts) == 1:
+            _done = max(0, int(value) - 1) * constants.TAR_RECORDSIZE
+            return cls(_done)
+        if len(_parts) not in (5, 6) or _parts[0] != _SERIALIZE_PREFIX:
+            raise ValueError("Invalid progress `%s`" % value)
+        _progress = cls(*[int(_part) for _part in _parts[1:5]])
+        if len(_parts) == 6:
+            _progress.profile = _parts[5]
+        return _progress
+
+
+class ProfilesProgress(object):
+    """The latest progress of each profile being backed up. The progress of
+    a profile is dropped if it was not updated for `expiry` seconds (e.g.
+    the backup of the profile finished).
+    """
+
+    def __init__(self, expiry = PROFILE_EXPIRY, clock = time.time):
+        self.__expiry = expiry
+        self.__clock = clock
+        # dictionary profile name -> (time of update, `ProgressInfo`)
+        self.__progress = {}
+
+    def update(self, progress):
+        """Stores the given `ProgressInfo` as the latest progress of its
+        profile.
+        """
+        self.__progress[progress.profile] = (self.__clock(), progress)
+
+    def get_progress(self):
+        """Returns the current progress of the profiles ordered by the names
+        of the profiles.
+        """
+        _now = self.__clock()
+        for _profile, (_time, _progress) in self.__progress.items():
+            if _now - _time > self.__expiry:
+                del self.__progress[_profile]
+        return [self.__progress[_profile][1] for _profile in sorted(self.__progress)]
+
+
+class ProgressEngine(object):
+    """Computes the progress from the number of processed bytes and
+    publishes it in limited intervals.
+    """
+
+    def __init__(self, total, publish, interval = PUBLISH_INTERVAL, clock = time.time):
+        """
+        @param total: number of bytes expected in total (`UNKNOWN` if not known)
+        @param publish: callable the `ProgressInfo` is passed to
+        @param interval: min. interval (seconds) between publishing
+        @param clock: function returning the current time (seconds)
+        """
+        self.__total = total
+        self.__publish = publish
+        self.__interval = interval
+        self.__clock = clock
+        self.__start = None
+        self.__done = 0
+        # time and processed bytes when the rate was updated
+        self.__last_time = None
+        self.__last_done = 0
+        self.__rate = UNKNOWN
+        self.__last_publish = None
+
+    def __update_rate(self, now):
+        _elapsed = now - self.__last_time
+        if _elapsed <= 0:
+            return
+        _rate = (self.__done - self.__last_done) / _elapsed
+        if self.__rate == UNKNOWN:
+            self.__rate = _rate
+        else:
+            self.__rate = _RATE_SMOOTHING * _rate + (1.0 - _RATE_SMOOTHING) * self.__rate
+        self.__last_time = now
+        self.__last_done = self.__done
+
+    def get_progress(self):
+        _remaining = UNKNOWN
+        if self.__total > 0 and self.__rate > 0:
+            _remaining = max(0, self.__total - self.__done) / self.__rate
+        return ProgressInfo(self.__done, self.__total, self.__rate, _remaining)
+
+    def update(self, done):
+        """Sets the number of processed bytes. The progress is published if
+        the interval since the last publishing passed.
+        """
+        _now = self.__clock()
+        if self.__start is None:
+            self.__start = _now
+            self.__last_time = _now
+        self.__done = done
+        if (self.__last_publish is not None) and (_now - self.__last_publish < self.__interval):
+            return
+        self.__update_rate(_now)
+        self.__last_publish = _now
+        self.__publish(self.get_progress())
+
+    def update_records(self, records):
+        """Sets the number of processed records (e.g. the checkpoint echoed
+        by TAR).
+        """
+        self.update(records * constants.TAR_RECORDSIZE)
+
+    def finish(self):
+        """Publishes the final progress (if any progress was published).
+        """
+        if self.__last_publish is not None:
+            self.__update_rate(self.__clock())
+            self.__publish(self.get_progress())
+
+
+class CheckpointReader(threading.Thread):
+    """Reads the stderr of a TAR process. Echoed checkpoints (see
+    `get_checkpoint_opts`) are passed to the given callback, the remaining
+    output is collected.
+    """
+
+    def __init__(self, stream, callback):
+        """
+        @param stream: the stream (pipe) to read
+        @param callback: callable the number of the checkpoint is passed to
+        """
+        threading.Thread.__init__(self, name = "CheckpointReader")
+        self.setDaemon(True)
+        self.__stream = stream
+        self.__callback = callback
+        self.__lines = []
+
+    def run(self):
+        for _line in iter(self.__stream.readline, ""):
+            _match = _CHECKPOINT_RE.search(_line)
+            if _match is None:
+                self.__lines.append(_line)
+            elif self.__callback is not None:
+                try:
+                    self.__callback(int(_match.group(1)))
+                except Exception, error:
+                    # the output must be read anyway; otherwise TAR blocks
+                    log.LogFactory.getLogger().warning(_("Unable to publish progress: %s") % error)
+                    self.__callback = None
+        self.__stream.close()
+
+    def get_output(self):
+        """Returns the output (without checkpoints) read so far.
+        """
+        return "".join(self.__lines)
@@ -19,6 +19,10 @@
 #
 
 import os
+import mmap
+import heapq
+import hashlib
+import tempfile
 
 from sbackup.util.exceptions import SBException
 from sbackup.util.exceptions import CorruptedSBdictException
@@ -86,6 +90,7 @@ class SBdict(dict) :
     
     @note: And yes, this penalty in speed is notable!
            We should replace it or at least provide a faster alternative.
+           See `FlatPathDict`.
     """
     def __init__(self, mapping = None):
         if not mapping :
@@ -374,3 +379,339 @@ class SBdict(dict) :
             return True
         else:
             return self.hasParentDirIncluded(_basename)
+
+
+class FlatPathDict(object):
+    """Faster alternative to `SBdict` providing the same operations on paths.
+
+    Instead of a tree of nested dictionaries the paths are stored as keys of
+    a single dictionary (i.e. a path is found using a single lookup). Sub-paths
+    of stored paths are stored as well (with `props` set to None) and an
+    index of the children of each path is maintained. Hence, lookups are
+    done in O(1) and the search for included parent directories in O(depth).
+
+    The path `/home/user` is stored as follows:
+
+    props    = { '' : None, '/home' : None, '/home/user' : 'props' }
+    children = { '' : ['/home'], '/home' : ['/home/user'] }
+
+    Like in `SBdict` the root directory is stored as empty string and trailing
+    separators are ignored.
+    
+    @note: Unlike `SBdict` the values of this dictionary are the `props` only.
+    """
+
+    def __init__(self, mapping = None):
+        # path -> props
+        self.__props = {}
+        # path -> list of child paths
+        self.__children = {}
+        # paths without parent (i.e. the first components)
+        self.__roots = []
+        if mapping:
+            for key, value in mapping:
+                self.__setitem__(key, value)
+
+    def __normpath(self, key):
+        """Strips a single trailing separator as done by `SBdict`.
+        """
+        if key.endswith(os.sep):
+            return key[:-1]
+        return key
+
+    def __get_parent(self, path):
+        """Returns the parent of given path or None if the path is a first
+        component.
+        """
+        _idx = path.rfind(os.sep)
+        if _idx == -1:
+            return None
+        return path[:_idx]
+
+    def __add_path(self, path):
+        """Adds the given (normalized) path and missing sub-paths with
+        `props` None.
+        """
+        _missing = []
+        _path = path
+        while _path is not None and _path not in self.__props:
+            _missing.append(_path)
+            _path = self.__get_parent(_path)
+        for _path in reversed(_missing):
+            self.__props[_path] = None
+            _parent = self.__get_parent(_path)
+            if _parent is None:
+                self.__roots.append(_path)
+            else:
+                self.__children.setdefault(_parent, []).append(_path)
+
+    def __len__(self):
+        return len(self.__props)
+
+    def __contains__(self, key):
+        return self.has_key(key)
+
+    def has_key(self, key):
+        """Return True if the path have been found and false if not
+        @param key: a path to search (/home/user/test/dir )
+        """
+        return self.__normpath(key) in self.__props
+
+    def __setitem__(self, key, value):
+        """Sets the `props` of given path. Sub-paths of the path are added
+        if they don't exist.
+        """
+        _path = self.__normpath(key)
+        if _path not in self.__props:
+            self.__add_path(_path)
+        self.__props[_path] = value
+
+    def __getitem__(self, key):
+        """Returns the `props` of given path.
+
+        @raise KeyError: if the path is not stored
+        """
+        return self.__props[self.__normpath(key)]
+
+    def __delitem__(self, key):
+        """Removes the given path and all paths below.
+        """
+        _path = self.__normpath(key)
+        if _path not in self.__props:
+            return False
+        _parent = self.__get_parent(_path)
+        if _parent is None:
+            self.__roots.remove(_path)
+        else:
+            self.__children[_parent].remove(_path)
+        _stack = [_path]
+        while _stack:
+            _path = _stack.pop()
+            del self.__props[_path]
+            _stack.extend(self.__children.pop(_path, []))
+        return True
+
+    def __iter_tree(self, prune = False):
+        """Iterator that goes through the paths (parents before their children)
+        and returns the paths and their properties.
+
+        @param prune: if True, paths below paths having `props` are skipped
+        """
+        _stack = list(reversed(self.__roots))
+        while _stack:
+            _path = _stack.pop()
+            _props = self.__props[_path]
+            yield (_path, _props)
+            if prune and _props is not None:
+                continue
+            _stack.extend(reversed(self.__children.get(_path, [])))
+
+    def iterkeys(self):
+        """Returns an iterator that goes through all paths including sub-paths.
+        """
+        for _path, _props in self.__iter_tree():
+            yield _path
+
+    def iteritems(self):
+        """Iterator that returns paths and their properties. Every sub-path
+        is considered.
+        
+        @return: (fullpath, props)
+        """
+        return self.__iter_tree()
+
+    def itervalues(self):
+        """Iterator that returns the props of all paths including sub-paths.
+        """
+        for _path, _props in self.__iter_tree():
+            yield _props
+
+    def iterFirstItems(self):
+        """Iterator that returns the paths having `props` that are not
+        contained in another path having `props`.
+        """
+        for _path, _props in self.__iter_tree(prune = True):
+            if _props is not None:
+                yield _path
+            elif not self.__children.get(_path):
+                raise SBException("getting to an ending file without properties")
+
+    def getEffectiveFileList(self):
+        """Iterator that returns the effective files list, i.e. the paths
+        whose `props` are set (see `SBdict.getEffectiveFileList`).
+        """
+        for _path, _props in self.__iter_tree():
+            if _props is not None:
+                yield _path
+
+    def get_eff_filelist_not_nested(self):
+        """Iterator that returns the effective files list without the paths
+        contained in an included parent directory.
+        """
+        for _path, _props in self.__iter_tree(prune = True):
+            if _props is not None:
+                yield _path
+
+    def hasFile(self, _file):
+        """Checks if the dictionary has a file. Unlike has_key, this will not
+        match sub-paths.
+        """
+        return self.__props.get(self.__normpath(_file)) is not None
+
+    def contains_path(self, path):
+        """Checks whether the given `path` is stored. Unlike `hasFile` this
+        will also match sub-directories. 
+        """
+        return self.has_key(path)
+
+    def hasParentDirIncluded(self, path):
+        """
+        Checks for a path if we have an effective parent dir
+        @param path: The path to check 
+        @type path: like /d/d1/d2
+        """
+        if not path:
+            return False
+        _parent = self.__get_parent(path)
+        while _parent is not None:
+            if self.__props.get(_parent) is not None:
+                return True
+            _parent = self.__get_parent(_parent)
+        return False
+
+
+class MappedHashSet(object):
+    """Memory-bounded set of strings (e.g. paths) supporting membership tests.
+
+    Instead of the strings, hashes of 64 bits are stored in a sorted array
+    within a temporary file that is mapped into memory. Hence, the required
+    memory is managed by the operating system (pages are loaded on demand)
+    and lookups are done using binary search in O(log n).
+
+    The array is created by sorting chunks of hashes in memory and merging
+    them afterwards, i.e. the memory used when creating is bounded by the
+    size of the chunks.
+
+    @note: Since hashes are compared, a string not contained in the set can be
+           considered as contained in the (very unlikely) case of a collision.
+    """
+
+    HASH_SIZE = 8
+    READ_BLOCKSIZE = 64 * 1024
+
+    def __init__(self, items, chunksize = 500000, tmpdir = None):
+        """
+        @param items: iterable of the strings contained in the set
+        @param chunksize: number of hashes sorted in memory at once
+        @param tmpdir: directory the temporary files are created in
+        """
+        self.__tmpdir = tmpdir
+        self.__map = None
+        self.__len = 0
+        self.__build(items, chunksize)
+
+    def __len__(self):
+        return self.__len
+
+    def __hash(self, item):
+        return hashlib.md5(item).digest()[:self.HASH_SIZE]
+
+    def __mkstemp(self):
+        return tempfile.mkstemp(prefix = "sbackup_hashes_", dir = self.__tmpdir)
+
+    def __write_run(self, chunk):
+        """Writes the given hashes sorted into a temporary file.
+
+        @return: the name of the file
+        """
+        chunk.sort()
+        _fd, _name = self.__mkstemp()
+        _fobj = os.fdopen(_fd, "wb")
+        try:
+            _fobj.write("".join(chunk))
+        finally:
+            _fobj.close()
+        return _name
+
+    def __iter_run(self, name):
+        """Returns the hashes stored in the file `name`.
+        """
+        _fobj = open(name, "rb")
+        try:
+            _blocksize = self.READ_BLOCKSIZE - (self.READ_BLOCKSIZE % self.HASH_SIZE)
+            while True:
+                _block = _fobj.read(_blocksize)
+                if not _block:
+                    break
+                for _pos in xrange(0, len(_block), self.HASH_SIZE):
+                    yield _block[_pos:_pos + self.HASH_SIZE]
+        finally:
+            _fobj.close()
+
+    def __build(self, items, chunksize):
+        _runs = []
+        try:
+            _chunk = []
+            for _item in items:
+                _chunk.append(self.__hash(_item))
+                if len(_chunk) >= chunksize:
+                    _runs.append(self.__write_run(_chunk))
+                    _chunk = []
+            if len(_chunk) > 0 or len(_runs) == 0:
+                _runs.append(self.__write_run(_chunk))
+
+            # merge the sorted runs and remove duplicates
+            _fd, _name = self.__mkstemp()
+            try:
+                _fobj = os.fdopen(_fd, "w+b")
+                try:
+                    _last = None
+                    _buf = []
+                    for _hash in heapq.merge(*[self.__iter_run(_run) for _run in _runs]):
+                        if _hash != _last:
+                            _buf.append(_hash)
+                            _last = _hash
+                            if len(_buf) >= chunksize:
+                                _fobj.write("".join(_buf))
+                                _buf = []
+                    _fobj.write("".join(_buf))
+                    _fobj.flush()
+                    _size = _fobj.tell()
+                    self.__len = _size / self.HASH_SIZE
+                    if _size > 0:
+                        self.__map = mmap.mmap(_fobj.fileno(), _size, access = mmap.ACCESS_READ)
+                finally:
+                    _fobj.close()
+            finally:
+                # the mapping remains valid after removal
+                os.remove(_name)
+        finally:
+            for _run in _runs:
+                os.remove(_run)
+
+    def __contains__(self, item):
+        if self.__len == 0:
+            return False
+        _hash = self.__hash(item)
+        _size = self.HASH_SIZE
+        _map = self.__map
+        _low = 0
+        _high = self.__len
+        while _low < _high:
+            _mid = (_low + _high) // 2
+            _val = _map[_mid * _size:(_mid + 1) * _size]
+            if _val < _hash:
+                _low = _mid + 1
+            elif _val > _hash:
+                _high = _mid
+            else:
+                return True
+        return False
+
+    def close(self):
+        """Releases the mapped memory.
+        """
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+        self.__len = 0
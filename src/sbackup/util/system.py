@@ -244,6 +244,19 @@ def set_default_environment():
             os.environ[var] = _vars[var]
 
 
+def which(program):
+    """Returns the full path of the given executable `program` found in
+    the directories defined by environment variable `PATH` or None if
+    it is not found.
+    """
+    _dirs = os.environ.get(ENVVAR_PATH, DEFAULT_PATH).split(os.pathsep)
+    for _dir in _dirs:
+        _path = os.path.join(_dir, program)
+        if os.path.isfile(_path) and os.access(_path, os.X_OK):
+            return _path
+    return None
+
+
 def get_process_environment(pid):
     _envlst = None
     _envfile = "/proc/%s/environ" % pid
@@ -19,6 +19,8 @@
 
 import unittest
 from sbackup.util.structs import SBdict
+from sbackup.util.structs import FlatPathDict
+from sbackup.util.structs import MappedHashSet
 
 
 class TestSBdict(unittest.TestCase):
@@ -81,6 +83,92 @@ class TestSBdict(unittest.TestCase):
         self.assertTrue(self.sbd.has_key("/home/usr1/usr2/test/dir/test/de"))
 
 
+class TestFlatPathDict(unittest.TestCase):
+    """
+    """
+    fpd = None
+
+    def setUp(self):
+        ""
+        self.fpd = FlatPathDict()
+        self.fpd["/home/user"] = "1"
+        self.fpd["/home/usr1"] = "1"
+        self.fpd["/home/usr1/usr2"] = "2"
+        self.fpd["/home/usr1/usr2/test/dir"] = "4"
+        self.fpd["/home/usr1/usr2/test/direrec"] = "4"
+        self.fpd["/home/usr1/usr2/test/dir/test/de/plus"] = "7"
+        self.fpd["/home/usr3/*"] = "1"
+
+    def testHasFile(self):
+        ""
+        self.assertFalse(self.fpd.hasFile("/home/usr1/usr2/test"))
+        self.assertTrue(self.fpd.hasFile("/home/usr1/usr2"))
+        self.assertTrue(self.fpd.hasFile("/home/usr1/usr2/"))
+        self.assertFalse(self.fpd.hasFile("/home/usr1/usr2/test/dir/test/de"))
+        self.assertTrue(self.fpd.has_key("/home/usr1/usr2/test/dir/test/de"))
+        self.assertFalse(self.fpd.has_key("/home/usr4"))
+
+    def testGetEffectiveFileList(self):
+        "Get Effective FileList"
+        self.assertEqual(sorted(self.fpd.getEffectiveFileList()),
+                         ["/home/user", "/home/usr1", "/home/usr1/usr2",
+                          "/home/usr1/usr2/test/dir", "/home/usr1/usr2/test/dir/test/de/plus",
+                          "/home/usr1/usr2/test/direrec", "/home/usr3/*"])
+        self.assertEqual(sorted(self.fpd.get_eff_filelist_not_nested()),
+                         ["/home/user", "/home/usr1", "/home/usr3/*"])
+        self.assertEqual(sorted(self.fpd.iterFirstItems()),
+                         ["/home/user", "/home/usr1", "/home/usr3/*"])
+
+    def testDisable(self):
+        "Paths disabled by setting props to None"
+        self.fpd["/home/usr1"] = None
+        self.assertFalse(self.fpd.hasFile("/home/usr1"))
+        self.assertTrue(self.fpd.contains_path("/home/usr1"))
+        self.assertTrue(self.fpd.hasParentDirIncluded("/home/usr1/usr2/test"))
+        self.assertFalse(self.fpd.hasParentDirIncluded("/home/usr1/usr2"))
+        self.assertEqual(sorted(self.fpd.get_eff_filelist_not_nested()),
+                         ["/home/user", "/home/usr1/usr2", "/home/usr3/*"])
+
+    def testSameAsSBdict(self):
+        "Same effective lists as SBdict"
+        _sbd = SBdict()
+        for _path in self.fpd.getEffectiveFileList():
+            _sbd[_path] = self.fpd[_path]
+        self.assertEqual(sorted(_sbd.iteritems()), sorted(self.fpd.iteritems()))
+        self.assertEqual(sorted(_sbd.get_eff_filelist_not_nested()),
+                         sorted(self.fpd.get_eff_filelist_not_nested()))
+
+    def testDelete(self):
+        ""
+        del self.fpd["/home/usr1/usr2/test"]
+        self.assertTrue(self.fpd.hasFile("/home/usr1/usr2"))
+        self.assertFalse(self.fpd.has_key("/home/usr1/usr2/test/dir"))
+        self.assertEqual(len(self.fpd), 7)
+
+
+class TestMappedHashSet(unittest.TestCase):
+    """
+    """
+
+    def testContains(self):
+        "Membership using several sorted runs"
+        _paths = ["/home/usr%d/file%d" % (_idx % 7, _idx) for _idx in range(1000)]
+        _set = MappedHashSet(_paths + _paths[:10], chunksize = 64)
+        self.assertEqual(len(_set), 1000)
+        for _path in _paths:
+            self.assertTrue(_path in _set)
+        self.assertFalse("/home/usr1/file1000" in _set)
+        self.assertFalse("/home/usr1" in _set)
+        _set.close()
+        self.assertFalse(_paths[0] in _set)
+
+    def testEmpty(self):
+        ""
+        _set = MappedHashSet([])
+        self.assertEqual(len(_set), 0)
+        self.assertFalse("/home" in _set)
+
+
 def suite():
     """Returns a test suite containing all test cases from this module.
     """
@@ -89,6 +177,8 @@ def suite():
     _suite.addTests(
         [
          _loader(TestSBdict),
+         _loader(TestFlatPathDict),
+         _loader(TestMappedHashSet),
         ])
     return _suite
 
@@ -0,0 +1,88 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   (c)2010 - Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Compares the structures available for the include and exclude file lists
+of snapshots.
+
+usage: profile_flist.py [NUMBER_OF_PATHS]
+"""
+
+import sys
+import time
+import random
+
+from sbackup.core import snapshot
+
+
+def make_paths(npaths, depth = 8, fanout = 10):
+    """Returns `npaths` random paths (like those excluded when collecting files).
+    """
+    _rand = random.Random(npaths)
+    _paths = []
+    for _idx in xrange(npaths):
+        _comps = ["d%d" % _rand.randint(0, fanout) for _lvl in range(_rand.randint(1, depth))]
+        _comps.append("f%d" % _idx)
+        _paths.append("/" + "/".join(_comps))
+    return _paths
+
+
+def measure(title, func):
+    _start = time.time()
+    func()
+    print "  %-30s %8.3f s" % (title, time.time() - _start)
+
+
+def benchmark(flist_type, paths):
+    print "%s (%s):" % (flist_type, snapshot.AVAIL_FLIST_TYPES[flist_type].__name__)
+    _flist = snapshot.AVAIL_FLIST_TYPES[flist_type]()
+
+    def _add():
+        for _path in paths:
+            _flist[_path] = "0"
+
+    def _has_file():
+        for _path in paths:
+            _flist.hasFile(_path)
+            _flist.hasFile(_path + "x")
+
+    def _contains_path():
+        for _path in paths:
+            _flist.contains_path(_path.rsplit("/", 1)[0])
+
+    def _eff_list():
+        for _path in _flist.getEffectiveFileList():
+            pass
+
+    def _eff_list_not_nested():
+        for _path in _flist.get_eff_filelist_not_nested():
+            pass
+
+    measure("add", _add)
+    measure("hasFile", _has_file)
+    measure("contains_path", _contains_path)
+    measure("getEffectiveFileList", _eff_list)
+    measure("get_eff_filelist_not_nested", _eff_list_not_nested)
+
+
+if __name__ == "__main__":
+    _npaths = 100000
+    if len(sys.argv) > 1:
+        _npaths = int(sys.argv[1])
+    _paths = make_paths(_npaths)
+    print "Number of paths: %s" % _npaths
+    for _type in (snapshot.FLIST_TYPE_TREE, snapshot.FLIST_TYPE_FLAT):
+        benchmark(_type, _paths)
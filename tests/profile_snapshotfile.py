@@ -18,17 +18,52 @@
 
 import sys
 import os.path
-import unittest
+import time
 
 from sbackup.util.log import LogFactory
-from sbackup.util import tar
-from sbackup.util import file_handling as fam
+from sbackup.ar_backend import tar
 
 import cProfile
 
 LOGLEVEL = 100
 
 
+def read_bytewise(snarfile):
+    """Reference implementation: reads the snar file byte by byte as done
+    before parsing in blocks was introduced. Used for comparison only.
+    """
+    fd = open(snarfile)
+    n = 0
+    while n < 2 :
+        c = fd.read(1)
+        if c == '\0':
+            n += 1
+    currentline = ""
+    last_c = ''
+    c = fd.read(1)
+    while c:
+        currentline += c
+        if c == '\0' and last_c == '\0' :
+            currentline.lstrip("\0").split("\0", 6)
+            currentline = ''
+            last_c = ''
+        else :
+            last_c = c
+        c = fd.read(1)
+    fd.close()
+
+
+def measure_throughput(title, func, snarfile):
+    """Calls `func` and prints the throughput in MB/s achieved when
+    processing given `snarfile`.
+    """
+    _size = os.path.getsize(snarfile)
+    _start = time.time()
+    func()
+    _duration = max(time.time() - _start, 1e-6)
+    print "%-30s %8.3f s  %8.2f MB/s" % (title, _duration, (_size / 1e6) / _duration)
+
+
 class TestSnapshotfile(object):
 
     __file = os.path.abspath("./test-datas/test-snapshotfile/files.snar")
@@ -69,6 +104,20 @@ class TestSnapshotfile(object):
             pass
 
 
+    def benchmark(self, snarfile = None):
+        """Prints the throughput of the available parsers for the snar file.
+        """
+        if snarfile is None:
+            snarfile = self.__file
+        snar = tar.SnapshotFile(snarfile)
+        print "Snar file: %s (%s bytes)" % (snarfile, os.path.getsize(snarfile))
+        measure_throughput("byte-wise (reference)",
+                           lambda: read_bytewise(snarfile), snarfile)
+        measure_throughput("parseFormat2",
+                           lambda: self.read_on_demand(snar), snarfile)
+        measure_throughput("get_dict_format2",
+                           snar.get_dict_format2, snarfile)
+
     def main(self):
         self.setUp()
         self.test_constructor()
@@ -77,4 +126,9 @@ class TestSnapshotfile(object):
 
 if __name__ == "__main__":
     tsnp = TestSnapshotfile()
-    cProfile.run('tsnp.main()')
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        # usage: profile_snapshotfile.py --benchmark [SNARFILE]
+        tsnp.setUp()
+        tsnp.benchmark(*sys.argv[2:3])
+    else:
+        cProfile.run('tsnp.main()')
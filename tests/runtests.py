@@ -23,12 +23,38 @@ import unittest
 import test_snapshot
 import test_utils
 import test_tar
+import test_catalog
+import test_purgeplan
+import test_revertplan
+import test_memberindex
+import test_transfer
+import test_scheduler
+import test_progress
+import test_dedup
+import test_delta
+import test_dircache
+import test_changejournal
+import test_filecollect
+import test_fs_backend
 
 
 def suite():
     alltests = unittest.TestSuite([ test_snapshot.suite(),
                                     test_utils.suite(),
-                                    test_tar.suite()
+                                    test_tar.suite(),
+                                    test_catalog.suite(),
+                                    test_purgeplan.suite(),
+                                    test_revertplan.suite(),
+                                    test_memberindex.suite(),
+                                    test_transfer.suite(),
+                                    test_scheduler.suite(),
+                                    test_progress.suite(),
+                                    test_dedup.suite(),
+                                    test_delta.suite(),
+                                    test_dircache.suite(),
+                                    test_changejournal.suite(),
+                                    test_filecollect.suite(),
+                                    test_fs_backend.suite()
                                   ])
     return alltests
 
@@ -0,0 +1,153 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the snapshot catalog (module 'catalog').
+"""
+
+
+import os
+import time
+import unittest
+import tempfile
+import shutil
+
+from sbackup.core import catalog
+from sbackup.core.snapshot import Snapshot
+from sbackup.util.exceptions import SBException
+from sbackup.util.log import LogFactory
+
+
+class TestSnapshotCatalog(unittest.TestCase):
+    """Test case for class 'SnapshotCatalog'.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.target = tempfile.mkdtemp(prefix = "test_catalog_")
+        self.entries = [ catalog.CatalogEntry("2010-01-01_10.00.00.000000.host.ful",
+                                              "1.5", "gzip", None, 0, 1024),
+                         catalog.CatalogEntry("2010-01-02_10.00.00.000000.host.inc",
+                                              "1.5", "gzip",
+                                              "2010-01-01_10.00.00.000000.host.ful",
+                                              100, catalog.SIZE_UNKNOWN)
+                       ]
+        for _entry in self.entries:
+            os.mkdir(os.path.join(self.target, _entry.name))
+
+    def tearDown(self):
+        shutil.rmtree(self.target)
+
+    def __commit(self):
+        _catalog = catalog.SnapshotCatalog(self.target)
+        _catalog.set_entries(self.entries)
+        _catalog.commit()
+        return _catalog
+
+    def test_entry_line(self):
+        """Entries are converted into lines of the catalog and back
+        """
+        for _entry in self.entries:
+            self.assertEqual(catalog.CatalogEntry.from_line(_entry.to_line()), _entry)
+        self.assertEqual(catalog.CatalogEntry.from_line(self.entries[0].to_line()).base, None)
+        self.assertRaises(ValueError, catalog.CatalogEntry.from_line, "name\t1.5\tgzip")
+
+    def test_commit_load(self):
+        """A committed catalog is loaded
+        """
+        self.__commit()
+        self.assertEqual([_name for _name in os.listdir(self.target)
+                          if catalog.is_catalog_file(_name)], [catalog.CATALOG_FILENAME])
+        self.assertEqual(len(os.listdir(self.target)), 3)
+
+        _catalog = catalog.SnapshotCatalog(self.target)
+        self.assertRaises(SBException, _catalog.get_entries)
+        self.assertTrue(_catalog.load())
+        self.assertTrue(_catalog.is_unchanged())
+        self.assertEqual(_catalog.get_entries(), list(reversed(self.entries)))
+
+        _catalog.set_base(self.entries[1].name, "2009-12-31_10.00.00.000000.host.ful")
+        _catalog.remove(self.entries[0].name)
+        os.rmdir(os.path.join(self.target, self.entries[0].name))
+        _catalog.commit()
+        self.assertTrue(_catalog.load())
+        self.assertEqual(len(_catalog.get_entries()), 1)
+        self.assertEqual(_catalog.get_entry(self.entries[1].name).base,
+                         "2009-12-31_10.00.00.000000.host.ful")
+
+    def test_outdated(self):
+        """Catalogs are not loaded after snapshots were added or removed by
+        other means (immediately after the catalog was written)
+        """
+        _catalog = self.__commit()
+        _past = time.time() - 60
+        os.utime(_catalog.get_path(), (_past, _past))
+        self.assertFalse(_catalog.is_unchanged())
+        self.assertTrue(catalog.SnapshotCatalog(self.target).load())
+
+        # other entries of the target are ignored
+        os.mkdir(os.path.join(self.target, "chunks"))
+        os.mkdir(os.path.join(self.target, "2010-01-03_10.00.00.000000.host.corrupt"))
+        self.assertTrue(catalog.SnapshotCatalog(self.target).load())
+
+        self.__commit()
+        _added = os.path.join(self.target, "2010-01-03_10.00.00.000000.host.inc")
+        os.mkdir(_added)
+        self.assertFalse(catalog.SnapshotCatalog(self.target).load())
+        os.rmdir(_added)
+        self.assertTrue(catalog.SnapshotCatalog(self.target).load())
+        os.rmdir(os.path.join(self.target, self.entries[0].name))
+        self.assertFalse(catalog.SnapshotCatalog(self.target).load())
+
+    def test_invalid(self):
+        """Invalid catalogs are not loaded and can be removed
+        """
+        _catalog = catalog.SnapshotCatalog(self.target)
+        self.assertFalse(_catalog.load())
+        _fobj = open(_catalog.get_path(), "w")
+        _fobj.write("invalid\n")
+        _fobj.close()
+        self.assertFalse(_catalog.load())
+        _catalog.invalidate()
+        self.assertEqual(sorted(os.listdir(self.target)),
+                         [_entry.name for _entry in self.entries])
+
+    def test_snapshot_from_entry(self):
+        """Snapshots are opened from catalog entries without accessing them
+        """
+        _entry = self.entries[1]
+        _snp = Snapshot(os.path.join(self.target, _entry.name), entry = _entry)
+        self.assertEqual(_snp.getBase(), _entry.base)
+        self.assertEqual(_snp.getFormat(), "gzip")
+        self.assertEqual(_snp.getSplitedSize(), 100)
+        self.assertEqual(_snp.getVersion(), "1.5")
+        self.assertEqual(os.listdir(os.path.join(self.target, _entry.name)), [])
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestSnapshotCatalog)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
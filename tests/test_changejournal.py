@@ -0,0 +1,143 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the journal of changed directories (modules
+'changejournal' and 'journal_service').
+"""
+
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from sbackup import journal_service
+from sbackup.util import changejournal
+from sbackup.util.log import LogFactory
+
+
+class TestChangeJournal(unittest.TestCase):
+    """Test case for recording and reading changed directories.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_changejournal_")
+        self.tree = os.path.join(self.tmpdir, "tree")
+        self.journal = os.path.join(self.tmpdir, "journal")
+        for _dir in ("a", "b", "c", "excl"):
+            os.makedirs(os.path.join(self.tree, _dir, "sub"))
+        self.service = None
+        self.thread = None
+
+    def tearDown(self):
+        self.__stop()
+        shutil.rmtree(self.tmpdir)
+
+    def __start(self, period = changejournal.PERIOD):
+        self.service = journal_service.ChangeJournalService(self.journal, [self.tree],
+                                                            [os.path.join(self.tree, "excl")],
+                                                            period)
+        self.thread = threading.Thread(target = self.service.main)
+        self.thread.start()
+        while not os.path.exists(self.journal) or os.path.getsize(self.journal) == 0:
+            time.sleep(0.05)
+
+    def __stop(self):
+        if self.thread is not None:
+            self.service.stop()
+            self.thread.join()
+            self.thread = None
+
+    def __path(self, *names):
+        return os.path.join(self.tree, *names)
+
+    def __get_changed_dirs(self, since):
+        return changejournal.ChangeJournal(self.journal).get_changed_dirs(since, timeout = 5.0)
+
+    def test_changes(self):
+        """Changed directories are recorded
+        """
+        _start = time.time()
+        self.__start()
+        open(self.__path("a", "sub", "file"), "w").close()
+        os.mkdir(self.__path("b", "new"))
+        os.mkdir(self.__path("b", "new", "deeper"))
+        open(self.__path("excl", "file"), "w").close()
+        _changed = self.__get_changed_dirs(_start + 60)
+        self.assertTrue(self.__path("a", "sub") in _changed)
+        self.assertTrue(self.__path("b") in _changed)
+        self.assertTrue(self.__path("b", "new") in _changed)
+        self.assertFalse(self.__path("a") in _changed)
+        self.assertFalse(self.__path("c") in _changed)
+        self.assertFalse(self.__path("excl") in _changed)
+        # changes in new directories are recorded too
+        open(self.__path("b", "new", "deeper", "file"), "w").close()
+        self.assertTrue(self.__path("b", "new", "deeper") in self.__get_changed_dirs(_start + 60))
+
+    def test_moved(self):
+        """Directories moved within the tree are recorded at their new path
+        """
+        self.__start()
+        os.rename(self.__path("a"), self.__path("c", "a"))
+        open(self.__path("c", "a", "sub", "file"), "w").close()
+        _changed = self.__get_changed_dirs(time.time() + 60)
+        self.assertTrue(self.__path("c", "a") in _changed)
+        self.assertTrue(self.__path("c", "a", "sub") in _changed)
+
+    def test_periods(self):
+        """Only directories changed since the given time are returned
+        """
+        self.__start(period = 0.2)
+        open(self.__path("a", "file"), "w").close()
+        time.sleep(1.5)
+        _since = time.time()
+        time.sleep(0.1)
+        open(self.__path("b", "file"), "w").close()
+        self.assertEqual(self.__get_changed_dirs(_since), set([self.__path("b")]))
+
+    def test_incomplete(self):
+        """Incomplete journals are not used
+        """
+        _before = time.time() - 1
+        self.assertEqual(self.__get_changed_dirs(_before), None)
+        self.__start()
+        self.assertEqual(self.__get_changed_dirs(_before), None)
+        self.assertEqual(self.__get_changed_dirs(time.time()), set())
+        self.assertEqual(changejournal.ChangeJournal(self.journal).get_session_pid(), os.getpid())
+        self.__stop()
+        self.assertEqual(changejournal.ChangeJournal(self.journal).get_session_pid(), None)
+        _journal = changejournal.ChangeJournal(self.journal)
+        self.assertEqual(_journal.get_changed_dirs(time.time(), timeout = 0.5), None)
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestChangeJournal)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
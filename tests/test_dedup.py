@@ -0,0 +1,258 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the deduplicated storage of archives (module 'dedup').
+"""
+
+
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from sbackup.ar_backend import dedup
+from sbackup.ar_backend import tar
+from sbackup.core.SnapshotManager import SnapshotManager
+from sbackup.util.exceptions import SBException
+from sbackup.util.log import LogFactory
+
+
+_FULL_SNP = "2010-01-01_10.00.00.000000.host.ful"
+_INCR_SNP = "2010-01-02_10.00.00.000000.host.inc"
+
+
+def _get_data(size, seed):
+    _random = random.Random(seed)
+    return "".join([chr(_random.randint(0, 255)) for _idx in xrange(size)])
+
+def _get_chunker():
+    return dedup.Chunker(min_size = 2048, avg_bits = 13, max_size = 65536)
+
+
+class TestChunker(unittest.TestCase):
+    """Test case for the content-defined chunking.
+    """
+
+    def __split(self, data, piecesize):
+        _chunker = _get_chunker()
+        _buffer = bytearray()
+        _chunks = []
+        for _pos in range(0, len(data), piecesize):
+            _buffer.extend(data[_pos:_pos + piecesize])
+            _size = _chunker.find_boundary(_buffer)
+            while _size > 0:
+                _chunks.append(str(_buffer[:_size]))
+                del _buffer[:_size]
+                _size = _chunker.find_boundary(_buffer)
+        _chunks.append(str(_buffer))
+        return _chunks
+
+    def test_boundaries(self):
+        """Chunks are determined by content only and are within the limits
+        """
+        _data = _get_data(512 * 1024, 1)
+        _chunks = self.__split(_data, 1000)
+        self.assertEqual("".join(_chunks), _data)
+        self.assertEqual(_chunks, self.__split(_data, 70000))
+        self.assertTrue(len(_chunks) > 20)
+        for _chunk in _chunks[:-1]:
+            self.assertTrue(2048 <= len(_chunk) <= 65536)
+
+    def test_shifted(self):
+        """Inserting data changes only the chunks around the insertion
+        """
+        _data = _get_data(512 * 1024, 2)
+        _chunks = self.__split(_data, 4096)
+        _shifted = self.__split(_data[:100000] + "inserted" + _data[100000:], 4096)
+        _common = set(_chunks) & set(_shifted)
+        self.assertTrue(len(_common) >= len(_chunks) - 2)
+
+
+class TestChunkStore(unittest.TestCase):
+    """Test case for writing and reading deduplicated archives.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.target = tempfile.mkdtemp(prefix = "test_dedup_")
+        self.store = os.path.join(self.target, dedup.STORE_DIRNAME)
+        self.data = _get_data(256 * 1024, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.target)
+
+    def __write(self, snpname, data):
+        os.mkdir(os.path.join(self.target, snpname))
+        _archive = os.path.join(self.target, snpname, "files.tar.dedup")
+        _writer = dedup.DedupWriter(_archive, _get_chunker())
+        for _pos in range(0, len(data), 10000):
+            _writer.write(data[_pos:_pos + 10000])
+        _writer.close()
+        return _archive
+
+    def __read(self, archive, size):
+        _reader = dedup.DedupReader(archive)
+        _bufs = []
+        while True:
+            _data = _reader.read(size)
+            if not _data:
+                break
+            _bufs.append(_data)
+        _reader.close()
+        return "".join(_bufs)
+
+    def test_write_read(self):
+        """Chunks are stored once and reassembled when reading
+        """
+        _archive = self.__write("snp1", self.data)
+        self.assertEqual(self.__read(_archive, 5000), self.data)
+        self.assertEqual(dedup.DedupReader(_archive).read(), self.data)
+        self.assertEqual(dedup.get_archive_size(_archive), len(self.data))
+        _nchunks = len(dedup.ChunkStore(self.store).list_chunks())
+        self.assertEqual(_nchunks, len(set(dedup.read_manifest(_archive))))
+        # unchanged data is not stored again
+        _archive2 = self.__write("snp2", self.data[:1000] + "changed" + self.data[1000:])
+        self.assertTrue(len(dedup.ChunkStore(self.store).list_chunks()) <= _nchunks + 2)
+        self.assertEqual(tar.getArchiveType(_archive2), dedup.FORMAT)
+
+    def test_corrupted(self):
+        """Corrupted and missing chunks are detected
+        """
+        _archive = self.__write("snp1", self.data)
+        _store = dedup.ChunkStore(self.store)
+        _digest = dedup.read_manifest(_archive)[0][0]
+        _fobj = open(_store.get_chunk_path(_digest), "w")
+        _fobj.write("garbage")
+        _fobj.close()
+        self.assertRaises(SBException, dedup.DedupReader(_archive).read)
+        _store.remove_chunk(_digest)
+        self.assertRaises(SBException, dedup.DedupReader(_archive).read)
+
+    def test_collect_garbage(self):
+        """Chunks not referenced by any archive are removed
+        """
+        _archive1 = self.__write("snp1", self.data)
+        _archive2 = self.__write("snp2", self.data[:200000] + _get_data(50000, 4))
+        _refcounts = dedup.get_refcounts([_archive1, _archive2])
+        self.assertTrue(2 in _refcounts.values())
+        self.assertEqual(dedup.collect_garbage(self.store, [_archive1, _archive2]), 0)
+        shutil.rmtree(os.path.dirname(_archive1))
+        _removed = dedup.collect_garbage(self.store, [_archive2])
+        self.assertTrue(_removed > 0)
+        self.assertEqual(sorted(dedup.ChunkStore(self.store).list_chunks()),
+                         sorted(set([_ref[0] for _ref in dedup.read_manifest(_archive2)])))
+        self.assertEqual(self.__read(_archive2, 4096), self.data[:200000] + _get_data(50000, 4))
+
+
+class TestDedupSnapshots(unittest.TestCase):
+    """Test case for snapshots using deduplicated archives.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_dedup_")
+        self.target = os.path.join(self.tmpdir, "target")
+        self.tree = os.path.join(self.tmpdir, "tree")
+        os.mkdir(self.target)
+        for _dir in range(3):
+            os.makedirs(os.path.join(self.tree, "d%s" % _dir))
+            for _file in range(4):
+                _fobj = open(os.path.join(self.tree, "d%s" % _dir, "f%s" % _file), "w")
+                _fobj.write(_get_data(20000, _dir * 10 + _file))
+                _fobj.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __make_snapshot(self, name):
+        """Writes a snapshot containing the tree using TAR.
+        """
+        _path = os.path.join(self.target, name)
+        os.mkdir(_path)
+        for _fname, _content in (("ver", "1.5"), ("format", "dedup\n0")):
+            _fobj = open(os.path.join(_path, _fname), "w")
+            _fobj.write(_content)
+            _fobj.close()
+        _archive = os.path.join(_path, "files.tar.dedup")
+        _writer = dedup.DedupWriter(_archive, _get_chunker())
+        _proc = subprocess.Popen(["tar", "-c", "--directory=%s" % self.tmpdir, "tree"],
+                                 stdout = subprocess.PIPE)
+        while True:
+            _data = _proc.stdout.read(4096)
+            if not _data:
+                break
+            _writer.write(_data)
+        self.assertEqual(_proc.wait(), 0)
+        _writer.close()
+        return _archive
+
+    def test_restore(self):
+        """Files are extracted from deduplicated archives
+        """
+        _archive = self.__make_snapshot(_FULL_SNP)
+        _dest = os.path.join(self.tmpdir, "dest")
+        os.mkdir(_dest)
+        tar.extract_files(_archive, None, ["tree/d1", "tree/d2/f3"], _dest)
+        self.assertEqual(sorted(os.listdir(os.path.join(_dest, "tree"))), ["d1", "d2"])
+        self.assertEqual(os.listdir(os.path.join(_dest, "tree", "d2")), ["f3"])
+        for _name in ("d1/f0", "d2/f3"):
+            self.assertEqual(open(os.path.join(_dest, "tree", _name)).read(),
+                             open(os.path.join(self.tree, _name)).read())
+
+    def test_remove_snapshot(self):
+        """Chunks are removed together with the last snapshot using them
+        """
+        self.__make_snapshot(_FULL_SNP)
+        _fobj = open(os.path.join(self.tree, "d0", "f0"), "w")
+        _fobj.write("modified")
+        _fobj.close()
+        _archive = self.__make_snapshot(_INCR_SNP.replace(".inc", ".ful"))
+        _store = dedup.ChunkStore(os.path.join(self.target, dedup.STORE_DIRNAME))
+        _nchunks = len(_store.list_chunks())
+
+        _snpman = SnapshotManager(self.target, use_catalog = False)
+        _snps = _snpman.get_snapshots()
+        self.assertEqual(len(_snps), 2)
+        self.assertEqual(_snps[1].getArchive(), os.path.join(self.target, _FULL_SNP,
+                                                             "files.tar.dedup"))
+        self.assertEqual(_snpman.collect_garbage(), 0)
+        _snpman.remove_snapshot_forced(_snps[1])
+        _chunks = _store.list_chunks()
+        self.assertTrue(0 < len(_chunks) < _nchunks)
+        self.assertEqual(sorted(_chunks),
+                         sorted(set([_ref[0] for _ref in dedup.read_manifest(_archive)])))
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestChunker),
+         unittest.TestLoader().loadTestsFromTestCase(TestChunkStore),
+         unittest.TestLoader().loadTestsFromTestCase(TestDedupSnapshots)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
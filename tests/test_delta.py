@@ -0,0 +1,265 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the block-level storage of large files (module 'delta').
+"""
+
+
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+from sbackup.ar_backend import delta
+from sbackup.util.exceptions import SBException
+from sbackup.util.log import LogFactory
+
+
+_BLOCKSIZE = 4096
+
+# values of `GSeekType`
+_G_SEEK_CUR = 0
+_G_SEEK_SET = 1
+_G_SEEK_END = 2
+
+
+class _GioInputStream(object):
+    """Input stream seeking like `gio.FileInputStream`.
+    """
+
+    def __init__(self, path):
+        self.__fobj = open(path, "rb")
+
+    def read(self, size):
+        return self.__fobj.read(size)
+
+    def seek(self, offset, type = _G_SEEK_SET):
+        _whence = { _G_SEEK_CUR : os.SEEK_CUR, _G_SEEK_SET : os.SEEK_SET,
+                    _G_SEEK_END : os.SEEK_END }[type]
+        self.__fobj.seek(offset, _whence)
+
+    def close(self):
+        self.__fobj.close()
+
+
+class _GioStreamOperations(object):
+    """File operations opening files for reading as GIO streams.
+    """
+
+    def __init__(self, fop):
+        self.__fop = fop
+
+    def __getattr__(self, name):
+        return getattr(self.__fop, name)
+
+    def openfile_for_read(self, path):
+        return _GioInputStream(path)
+
+
+class TestDeltaStorage(unittest.TestCase):
+    """Test case for storing and restoring large files by blocks.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_delta_")
+        self.source = os.path.join(self.tmpdir, "source")
+        self.target = os.path.join(self.tmpdir, "target")
+        os.mkdir(self.source)
+        os.mkdir(self.target)
+        self.mtime = 1000000000
+        self.bigfile = os.path.join(self.source, "big")
+        self.other = os.path.join(self.source, "other")
+        self.__write(self.bigfile, os.urandom(10 * _BLOCKSIZE + 100))
+        self.__write(self.other, os.urandom(3 * _BLOCKSIZE))
+        # snapshot directories (most recent first)
+        self.snppaths = []
+        # content of the big file when the snapshots were written
+        self.versions = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __write(self, path, data, offset = None):
+        if offset is None:
+            _fobj = open(path, "wb")
+        else:
+            _fobj = open(path, "r+b")
+            _fobj.seek(offset)
+        _fobj.write(data)
+        _fobj.close()
+        # the time of modification must change
+        self.mtime += 10
+        os.utime(path, (self.mtime, self.mtime))
+
+    def __snapshot(self):
+        _path = os.path.join(self.target, "snp%s" % len(self.snppaths))
+        os.mkdir(_path)
+        _basepath = None
+        if len(self.snppaths) > 0:
+            _basepath = self.snppaths[0]
+        delta.write_deltas(_path, [self.bigfile, self.other], _basepath, _BLOCKSIZE)
+        self.snppaths.insert(0, _path)
+        self.versions.insert(0, open(self.bigfile, "rb").read())
+        return delta.read_index(_path)
+
+    def __restore(self, snppaths):
+        _dest = os.path.join(self.tmpdir, "restored")
+        delta.DeltaRestorer(snppaths).restore_file(self.bigfile, _dest)
+        _data = open(_dest, "rb").read()
+        os.remove(_dest)
+        return _data
+
+    def test_changed_blocks(self):
+        """Only changed blocks are stored in incremental snapshots
+        """
+        _index = self.__snapshot()
+        self.assertTrue(_index[self.bigfile].full)
+        self.assertEqual(len(_index[self.bigfile].blocks), 11)
+        self.__write(self.bigfile, "changed", offset = 5 * _BLOCKSIZE + 10)
+        _index = self.__snapshot()
+        self.assertFalse(_index[self.bigfile].full)
+        self.assertEqual(_index[self.bigfile].blocks.keys(), [5])
+        # unchanged files are recorded only
+        self.assertEqual(_index[self.other].blocks, {})
+        self.assertEqual(_index[self.other].digests, delta.read_index(self.snppaths[1])[self.other].digests)
+
+        self.assertEqual(self.__restore(self.snppaths), self.versions[0])
+        self.assertEqual(self.__restore(self.snppaths[1:]), self.versions[1])
+
+    def test_size_changed(self):
+        """Files growing and shrinking are restored
+        """
+        self.__snapshot()
+        _fobj = open(self.bigfile, "ab")
+        _fobj.write(os.urandom(2 * _BLOCKSIZE))
+        _fobj.close()
+        self.__write(self.bigfile, "x", offset = 0)
+        _index = self.__snapshot()
+        self.assertEqual(sorted(_index[self.bigfile].blocks.keys()), [0, 10, 11, 12])
+        self.__write(self.bigfile, self.versions[0][:3 * _BLOCKSIZE - 5])
+        self.__snapshot()
+        for _idx in range(len(self.snppaths)):
+            self.assertEqual(self.__restore(self.snppaths[_idx:]), self.versions[_idx])
+
+    def test_attributes(self):
+        """Permissions and time of modification are restored
+        """
+        os.chmod(self.bigfile, 0640)
+        self.__snapshot()
+        _dest = os.path.join(self.tmpdir, "restored", "big")
+        delta.DeltaRestorer(self.snppaths).restore_file(self.bigfile, _dest, ".bak")
+        self.assertEqual(os.stat(_dest).st_mode & 0777, 0640)
+        self.assertEqual(os.stat(_dest).st_mtime, os.stat(self.bigfile).st_mtime)
+        # existing files are backed up
+        delta.DeltaRestorer(self.snppaths).restore_file(self.bigfile, _dest, ".bak")
+        self.assertEqual(sorted(os.listdir(os.path.dirname(_dest))), ["big", "big.bak"])
+
+    def test_corrupted(self):
+        """Corrupted blocks and incomplete histories are detected
+        """
+        self.__snapshot()
+        self.__write(self.bigfile, "changed", offset = 0)
+        self.__snapshot()
+        self.assertRaises(SBException, self.__restore, self.snppaths[:1])
+        _archive = os.path.join(self.snppaths[1], delta.ARCHIVE_FILENAME)
+        _fobj = open(_archive, "r+b")
+        _fobj.seek(os.path.getsize(_archive) / 2)
+        _fobj.write("garbage")
+        _fobj.close()
+        self.assertRaises(SBException, self.__restore, self.snppaths)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, "restored")))
+
+    def test_skip_gio_stream(self):
+        """Blocks are skipped within streams seeking like GIO's
+        """
+        self.__snapshot()
+        for _offset in (0, 4 * _BLOCKSIZE):
+            self.__write(self.bigfile, "changed", offset = _offset)
+        self.__snapshot()
+        _fop = delta._FOP
+        delta._FOP = _GioStreamOperations(_fop)
+        try:
+            self.assertEqual(self.__restore(self.snppaths), self.versions[0])
+        finally:
+            delta._FOP = _fop
+
+    def test_index(self):
+        """The index is stored as table; other contents are rejected
+        """
+        _index = self.__snapshot()
+        self.__write(self.bigfile, "changed", offset = 3 * _BLOCKSIZE)
+        _index = self.__snapshot()
+        _path = os.path.join(self.snppaths[0], delta.INDEX_FILENAME)
+        _stored = open(_path, "rb").read()
+        for _file, _entry in _index.iteritems():
+            _written = os.stat(_file)
+            self.assertEqual((_entry.size, _entry.mtime, _entry.mode, _entry.uid, _entry.gid),
+                             (_written.st_size, _written.st_mtime, _written.st_mode,
+                              _written.st_uid, _written.st_gid))
+        self.assertEqual(_index[self.bigfile].blocks.keys(), [3])
+        self.assertEqual(len(_index[self.bigfile].digests), 11 * 16)
+
+        for _data in (zlib.compress(pickle.dumps(_index, pickle.HIGHEST_PROTOCOL)),
+                      zlib.compress(zlib.decompress(_stored)[:-1]),
+                      zlib.compress(zlib.decompress(_stored) + "\0"),
+                      _stored[:-1]):
+            _fobj = open(_path, "wb")
+            _fobj.write(_data)
+            _fobj.close()
+            self.assertRaises(SBException, delta.read_index, self.snppaths[0])
+
+    def test_merge(self):
+        """The blocks of merged snapshots are combined
+        """
+        self.__snapshot()
+        for _offset in (0, 4 * _BLOCKSIZE, 0):
+            self.__write(self.bigfile, os.urandom(10), offset = _offset)
+            self.__snapshot()
+        # rebase the most recent snapshot on the first one
+        _merged = os.path.join(self.target, "merged")
+        os.mkdir(_merged)
+        delta.merge_deltas(self.snppaths[:3], _merged)
+        _index = delta.read_index(_merged)
+        self.assertEqual(sorted(_index[self.bigfile].blocks.keys()), [0, 4])
+        self.assertFalse(_index[self.bigfile].full)
+        self.assertEqual(self.__restore([_merged, self.snppaths[3]]), self.versions[0])
+        # convert into a full snapshot
+        _full = os.path.join(self.target, "full")
+        os.mkdir(_full)
+        delta.merge_deltas(self.snppaths, _full, complete = True)
+        self.assertTrue(delta.read_index(_full)[self.bigfile].full)
+        self.assertEqual(self.__restore([_full]), self.versions[0])
+        self.assertRaises(SBException, delta.merge_deltas, self.snppaths[:3], _full, True)
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestDeltaStorage)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
@@ -0,0 +1,137 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the cache of directory metadata (module 'dircache').
+"""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sbackup.util import dircache
+from sbackup.util.log import LogFactory
+
+
+class TestDirectoryCache(unittest.TestCase):
+    """Test case for storing and validating cached directory records.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_dircache_")
+        self.cachefile = os.path.join(self.tmpdir, "data", "collector.cache")
+        self.tree = os.path.join(self.tmpdir, "tree")
+        os.makedirs(os.path.join(self.tree, "sub"))
+        self.fingerprint = dircache.get_fingerprint(["/home"], [r"\.mp3$"], 1)
+        # the directory was not modified since the (fake) base snapshot
+        os.utime(self.tree, (1000000000, 1000000000))
+        self.basetime = os.stat(self.tree).st_ctime + 1
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __write_cache(self, cacheable = True):
+        _cache = dircache.DirectoryCache(self.cachefile, self.fingerprint)
+        _cache.load()
+        _record = _cache.add_record(self.tree, os.stat(self.tree))
+        _record.add("sub", dircache.DIRECTORY)
+        _record.add("song.mp3", dircache.EXCLUDED)
+        _record.add("link", dircache.FILE, True, dircache.FileStats(4, 1000000000.5, 1000000001.5,
+                                                                    0120777))
+        if not cacheable:
+            _record.set_uncacheable()
+        _cache.save()
+
+    def __get_record(self, fingerprint = None, basetime = None):
+        if fingerprint is None:
+            fingerprint = self.fingerprint
+        if basetime is None:
+            basetime = self.basetime
+        _cache = dircache.DirectoryCache(self.cachefile, fingerprint)
+        _cache.load()
+        return _cache.get_record(self.tree, os.stat(self.tree), basetime)
+
+    def test_unchanged(self):
+        """Records of unchanged directories are read from the cache
+        """
+        self.assertEqual(self.__get_record(), None)
+        self.__write_cache()
+        _record = self.__get_record()
+        self.assertEqual(_record.entries, [("sub", dircache.DIRECTORY, False, None),
+                                           ("song.mp3", dircache.EXCLUDED, False, None),
+                                           ("link", dircache.FILE, True,
+                                            (4, 1000000000.5, 1000000001.5, 0120777))])
+        self.assertEqual(_record.entries[2][3].st_ctime, 1000000001.5)
+
+    def test_invalid(self):
+        """Records are not used if the directory or the settings changed
+        """
+        self.__write_cache()
+        self.assertEqual(self.__get_record(basetime = self.basetime - 2), None)
+        self.assertEqual(self.__get_record(fingerprint = dircache.get_fingerprint(["/home"])), None)
+        os.utime(self.tree, (1000000010, 1000000010))
+        self.assertEqual(self.__get_record(basetime = os.stat(self.tree).st_ctime + 1), None)
+
+    def test_uncacheable(self):
+        """Uncacheable records are not stored
+        """
+        self.__write_cache(cacheable = False)
+        self.assertEqual(self.__get_record(), None)
+
+    def test_carried_forward(self):
+        """Records used from the cache are stored again
+        """
+        self.__write_cache()
+        _cache = dircache.DirectoryCache(self.cachefile, self.fingerprint)
+        _cache.load()
+        self.assertNotEqual(_cache.get_record(self.tree, os.stat(self.tree), self.basetime), None)
+        _cache.save()
+        self.assertNotEqual(self.__get_record(), None)
+        # directories not seen are dropped
+        _cache = dircache.DirectoryCache(self.cachefile, self.fingerprint)
+        _cache.load()
+        _cache.save()
+        self.assertEqual(self.__get_record(), None)
+
+    def test_corrupted(self):
+        """Corrupted cache files are ignored
+        """
+        os.makedirs(os.path.dirname(self.cachefile))
+        _fobj = open(self.cachefile, "wb")
+        _fobj.write("garbage")
+        _fobj.close()
+        self.assertEqual(self.__get_record(), None)
+        self.__write_cache()
+        self.assertNotEqual(self.__get_record(), None)
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestDirectoryCache)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
@@ -0,0 +1,357 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the collecting of files (module 'filecollect').
+"""
+
+
+import cPickle as pickle
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from sbackup import journal_service
+from sbackup.core.snapshot import Snapshot
+from sbackup.util import filecollect
+from sbackup.util import local_file_utils
+from sbackup.util.log import LogFactory
+
+
+class _FakeConfiguration(object):
+    """Provides the options of `ConfigManager` required by the collector.
+    """
+
+    def __init__(self, tree, maxsize = 0, nthreads = 1, cachefile = None, journal = None):
+        self.tree = tree
+        self.maxsize = maxsize
+        self.nthreads = nthreads
+        self.cachefile = cachefile
+        self.journal = journal
+
+    def has_maxsize_limit(self):
+        return self.maxsize > 0
+
+    def get_maxsize_limit(self):
+        return self.maxsize
+
+    def get_dirconfig_local(self):
+        return [(self.tree, 1)]
+
+    def get_collector_threads(self):
+        return self.nthreads
+
+    def get_snar_memory_limit(self):
+        return 0
+
+    def get_delta_threshold(self):
+        return 0
+
+    def get_collector_cache_file(self):
+        return self.cachefile
+
+    def get_change_journal_file(self):
+        return self.journal
+
+
+class _FakeSnapshotFile(object):
+    """Snapshot file (snar) of a base snapshot containing the given paths.
+    """
+
+    def __init__(self, backup_time, paths):
+        self.backup_time = backup_time
+        self.paths = paths
+
+    def get_time_of_backup(self):
+        return self.backup_time
+
+    def get_dict_format2(self):
+        return dict.fromkeys(self.paths)
+
+
+class TestFileCollector(unittest.TestCase):
+    """Test case for collecting files with and without the directory cache.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        # not in /tmp since it is excluded by default
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_filecollect_",
+                                       dir = os.path.abspath("test-datas"))
+        self.tree = os.path.join(self.tmpdir, "tree")
+        self.target = os.path.join(self.tmpdir, "target")
+        self.cachefile = os.path.join(self.tmpdir, "data", "collector.cache")
+        os.makedirs(os.path.join(self.tree, "unchanged"))
+        os.makedirs(self.target)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _path(self, *names):
+        return os.path.join(self.tree, *names)
+
+    def _write(self, path, size):
+        _fobj = open(path, "wb")
+        _fobj.write("x" * size)
+        _fobj.close()
+
+    def _make_tree(self, seed):
+        """Generates a tree of directories, files (some of them excluded by
+        name or size) and symbolic links.
+        """
+        _rand = random.Random(seed)
+        _dirs = [self.tree]
+        for _idx in range(60):
+            _dir = os.path.join(_rand.choice(_dirs), "d%s" % _idx)
+            os.mkdir(_dir)
+            _dirs.append(_dir)
+        for _idx in range(400):
+            _name = "f%s%s" % (_idx, _rand.choice(["", "", ".mp3"]))
+            self._write(os.path.join(_rand.choice(_dirs), _name),
+                        _rand.choice([0, 10, 100, 10000]))
+        for _idx in range(10):
+            os.symlink(_rand.choice(_dirs), os.path.join(_rand.choice(_dirs), "l%s" % _idx))
+
+    def _collect(self, configuration, name, base = None):
+        """Collects the files of the tree and returns the snapshot and
+        the stats.
+        """
+        _snp = Snapshot(os.path.join(self.target, name))
+        _snp.setExcludes([r"\.mp3$"])
+        _collector = filecollect.FileCollector(_snp,
+                        filecollect.FileCollectorConfigFacade(configuration, self.target))
+        if base is not None:
+            _collector.set_parent_snapshot(base)
+        _collector.collect_files()
+        return _snp, _collector.get_stats()
+
+    def test_cached_file_exceeds_maxsize(self):
+        """Cached files in unchanged directories are checked for their size
+        """
+        self._write(self._path("unchanged", "grows"), 10)
+        self._write(self._path("unchanged", "modified"), 10)
+        self._write(self._path("unchanged", "kept"), 10)
+        _conf = _FakeConfiguration(self.tree, maxsize = 5000, cachefile = self.cachefile)
+        self._collect(_conf, "2020-01-01_00.00.00.000000.host.ful")
+        _base = _FakeSnapshotFile(time.time() + 1.0,
+                                  [self._path("unchanged", _name)
+                                   for _name in ("grows", "modified", "kept")])
+        time.sleep(1.1)
+
+        # files are modified in place, the directory is not modified
+        self._write(self._path("unchanged", "grows"), 10000)
+        self._write(self._path("unchanged", "modified"), 20)
+        _snp, _stats = self._collect(_conf, "2020-01-02_00.00.00.000000.host.inc", _base)
+
+        # the directories were taken from the cache, i.e. they were not listed
+        self.assertEqual(_stats.get_count_syscalls().get("scandir", 0)
+                         + _stats.get_count_syscalls().get("listdir", 0), 0)
+        self.assertTrue(_snp.is_path_in_excl_filelist(self._path("unchanged", "grows")))
+        self.assertEqual(_stats.get_count_items_excl_config(), 1)
+        self.assertEqual(_stats.get_count_files_total(), 2)
+        self.assertEqual(_stats.get_count_files_incl(), 1)
+        self.assertEqual(_stats.get_count_files_skip(), 1)
+        self.assertEqual(_stats.get_size_payload(), 20)
+
+    def test_journal_unchanged_files(self):
+        """Files in directories not recorded in the change journal are not stat'ed
+        """
+        os.makedirs(self._path("changed"))
+        self._write(self._path("unchanged", "kept"), 10)
+        self._write(self._path("unchanged", "large"), 10000)
+        self._write(self._path("changed", "modified"), 10)
+        _journal = os.path.join(self.tmpdir, "journal")
+        _service = journal_service.ChangeJournalService(_journal, [self.tree])
+        _thread = threading.Thread(target = _service.main)
+        _thread.start()
+        try:
+            while not os.path.exists(_journal) or os.path.getsize(_journal) == 0:
+                time.sleep(0.05)
+            _conf = _FakeConfiguration(self.tree, maxsize = 5000, cachefile = self.cachefile,
+                                       journal = _journal)
+            self._collect(_conf, "2020-01-01_00.00.00.000000.host.ful")
+            _base = _FakeSnapshotFile(time.time(),
+                                      [self._path("unchanged", "kept"),
+                                       self._path("changed", "modified")])
+            time.sleep(1.1)
+
+            self._write(self._path("changed", "modified"), 20)
+            _snp, _stats = self._collect(_conf, "2020-01-02_00.00.00.000000.host.inc", _base)
+        finally:
+            _service.stop()
+            _thread.join()
+
+        # only the tree, the changed directory and its file were stat'ed
+        self.assertEqual(_stats.get_count_syscalls().get("lstat", 0), 3)
+        self.assertTrue(_snp.is_path_in_excl_filelist(self._path("unchanged", "large")))
+        self.assertEqual(_stats.get_count_items_excl_config(), 1)
+        self.assertEqual(_stats.get_count_files_total(), 2)
+        self.assertEqual(_stats.get_count_files_incl(), 1)
+        self.assertEqual(_stats.get_count_files_skip(), 1)
+        self.assertEqual(_stats.get_size_payload(), 20)
+
+    def __get_results(self, snp, stats):
+        return (sorted(snp.getExcludeFlist().iterkeys()),
+                stats.get_count_files_total(), stats.get_count_dirs(),
+                stats.get_count_symlinks(), stats.get_count_files_incl(),
+                stats.get_count_files_new(), stats.get_count_items_excl_forced(),
+                stats.get_count_items_excl_config(), stats.get_size_payload())
+
+    def __get_cached_entries(self, cachefile):
+        """Returns the entries of the records stored in the directory cache.
+        """
+        _fobj = open(cachefile, "rb")
+        try:
+            _dirs = pickle.load(_fobj)[3]
+        finally:
+            _fobj.close()
+        _res = {}
+        for _dir, _item in _dirs.iteritems():
+            _res[_dir] = _item[4].entries
+        return _res
+
+    def test_concurrent(self):
+        """Collecting files concurrently yields the same results as a single thread
+        """
+        self._make_tree(seed = 3)
+        _results = []
+        for _nthreads in (1, 4):
+            _cachefile = "%s.%s" % (self.cachefile, _nthreads)
+            _conf = _FakeConfiguration(self.tree, maxsize = 5000, nthreads = _nthreads,
+                                       cachefile = _cachefile)
+            _snp, _stats = self._collect(_conf, "2020-01-01_00.00.00.00000%s.host.ful" % _nthreads)
+            _results.append((self.__get_results(_snp, _stats),
+                             self.__get_cached_entries(_cachefile)))
+        self.assertTrue(len(_results[0][0][0]) > 100)
+        self.assertTrue(len(_results[0][1]) > 0)
+        self.assertEqual(_results[0], _results[1])
+
+
+class _FakeDirEntry(object):
+    """Entry of a directory as returned by `scandir`.
+    """
+
+    def __init__(self, path, name):
+        self.name = name
+        self.__path = os.path.join(path, name)
+
+    def is_symlink(self):
+        # the type is taken from the listing, i.e. the entry need not exist
+        if os.path.lexists(self.__path):
+            return os.path.islink(self.__path)
+        return False
+
+
+class TestPathClassification(unittest.TestCase):
+    """Test case for classifying symbolic links, unreadable paths and paths
+    vanishing while the directory is checked. The classification must not
+    depend on whether the directory is listed using `scandir`.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        # not in /tmp since it is excluded by default
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_filecollect_",
+                                       dir = os.path.abspath("test-datas"))
+        self.tree = os.path.join(self.tmpdir, "tree")
+        self.target = os.path.join(self.tmpdir, "target")
+        os.makedirs(os.path.join(self.tree, "dir"))
+        os.makedirs(self.target)
+        for _path in ("file", os.path.join("dir", "inner"), "unreadable"):
+            open(os.path.join(self.tree, _path), "w").close()
+        os.chmod(os.path.join(self.tree, "unreadable"), 0)
+        os.symlink(os.path.join(self.tree, "file"), os.path.join(self.tree, "link_file"))
+        os.symlink(os.path.join(self.tree, "dir"), os.path.join(self.tree, "link_dir"))
+        os.symlink(os.path.join(self.tree, "missing"), os.path.join(self.tree, "dangling"))
+        # root can read any file
+        self.readable = (os.geteuid() == 0)
+        self.__scandir = getattr(filecollect, "_scandir", None)
+        self.__listdir = local_file_utils.listdir
+
+    def tearDown(self):
+        filecollect._scandir = self.__scandir
+        local_file_utils.listdir = self.__listdir
+        shutil.rmtree(self.tmpdir)
+
+    def __listdir_vanishing(self, path):
+        """Lists the given directory including an entry removed in the meantime.
+        """
+        _res = self.__listdir(path)
+        if path == self.tree:
+            _res.append("vanished")
+        return _res
+
+    def __scandir_vanishing(self, path):
+        return [_FakeDirEntry(path, _name) for _name in self.__listdir_vanishing(path)]
+
+    def __collect(self, followlinks):
+        _snp = Snapshot(os.path.join(self.target, "2020-01-01_00.00.00.000000.host.ful"))
+        _snp.setFollowLinks(followlinks)
+        _conf = _FakeConfiguration(self.tree)
+        _collector = filecollect.FileCollector(_snp,
+                        filecollect.FileCollectorConfigFacade(_conf, self.target))
+        _collector.collect_files()
+        shutil.rmtree(_snp.getPath())
+        _stats = _collector.get_stats()
+        _excluded = sorted([os.path.relpath(_path, self.tree)
+                            for _path in _snp.getExcludeFlist().iterkeys()
+                            if _path.startswith(self.tree + os.sep)])
+        return (_excluded, _stats.get_count_files_total(), _stats.get_count_dirs(),
+                _stats.get_count_symlinks(), _stats.get_count_items_excl_forced())
+
+    def __check(self, followlinks, expected):
+        local_file_utils.listdir = self.__listdir_vanishing
+        for _scandir in (None, self.__scandir_vanishing):
+            filecollect._scandir = _scandir
+            self.assertEqual(self.__collect(followlinks), expected)
+
+    def test_not_followed(self):
+        """Symbolic links not followed are counted as files unless dangling
+        """
+        if self.readable:
+            self.__check(False, (["dangling", "vanished"], 5, 2, 2, 2))
+        else:
+            self.__check(False, (["dangling", "unreadable", "vanished"], 4, 2, 2, 3))
+
+    def test_followed(self):
+        """Followed symbolic links to directories are entered
+        """
+        if self.readable:
+            self.__check(True, (["dangling", "vanished"], 5, 3, 2, 2))
+        else:
+            self.__check(True, (["dangling", "unreadable", "vanished"], 4, 3, 2, 3))
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestFileCollector),
+         unittest.TestLoader().loadTestsFromTestCase(TestPathClassification)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
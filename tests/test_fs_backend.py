@@ -0,0 +1,307 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the caching of file infos by the file operations
+(modules '_gio_utils' and '_fuse_utils'). GIO is replaced by a fake module
+working on a file system held in memory.
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from sbackup.util.log import LogFactory
+
+
+class _FakeGioError(Exception):
+
+    def __init__(self, code, msg = ""):
+        Exception.__init__(self, msg)
+        self.code = code
+
+
+class _FakeFileSystem(object):
+    """File system of the fake GIO module. Paths are mapped to file types;
+    the requests are counted by name.
+    """
+
+    def __init__(self):
+        self.types = {}
+        self.requests = {}
+
+    def count(self, name):
+        self.requests[name] = self.requests.get(name, 0) + 1
+
+    def get_count(self, name):
+        return self.requests.get(name, 0)
+
+
+class _FakeFileInfo(object):
+
+    def __init__(self, name, ftype):
+        self.__name = name
+        self.__ftype = ftype
+
+    def get_name(self):
+        return self.__name
+
+    def get_file_type(self):
+        return self.__ftype
+
+
+class _FakeFile(object):
+    """A `gio.File` of the fake file system. The URI is the path.
+    """
+
+    def __init__(self, gio, path):
+        self.__gio = gio
+        self.__fs = gio.fs
+        self.__path = path.rstrip("/") or "/"
+
+    def get_uri(self):
+        return self.__path
+
+    def get_path(self):
+        return self.__path
+
+    def get_basename(self):
+        return os.path.basename(self.__path)
+
+    def get_parent(self):
+        if self.__path == "/":
+            return None
+        return _FakeFile(self.__gio, os.path.dirname(self.__path))
+
+    def get_child(self, name):
+        return _FakeFile(self.__gio, os.path.join(self.__path, name))
+
+    def __get_type(self):
+        _ftype = self.__fs.types.get(self.__path)
+        if _ftype is None:
+            raise _FakeGioError(self.__gio.ERROR_NOT_FOUND, "%s not found" % self.__path)
+        return _ftype
+
+    def query_info(self, attributes = None, flags = 0, cancellable = None):
+        self.__fs.count("query_info")
+        return _FakeFileInfo(self.get_basename(), self.__get_type())
+
+    def query_exists(self):
+        self.__fs.count("query_exists")
+        return self.__path in self.__fs.types
+
+    def enumerate_children(self, attributes, flags = 0):
+        self.__fs.count("enumerate_children")
+        if self.__get_type() != self.__gio.FILE_TYPE_DIRECTORY:
+            raise _FakeGioError(self.__gio.ERROR_NOT_DIRECTORY)
+        _prefix = "%s/" % self.__path.rstrip("/")
+        _res = []
+        for _path, _ftype in sorted(self.__fs.types.iteritems()):
+            if _path.startswith(_prefix) and "/" not in _path[len(_prefix):]:
+                _res.append(_FakeFileInfo(os.path.basename(_path), _ftype))
+        return _res
+
+    def make_directory(self):
+        self.__fs.count("make_directory")
+        self.__fs.types[self.__path] = self.__gio.FILE_TYPE_DIRECTORY
+
+    def replace(self, etag, make_backup):
+        self.__fs.count("replace")
+        self.__fs.types[self.__path] = self.__gio.FILE_TYPE_REGULAR
+        return None
+
+    def delete(self):
+        self.__fs.count("delete")
+        self.__get_type()
+        del self.__fs.types[self.__path]
+
+
+class _FakeGioModule(object):
+    """Replaces module `gio`. Constants not defined here get distinct values.
+    """
+
+    FILE_TYPE_UNKNOWN = 0
+    FILE_TYPE_REGULAR = 1
+    FILE_TYPE_DIRECTORY = 2
+    FILE_TYPE_SYMBOLIC_LINK = 3
+    ERROR_NOT_FOUND = 1
+    ERROR_NOT_DIRECTORY = 2
+
+    Error = _FakeGioError
+
+    def __init__(self):
+        self.fs = _FakeFileSystem()
+        self.__constants = {}
+
+    def __getattr__(self, name):
+        if not name.isupper():
+            raise AttributeError(name)
+        if name.startswith("FILE_ATTRIBUTE_"):
+            return name.lower()
+        return self.__constants.setdefault(name, 1000 + len(self.__constants))
+
+    def File(self, path):
+        return _FakeFile(self, path)
+
+
+def _import_gio_utils():
+    """Imports module `_gio_utils`; the fake GIO module is used for importing
+    if GIO is not available.
+    """
+    try:
+        import gio  #IGNORE:W0612
+    except ImportError:
+        sys.modules["gio"] = _FakeGioModule()
+        try:
+            from sbackup.fs_backend import _gio_utils
+        finally:
+            del sys.modules["gio"]
+    from sbackup.fs_backend import _gio_utils
+    return _gio_utils
+
+
+class TestGioInfoCache(unittest.TestCase):
+    """Test case for the scope and invalidation of the file info cache.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.gio_utils = _import_gio_utils()
+        self.__gio = self.gio_utils.gio
+        self.gio = _FakeGioModule()
+        self.gio_utils.gio = self.gio
+        self.fs = self.gio.fs
+        for _path, _ftype in (("/", self.gio.FILE_TYPE_DIRECTORY),
+                              ("/target", self.gio.FILE_TYPE_DIRECTORY),
+                              ("/target/snp", self.gio.FILE_TYPE_DIRECTORY),
+                              ("/target/snp/ver", self.gio.FILE_TYPE_REGULAR),
+                              ("/target/link", self.gio.FILE_TYPE_SYMBOLIC_LINK)):
+            self.fs.types[_path] = _ftype
+        self.fop = self.gio_utils.GioOperations
+
+    def tearDown(self):
+        self.gio_utils.gio = self.__gio
+
+    def test_scope(self):
+        """Infos are only cached between begin and (outermost) end of the scope
+        """
+        self.assertTrue(self.fop.is_dir("/target/snp"))
+        self.assertTrue(self.fop.is_dir("/target/snp"))
+        self.assertEqual(self.fs.get_count("query_info"), 2)
+
+        self.fop.begin_info_cache()
+        try:
+            self.assertTrue(self.fop.is_dir("/target/snp"))
+            self.fop.begin_info_cache()
+            self.assertTrue(self.fop.is_dir("/target/snp"))
+            self.fop.end_info_cache()
+            self.assertTrue(self.fop.is_dir("/target/snp"))
+            self.assertEqual(self.fs.get_count("query_info"), 3)
+        finally:
+            self.fop.end_info_cache()
+        self.assertTrue(self.fop.is_dir("/target/snp"))
+        self.assertEqual(self.fs.get_count("query_info"), 4)
+
+    def test_listing(self):
+        """Entries of listed directories are known without further requests
+        """
+        self.fop.begin_info_cache()
+        try:
+            self.assertEqual(self.fop.listdir("/target"), ["link", "snp"])
+            self.assertTrue(self.fop.is_dir("/target/snp"))
+            self.assertFalse(self.fop.path_exists("/target/missing"))
+            self.assertEqual(self.fop.listdir("/target"), ["link", "snp"])
+            self.assertEqual(self.fs.get_count("enumerate_children"), 1)
+            self.assertEqual(self.fs.get_count("query_info"), 0)
+            self.assertEqual(self.fs.get_count("query_exists"), 0)
+            # infos of symbolic links in listings are not used
+            self.assertTrue(self.fop.is_link("/target/link"))
+            self.assertEqual(self.fs.get_count("query_info"), 1)
+        finally:
+            self.fop.end_info_cache()
+
+    def test_invalidate(self):
+        """Modified files and the listings of their parents are invalidated
+        """
+        self.fop.begin_info_cache()
+        try:
+            self.assertEqual(self.fop.listdir("/target"), ["link", "snp"])
+            self.assertFalse(self.fop.path_exists("/target/new"))
+            self.fop.makedir("/target/new")
+            self.assertTrue(self.fop.path_exists("/target/new"))
+            self.assertEqual(self.fop.listdir("/target"), ["link", "new", "snp"])
+            self.assertEqual(self.fs.get_count("enumerate_children"), 2)
+
+            self.assertEqual(self.fop.listdir("/target/snp"), ["ver"])
+            self.fop.openfile_for_write("/target/snp/format")
+            self.assertEqual(self.fop.listdir("/target/snp"), ["format", "ver"])
+
+            self.fop.delete("/target/snp")
+            self.assertFalse(self.fop.path_exists("/target/snp"))
+            self.assertFalse(self.fop.is_dir("/target/snp/ver"))
+            self.assertEqual(self.fop.listdir("/target"), ["link", "new"])
+        finally:
+            self.fop.end_info_cache()
+
+
+class TestFuseInfoCache(unittest.TestCase):
+    """Test case for the (not existing) file info cache of local operations.
+    """
+
+    def setUp(self):
+        from sbackup.fs_backend import _fuse_utils
+        self.fop = _fuse_utils.FuseOperations
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_fs_backend_")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_no_cache(self):
+        """Beginning and ending the scope of the cache has no effect
+        """
+        _path = os.path.join(self.tmpdir, "file")
+        self.fop.begin_info_cache()
+        self.fop.begin_info_cache()
+        try:
+            self.assertFalse(self.fop.path_exists(_path))
+            open(_path, "w").close()
+            self.assertTrue(self.fop.path_exists(_path))
+            self.assertEqual(self.fop.listdir(self.tmpdir), ["file"])
+        finally:
+            self.fop.end_info_cache()
+            self.fop.end_info_cache()
+        os.remove(_path)
+        self.assertFalse(self.fop.path_exists(_path))
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestGioInfoCache),
+         unittest.TestLoader().loadTestsFromTestCase(TestFuseInfoCache)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
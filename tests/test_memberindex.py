@@ -0,0 +1,254 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the member index of archives (module 'memberindex').
+"""
+
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from sbackup.ar_backend import memberindex
+from sbackup.ar_backend import tar
+from sbackup.core import snapshot
+from sbackup.core.ConfigManager import ConfigManager
+from sbackup.util.exceptions import SBException
+from sbackup.util.log import LogFactory
+
+
+class TestMemberIndex(unittest.TestCase):
+    """Test case for the indexed writing and reading of archives.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.__frame_size = memberindex.FRAME_SIZE
+        memberindex.FRAME_SIZE = 16 * 1024
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_memberindex_")
+        self.tree = os.path.join(self.tmpdir, "tree")
+        for _dir in range(5):
+            os.makedirs(os.path.join(self.tree, "d%s" % _dir))
+            for _file in range(10):
+                self.__write("d%s/f%s" % (_dir, _file), 3000)
+        self.__write("d0/new\nline", 100)
+
+    def tearDown(self):
+        memberindex.FRAME_SIZE = self.__frame_size
+        shutil.rmtree(self.tmpdir)
+
+    def __write(self, name, size):
+        _fobj = open(os.path.join(self.tree, name), "w")
+        _fobj.write(("%s\n" % name) * size)
+        _fobj.close()
+
+    def __make_archive(self, cformat):
+        _archive = os.path.join(self.tmpdir, "files.tar")
+        _memberlist = os.path.join(self.tmpdir, "members")
+        _writer = memberindex.IndexedArchiveWriter(open(_archive, "wb"), cformat)
+        _proc = subprocess.Popen(["tar", "-c", "--block-number", "--verbose",
+                                  "--quoting-style=escape", "--index-file=%s" % _memberlist,
+                                  "--directory=%s" % self.tmpdir, "tree"],
+                                 stdout = subprocess.PIPE)
+        while True:
+            _data = _proc.stdout.read(4096)
+            if not _data:
+                break
+            _writer.write(_data)
+        self.assertEqual(_proc.wait(), 0)
+        _writer.close()
+        self.assertTrue(len(_writer.get_checkpoints()) > 1)
+        memberindex.write_index(_archive, _writer, _memberlist)
+        return _archive
+
+    def __extract(self, reader):
+        _dest = os.path.join(self.tmpdir, "dest")
+        if os.path.exists(_dest):
+            shutil.rmtree(_dest)
+        os.mkdir(_dest)
+        _proc = subprocess.Popen(["tar", "-x", "--directory=%s" % _dest],
+                                 stdin = subprocess.PIPE)
+        _proc.stdin.write(reader.read())
+        _proc.stdin.close()
+        reader.close()
+        self.assertEqual(_proc.wait(), 0)
+        return _dest
+
+    def __assert_equal_files(self, dest, name):
+        _expected = open(os.path.join(self.tree, name)).read()
+        self.assertEqual(open(os.path.join(dest, "tree", name)).read(), _expected)
+
+    def test_whole_archive(self):
+        """Concatenated frames are a valid archive
+        """
+        for _cformat, _opt in (("gzip", "-z"), ("bzip2", "-j")):
+            _archive = self.__make_archive(_cformat)
+            _dest = os.path.join(self.tmpdir, _cformat)
+            os.mkdir(_dest)
+            subprocess.check_call(["tar", "-x", _opt, "--file=%s" % _archive,
+                                   "--directory=%s" % _dest])
+            self.__assert_equal_files(_dest, "d4/f9")
+
+    def test_single_members(self):
+        """Only the requested members are extracted
+        """
+        for _cformat in ("none", "gzip", "bzip2"):
+            _archive = self.__make_archive(_cformat)
+            self.assertTrue(memberindex.has_index(_archive))
+            _reader = memberindex.open_members(_archive, ["/tree/d3/f7", "tree/d0/new\nline"])
+            _dest = self.__extract(_reader)
+            self.__assert_equal_files(_dest, "d3/f7")
+            self.__assert_equal_files(_dest, "d0/new\nline")
+            self.assertFalse(os.path.exists(os.path.join(_dest, "tree", "d3", "f6")))
+
+    def test_directory(self):
+        """The content of directories is looked up if recursive
+        """
+        _archive = self.__make_archive("gzip")
+        _dest = self.__extract(memberindex.open_members(_archive, ["tree/d2"]))
+        self.assertEqual(len(os.listdir(os.path.join(_dest, "tree", "d2"))), 10)
+        self.assertFalse(os.path.exists(os.path.join(_dest, "tree", "d1")))
+        _lookup = memberindex.MemberIndex(_archive).get_ranges(["tree/d2"], recursive = False)
+        self.assertEqual(len(_lookup[4]), 1)
+
+    def test_missing(self):
+        """Missing members and archives without index are reported
+        """
+        _archive = self.__make_archive("gzip")
+        self.assertRaises(SBException, memberindex.MemberIndex(_archive).get_ranges,
+                          ["tree/missing"])
+        self.assertEqual(memberindex.open_members(_archive, ["tree/missing"]), None)
+        os.remove(memberindex.get_index_filename(_archive))
+        self.assertEqual(memberindex.open_members(_archive, ["tree/d1/f1"]), None)
+        self.assertRaises(SBException, memberindex.IndexedArchiveWriter, None, "xz")
+
+
+class _LaunchedError(Exception):
+    pass
+
+
+class _FakeLauncher(object):
+    """Records the options TAR is launched with instead of launching it.
+    """
+    options = None
+    stdout_file = None
+
+    def set_transfer_bufsize(self, bufsize):
+        pass
+
+    def set_progress_callback(self, callback):
+        pass
+
+    def set_stdout_file(self, stdout_file):
+        _FakeLauncher.stdout_file = stdout_file
+
+    def launch_sync(self, options, env):
+        _FakeLauncher.options = options
+        raise _LaunchedError
+
+
+class _FakeTargetHandler(object):
+
+    def __init__(self, path):
+        self.__path = path
+
+    def get_use_iopipe(self):
+        return False
+
+    def get_eff_fullpath(self, *names):
+        return os.path.join(self.__path, *names)
+
+
+class TestMemberIndexOption(unittest.TestCase):
+    """Test case for the TAR command line of profiles with and without
+    member index.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_memberindex_")
+        self.__launcher = tar.TarBackendLauncherSingleton
+        tar.TarBackendLauncherSingleton = _FakeLauncher
+        _FakeLauncher.options = None
+        _FakeLauncher.stdout_file = None
+        self.snapshot = snapshot.Snapshot(os.path.join(self.tmpdir,
+                                                       "2010-01-01_10.00.00.000000.host.ful"))
+        self.snapshot.setFormat("gzip")
+        # TAR reads the lists from the temporary directory of the snapshot
+        for _flist in (self.snapshot.getIncludeFListFile(), self.snapshot.getExcludeFListFile()):
+            open(os.path.join(self.snapshot.get_tempdir(), os.path.basename(_flist)), "w").close()
+
+    def tearDown(self):
+        tar.TarBackendLauncherSingleton = self.__launcher
+        self.snapshot.remove_tempdir()
+        shutil.rmtree(self.tmpdir)
+
+    def __get_config(self, options = ""):
+        _conffile = os.path.join(self.tmpdir, "sbackup.conf")
+        _fobj = open(_conffile, "w")
+        _fobj.write("[general]\ntarget = %s\nformat = gzip\n%s" % (self.tmpdir, options))
+        _fobj.close()
+        return ConfigManager(_conffile)
+
+    def __launch(self, config):
+        self.snapshot.set_member_index(config.get_member_index())
+        self.assertRaises(_LaunchedError, tar.mk_archive, self.snapshot,
+                          _FakeTargetHandler(self.tmpdir), None, True)
+        return _FakeLauncher.options
+
+    def test_default(self):
+        """Profiles without the option get TAR's compression and output
+        """
+        _config = self.__get_config()
+        self.assertFalse(_config.get_member_index())
+        _options = self.__launch(_config)
+        _compress = tar.get_compress_opts("gzip")
+        self.assertEqual(_options[:len(_compress)], _compress)
+        self.assertTrue("--file=%s" % os.path.join(self.tmpdir, self.snapshot.getName(),
+                                                   "files.tar.gz") in _options)
+        self.assertFalse([_opt for _opt in _options if _opt.startswith("--index-file")])
+        self.assertEqual(_FakeLauncher.stdout_file, None)
+
+    def test_enabled(self):
+        """Profiles with the option write an indexed archive
+        """
+        _options = self.__launch(self.__get_config("memberindex = 1\n"))
+        self.assertFalse(set(tar.get_compress_opts("gzip")) & set(_options))
+        self.assertFalse([_opt for _opt in _options if _opt.startswith("--file=")])
+        self.assertTrue([_opt for _opt in _options if _opt.startswith("--index-file")])
+        self.assertTrue(isinstance(_FakeLauncher.stdout_file, memberindex.IndexedArchiveWriter))
+        _FakeLauncher.stdout_file.close()
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestMemberIndex),
+         unittest.TestLoader().loadTestsFromTestCase(TestMemberIndexOption)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
@@ -0,0 +1,154 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the progress of archive creation (module 'progress').
+"""
+
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from sbackup.util import constants
+from sbackup.util import progress
+from sbackup.util.log import LogFactory
+
+
+class _Clock(object):
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressEngine(unittest.TestCase):
+    """Test case for class 'ProgressEngine'.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.published = []
+        self.clock = _Clock()
+        self.engine = progress.ProgressEngine(1000000, self.published.append,
+                                              interval = 2.0, clock = self.clock)
+
+    def test_rate_limit(self):
+        """Progress is published at most once per interval
+        """
+        for _step in range(10):
+            self.engine.update(_step * 1000)
+            self.clock.now += 0.5
+        self.assertEqual(len(self.published), 3)
+        self.engine.finish()
+        self.assertEqual(self.published[-1].done, 9000)
+
+    def test_estimate(self):
+        """Throughput, percentage and remaining time are computed
+        """
+        self.engine.update(0)
+        self.clock.now += 10
+        self.engine.update(100000)
+        _info = self.published[-1]
+        self.assertEqual(_info.rate, 10000)
+        self.assertEqual(_info.get_percent(), 10.0)
+        self.assertEqual(_info.remaining, 90)
+        # throughput is smoothed
+        self.clock.now += 10
+        self.engine.update(400000)
+        self.assertEqual(self.published[-1].rate, 0.3 * 30000 + 0.7 * 10000)
+
+    def test_serialize(self):
+        """Progress is passed as string; plain checkpoints are supported
+        """
+        _info = progress.ProgressInfo(5000, 10000, 250, 20)
+        _copy = progress.ProgressInfo.deserialize(_info.serialize())
+        self.assertEqual((_copy.done, _copy.total, _copy.rate, _copy.remaining),
+                         (5000, 10000, 250, 20))
+        _legacy = progress.ProgressInfo.deserialize("11")
+        self.assertEqual(_legacy.done, 10 * constants.TAR_RECORDSIZE)
+        self.assertEqual(_legacy.get_percent(), progress.UNKNOWN)
+        self.assertRaises(ValueError, progress.ProgressInfo.deserialize, "x:1")
+        self.assertEqual(_copy.profile, None)
+
+    def test_profiles(self):
+        """The progress of concurrent backups is kept per profile
+        """
+        _info = progress.ProgressInfo(5000, 10000, 250, 20, profile = "home: docs")
+        _copy = progress.ProgressInfo.deserialize(_info.serialize())
+        self.assertEqual((_copy.done, _copy.profile), (5000, "home: docs"))
+
+        _profiles = progress.ProfilesProgress(expiry = 30, clock = self.clock)
+        _profiles.update(progress.ProgressInfo(100, profile = "work"))
+        _profiles.update(_copy)
+        self.clock.now += 20
+        _profiles.update(progress.ProgressInfo(200, profile = "work"))
+        self.assertEqual([(_info.profile, _info.done) for _info in _profiles.get_progress()],
+                         [("home: docs", 5000), ("work", 200)])
+        # finished backups are dropped
+        self.clock.now += 20
+        self.assertEqual([_info.profile for _info in _profiles.get_progress()], ["work"])
+
+
+class TestCheckpointReader(unittest.TestCase):
+    """Test case for reading checkpoints echoed by TAR.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_progress_")
+        _fobj = open(os.path.join(self.tmpdir, "data"), "w")
+        _fobj.write(os.urandom(3 * 1024 * 1024))
+        _fobj.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_checkpoints(self):
+        """Checkpoints are passed to the callback, other output is kept
+        """
+        _checkpoints = []
+        _proc = subprocess.Popen(["tar", "-c", "--file=%s" % os.devnull,
+                                  "--directory=%s" % self.tmpdir, "data", "missing"]\
+                                 + progress.get_checkpoint_opts(),
+                                 stderr = subprocess.PIPE)
+        _reader = progress.CheckpointReader(_proc.stderr, _checkpoints.append)
+        _reader.start()
+        _proc.wait()
+        _reader.join()
+        self.assertEqual(_checkpoints[:3], [100, 200, 300])
+        self.assertTrue("missing" in _reader.get_output())
+        self.assertFalse(progress.CHECKPOINT_MARKER in _reader.get_output())
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestProgressEngine),
+         unittest.TestLoader().loadTestsFromTestCase(TestCheckpointReader)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
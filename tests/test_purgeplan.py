@@ -0,0 +1,143 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the planning of purges (module 'purgeplan').
+"""
+
+
+import datetime
+import unittest
+
+from sbackup.core import purgeplan
+from sbackup.core.catalog import CatalogEntry
+from sbackup.core.snapshot import Snapshot
+from sbackup.util.log import LogFactory
+
+
+_TODAY = datetime.date(2010, 6, 30)
+
+
+def _make_snapshots(specs):
+    """Creates snapshots (without accessing the disk) from the given list of
+    tuples (age in days, full, index of base in list).
+    """
+    _names = []
+    _snps = []
+    for _idx, (_age, _full, _base) in enumerate(specs):
+        _date = _TODAY - datetime.timedelta(days = _age)
+        _type = "inc"
+        if _full:
+            _type = "ful"
+        _name = "%s_10.00.00.%06d.host.%s" % (_date.isoformat(), _idx, _type)
+        _names.append(_name)
+        _basename = None
+        if _base is not None:
+            _basename = _names[_base]
+        _entry = CatalogEntry(_name, "1.5", "gzip", _basename)
+        _snps.append(Snapshot("/nonexistent/%s" % _name, entry = _entry))
+    return _names, _snps
+
+
+class TestPurgePlanner(unittest.TestCase):
+    """Test case for class 'PurgePlanner'.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        # two chains: full (60 days) <- inc (50) <- inc (40), full (20) <- inc (10)
+        self.names, self.snps = _make_snapshots([(60, True, None),
+                                                 (50, False, 0),
+                                                 (40, False, 1),
+                                                 (20, True, None),
+                                                 (10, False, 3)])
+
+    def __plan(self, purge, no_purge_snp = "", consolidate = False):
+        _planner = purgeplan.PurgePlanner(self.snps, no_purge_snp, consolidate, today = _TODAY)
+        return _planner.plan(purge)
+
+    def test_cutoff(self):
+        """Chains older than the cut-off are removed from the most recent one
+        """
+        _plan = self.__plan("30")
+        self.assertEqual(_plan.get_removed(), [self.names[2], self.names[1], self.names[0]])
+        self.assertEqual(_plan.get_kept(), [self.names[4], self.names[3]])
+        # each removal depends on the previous one
+        self.assertEqual(len(_plan.get_steps()), 3)
+
+    def test_cutoff_keeps_bases(self):
+        """Snapshots that younger snapshots rely on are kept
+        """
+        _plan = self.__plan("15")
+        self.assertEqual(_plan.get_removed(), [self.names[2], self.names[1], self.names[0]])
+        self.assertTrue(self.names[3] in _plan.get_kept())
+
+    def test_no_purge_snapshot(self):
+        """The given snapshot is never removed (nor its bases)
+        """
+        _plan = self.__plan("30", no_purge_snp = self.names[2])
+        self.assertTrue(_plan.is_empty())
+        self.assertEqual(len(_plan.get_kept()), 5)
+
+    def test_consolidate(self):
+        """Snapshots with childs are removed after rebasing the childs
+        """
+        _plan = self.__plan("15", no_purge_snp = self.names[4], consolidate = True)
+        _actions = [str(_action) for _action in _plan.get_actions()]
+        self.assertEqual(_actions[:3], [str(purgeplan.PurgeAction(purgeplan.ACTION_REMOVE, _name))
+                                        for _name in (self.names[2], self.names[1], self.names[0])])
+        _converted = "%sful" % self.names[4][:-3]
+        self.assertEqual(_plan.get_steps()[-2][0].newbase, None)
+        self.assertEqual(_plan.get_removed()[-1], self.names[3])
+        self.assertEqual(_plan.get_kept(), [_converted])
+
+    def test_parallel_steps(self):
+        """Independent removals are grouped into a single step
+        """
+        _names, self.snps = _make_snapshots([(60, True, None),
+                                             (50, False, 0),
+                                             (40, False, 0),
+                                             (30, False, 0)])
+        _steps = self.__plan("10").get_steps()
+        self.assertEqual([len(_step) for _step in _steps], [3, 1])
+        self.assertEqual(_steps[1][0].name, _names[0])
+
+    def test_log(self):
+        """Logarithmic purge keeps one snapshot per period
+        """
+        _names, self.snps = _make_snapshots([(_age, True, None) for _age in range(14, 0, -1)])
+        _plan = self.__plan("log")
+        _kept = _plan.get_kept()
+        self.assertTrue(_names[-1] in _kept)
+        self.assertEqual(len(_kept) + len(_plan.get_removed()), 14)
+        self.assertTrue(len(_plan.get_removed()) > 0)
+        self.assertTrue(_plan.get_report().startswith("Purge plan:"))
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestPurgePlanner)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
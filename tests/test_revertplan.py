@@ -0,0 +1,137 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the planning of reverts (module 'revertplan').
+"""
+
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+from sbackup.ar_backend import tar
+from sbackup.core import revertplan
+from sbackup.util.exceptions import SBException
+from sbackup.util.log import LogFactory
+
+
+class _Snapshot(object):
+    """Provides the snar file of a snapshot created by TAR.
+    """
+
+    def __init__(self, name, snarfile):
+        self.__name = name
+        self.__snarfile = snarfile
+
+    def getName(self):
+        return self.__name
+
+    def getSnarFile(self):
+        return self.__snarfile
+
+    def getSnapshotFileInfos(self):
+        return tar.ProcSnapshotFile(tar.SnapshotFile(self.__snarfile))
+
+
+class TestRevertPlanner(unittest.TestCase):
+    """Test case for class 'RevertPlanner'.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_revertplan_")
+        self.tree = os.path.join(self.tmpdir, "tree")
+        os.makedirs(os.path.join(self.tree, "dir", "sub"))
+        for _name in ("dir/a", "dir/b", "dir/sub/c"):
+            self.__write(_name)
+        self.history = [self.__make_snapshot("full", None)]
+        self.__write("dir/a")
+        self.history.insert(0, self.__make_snapshot("inc1", self.history[0]))
+        self.__write("dir/sub/c")
+        self.history.insert(0, self.__make_snapshot("inc2", self.history[0]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __write(self, name):
+        _fobj = open(os.path.join(self.tree, name), "w")
+        _fobj.write("content of %s at %s\n" % (name, time.time()))
+        _fobj.close()
+
+    def __make_snapshot(self, name, base):
+        _snarfile = os.path.join(self.tmpdir, "%s.snar" % name)
+        if base is not None:
+            shutil.copy(base.getSnarFile(), _snarfile)
+        subprocess.check_call(["tar", "-c", "--listed-incremental=%s" % _snarfile,
+                               "--file=%s" % os.devnull, "--absolute-names", self.tree])
+        return _Snapshot(name, _snarfile)
+
+    def __path(self, name):
+        return os.path.join(self.tree, name)
+
+    def test_directory(self):
+        """Each file is taken from the most recent snapshot it is included in
+        """
+        _plan = revertplan.RevertPlanner(self.history).plan(self.tree)
+        self.assertEqual(_plan.get_snapshots(), ["inc2", "inc1", "full"])
+        self.assertEqual(sorted(_plan.get_members("inc2")),
+                         [self.tree, self.__path("dir"), self.__path("dir/sub"),
+                          self.__path("dir/sub/c")])
+        self.assertEqual(_plan.get_members("inc1"), [self.__path("dir/a")])
+        self.assertEqual(_plan.get_members("full"), [self.__path("dir/b")])
+        self.assertEqual(_plan.get_count(), 6)
+
+    def test_subdirectory(self):
+        """Base snapshots are not used if not required
+        """
+        _plan = revertplan.RevertPlanner(self.history).plan(self.__path("dir/sub"))
+        self.assertEqual(_plan.get_snapshots(), ["inc2"])
+
+    def test_file(self):
+        """Single files are taken from a single snapshot
+        """
+        _plan = revertplan.RevertPlanner(self.history).plan(self.__path("dir/b"))
+        self.assertEqual(_plan.get_snapshots(), ["full"])
+        self.assertEqual(_plan.get_members("full"), [self.__path("dir/b")])
+        self.assertRaises(SBException, revertplan.RevertPlanner(self.history).plan,
+                          self.__path("dir/missing"))
+
+    def test_excludes(self):
+        """Excluded files are not taken from base snapshots
+        """
+        _planner = revertplan.RevertPlanner(self.history, set([self.__path("dir/b")]))
+        _plan = _planner.plan(self.__path("dir"))
+        self.assertEqual(_plan.get_snapshots(), ["inc2", "inc1"])
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestRevertPlanner)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
@@ -0,0 +1,174 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the scheduling of backups (module 'scheduler').
+"""
+
+
+import os
+import tempfile
+import unittest
+
+from sbackup.core import scheduler
+from sbackup.util import constants
+from sbackup.util import exceptions
+from sbackup.util.log import LogFactory
+
+
+class _Process(object):
+    """Backup process that finishes after the given number of polls.
+    """
+
+    def __init__(self, job, nticks, returncode, launcher):
+        self.job = job
+        self.__nticks = nticks
+        self.__returncode = returncode
+        self.__launcher = launcher
+        self.signals = []
+
+    def poll(self):
+        self.__launcher.tick(self)
+        self.__nticks -= 1
+        if self.__nticks <= 0:
+            return self.__returncode
+        return None
+
+    def send_signal(self, signum):
+        self.signals.append(signum)
+        self.__nticks = 0
+
+
+class _Launcher(object):
+    """Starts fake processes and records the jobs running concurrently.
+    """
+
+    def __init__(self, nticks = 3, returncodes = None, cancel_after = None):
+        self.__nticks = nticks
+        self.__returncodes = returncodes or {}
+        self.__cancel_after = cancel_after
+        self.__npolls = 0
+        self.running = []
+        self.concurrent = []
+        self.processes = []
+
+    def __call__(self, job):
+        _proc = _Process(job, self.__nticks,
+                         self.__returncodes.get(job.profilename, constants.EXCODE_SUCCESS),
+                         self)
+        self.running.append(job.profilename)
+        self.concurrent.append(sorted(self.running))
+        self.processes.append(_proc)
+        return _proc
+
+    def tick(self, proc):
+        self.__npolls += 1
+        if self.__cancel_after is not None and self.__npolls == self.__cancel_after:
+            raise exceptions.BackupCanceledError
+        if proc.job.profilename in self.running:
+            self.running.remove(proc.job.profilename)
+
+
+class TestProfileScheduler(unittest.TestCase):
+    """Test case for class 'ProfileScheduler'.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def __jobs(self, specs):
+        return [scheduler.ProfileJob(_name, "/nonexistent/%s.conf" % _name, _target, _cost)
+                for _name, _target, _cost in specs]
+
+    def __run(self, jobs, launcher, target_limit = 1, cpu_budget = 4):
+        _scheduler = scheduler.ProfileScheduler(jobs, launcher, target_limit, cpu_budget)
+        return _scheduler.run(interval = 0), _scheduler
+
+    def test_targets(self):
+        """Backups writing to the same target are not run concurrently
+        """
+        _launcher = _Launcher()
+        _jobs = self.__jobs([("a", "disk1", 1), ("b", "disk1", 1), ("c", "host", 1)])
+        _retc, _scheduler = self.__run(_jobs, _launcher)
+        self.assertEqual(_retc, constants.EXCODE_SUCCESS)
+        self.assertEqual(_launcher.concurrent[:2], [["a"], ["a", "c"]])
+        self.assertEqual(len(_scheduler.get_finished()), 3)
+
+    def test_target_limit(self):
+        """The limit of backups per target is configurable
+        """
+        _launcher = _Launcher()
+        _jobs = self.__jobs([("a", "disk1", 1), ("b", "disk1", 1), ("c", "disk1", 1)])
+        self.__run(_jobs, _launcher, target_limit = 2)
+        self.assertEqual(_launcher.concurrent[1], ["a", "b"])
+
+    def test_cpu_budget(self):
+        """The compression threads of running backups fit into the budget
+        """
+        _launcher = _Launcher()
+        _jobs = self.__jobs([("a", "t1", 3), ("b", "t2", 2), ("c", "t3", 1), ("d", "t4", 8)])
+        self.__run(_jobs, _launcher)
+        # `b` does not fit and blocks `c`; `d` exceeds the budget and runs alone
+        self.assertEqual(_launcher.concurrent[0], ["a"])
+        self.assertEqual(_launcher.concurrent[1], ["b"])
+        self.assertEqual(_launcher.concurrent[-1], ["d"])
+
+    def test_exitcode(self):
+        """The first failure is returned
+        """
+        _launcher = _Launcher(returncodes = { "b" : constants.EXCODE_BACKUP_ERROR })
+        _jobs = self.__jobs([("a", "t1", 1), ("b", "t2", 1)])
+        _retc, _scheduler = self.__run(_jobs, _launcher)
+        self.assertEqual(_retc, constants.EXCODE_BACKUP_ERROR)
+
+    def test_cancel(self):
+        """Canceling is forwarded to the running backups
+        """
+        _launcher = _Launcher(nticks = 10, cancel_after = 2)
+        _jobs = self.__jobs([("a", "t1", 1), ("b", "t2", 1), ("c", "t1", 1)])
+        _scheduler = scheduler.ProfileScheduler(_jobs, _launcher, 1, 4)
+        self.assertRaises(exceptions.BackupCanceledError, _scheduler.run, 0)
+        self.assertEqual(len(_launcher.processes), 2)
+        for _proc in _launcher.processes:
+            self.assertEqual(_proc.signals, [constants.BACKUP_CANCEL_SIG])
+
+    def test_target_key(self):
+        """Local targets are identified by device, remote ones by host
+        """
+        _dir = tempfile.mkdtemp(prefix = "test_scheduler_")
+        try:
+            _key = scheduler.get_target_key(_dir)
+            self.assertEqual(_key, "dev:%s" % os.stat(_dir).st_dev)
+            self.assertEqual(scheduler.get_target_key(os.path.join(_dir, "not", "yet")), _key)
+        finally:
+            os.rmdir(_dir)
+        self.assertEqual(scheduler.get_target_key("sftp://user@host.example/backups"),
+                         "sftp://host.example")
+        self.assertTrue(scheduler.get_profile_lockfile("My Profile").endswith("sbackup-profile-My_Profile.lock"))
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestProfileScheduler)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
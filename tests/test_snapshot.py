@@ -24,13 +24,16 @@ import os
 import os.path
 import unittest
 import pickle
+import shutil
 import subprocess
+import tempfile
 
 from sbackup.util.exceptions import SBException
 from sbackup.util.exceptions import NotValidSnapshotNameException
 from sbackup.util.exceptions import NotValidSnapshotException
 
-from sbackup.util import snapshot
+from sbackup.ar_backend import tar
+from sbackup.core import snapshot
 from sbackup.util.log import LogFactory
 
 
@@ -441,6 +444,61 @@ class TestSnapshotCreateToDisk(unittest.TestCase):
 
 
 
+class TestSnapshotTempFiles(unittest.TestCase):
+    """Test case for the temporary files written when committing snapshots
+    of several profiles at the same time.
+    """
+
+    def setUp(self):
+        LogFactory.getLogger(level = 10)
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_snapshot_")
+        self.snapshots = []
+        for _profile in ("first", "second"):
+            os.mkdir(os.path.join(self.tmpdir, _profile))
+            _snp = snapshot.Snapshot(os.path.join(self.tmpdir, _profile,
+                                                  "2010-01-01_10.00.00.000000.host.ful"))
+            _snp.set_member_index(True)
+            _snp.addToIncludeFlist(os.path.join(self.tmpdir, "%s.txt" % _profile))
+            self.snapshots.append(_snp)
+
+    def tearDown(self):
+        for _snp in self.snapshots:
+            _snp.remove_tempdir()
+        shutil.rmtree(self.tmpdir)
+
+    def __read(self, path):
+        _fobj = open(path, "r")
+        try:
+            return _fobj.read()
+        finally:
+            _fobj.close()
+
+    def test_separate_tempfiles(self):
+        """Snapshots committed at the same time do not share temporary files
+        """
+        _paths = []
+        for _snp in self.snapshots:
+            _snp.commitflistFiles()
+            _memberlist = getattr(tar, "__get_memberlist")(_snp)
+            _options, _ar_path, _tmp_incl, _tmp_excl = getattr(tar, "__prepare_common_opts")(
+                                                        _snp, None, None, True, _memberlist)
+            self.assertTrue("--files-from=%s" % _tmp_incl in _options)
+            self.assertTrue("--exclude-from=%s" % _tmp_excl in _options)
+            self.assertTrue("--index-file=%s" % _memberlist in _options)
+            self.assertEqual(self.__read(_tmp_incl),
+                             "\n".join(_snp.get_eff_incl_filelst_not_nested()))
+            _paths.append([_tmp_incl, _tmp_excl, _memberlist])
+        self.assertFalse(set(_paths[0]) & set(_paths[1]))
+        for _snp, _tmpfiles in zip(self.snapshots, _paths):
+            for _path in _tmpfiles:
+                self.assertEqual(os.path.dirname(_path), _snp.get_tempdir())
+
+        _tempdir = self.snapshots[0].get_tempdir()
+        self.snapshots[0].remove_tempdir()
+        self.assertFalse(os.path.exists(_tempdir))
+        self.assertTrue(os.path.exists(_paths[1][0]))
+
+
 def suite():
     """Returns a test suite containing all test cases from this module.
     """
@@ -449,6 +507,7 @@ def suite():
         [
          unittest.TestLoader().loadTestsFromTestCase(TestSnapshotFromDisk),
          unittest.TestLoader().loadTestsFromTestCase(TestSnapshotCreateToDisk),
+         unittest.TestLoader().loadTestsFromTestCase(TestSnapshotTempFiles),
          unittest.TestLoader().loadTestsFromTestCase(TestSnapshot)
         ])
     return _suite
@@ -20,13 +20,26 @@ import unittest
 import os
 import subprocess
 import datetime
-
-from sbackup.util.tar import SnapshotFile
-from sbackup.util.tar import MemSnapshotFile
-from sbackup.util.tar import ProcSnapshotFile
-from sbackup.util.tar import Dumpdir
-from sbackup.util.tar import getArchiveType
-from sbackup.util.tar import get_dumpdir_from_list
+import tempfile
+import shutil
+import pickle
+
+from sbackup.ar_backend.tar import SnapshotFile
+from sbackup.ar_backend.tar import MemSnapshotFile
+from sbackup.ar_backend.tar import ProcSnapshotFile
+from sbackup.ar_backend.tar import SnapshotContentMap
+from sbackup.ar_backend.tar import SnapshotFileIndex
+from sbackup.ar_backend.tar import Dumpdir
+from sbackup.ar_backend.tar import getArchiveType
+from sbackup.ar_backend.tar import get_archive_name
+from sbackup.ar_backend.tar import get_compress_opts
+from sbackup.ar_backend.tar import get_decompress_opts
+from sbackup.ar_backend.tar import get_dumpdir_from_list
+from sbackup.ar_backend.tar import extract_files
+
+from sbackup.ar_backend import chunks
+from sbackup.ar_backend import memberindex
+from sbackup.ar_backend import streams
 
 from sbackup.util.log import LogFactory
 from sbackup.util.exceptions import SBException
@@ -127,6 +140,7 @@ class TestSnapshotFile(unittest.TestCase):
         rmlst = [ self.snarfile, self.snarf_new, self.snarf_notexist,
                   self.snarsnpfile_path, self.snarsnpfile2_path
                 ]
+        rmlst.extend(["%s%s" % (_rm, SnapshotFile.INDEX_SUFFIX) for _rm in rmlst])
         for rm in rmlst:
             if os.path.exists(rm):
                 os.remove(rm)
@@ -207,6 +221,110 @@ class TestSnapshotFile(unittest.TestCase):
         self.assertTrue(snpf2.hasFile("/home/wattazoum/Images/article.html"))
         self.assertTrue(snpf2.hasPath("/home/wattazoum/Images"))
 
+    def test_index(self):
+        """Lookups using the index of the snar file give the same results
+        as parsing the snar file.
+        """
+        snpf = SnapshotFile(self.snarsnpfile2_path)
+        self.assertEqual(snpf.load_index(), None)
+
+        psnpf = ProcSnapshotFile(snpf)
+        for _record in snpf.parseFormat2():
+            _dirname = _record[SnapshotFile.REC_DIRNAME]
+            self.assertTrue(psnpf.hasPath(_dirname))
+            self.assertEqual(repr(psnpf.getContent(_dirname)),
+                             repr(_record[SnapshotFile.REC_CONTENT]))
+            for _dumpdir in _record[SnapshotFile.REC_CONTENT]:
+                _path = os.path.join(_dirname, _dumpdir.getFilename())
+                self.assertEqual(psnpf.hasFile(_path),
+                                 _dumpdir.getControl() != Dumpdir.UNCHANGED)
+        self.assertFalse(psnpf.hasPath("/not/existing"))
+        self.assertRaises(SBException, psnpf.getContent, "/not/existing")
+
+        # the index was written on first access
+        self.assertTrue(os.path.exists(snpf.get_index_filename()))
+        self.assertNotEqual(snpf.load_index(), None)
+
+    def test_content_map(self):
+        """The content map gives the same results as parsing the snar file.
+        """
+        snpf = SnapshotFile(self.snarsnpfile2_path)
+        _map = SnapshotContentMap(snpf)
+        _ndirs = 0
+        for _record in snpf.parseFormat2():
+            _ndirs += 1
+            _dirname = _record[SnapshotFile.REC_DIRNAME]
+            self.assertTrue(_map.hasPath(_dirname))
+            self.assertEqual(repr(_map.getContent(_dirname)),
+                             repr(_record[SnapshotFile.REC_CONTENT]))
+            _cdict = _map.getContentDict(_dirname)
+            for _dumpdir in _record[SnapshotFile.REC_CONTENT]:
+                self.assertEqual(_cdict[_dumpdir.getFilename()].getControl(),
+                                 _dumpdir.getControl())
+        self.assertEqual(len(_map), _ndirs)
+        self.assertFalse(_map.hasPath("/not/existing"))
+        self.assertRaises(SBException, _map.getContent, "/not/existing")
+
+    def test_add_records(self):
+        """Adding several records at once gives the same file as adding
+        them one by one.
+        """
+        snpf = SnapshotFile(self.snarsnpfile2_path)
+        _records = list(snpf.parseFormat2())
+
+        snpf_single = SnapshotFile(self.snarf_new, True)
+        snpf_single.setHeader(datetime.datetime(2010, 1, 1))
+        for _record in _records:
+            snpf_single.addRecord(_record)
+        _single = open(self.snarf_new).read()
+
+        snpf_multi = SnapshotFile(self.snarf_new, True)
+        snpf_multi.setHeader(datetime.datetime(2010, 1, 1))
+        self.assertEqual(snpf_multi.addRecords(iter(_records)), len(_records))
+        self.assertEqual(open(self.snarf_new).read(), _single)
+        self.assertEqual(repr(list(snpf_multi.parseFormat2())), repr(_records))
+
+    def test_index_outdated(self):
+        """An index is not used after records were added to the snar file.
+        """
+        snpf = SnapshotFile(self.snarsnpfile2_path)
+        snpf.write_index()
+        self.assertNotEqual(snpf.load_index(), None)
+
+        psnpf = ProcSnapshotFile(snpf)
+        psnpf.addRecord(['0', '1195399253', '1195399253', '2049', '420738',
+                         "/home/wattazoum/Added",
+                         [Dumpdir('%sadded.txt' % Dumpdir.INCLUDED)]])
+        self.assertEqual(snpf.load_index(), None)
+        self.assertTrue(psnpf.hasFile("/home/wattazoum/Added/added.txt"))
+        self.assertNotEqual(snpf.load_index(), None)
+
+    def test_index_file(self):
+        """Lookups read the entries from the index file; invalid index
+        files are not used.
+        """
+        snpf = SnapshotFile(self.snarsnpfile2_path)
+        _entries = snpf.write_index().get_table()
+        _index = snpf.load_index()
+        self.assertEqual(_index.get_table(), None)
+        self.assertEqual(_index.count * SnapshotFileIndex.ENTRY.size, len(_entries))
+
+        psnpf = ProcSnapshotFile(snpf)
+        for _record in snpf.parseFormat2():
+            _dirname = _record[SnapshotFile.REC_DIRNAME]
+            self.assertEqual(repr(psnpf.getContent(_dirname)),
+                             repr(_record[SnapshotFile.REC_CONTENT]))
+        self.assertFalse(psnpf.hasPath("/not/existing"))
+
+        _idxfile = snpf.get_index_filename()
+        _data = open(_idxfile).read()
+        for _invalid in (_data[:-1], "x%s" % _data[1:],
+                         pickle.dumps({ "offsets" : {} }), ""):
+            _fobj = open(_idxfile, "w")
+            _fobj.write(_invalid)
+            _fobj.close()
+            self.assertEqual(snpf.load_index(), None)
+
     def test_create_SnapshotFile_newfile(self):
         """Instantiation of SnapshotFile with creation of SNAR-file.
         """
@@ -306,6 +424,28 @@ class TestSnapshotFile(unittest.TestCase):
             dmpd_str = "%s %s" % (dmpd.getControl(), dmpd.getFilename())
             self.assertEqual(dmpd_str, dumpdir2[_idx])
 
+    def test_parse_format2_blocksize(self):
+        """Parsing with small read blocks gives the same records as parsing
+        with the default block size (separators spanning block boundaries).
+        """
+        _default_bs = SnapshotFile.READ_BLOCKSIZE
+        _results = []
+        try:
+            for _bs in (_default_bs, 1, 2, 3, 7):
+                SnapshotFile.READ_BLOCKSIZE = _bs
+                _res = []
+                for _snarf in (self.snarfile, self.snarsnpfile2_path):
+                    snpf = SnapshotFile(_snarf)
+                    for entr in snpf.parseFormat2():
+                        _res.append(repr(entr))
+                    _res.append(snpf.getHeader())
+                    _res.append(sorted(snpf.get_dict_format2().items()))
+                _results.append(_res)
+        finally:
+            SnapshotFile.READ_BLOCKSIZE = _default_bs
+
+        for _res in _results[1:]:
+            self.assertEqual(_results[0], _res)
 
     def test_header_newfile(self):
         """Test methods related to header on fresh created file.
@@ -418,6 +558,7 @@ class TestProcSnapshotFile(unittest.TestCase):
         """
         rmlst = [ self.snarsnpfile_path, self.snarsnpfile2_path
                 ]
+        rmlst.extend(["%s%s" % (_rm, SnapshotFile.INDEX_SUFFIX) for _rm in rmlst])
         for rm in rmlst:
             if os.path.exists(rm):
                 os.remove(rm)
@@ -487,6 +628,239 @@ class TestTarUtilsArchiveType(unittest.TestCase) :
             self.assertEqual(_res, _data["type"])
 
 
+class TestTarUtilsCompression(unittest.TestCase) :
+    """Test case for the compression related functions defined in module 'tar'.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def test_archive_names(self):
+        """Names of archives are recognized
+        """
+        for _cformat, _type in (("none", "tar"), ("gzip", "gzip"), ("bzip2", "bzip2"),
+                                ("xz", "xz"), ("zstd", "zstd")):
+            _name = get_archive_name(_cformat)
+            self.assertEqual(getArchiveType(_name), _type)
+            self.assertEqual(get_decompress_opts(_type), get_compress_opts(_cformat))
+        self.assertEqual(get_archive_name("xz"), "files.tar.xz")
+        self.assertRaises(SBException, get_archive_name, "lzma")
+        self.assertRaises(SBException, get_decompress_opts, None)
+
+    def test_compress_opts(self):
+        """TAR options for compression
+        """
+        self.assertEqual(get_compress_opts("none", 4), [])
+        self.assertEqual(get_compress_opts("gzip"), ["--gzip"])
+        self.assertEqual(get_compress_opts("bzip2", 1), ["--bzip2"])
+        self.assertRaises(SBException, get_compress_opts, "lzma")
+        for _cformat in ("gzip", "bzip2", "xz", "zstd"):
+            _opts = get_compress_opts(_cformat, 4)
+            self.assertEqual(len(_opts), 1)
+            if _opts[0].startswith("--use-compress-program="):
+                self.assertTrue("4" in _opts[0])
+            else:
+                self.assertEqual(_opts, get_compress_opts(_cformat))
+
+
+class TestTarUtilsChunks(unittest.TestCase) :
+    """Test case for splitting of archives into parts (module 'chunks').
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_chunks_")
+        self.archive = os.path.join(self.tmpdir, "files.tar.gz")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __write(self, data, partsize, blocksize):
+        _writer = chunks.ChunkWriter(self.archive, partsize)
+        for _idx in range(0, len(data), blocksize):
+            _writer.write(data[_idx:_idx + blocksize])
+        _writer.close()
+        return _writer.get_parts()
+
+    def test_roundtrip(self):
+        """Written parts are reassembled when read
+        """
+        _data = os.urandom(10000)
+        _parts = self.__write(_data, 3000, 700)
+        self.assertEqual([_part[1] for _part in _parts], [3000, 3000, 3000, 1000])
+        self.assertTrue(chunks.is_split_archive(self.archive))
+        self.assertFalse(os.path.exists(self.archive))
+        self.assertTrue(os.path.exists(chunks.get_part_filename(self.archive, 4)))
+        self.assertEqual(chunks.read_manifest(self.archive), _parts)
+
+        _reader = chunks.ChunkReader(self.archive)
+        self.assertEqual(_reader.read(), _data)
+        _reader.close()
+
+        _reader = chunks.ChunkReader(self.archive)
+        _res = []
+        while True:
+            _buf = _reader.read(1024)
+            if not _buf:
+                break
+            _res.append(_buf)
+        _reader.close()
+        self.assertEqual("".join(_res), _data)
+
+    def test_empty_archive(self):
+        """An empty archive consists of a single empty part
+        """
+        _parts = self.__write("", 3000, 1)
+        self.assertEqual(len(_parts), 1)
+        self.assertEqual(chunks.ChunkReader(self.archive).read(), "")
+
+    def test_corrupted_part(self):
+        """Corrupted parts are detected while reading
+        """
+        self.__write(os.urandom(5000), 2000, 5000)
+        _part = chunks.get_part_filename(self.archive, 2)
+        _fobj = open(_part, "r+b")
+        _fobj.write("x")
+        _fobj.close()
+        _reader = chunks.ChunkReader(self.archive)
+        self.assertRaises(SBException, _reader.read)
+        _reader.close()
+
+    def test_invalid_manifest(self):
+        """Invalid manifests are refused
+        """
+        self.__write(os.urandom(100), 2000, 100)
+        _fobj = open(chunks.get_manifest_filename(self.archive), "w")
+        _fobj.write("files.tar.gz.001\t100\n")
+        _fobj.close()
+        self.assertRaises(SBException, chunks.ChunkReader, self.archive)
+
+
+class TestTarUtilsStreams(unittest.TestCase) :
+    """Test case for streaming of members between archives (module 'streams').
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_streams_")
+        self.srcdir = os.path.join(self.tmpdir, "source")
+        os.makedirs(os.path.join(self.srcdir, "dir"))
+        for _name in ("dir/a", "dir/b"):
+            _fobj = open(os.path.join(self.srcdir, _name), "w")
+            _fobj.write("content of %s\n" % _name)
+            _fobj.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def __list(self, archive):
+        _reader = streams.ArchiveReader(archive)
+        _names = [_member.name for _member in _reader]
+        _reader.close()
+        return _names
+
+    def test_copy_members(self):
+        """Members of a compressed archive are copied into a split archive
+        """
+        _src = os.path.join(self.tmpdir, "src.tar.gz")
+        subprocess.check_call(["tar", "-czf", _src, "-C", self.srcdir, "dir"])
+        _dst = os.path.join(self.tmpdir, "files.tar.gz")
+
+        _count = streams.write_consolidated_archive(_dst, "gzip", [(_src, None)],
+                                                    None, partsize = 200)
+        self.assertEqual(_count, 3)
+        self.assertTrue(chunks.is_split_archive(_dst))
+        self.assertEqual(sorted(self.__list(_dst)), ["dir", "dir/a", "dir/b"])
+
+    def __write_sparse(self, name, sections, size):
+        _fobj = open(os.path.join(self.srcdir, name), "wb")
+        for _offset, _data in sections:
+            _fobj.seek(_offset)
+            _fobj.write(_data)
+        _fobj.truncate(size)
+        _fobj.close()
+
+    def test_sparse_members(self):
+        """Sparse members are copied without their holes
+        """
+        self.__write_sparse("dir/sparse", [(0, "head"), (300000, "middle")], 1000000)
+        self.__write_sparse("dir/sections", [(_idx * 40000, "section %s" % _idx)
+                                             for _idx in range(30)], 1200000)
+        _src = os.path.join(self.tmpdir, "src.tar")
+        subprocess.check_call(["tar", "--sparse", "-cf", _src, "-C", self.srcdir, "dir"])
+        _dst = os.path.join(self.tmpdir, "files.tar")
+
+        self.assertEqual(streams.write_consolidated_archive(_dst, "none", [(_src, None)], None), 5)
+        self.assertTrue(os.path.getsize(_dst) < 400000)
+        _reader = streams.ArchiveReader(_dst)
+        _sparse = [_member.name for _member in _reader if _member.issparse()]
+        _reader.close()
+        self.assertEqual(sorted(_sparse), ["dir/sections", "dir/sparse"])
+
+        _dest = os.path.join(self.tmpdir, "dest")
+        os.mkdir(_dest)
+        subprocess.check_call(["tar", "-xf", _dst, "-C", _dest])
+        for _name in ("dir/a", "dir/sparse", "dir/sections"):
+            self.assertEqual(open(os.path.join(_dest, _name), "rb").read(),
+                             open(os.path.join(self.srcdir, _name), "rb").read())
+
+    def test_indexed(self):
+        """The member index of the written archive is created if requested
+        """
+        _src = os.path.join(self.tmpdir, "src.tar.gz")
+        subprocess.check_call(["tar", "-czf", _src, "-C", self.srcdir, "dir"])
+        _dst = os.path.join(self.tmpdir, "files.tar.gz")
+
+        streams.write_consolidated_archive(_dst, "gzip", [(_src, None)], None, indexed = True)
+        self.assertTrue(memberindex.has_index(_dst))
+        _proc = subprocess.Popen(["tar", "-xO"], stdin = subprocess.PIPE,
+                                 stdout = subprocess.PIPE)
+        _data = memberindex.open_members(_dst, ["dir/b"]).read()
+        self.assertEqual(_proc.communicate(_data)[0], "content of dir/b\n")
+        self.assertRaises(SBException, streams.ArchiveWriter,
+                          os.path.join(self.tmpdir, "files.tar.xz"), "xz",
+                          indexed = True)
+
+    def test_split_uncompressed(self):
+        """Uncompressed archives cannot be split
+        """
+        self.assertRaises(SBException, streams.ArchiveWriter,
+                          os.path.join(self.tmpdir, "files.tar"), "none",
+                          partsize = 200)
+
+
+class TestTarUtilsExtract(unittest.TestCase) :
+    """Test case for function 'extract_files' defined in module 'tar'.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix = "test_extract_")
+        self.srcdir = os.path.join(self.tmpdir, "source")
+        self.destdir = os.path.join(self.tmpdir, "dest")
+        os.makedirs(os.path.join(self.srcdir, "dir"))
+        os.makedirs(self.destdir)
+        for _name in ("dir/a", "dir/sp ace", "dir/-x", "dir/c"):
+            _fobj = open(os.path.join(self.srcdir, _name), "w")
+            _fobj.write("content of %s\n" % _name)
+            _fobj.close()
+        self.archive = os.path.join(self.tmpdir, "files.tar.gz")
+        subprocess.check_call(["tar", "-czf", self.archive, "-C", self.srcdir, "dir"])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_extract_files(self):
+        """Several files (with unusual names) are extracted at once
+        """
+        extract_files(self.archive, self.archive, ["/dir/a", "/dir/sp ace", "dir/-x"],
+                      self.destdir)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.destdir, "dir"))),
+                         ["-x", "a", "sp ace"])
+
+
 class TestTarUtilsGetDumpdir(unittest.TestCase) :
     """Test case for function 'get_dumpdir_from_list' defined in module 'tar'.
     """
@@ -597,6 +971,10 @@ def suite():
           unittest.TestLoader().loadTestsFromTestCase(TestProcSnapshotFile),
           unittest.TestLoader().loadTestsFromTestCase(TestSnapshotFile),
           unittest.TestLoader().loadTestsFromTestCase(TestTarUtilsArchiveType),
+          unittest.TestLoader().loadTestsFromTestCase(TestTarUtilsCompression),
+          unittest.TestLoader().loadTestsFromTestCase(TestTarUtilsChunks),
+          unittest.TestLoader().loadTestsFromTestCase(TestTarUtilsStreams),
+          unittest.TestLoader().loadTestsFromTestCase(TestTarUtilsExtract),
           unittest.TestLoader().loadTestsFromTestCase(TestTarUtilsGetDumpdir),
           unittest.TestLoader().loadTestsFromTestCase(TestTarUtilsAppendTar)
 
@@ -0,0 +1,116 @@
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+# Authors :
+#   Jean-Peer Lorenz <peer.loz@gmx.net>
+
+"""Unittests for testing the transfer of archive streams (module 'transfer').
+"""
+
+
+import os
+import StringIO
+import tempfile
+import time
+import unittest
+
+from sbackup.ar_backend import transfer
+from sbackup.util.log import LogFactory
+
+
+class _Destination(object):
+    """Collects the written data; optionally slow or failing.
+    """
+
+    def __init__(self, delay = 0.0, fail_after = None):
+        self.chunks = []
+        self.__delay = delay
+        self.__fail_after = fail_after
+
+    def write(self, data):
+        if self.__fail_after is not None and len(self.chunks) >= self.__fail_after:
+            raise IOError("Destination is not writable")
+        time.sleep(self.__delay)
+        self.chunks.append(data)
+
+    def get_value(self):
+        return "".join(self.chunks)
+
+
+class TestTransfer(unittest.TestCase):
+    """Test case for class 'Transfer'.
+    """
+
+    LogFactory.getLogger(level = 10)
+
+    def setUp(self):
+        self.data = os.urandom(100 * 1024 + 17)
+
+    def test_copy(self):
+        """The data is copied completely in buffers of the given size
+        """
+        _dest = _Destination()
+        _stats = transfer.Transfer(StringIO.StringIO(self.data), _dest, bufsize = 4096).run()
+        self.assertEqual(_dest.get_value(), self.data)
+        self.assertEqual(_stats.nbytes, len(self.data))
+        self.assertEqual(_stats.nbuffers, 26)
+        self.assertEqual(max([len(_chunk) for _chunk in _dest.chunks]), 4096)
+        self.assertTrue(str(_stats).startswith("0.1 MiB"))
+
+    def test_backpressure(self):
+        """Reading waits for slow destinations if all buffers are queued
+        """
+        _dest = _Destination(delay = 0.02)
+        _transfer = transfer.Transfer(StringIO.StringIO(self.data), _dest,
+                                      bufsize = 4096, nbuffers = 2)
+        _stats = _transfer.run()
+        self.assertEqual(_dest.get_value(), self.data)
+        self.assertTrue(_stats.read_wait > 0.2)
+        self.assertTrue(_stats.max_queued <= 2)
+
+    def test_write_error(self):
+        """Errors raised by the writer are propagated
+        """
+        _dest = _Destination(fail_after = 3)
+        _transfer = transfer.Transfer(StringIO.StringIO(self.data), _dest, bufsize = 1024)
+        self.assertRaises(IOError, _transfer.run)
+        self.assertEqual(len(_dest.chunks), 3)
+
+    def test_is_local_file(self):
+        """Only real files are passed to TAR directly
+        """
+        _fd, _path = tempfile.mkstemp(prefix = "test_transfer_")
+        os.close(_fd)
+        _fobj = open(_path, "w")
+        try:
+            self.assertTrue(transfer.is_local_file(_fobj))
+            self.assertFalse(transfer.is_local_file(StringIO.StringIO()))
+        finally:
+            _fobj.close()
+            os.remove(_path)
+
+
+def suite():
+    """Returns a test suite containing all test cases from this module.
+    """
+    _suite = unittest.TestSuite()
+    _suite.addTests(
+        [
+         unittest.TestLoader().loadTestsFromTestCase(TestTransfer)
+        ])
+    return _suite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity = 2).run(suite())
@@ -19,6 +19,8 @@
 import os
 import unittest
 from sbackup import util as Util
+from sbackup.util import accesscheck
+from sbackup.util import exclusion
 
 class TestUtilsRemoveConfEntry(unittest.TestCase):
     """Testing function 'util.remove_conf_entry'.
@@ -223,11 +225,114 @@ class TestUtilsNssbCopy(unittest.TestCase):
         Util.nssb_copy(self.src_abspath, self.dst_absdir)
 
 
+class TestAccessCheck(unittest.TestCase):
+    """Testing of read access checks.
+    """
+
+    def setUp(self):
+        self.mounts_relpath = "./test-datas/test_utils.mounts"
+        _fobj = open(self.mounts_relpath, "w")
+        _fobj.write("/dev/sda1 / ext4 rw,relatime 0 0\n"\
+                    "server:/export /home/john\\040doe/nfs nfs4 rw 0 0\n"\
+                    "sshfs#user@host: /mnt/remote fuse.sshfs rw 0 0\n")
+        _fobj.close()
+        self.checker = None
+
+    def tearDown(self):
+        if self.checker is not None:
+            self.checker.close()
+        if os.path.exists(self.mounts_relpath):
+            os.remove(self.mounts_relpath)
+
+    def test_get_mounts(self):
+        """Reading of mounted file systems.
+        """
+        _mounts = accesscheck.get_mounts(self.mounts_relpath)
+        self.assertEqual(_mounts, [("/home/john doe/nfs", "nfs4"),
+                                   ("/mnt/remote", "fuse.sshfs"),
+                                   ("/", "ext4")])
+
+    def test_is_suspicious_fs_type(self):
+        """File system types for which files are opened.
+        """
+        for _fstype in ("nfs", "cifs", "fuse", "fuse.sshfs"):
+            self.assertTrue(accesscheck.is_suspicious_fs_type(_fstype))
+        for _fstype in ("ext4", "xfs", "btrfs", "tmpfs", "fusectl"):
+            self.assertFalse(accesscheck.is_suspicious_fs_type(_fstype))
+
+    def test_check(self):
+        """Checking read access of local files.
+        """
+        self.checker = accesscheck.ReadAccessChecker(mounts = [("/", "ext4")])
+        _path = self.mounts_relpath
+        _stats = os.lstat(_path)
+        self.assertFalse(self.checker.is_opened(_path, _stats))
+        self.assertEqual(self.checker.check(_path, _stats),
+                         (accesscheck.READABLE, None))
+
+        self.checker.close()
+        self.checker = accesscheck.ReadAccessChecker(mounts = [("/", "fuse")])
+        self.assertTrue(self.checker.is_opened(_path, _stats))
+        self.assertEqual(self.checker.check(_path, _stats),
+                         (accesscheck.READABLE, None))
+
+
+class TestExcludeRegexMatcher(unittest.TestCase):
+    """Testing of matching paths against exclusion rules.
+    """
+
+    def test_literal_rules(self):
+        """Detection of literal suffixes and prefixes.
+        """
+        self.assertEqual(exclusion.get_literal_suffix(r"\.mp3$"), ".mp3")
+        self.assertEqual(exclusion.get_literal_suffix(r".*~$"), "~")
+        self.assertEqual(exclusion.get_literal_suffix(r"\.mp3"), None)
+        self.assertEqual(exclusion.get_literal_suffix(r"\.mp3?$"), None)
+        self.assertEqual(exclusion.get_literal_prefix(r"^/home/john/tmp"), "/home/john/tmp")
+        self.assertEqual(exclusion.get_literal_prefix(r"^/home/jo?hn"), "/home/j")
+        self.assertEqual(exclusion.get_literal_prefix(r"^/home|/tmp"), None)
+        self.assertEqual(exclusion.get_literal_prefix(r"/home"), None)
+
+    def test_match(self):
+        """The first matching rule is reported.
+        """
+        _regexes = [r"/d4/d1", r"\.mp3$", "", "[[[", r"^/home/john/tmp",
+                    r"(?i)\.jpg$", r"(a)\1", r"\.mp3$"]
+        _matcher = exclusion.ExcludeRegexMatcher(_regexes)
+        self.assertEqual(_matcher.get_patterns(), [r"/d4/d1", r"\.mp3$", r"^/home/john/tmp",
+                                                   r"(?i)\.jpg$", r"(a)\1", r"\.mp3$"])
+        self.assertEqual(_matcher.match("/home/john/music/a.mp3"), r"\.mp3$")
+        self.assertEqual(_matcher.match("/d4/d1/a.mp3"), r"/d4/d1")
+        self.assertEqual(_matcher.match("/home/john/tmp/a.mp3"), r"\.mp3$")
+        self.assertEqual(_matcher.match("/home/john/tmp/a.txt"), r"^/home/john/tmp")
+        self.assertEqual(_matcher.match("/home/john/tmpfile"), r"^/home/john/tmp")
+        self.assertEqual(_matcher.match("/tmp/home/john/tmp"), None)
+        self.assertEqual(_matcher.match("/home/john/a.JPG"), r"(?i)\.jpg$")
+        self.assertEqual(_matcher.match("/home/john/aa"), r"(a)\1")
+        self.assertEqual(_matcher.match("/home/john/a.txt"), None)
+
+    def test_match_many(self):
+        """Matching against more rules than groups allowed in a single expression.
+        """
+        _regexes = [r"(x%d)$" % _idx for _idx in range(250)]
+        _matcher = exclusion.ExcludeRegexMatcher(_regexes)
+        self.assertEqual(_matcher.match("/tmp/x42"), r"(x42)$")
+        self.assertEqual(_matcher.match("/tmp/x249"), r"(x249)$")
+        self.assertEqual(_matcher.match("/tmp/x250"), None)
+
+    def test_match_empty(self):
+        """Matching without rules.
+        """
+        self.assertEqual(exclusion.ExcludeRegexMatcher(False).match("/tmp"), None)
+
+
 def suite():
     _suite = unittest.TestSuite()
     _suite.addTests([ unittest.TestLoader().loadTestsFromTestCase(TestUtilsRemoveConfEntry),
                      unittest.TestLoader().loadTestsFromTestCase(TestUtilsRegex),
-                     unittest.TestLoader().loadTestsFromTestCase(TestUtilsNssbCopy)
+                     unittest.TestLoader().loadTestsFromTestCase(TestUtilsNssbCopy),
+                     unittest.TestLoader().loadTestsFromTestCase(TestAccessCheck),
+                     unittest.TestLoader().loadTestsFromTestCase(TestExcludeRegexMatcher)
                    ])
     return _suite
 